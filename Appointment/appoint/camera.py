@@ -0,0 +1,242 @@
+'''
+camera.py
+
+摄像头人数检测：每个房间的摄像头每分钟发送约两次人数，更新房间人数和进行中预约的检测结果
+
+- 逐条处理时，每个读数在一个事务中更新房间并锁定、保存当时进行中的预约，见apply_reading
+- 启用批量写入时，接口只将读数记入缓存日志，由定时任务每分钟调用flush_readings，
+  按到达顺序在内存中重放读数，一次bulk_update写回房间、检测结果和迟到标记
+- 两种方式使用相同的检测规则update_check_state，重放顺序与逐条处理一致，结果相同
+- 预约结束判定前先写回日志（见status_control.py），保证使用完整的检测结果
+- 多进程部署时，日志使用的缓存（CONFIG.camera_cache）必须是共享缓存，如Redis
+
+update_check_state: 用一次读数更新预约的检测结果，不保存
+apply_reading: 逐条处理一次读数
+buffer_enabled: 是否启用批量写入
+record_reading: 将读数记入日志
+apply_readings: 批量处理一组读数
+flush_readings: 将日志中的读数批量写回数据库
+'''
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.cache import caches
+from django.db import transaction
+
+from Appointment.config import appointment_config as CONFIG
+from Appointment.models import Room, Appoint
+from Appointment.utils.log import logger, get_user_logger
+from Appointment.utils.occupancy import invalidate_room
+from Appointment.appoint.judge import set_appoint_reason
+
+
+__all__ = [
+    'update_check_state',
+    'apply_reading',
+    'buffer_enabled',
+    'record_reading',
+    'apply_readings',
+    'flush_readings',
+]
+
+
+# 写回锁的过期时间（秒），避免进程异常退出导致死锁
+FLUSH_LOCK_TIMEOUT = 60
+# 迟到的判定时间
+LATE_DELAY = timedelta(minutes=15)
+# 读数更新的预约检测字段
+CHECK_FIELDS = ['Acheck_status', 'Acamera_check_num', 'Acamera_ok_num']
+
+
+def update_check_state(appoint: Appoint, current_num: int, refresh: bool = False):
+    '''
+    用一次读数更新预约的检测结果，不保存
+
+    :param appoint: 读数时进行中的预约
+    :type appoint: Appoint
+    :param current_num: 摄像头识别的人数
+    :type current_num: int
+    :param refresh: 读数是否与房间的上一次读数在不同的分钟
+    :type refresh: bool
+    '''
+    if appoint.Acheck_status == Appoint.CheckStatus.UNSAVED or refresh:
+        # 说明是新的一分钟或者本分钟还没有记录
+        # 如果随机成功，记录新的检查结果
+        if random.uniform(0, 1) < CONFIG.check_rate:
+            appoint.Acheck_status = Appoint.CheckStatus.FAILED
+            appoint.Acamera_check_num += 1
+            if current_num >= appoint.Aneed_num:  # 如果本次检测合规
+                appoint.Acamera_ok_num += 1
+                appoint.Acheck_status = Appoint.CheckStatus.PASSED
+        # 如果随机失败，锁定上一分钟的结果
+        else:
+            if appoint.Acheck_status == Appoint.CheckStatus.FAILED:
+                # 如果本次检测合规，宽容时也算上一次通过（因为一分钟只检测两次）
+                if current_num >= appoint.Aneed_num:
+                    appoint.Acamera_ok_num += 1
+            # 本分钟暂无记录
+            appoint.Acheck_status = Appoint.CheckStatus.UNSAVED
+    else:
+        # Appoint.CheckStatus可能是：PASSED，FAILED
+        # 和上一次检测在同一分钟，此时：1.不增加检测次数 2.如果合规则增加ok次数
+        if appoint.Acheck_status == Appoint.CheckStatus.FAILED:
+            # 当前（上一次检查）不合规；如果这次检测合规，那么认为本分钟合规
+            if current_num >= appoint.Aneed_num:
+                appoint.Acamera_ok_num += 1
+                appoint.Acheck_status = Appoint.CheckStatus.PASSED
+        # else:当前已经合规，不需要额外操作，本分钟视为合规
+
+
+def _is_late(appoint: Appoint, now_time: datetime) -> bool:
+    return (now_time > appoint.Astart + LATE_DELAY
+            and appoint.Astatus == Appoint.Status.APPOINTED)
+
+
+def apply_reading(room: Room, current_num: int, now_time: datetime):
+    '''逐条处理一次读数，更新房间人数和进行中预约的检测结果，失败时抛出异常'''
+    # 存储上一次的检测时间
+    previous_check_time = room.Rlatest_time
+    # 更新现在的人数、最近更新时间
+    Room.objects.filter(Rid=room.Rid).update(
+        Rpresent=current_num, Rlatest_time=now_time)
+    room.Rpresent, room.Rlatest_time = current_num, now_time
+
+    # 逻辑是尽量宽容，因为一分钟只记录两次，两次随机大概率只有一次成功
+    # 所以没必要必须随机成功才能修改错误结果
+    refresh = (now_time.minute != previous_check_time.minute)
+    with transaction.atomic():
+        for appoint in Appoint.objects.not_canceled().filter(
+            Astart__lte=now_time, Afinish__gte=now_time, Room=room,
+        ).select_for_update():
+            update_check_state(appoint, current_num, refresh)
+            # 检测结果不影响房间的占用索引，只保存检测字段，见models.py
+            appoint.save(update_fields=CHECK_FIELDS)
+            if _is_late(appoint, now_time):
+                # 该函数只是把appoint标记为迟到并修改状态为进行中，不发送微信提醒
+                set_appoint_reason(appoint, Appoint.Reason.R_LATE)
+
+
+def buffer_enabled() -> bool:
+    '''是否启用读数的批量写入'''
+    return CONFIG.camera_buffer
+
+
+def _cache():
+    return caches[CONFIG.camera_cache]
+
+
+def _key(name: str | int) -> str:
+    return f'camera_readings:{name}'
+
+
+def record_reading(rid: str, current_num: int, now_time: datetime) -> int:
+    '''将一次读数记入日志，返回日志序号'''
+    cache = _cache()
+    cache.add(_key('head'), 0, None)
+    seq = cache.incr(_key('head'))
+    cache.set(_key(seq), (rid, current_num, now_time), None)
+    return seq
+
+
+def _replay(readings: list[tuple[str, int, datetime]]):
+    '''按到达顺序重放读数，返回更新的房间、预约和迟到的预约'''
+    rids = {rid for rid, _, _ in readings}
+    times = [now_time for _, _, now_time in readings]
+    rooms = Room.objects.in_bulk(rids)
+    appoints: dict[str, list[Appoint]] = {rid: [] for rid in rooms}
+    # 与逐条处理相同，按预约编号的顺序更新
+    for appoint in Appoint.objects.not_canceled().filter(
+        Room_id__in=rooms, Astart__lte=max(times), Afinish__gte=min(times),
+    ).select_for_update().order_by('Aid'):
+        appoints[appoint.Room_id].append(appoint)
+
+    changed_rooms: dict[str, Room] = {}
+    changed: dict[int, Appoint] = {}
+    late: list[Appoint] = []
+    for rid, current_num, now_time in readings:
+        room = rooms.get(rid)
+        if room is None:
+            continue
+        refresh = (now_time.minute != room.Rlatest_time.minute)
+        room.Rpresent, room.Rlatest_time = current_num, now_time
+        changed_rooms[rid] = room
+        for appoint in appoints[rid]:
+            if not appoint.Astart <= now_time <= appoint.Afinish:
+                continue
+            update_check_state(appoint, current_num, refresh)
+            changed[appoint.pk] = appoint
+            if _is_late(appoint, now_time):
+                appoint.Astatus = Appoint.Status.PROCESSING
+                appoint.Areason = Appoint.Reason.R_LATE
+                late.append(appoint)
+    return list(changed_rooms.values()), list(changed.values()), late
+
+
+def apply_readings(readings: list[tuple[str, int, datetime]]) -> int:
+    '''
+    在一个事务中批量处理一组读数，结果与按顺序逐条调用apply_reading相同
+
+    :param readings: 按到达顺序排列的(房间编号, 人数, 时间)
+    :type readings: list[tuple[str, int, datetime]]
+    :return: 更新的预约数
+    :rtype: int
+    '''
+    if not readings:
+        return 0
+    with transaction.atomic():
+        rooms, appoints, late = _replay(readings)
+        Room.objects.bulk_update(rooms, ['Rpresent', 'Rlatest_time'])
+        Appoint.objects.bulk_update(appoints, [*CHECK_FIELDS, 'Astatus', 'Areason'])
+        for rid in {appoint.Room_id for appoint in late}:
+            invalidate_room(rid)
+    for appoint in late:
+        get_user_logger(appoint).info(
+            f"预约{appoint.Aid}出现违约:{appoint.get_Areason_display()}")
+    return len(appoints)
+
+
+def flush_readings(wait: bool = False) -> int:
+    '''
+    将日志中的读数按顺序批量写回数据库
+
+    已分配序号但尚未写入的读数留待下次写回，下次写回时仍缺失则跳过
+
+    :param wait: 等待其它进程写回完成，用于预约结束判定前, defaults to False
+    :type wait: bool, optional
+    :return: 写回的读数条数
+    :rtype: int
+    '''
+    cache = _cache()
+    lock_key = _key('lock')
+    while not cache.add(lock_key, 1, FLUSH_LOCK_TIMEOUT):
+        if not wait:
+            return 0
+        time.sleep(0.01)
+    try:
+        cache.add(_key('flushed'), 0, None)
+        head = cache.get(_key('head'), 0)
+        flushed = cache.get(_key('flushed'), 0)
+        missing = cache.get(_key('missing'), 0)
+        keys = [_key(seq) for seq in range(flushed + 1, head + 1)]
+        found = cache.get_many(keys)
+        readings, done = [], 0
+        for index, key in enumerate(keys):
+            if key in found:
+                readings.append(found[key])
+            elif flushed + index + 1 > missing:
+                # 可能正在写入，记录位置，下次写回时仍缺失说明写入的进程已异常退出
+                cache.set(_key('missing'), flushed + index + 1, None)
+                break
+            done = index + 1
+        if not done:
+            return 0
+        apply_readings(readings)
+        cache.set(_key('flushed'), flushed + done, None)
+        cache.delete_many(keys[:done])
+        return done
+    except:
+        logger.exception('摄像头读数写回失败')
+        raise
+    finally:
+        cache.delete(lock_key)
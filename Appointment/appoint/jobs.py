@@ -4,7 +4,7 @@ from Appointment.models import Appoint
 from Appointment.utils.log import logger
 from Appointment.appoint.status_control import start_appoint, finish_appoint
 from Appointment.extern.jobs import remove_appoint_reminder
-from scheduler.adder import ScheduleAdder
+from scheduler.adder import ScheduleAdder, schedule_batch
 from scheduler.cancel import remove_job
 
 
@@ -32,12 +32,13 @@ def set_scheduler(appoint: Appoint) -> bool:
     if has_started:             # 临时预约或特殊情况下设置任务时预约可能已经开始
         start = current_time    # 改为立刻执行
 
-    if not (has_started and appoint.Astatus == Appoint.Status.PROCESSING):
-        ScheduleAdder(start_appoint, id=f'{appoint.pk}_start',
-                      run_time=start)(appoint.pk)
+    with schedule_batch():
+        if not (has_started and appoint.Astatus == Appoint.Status.PROCESSING):
+            ScheduleAdder(start_appoint, id=f'{appoint.pk}_start',
+                          run_time=start)(appoint.pk)
 
-    ScheduleAdder(finish_appoint, id=f'{appoint.pk}_finish',
-                  run_time=finish)(appoint.pk)
+        ScheduleAdder(finish_appoint, id=f'{appoint.pk}_finish',
+                      run_time=finish)(appoint.pk)
     return True
 
 
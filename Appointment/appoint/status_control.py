@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from Appointment.config import appointment_config as CONFIG
 from Appointment.models import Appoint
 from Appointment.appoint.judge import appoint_violate
+from Appointment.appoint.camera import buffer_enabled, flush_readings
 from Appointment.utils.log import logger, get_user_logger
 from Appointment.extern.wechat import MessageType, notify_appoint
 
@@ -34,6 +35,13 @@ def _adjusted_rate(original_rate: float, appoint: Appoint) -> float:
     return rate
 
 
+def camera_check_failed(appoint: Appoint) -> bool:
+    '''摄像头的人数检查是否不合格，不考虑摄像头超时'''
+    adjusted_rate = _adjusted_rate(CONFIG.camera_qualify_rate, appoint)
+    need_num = appoint.Acamera_check_num * adjusted_rate - 0.01
+    return appoint.Acamera_ok_num < need_num
+
+
 def start_appoint(appoint_id: int):
     '''预约开始，切换状态'''
     try:
@@ -72,6 +80,13 @@ def finish_appoint(appoint_id: int):
 
     要注意的是，由于定时任务可能执行多次，第二次的时候可能已经终止
     '''
+    # 摄像头读数批量写入时，先写回尚未写入的读数
+    if buffer_enabled():
+        try:
+            flush_readings(wait=True)
+        except:
+            # 写回失败时已记录日志，按已写回的结果判定
+            pass
     try:
         appoint: Appoint = Appoint.objects.get(Aid=appoint_id)
     except:
@@ -94,11 +109,7 @@ def finish_appoint(appoint_id: int):
         return
 
     # 检查人数是否足够
-    adjusted_rate = _adjusted_rate(CONFIG.camera_qualify_rate, appoint)
-    need_num = appoint.Acamera_check_num * adjusted_rate - 0.01
-    check_failed = appoint.Acamera_ok_num < need_num
-
-    if check_failed:
+    if camera_check_failed(appoint):
         # 迟到的预约通知在这里处理。如果迟到不扣分，删掉这个if的内容即可
         # 让下面那个camera check的if判断是否违规。
         if appoint.Areason == Appoint.Reason.R_LATE:
@@ -21,6 +21,9 @@ class AppointmentConfig(Config):
     check_rate = 0.6  # 摄像头发来的每个数据，都有check_rate的几率当成采样点
     camera_qualify_rate = 0.4  # 人数够的次数达到(总采样次数*rate)即可。
     # 由于最短预约时间为30分钟，允许晚到15分钟，所以达标线设在50%以下比较合适(?)
+    # 摄像头读数先记入缓存，每分钟批量写回，多进程部署时需要共享缓存
+    camera_buffer = LazySetting('camera/buffer', default=False)
+    camera_cache = LazySetting('camera/cache', default='default')
 
     # 是否清除一周前的预约
     delete_appoint_weekly = False
@@ -1,10 +1,7 @@
 import json
-import random
 from datetime import datetime, timedelta
 
 from django.http import JsonResponse, HttpRequest
-from django.db.models import QuerySet
-from django.db import transaction
 
 from Appointment.models import Room, Appoint, Participant, CardCheckInfo
 from Appointment.extern.wechat import notify_user
@@ -16,40 +13,10 @@ from Appointment.utils.log import logger
 import Appointment.utils.web_func as web_func
 from Appointment.utils.identity import get_participant
 from Appointment.appoint.manage import create_appoint
-from Appointment.appoint.judge import set_appoint_reason
+from Appointment.appoint.camera import apply_reading, buffer_enabled, record_reading
 from Appointment.config import appointment_config as CONFIG
 
 
-def _update_camera_check_state(appoint: Appoint, current_num: int, refresh=False):
-    if appoint.Acheck_status == Appoint.CheckStatus.UNSAVED or refresh:
-        # 说明是新的一分钟或者本分钟还没有记录
-        # 如果随机成功，记录新的检查结果
-        if random.uniform(0, 1) < CONFIG.check_rate:
-            appoint.Acheck_status = Appoint.CheckStatus.FAILED
-            appoint.Acamera_check_num += 1
-            if current_num >= appoint.Aneed_num:  # 如果本次检测合规
-                appoint.Acamera_ok_num += 1
-                appoint.Acheck_status = Appoint.CheckStatus.PASSED
-        # 如果随机失败，锁定上一分钟的结果
-        else:
-            if appoint.Acheck_status == Appoint.CheckStatus.FAILED:
-                # 如果本次检测合规，宽容时也算上一次通过（因为一分钟只检测两次）
-                if current_num >= appoint.Aneed_num:
-                    appoint.Acamera_ok_num += 1
-            # 本分钟暂无记录
-            appoint.Acheck_status = Appoint.CheckStatus.UNSAVED
-    else:
-        # Appoint.CheckStatus可能是：PASSED，FAILED
-        # 和上一次检测在同一分钟，此时：1.不增加检测次数 2.如果合规则增加ok次数
-        if appoint.Acheck_status == Appoint.CheckStatus.FAILED:
-            # 当前（上一次检查）不合规；如果这次检测合规，那么认为本分钟合规
-            if current_num >= appoint.Aneed_num:
-                appoint.Acamera_ok_num += 1
-                appoint.Acheck_status = Appoint.CheckStatus.PASSED
-        # else:当前已经合规，不需要额外操作，本分钟视为合规
-    appoint.save()
-
-
 def _record_cardcheck(user: Participant | None, room: Room, real_status, message=None):
     CardCheckInfo.objects.create(
         Cardroom=room, Cardstudent=user,
@@ -106,48 +73,24 @@ def cameracheck(request: HttpRequest):
         rid = ip2room(ip.split(".")[3])  # !!!!!
     except:
         return JsonResponse({'statusInfo': {'message': 'invalid or null remote address'}}, status=400)
-    room: Room = Room.objects.get(Rid=rid)
 
     try:
         current_num = int(json.loads(request.body)['body']['people_num'])
     except:
         return JsonResponse({'statusInfo': {'message': '缺少摄像头人数信息!'}}, status=400)
 
-    # 存储上一次的检测时间
-    now_time = datetime.now()
-    previous_check_time = room.Rlatest_time
+    if buffer_enabled():
+        # 只记录读数，由定时任务每分钟批量写回
+        record_reading(rid, current_num, datetime.now())
+        return JsonResponse({'statusInfo': {'message': '更新成功！'}}, status=200)
 
-    # 更新现在的人数、最近更新时间
+    room: Room = Room.objects.get(Rid=rid)
     try:
-        # 保证：若有一个数据更新失败，则所有数据都不会被更新
-        Room.objects.filter(Rid=rid).update(
-            Rpresent=current_num, Rlatest_time=now_time)
+        apply_reading(room, current_num, datetime.now())
     except Exception as e:
-        logger.exception(f"更新房间{rid}人数失败: {e}")
+        logger.exception(f"更新房间{rid}摄像头人数失败: {e}")
         return JsonResponse({'statusInfo': {'message': '更新摄像头人数失败!'}}, status=400)
 
-    # 检查时间问题，可能修改预约状态；
-    appointments: QuerySet[Appoint] = Appoint.objects.not_canceled().filter(
-        Astart__lte=now_time,
-        Afinish__gte=now_time,
-        Room=room,
-    )
-
-    # 逻辑是尽量宽容，因为一分钟只记录两次，两次随机大概率只有一次成功
-    # 所以没必要必须随机成功才能修改错误结果
-    refresh = (now_time.minute != previous_check_time.minute)
-    with transaction.atomic():
-        for appoint in appointments.select_for_update():
-            try:
-                _update_camera_check_state(appoint, current_num, refresh)
-                if (now_time > appoint.Astart + timedelta(minutes=15)
-                        and appoint.Astatus == Appoint.Status.APPOINTED):
-                    # 该函数只是把appoint标记为迟到并修改状态为进行中，不发送微信提醒
-                    set_appoint_reason(appoint, Appoint.Reason.R_LATE)
-            except Exception as e:
-                logger.exception(f"更新预约 {appoint.Aid} 检查人数失败: {e}")
-                return JsonResponse({'statusInfo': {'message': f'更新预约 {appoint.Aid} 状态失败!'}}, status=400)
-
     return JsonResponse({'statusInfo': {'message': '更新成功！'}}, status=200)
 
 
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from django.db import transaction
 
 from Appointment.appoint.jobs import set_scheduler
+from Appointment.appoint.camera import buffer_enabled, flush_readings
 from Appointment.config import appointment_config as CONFIG
 from Appointment.extern.jobs import set_appoint_reminder
 from Appointment.models import Appoint
@@ -42,6 +43,13 @@ def clear_appointments():
         logger.info("定时删除任务成功")
 
 
+@periodical('interval', 'cameraReadingFlusher', minutes=1)
+def flush_camera_readings():
+    '''批量写回摄像头读数，每分钟一次'''
+    if buffer_enabled():
+        flush_readings()
+
+
 def get_longterm_display(times: int, interval_week: int, type: str = 'adj'):
     if type == 'adj':
         if interval_week == 1:
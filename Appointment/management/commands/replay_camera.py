@@ -0,0 +1,160 @@
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from generic.models import User
+from Appointment.models import Room, Participant, Appoint
+from Appointment.appoint.camera import apply_reading, apply_readings
+from Appointment.appoint.status_control import camera_check_failed
+
+
+PREFIX = 'replay_camera_'
+
+Reading = tuple[str, int, datetime]
+
+
+class QueryCounter:
+    '''统计执行的查询数和写入语句数'''
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        self.writes += sql.lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE'))
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('摄像头读数回放：分别逐条处理和按分钟批量处理同一组读数，'
+            '比较预约的检测结果和违约判定，所有修改都会回滚')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--load', help='录制的读数，每行一个JSON对象，'
+                            '包含rid, time, people_num，按到达顺序排列；'
+                            '不提供时生成合成的房间、预约和读数')
+        parser.add_argument('--rooms', type=int, default=5, help='合成的房间数')
+        parser.add_argument('--hours', type=int, default=6, help='合成读数的时长')
+        parser.add_argument('--tick', type=int, default=60, help='批量处理的间隔秒数')
+        parser.add_argument('--seed', type=int, default=0, help='随机采样的种子')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['load']:
+                readings = self._load(options['load'])
+            else:
+                readings = self._synthetic(options['rooms'], options['hours'],
+                                           random.Random(options['seed']))
+            legacy, legacy_time, legacy_counter = self._run(
+                readings, options['seed'])
+            batched, batched_time, batched_counter = self._run(
+                readings, options['seed'], options['tick'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'读数{len(readings)}条，涉及预约{len(legacy)}个')
+        self.stdout.write(
+            f'逐条处理: {legacy_time * 1000:.1f}ms, {legacy_counter.queries}次查询, '
+            f'其中{legacy_counter.writes}次写入')
+        self.stdout.write(
+            f'批量处理（每{options["tick"]}秒）: {batched_time * 1000:.1f}ms, '
+            f'{batched_counter.queries}次查询, 其中{batched_counter.writes}次写入')
+        violated = sum(result[-1] for result in legacy.values())
+        mismatched = [Aid for Aid in legacy if legacy[Aid] != batched.get(Aid)]
+        if mismatched:
+            for Aid in mismatched[:10]:
+                self.stderr.write(f'预约{Aid}: 逐条{legacy[Aid]} 批量{batched.get(Aid)}')
+            raise CommandError(f'{len(mismatched)}个预约的结果不一致')
+        self.stdout.write(f'检测结果和违约判定一致，其中{violated}个预约人数不合格')
+
+    def _run(self, readings: list[Reading], seed: int, tick: int | None = None):
+        '''处理读数并返回预约的结果，tick为None时逐条处理，结束后回滚'''
+        with transaction.atomic():
+            random.seed(seed)
+            begin = time.perf_counter()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                if tick is None:
+                    rooms = Room.objects.in_bulk({rid for rid, _, _ in readings})
+                    for rid, current_num, now_time in readings:
+                        if rid in rooms:
+                            apply_reading(rooms[rid], current_num, now_time)
+                else:
+                    batch, batch_tick = [], None
+                    for reading in readings:
+                        reading_tick = int(reading[2].timestamp()) // tick
+                        if reading_tick != batch_tick:
+                            apply_readings(batch)
+                            batch, batch_tick = [], reading_tick
+                        batch.append(reading)
+                    apply_readings(batch)
+            elapsed = time.perf_counter() - begin
+            times = [now_time for _, _, now_time in readings]
+            results = {
+                appoint.Aid: (appoint.Acamera_check_num, appoint.Acamera_ok_num,
+                              appoint.Astatus, appoint.Areason,
+                              camera_check_failed(appoint))
+                for appoint in Appoint.objects.not_canceled().filter(
+                    Room_id__in={rid for rid, _, _ in readings},
+                    Astart__lte=max(times), Afinish__gte=min(times),
+                ).select_related('Room')
+            }
+            transaction.set_rollback(True)
+        return results, elapsed, counter
+
+    def _load(self, path: str) -> list[Reading]:
+        readings = []
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                readings.append((record['rid'], int(record['people_num']),
+                                 datetime.fromisoformat(record['time'])))
+        if not readings:
+            raise CommandError('没有读数')
+        return readings
+
+    def _synthetic(self, num: int, hours: int, rng: random.Random) -> list[Reading]:
+        student = Participant.objects.create(Sid=User.objects.create_user(
+            f'{PREFIX}0', PREFIX, User.Type.STUDENT))
+        begin = datetime.combine(date.today() - timedelta(days=1), datetime.min.time())
+        begin += timedelta(hours=8)
+        end = begin + timedelta(hours=hours)
+        crowds: dict[str, list[tuple[datetime, datetime, int]]] = {}
+        for i in range(num):
+            room = Room.objects.create(
+                Rid=f'BPLY{i}', Rtitle=f'{PREFIX}研讨室',
+                Rstart=begin.time(), Rfinish=datetime.max.time().replace(microsecond=0))
+            crowds[room.Rid] = []
+            start = begin
+            while start < end:
+                finish = start + timedelta(minutes=rng.choice([30, 60, 90, 120]))
+                need = rng.randint(2, 5)
+                Appoint.objects.create(
+                    Room=room, major_student=student, Astart=start, Afinish=finish,
+                    Aneed_num=need, Ausage=PREFIX, Atype=Appoint.Type.NORMAL,
+                    Astatus=rng.choice([Appoint.Status.APPOINTED,
+                                        Appoint.Status.PROCESSING]))
+                # 到场人数有多有少，部分预约迟到
+                crowds[room.Rid].append((
+                    start + timedelta(minutes=rng.choice([0, 0, 10, 20])),
+                    finish, rng.randint(need - 3, need + 1)))
+                start = finish + timedelta(minutes=rng.choice([0, 0, 30]))
+
+        readings = []
+        for rid, periods in crowds.items():
+            for minute in range(hours * 60):
+                for half in range(2):
+                    now_time = begin + timedelta(
+                        minutes=minute, seconds=half * 30 + rng.randrange(30))
+                    present = [crowd for start, finish, crowd in periods
+                               if start <= now_time <= finish]
+                    current_num = max(0, (present[-1] if present else 0)
+                                      + rng.randint(-1, 1))
+                    readings.append((rid, current_num, now_time))
+        readings.sort(key=lambda reading: reading[2])
+        return readings
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointment', '0003_alter_appoint_options_alter_appoint_areason'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appoint',
+            index=models.Index(fields=['Room', 'Astart', 'Afinish'], name='Appointment_Room_id_bc56bd_idx'),
+        ),
+    ]
@@ -2,7 +2,7 @@ from datetime import timedelta
 from typing import cast
 
 from django.db import models
-from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_delete, post_save, post_delete
 from django.db.models import QuerySet, Q
 from django.dispatch import receiver
 from django.db import transaction
@@ -231,6 +231,8 @@ class Appoint(models.Model, metaclass=PermissionModelBase):
         verbose_name = '预约信息'
         verbose_name_plural = verbose_name
         ordering = ['Aid']
+        # 冲突检查、摄像头检查和时间表均按房间和时间段查找预约
+        indexes = [models.Index(fields=['Room', 'Astart', 'Afinish'])]
 
     Aid = models.AutoField('预约编号', primary_key=True)
     # 申请时间为插入数据库的时间
@@ -523,3 +525,25 @@ class LongTermAppoint(models.Model):
 def before_delete_Appoint(sender, instance, **kwargs):
     from Appointment.appoint.jobs import cancel_scheduler
     cancel_scheduler(instance.Aid)
+
+
+# 房间的占用索引包含的字段，只修改其它字段时不使索引失效
+OCCUPANCY_FIELDS = {
+    'Room', 'Room_id', 'Astart', 'Afinish', 'Astatus', 'Atype',
+    'major_student', 'major_student_id',
+}
+
+
+@receiver([post_save, post_delete], sender=Appoint)
+def invalidate_appoint_occupancy(sender, instance: Appoint, update_fields=None, **kwargs):
+    if update_fields is not None and OCCUPANCY_FIELDS.isdisjoint(update_fields):
+        return
+    from Appointment.utils.occupancy import invalidate_room
+    invalidate_room(instance.Room_id)
+
+
+@receiver([post_save, post_delete], sender=LongTermAppoint)
+def invalidate_longterm_occupancy(sender, instance: LongTermAppoint, **kwargs):
+    from Appointment.utils.occupancy import invalidate_room
+    invalidate_room(Appoint.objects.filter(pk=instance.appoint_id).values_list(
+        'Room_id', flat=True).first())
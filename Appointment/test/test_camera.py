@@ -0,0 +1,95 @@
+import json
+import random
+from io import StringIO
+from datetime import datetime, timedelta, time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from generic.models import User
+from Appointment.models import Participant, Room, Appoint
+from Appointment.appoint.camera import apply_reading, record_reading, flush_readings
+
+
+class CameraCheckTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = Room.objects.create(Rid='B101', Rtitle='讨论室',
+                                       Rstart=time(8), Rfinish=time(23))
+        cls.student = Participant.objects.create(Sid=User.objects.create_user(
+            '2000000000', '学生', User.Type.STUDENT))
+        cls.start = datetime.combine(datetime.now().date(), time(10))
+        cls.appoints = [
+            Appoint.objects.create(
+                Room=cls.room, major_student=cls.student, Aneed_num=3,
+                Astart=cls.start + timedelta(hours=i), Afinish=cls.start + timedelta(hours=i + 1),
+                Astatus=Appoint.Status.APPOINTED)
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def readings(self):
+        rng = random.Random(0)
+        return [
+            (self.room.Rid, rng.randint(1, 4),
+             self.start + timedelta(minutes=minute, seconds=half * 30 + rng.randrange(30)))
+            for minute in range(120) for half in range(2)
+        ]
+
+    def results(self):
+        return list(Appoint.objects.order_by('Aid').values_list(
+            'Acheck_status', 'Acamera_check_num', 'Acamera_ok_num', 'Astatus', 'Areason'))
+
+    def test_flush_matches_legacy(self):
+        readings = self.readings()
+        random.seed(1)
+        for rid, current_num, now_time in readings:
+            apply_reading(Room.objects.get(Rid=rid), current_num, now_time)
+        expected = self.results()
+        self.assertTrue(all(status == Appoint.Status.PROCESSING
+                            for _, _, _, status, _ in expected))
+
+        Appoint.objects.update(Acheck_status=Appoint.CheckStatus.UNSAVED,
+                               Acamera_check_num=0, Acamera_ok_num=0,
+                               Astatus=Appoint.Status.APPOINTED, Areason=0)
+        Room.objects.update(Rlatest_time=self.room.Rlatest_time)
+        random.seed(1)
+        for index, (rid, current_num, now_time) in enumerate(readings):
+            record_reading(rid, current_num, now_time)
+            if index % 7 == 6:
+                flush_readings()
+        flush_readings()
+        self.assertListEqual(self.results(), expected)
+        room = Room.objects.get(Rid=self.room.Rid)
+        self.assertEqual(room.Rlatest_time, readings[-1][2])
+
+    def test_missing_reading(self):
+        record_reading(self.room.Rid, 3, self.start)
+        # 已分配序号但未写入的读数
+        cache.incr('camera_readings:head')
+        record_reading(self.room.Rid, 3, self.start + timedelta(seconds=30))
+        self.assertEqual(flush_readings(), 1)
+        # 下次写回时仍缺失，跳过
+        self.assertEqual(flush_readings(), 2)
+        self.assertEqual(flush_readings(), 0)
+        self.assertEqual(Room.objects.get(Rid=self.room.Rid).Rpresent, 3)
+
+    @mock.patch('Appointment.hardware_api.buffer_enabled', return_value=True)
+    @mock.patch('Appointment.hardware_api.ip2room', return_value='B101')
+    def test_endpoint(self, *_):
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                '/underground/camera-check', json.dumps({'body': {'people_num': 4}}),
+                content_type='application/json', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        flush_readings()
+        self.assertEqual(Room.objects.get(Rid=self.room.Rid).Rpresent, 4)
+
+    def test_replay_command(self):
+        out = StringIO()
+        call_command('replay_camera', '--rooms', '2', '--hours', '2', stdout=out)
+        self.assertIn('检测结果和违约判定一致', out.getvalue())
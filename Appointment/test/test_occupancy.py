@@ -0,0 +1,105 @@
+import random
+from datetime import datetime, timedelta, time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from generic.models import User
+from Appointment.models import Participant, Room, Appoint, LongTermAppoint
+from Appointment.utils.utils import get_conflict_appoints
+from Appointment.utils.occupancy import room_occupancy
+from Appointment.appoint.camera import CHECK_FIELDS
+
+
+@mock.patch('Appointment.utils.occupancy.shared_cache', return_value=True)
+class RoomOccupancyTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = Room.objects.create(Rid='B101', Rtitle='讨论室',
+                                       Rstart=time(8), Rfinish=time(23))
+        cls.students = [
+            Participant.objects.create(Sid=User.objects.create_user(
+                f'200000000{i}', f'学生{i}', User.Type.STUDENT))
+            for i in range(2)
+        ]
+        cls.monday = datetime.combine(
+            datetime.now().date() - timedelta(days=datetime.now().weekday()), time())
+        # 每周一10点的长期预约，共4次
+        cls.base = cls.create_appoint(cls.monday + timedelta(hours=10), 2,
+                                      type=Appoint.Type.LONGTERM)
+        cls.longterm = LongTermAppoint.objects.create(
+            appoint=cls.base, applicant=cls.students[0], times=4, interval=1)
+        cls.subs = [
+            cls.create_appoint(cls.base.Astart + timedelta(weeks=week), 2,
+                               type=Appoint.Type.LONGTERM)
+            for week in range(1, 4)
+        ]
+        rng = random.Random(0)
+        for _ in range(60):
+            start = cls.monday + timedelta(days=rng.randrange(28), hours=rng.randrange(8, 22),
+                                           minutes=rng.choice([0, 30]))
+            cls.create_appoint(start, rng.choice([0.5, 1, 2]), cls.students[1],
+                               status=rng.choice(list(Appoint.Status)))
+
+    @classmethod
+    def create_appoint(cls, start: datetime, hours: float, student=None, *,
+                       type=Appoint.Type.NORMAL, status=Appoint.Status.APPOINTED):
+        return Appoint.objects.create(
+            Room=cls.room, major_student=student or cls.students[0],
+            Astart=start, Afinish=start + timedelta(hours=hours),
+            Atype=type, Astatus=status, Aneed_num=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_conflicts(self, shared):
+        occupancy = room_occupancy(self.room.Rid)
+        rng = random.Random(1)
+        for _ in range(50):
+            start = self.monday + timedelta(days=rng.randrange(7), hours=rng.randrange(8, 22))
+            finish = start + timedelta(minutes=rng.choice([30, 60, 180]))
+            times, interval = rng.randrange(1, 5), rng.randrange(1, 3)
+            appoint = Appoint(Room=self.room, Astart=start, Afinish=finish)
+            expected = get_conflict_appoints(appoint, times, interval)
+            slots = occupancy.conflicts(start, finish, times, interval)
+            self.assertListEqual([slot.id for slot in slots],
+                                 [appoint.pk for appoint in expected])
+
+    def test_owner(self, shared):
+        occupancy = room_occupancy(self.room.Rid)
+        for appoint in [self.base, *self.subs]:
+            self.assertEqual(occupancy.owner(occupancy.get(appoint.pk)).id, self.longterm.id)
+        self.assertListEqual([slot.id for slot in occupancy.sub_slots(occupancy.series[0])],
+                             [appoint.pk for appoint in self.longterm.sub_appoints()])
+        normal = Appoint.objects.filter(Atype=Appoint.Type.NORMAL).exclude(
+            Astatus=Appoint.Status.CANCELED).first()
+        self.assertIsNone(occupancy.owner(occupancy.get(normal.pk)))
+
+    def test_invalidation(self, shared):
+        start = self.monday + timedelta(weeks=5, hours=10)
+        self.assertFalse(room_occupancy(self.room.Rid).overlapping(start, start + timedelta(hours=1)))
+        appoint = self.create_appoint(start, 1)
+        room_occupancy(self.room.Rid)
+        # 重建后使用缓存
+        with self.assertNumQueries(0):
+            slots = room_occupancy(self.room.Rid).overlapping(start, start + timedelta(hours=1))
+        self.assertListEqual([slot.id for slot in slots], [appoint.pk])
+        # 摄像头只更新检测字段，不使索引失效
+        appoint.Acamera_check_num += 1
+        appoint.save(update_fields=CHECK_FIELDS)
+        with self.assertNumQueries(0):
+            room_occupancy(self.room.Rid)
+        appoint.Astatus = Appoint.Status.CANCELED
+        appoint.save()
+        self.assertFalse(room_occupancy(self.room.Rid).overlapping(start, start + timedelta(hours=1)))
+
+    def test_process_local_cache(self, shared):
+        shared.return_value = False
+        start = self.monday + timedelta(weeks=5, hours=10)
+        room_occupancy(self.room.Rid)
+        # 模拟其它进程创建的预约，不经过本进程的失效
+        with mock.patch('Appointment.utils.occupancy.invalidate_room'):
+            appoint = self.create_appoint(start, 1)
+        slots = room_occupancy(self.room.Rid).overlapping(start, start + timedelta(hours=1))
+        self.assertIn(appoint.pk, [slot.id for slot in slots])
@@ -0,0 +1,94 @@
+import random
+from datetime import datetime, timedelta, time
+from unittest import mock
+
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase
+
+from generic.models import User
+from Appointment.models import Participant, Room, Appoint, LongTermAppoint
+from Appointment.utils import web_func
+from Appointment.utils.slot_grid import TimeStatus, RoomGrid, room_grids
+
+
+@mock.patch('Appointment.utils.slot_grid.shared_cache', return_value=True)
+class SlotGridTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = Room.objects.create(Rid='B101', Rtitle='讨论室',
+                                       Rstart=time(8), Rfinish=time(23))
+        cls.other = Room.objects.create(Rid='B102', Rtitle='讨论室',
+                                        Rstart=time(9, 30), Rfinish=time(22))
+        cls.student = Participant.objects.create(Sid=User.objects.create_user(
+            '2000000000', '学生', User.Type.STUDENT))
+        cls.today = datetime.now().date()
+        cls.first = datetime.combine(cls.today, time())
+
+    @classmethod
+    def create_appoint(cls, start: datetime, hours: float, room=None, *,
+                       type=Appoint.Type.NORMAL, status=Appoint.Status.APPOINTED):
+        return Appoint.objects.create(
+            Room=room or cls.room, major_student=cls.student, Ausage='<讨论>',
+            Astart=start, Afinish=start + timedelta(hours=hours),
+            Atype=type, Astatus=status, Aneed_num=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_time_ids(self, shared):
+        rng = random.Random(0)
+        for _ in range(80):
+            room = rng.choice([self.room, self.other])
+            start = self.first + timedelta(days=rng.randrange(7), hours=rng.randrange(6, 22),
+                                           minutes=rng.choice([0, 30]))
+            self.create_appoint(start, rng.choice([0.5, 1, 2]), room,
+                                type=rng.choice([Appoint.Type.NORMAL, Appoint.Type.LONGTERM]),
+                                status=rng.choice(list(Appoint.Status)))
+        grids = room_grids([self.room, self.other], self.today)
+        for room, grid in zip([self.room, self.other], grids):
+            max_id = web_func.get_time_id(room, room.Rfinish, mode='leftopen')
+            expected = np.zeros((7, max_id + 1), dtype=np.uint8)
+            for appoint in Appoint.objects.not_canceled().filter(Room=room).order_by('Aid'):
+                day = (appoint.Astart.date() - self.today).days
+                status = (TimeStatus.LONGTERM if appoint.Atype == Appoint.Type.LONGTERM
+                          else TimeStatus.NORMAL)
+                for i in web_func.timerange2idlist(
+                        room.Rid, appoint.Astart, appoint.Afinish, max_id):
+                    expected[day, i] = status
+            np.testing.assert_array_equal(grid.status, expected)
+
+    def test_cross_day(self, shared):
+        self.create_appoint(self.first + timedelta(hours=22), 11)
+        [grid] = room_grids([self.room], self.today)
+        self.assertEqual(RoomGrid.encode(grid.status[:2]), [
+            '0' * 28 + '22',
+            '2' * 2 + '0' * 28,
+        ])
+
+    def test_longterm_and_passed(self, shared):
+        base = self.create_appoint(self.first + timedelta(days=1, hours=10), 1,
+                                   type=Appoint.Type.LONGTERM)
+        LongTermAppoint.objects.create(appoint=base, applicant=self.student,
+                                       times=4, interval=2)
+        [grid] = room_grids([self.room], self.today)
+        self.assertEqual(grid.statuses(longterm=True)[1, 4], TimeStatus.LONGTERM)
+        self.assertEqual(grid.statuses(longterm=False)[1, 4], TimeStatus.NORMAL)
+        self.assertEqual(grid.display(1, 4), '&lt;讨论&gt;<br/>预约者：学生')
+        self.assertIn('隔周一次 共4次', grid.display(1, 4, longterm=True))
+        self.assertEqual(grid.display(1, 0), '')
+
+        status = grid.statuses(now=self.first + timedelta(hours=9, minutes=10))
+        self.assertEqual(RoomGrid.encode(status[:1])[0][:4], '1110')
+        self.assertTrue((status[1:, :4] == TimeStatus.AVAILABLE).all())
+
+    def test_cache(self, shared):
+        room_grids([self.room, self.other], self.today)
+        with self.assertNumQueries(0):
+            room_grids([self.room, self.other], self.today)
+        # 新的预约使该房间的网格失效
+        self.create_appoint(self.first + timedelta(days=2, hours=8), 1)
+        with self.assertNumQueries(1):
+            grid, other = room_grids([self.room, self.other], self.today)
+        self.assertEqual(grid.status[2, 0], TimeStatus.NORMAL)
+        self.assertFalse(other.status.any())
@@ -0,0 +1,216 @@
+'''
+occupancy.py
+
+房间占用的区间索引，在内存中完成预约冲突检测和长期预约归属查找
+
+- 每个房间缓存近期未取消的预约，按开始时间排序，并记录结束时间的前缀最大值，
+  查找与某一时段重叠的预约只需两次二分查找
+- 同时缓存房间的长期预约，查找预约所属的长期预约不再查询数据库
+- 索引保存在进程内，共享缓存只保存版本号，避免每次读取都反序列化整个索引
+- 缓存后端不在进程间共享时，其它进程的失效不可见，不缓存索引，见utils/cache.py
+- 预约或长期预约保存、删除时使房间的索引失效（见models.py），下次查询时重建
+- 只索引最近若干周以来的预约，更早的查询回退到数据库
+- 索引只用于展示，创建预约时仍加锁查询数据库检查冲突，见get_conflict_appoints
+
+room_version: 获取房间预约数据的版本号，预约变化后改变
+room_occupancy: 获取房间的占用索引
+invalidate_room: 使房间的占用索引失效
+'''
+from uuid import uuid4
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, time
+from itertools import accumulate
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from utils.cache import shared_cache
+from Appointment.config import appointment_config as CONFIG
+from Appointment.models import Appoint, LongTermAppoint
+
+
+__all__ = [
+    'Slot',
+    'Series',
+    'RoomOccupancy',
+    'room_version',
+    'room_occupancy',
+    'invalidate_room',
+]
+
+
+_CACHE_KEY = 'appoint:occupancy:{}'
+CACHE_TIMEOUT = 600
+# 房间编号 -> (版本号, 索引)
+_local: dict[str, tuple[str, 'RoomOccupancy']] = {}
+
+
+class Slot(NamedTuple):
+    '''一次未取消的预约'''
+    id: int
+    start: datetime
+    finish: datetime
+    status: int
+    type: int
+    student_id: str | None
+
+
+class Series(NamedTuple):
+    '''一个长期预约，首次预约的时间每隔interval周重复times次'''
+    id: int
+    appoint_id: int
+    start: datetime
+    finish: datetime
+    student_id: str | None
+    times: int
+    interval: int
+
+
+class RoomOccupancy:
+    '''
+    房间的占用索引，只包含结束时间不早于since的预约
+
+    Attributes:
+        room_id (str): 房间编号
+        since (datetime): 索引的起始时间，查询时段不应早于该时间
+        slots (list[Slot]): 按开始、结束时间排序的预约
+        series (list[Series]): 房间的长期预约
+    '''
+    def __init__(self, room_id: str, since: datetime,
+                 slots: list[Slot], series: list[Series]):
+        self.room_id = room_id
+        self.since = since
+        self.slots = slots
+        self.series = series
+        self._by_id = {slot.id: slot for slot in slots}
+        self._starts = [slot.start for slot in slots]
+        self._max_finish = list(accumulate((slot.finish for slot in slots), max))
+
+    def covers(self, start: datetime) -> bool:
+        '''从start开始的时段能否由索引回答'''
+        return start >= self.since
+
+    def overlapping(self, start: datetime, finish: datetime) -> list[Slot]:
+        '''与[start, finish)重叠的预约，按开始时间排序'''
+        # 开始比时段的结束早
+        hi = bisect_left(self._starts, finish)
+        # 之前的预约结束时间都不晚于start，不会重叠
+        lo = bisect_right(self._max_finish, start, hi=hi)
+        return [slot for slot in self.slots[lo:hi] if slot.finish > start]
+
+    def conflicts(self, start: datetime, finish: datetime,
+                  times: int = 1, interval: int = 1, week_offset: int = 0,
+                  exclude: int | None = None) -> list[Slot]:
+        '''
+        每隔interval周重复times次的时段的冲突预约，与get_conflict_appoints一致
+
+        :param exclude: 排除的预约编号, defaults to None
+        :type exclude: int | None, optional
+        :return: 按开始、结束时间排序的冲突预约
+        :rtype: list[Slot]
+        '''
+        found: dict[int, Slot] = {}
+        for week in range(0, times * interval, interval):
+            delta = timedelta(weeks=week + week_offset)
+            for slot in self.overlapping(start + delta, finish + delta):
+                found[slot.id] = slot
+        found.pop(exclude, None)  # type: ignore
+        return sorted(found.values(), key=lambda slot: (slot.start, slot.finish))
+
+    def sub_slots(self, series: Series) -> list[Slot]:
+        '''长期预约的子预约，与LongTermAppoint.sub_appoints一致'''
+        return [
+            slot for slot in self.conflicts(
+                series.start, series.finish, series.times, series.interval)
+            if slot.student_id == series.student_id
+            and slot.type == Appoint.Type.LONGTERM
+        ]
+
+    def owner(self, slot: Slot) -> Series | None:
+        '''查找预约所属的长期预约，不存在时返回None'''
+        for series in self.series:
+            if series.student_id != slot.student_id:
+                continue
+            if any(sub.id == slot.id for sub in self.sub_slots(series)):
+                return series
+        return None
+
+    def get(self, appoint_id: int) -> Slot | None:
+        '''获取索引中的预约'''
+        return self._by_id.get(appoint_id)
+
+
+def _default_since() -> datetime:
+    # 查找长期预约归属时最多向前查找longterm_max_week周
+    return datetime.combine(
+        datetime.now().date() - timedelta(weeks=CONFIG.longterm_max_week + 1), time.min)
+
+
+def _build(room_id: str, since: datetime) -> RoomOccupancy:
+    slots = [
+        Slot(*values) for values in Appoint.objects.not_canceled().filter(
+            Room_id=room_id, Afinish__gte=since,
+        ).order_by('Astart', 'Afinish').values_list(
+            'Aid', 'Astart', 'Afinish', 'Astatus', 'Atype', 'major_student_id')
+    ]
+    # 长期预约最多持续longterm_max_week周，更早开始的不会有子预约在索引中
+    series = [
+        Series(*values) for values in LongTermAppoint.objects.filter(
+            appoint__Room_id=room_id,
+            appoint__Astart__gte=since - timedelta(weeks=CONFIG.longterm_max_week),
+        ).order_by('appoint__Astart').values_list(
+            'id', 'appoint_id', 'appoint__Astart', 'appoint__Afinish',
+            'appoint__major_student_id', 'times', 'interval')
+    ]
+    return RoomOccupancy(room_id, since, slots, series)
+
+
+def room_version(room_id: str) -> str:
+    '''获取房间预约数据的版本号，可用于缓存由房间预约计算出的其它结果'''
+    key = _CACHE_KEY.format(room_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, CACHE_TIMEOUT)
+        # 并发时以先写入的为准
+        version = cache.get(key)
+    return version
+
+
+def room_occupancy(room_id: str, since: datetime | None = None) -> RoomOccupancy:
+    '''
+    获取房间的占用索引，默认索引最近longterm_max_week周以来的预约
+
+    :param room_id: 房间编号
+    :type room_id: str
+    :param since: 需要覆盖的最早时间，早于默认范围时临时构建且不缓存
+    :type since: datetime | None, optional
+    :return: 房间的占用索引
+    :rtype: RoomOccupancy
+    '''
+    default_since = _default_since()
+    if since is not None and since < default_since:
+        return _build(room_id, since)
+    if not shared_cache():
+        return _build(room_id, default_since)
+    # 先取版本号再构建，构建期间失效时版本号不再匹配，下次调用会重建
+    version = room_version(room_id)
+    cached = _local.get(room_id)
+    if cached is not None:
+        local_version, occupancy = cached
+        if local_version == version and (since is None or occupancy.covers(since)):
+            return occupancy
+    occupancy = _build(room_id, default_since)
+    _local[room_id] = version, occupancy
+    return occupancy
+
+
+def invalidate_room(room_id: str | None) -> None:
+    '''使房间的占用索引和版本号失效，预约创建、取消、结束或修改时调用'''
+    if room_id is None:
+        return
+    key = _CACHE_KEY.format(room_id)
+    cache.delete(key)
+    _local.pop(room_id, None)
+    # 提交前其他请求可能用旧数据重建了索引
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,242 @@
+'''
+slot_grid.py
+
+房间时间表的时段网格，预约时间页面和讨论室页面共用
+
+- 房间连续若干天的时段以(天数, 时段数)的数组表示，每天的第0个时段从房间的开始预约时间开始，
+  每个时段半小时，与web_func.get_time_id的编号一致
+- 一次查询房间的全部预约，按预约覆盖的时段区间整段赋值，跨天的预约同时占用两天的时段
+- 网格与用户无关，按(房间, 首日)缓存，房间的预约变化时随房间的版本号失效（见occupancy.py），
+  缓存后端不在进程间共享时不缓存
+- 已过去的时段和长期预约的显示与当前时间和用户有关，在每次请求时处理
+- 前端脚本只需要每天一个状态字符串，如'0022213'，见RoomGrid.encode
+
+TimeStatus: 时段状态
+RoomGrid: 房间的时段网格
+room_grids: 批量获取房间的时段网格
+'''
+import html
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+
+from utils.cache import shared_cache
+from Appointment.models import Room, Appoint
+from Appointment.utils.occupancy import room_version, room_occupancy
+from Appointment import jobs
+
+
+__all__ = [
+    'TimeStatus',
+    'RoomGrid',
+    'room_grids',
+]
+
+
+_CACHE_KEY = 'appoint:grid:{}:{}:{}:{}'
+CACHE_TIMEOUT = 600
+SLOT_SECONDS = 1800
+SLOTS_PER_DAY = 86400 // SLOT_SECONDS
+
+
+class TimeStatus:
+    '''时段状态，与预约状态并不完全一致'''
+    AVAILABLE = 0   # 可预约
+    PASSED = 1      # 已过期
+    NORMAL = 2      # 已被普通预约
+    LONGTERM = 3    # 已被长期预约
+
+
+def _slot_count(room: Room) -> int:
+    # 与web_func.get_time_id(room, room.Rfinish, mode='leftopen') + 1一致
+    start = room.Rstart.hour * 60 + room.Rstart.minute
+    finish = room.Rfinish.hour * 60 + room.Rfinish.minute
+    if finish <= start:
+        return 0
+    return -(-(finish - start) // (SLOT_SECONDS // 60))
+
+
+@dataclass
+class RoomGrid:
+    '''
+    房间连续若干天的时段网格
+
+    Attributes:
+        room_id (str): 房间编号
+        first_day (date): 第一天
+        start (time): 每天第0个时段的开始时间，即房间的开始预约时间
+        status (np.ndarray): (天数, 时段数)的时段状态，只有可预约、普通预约和长期预约三种
+        info (np.ndarray): (天数, 时段数)的预约信息下标，-1表示没有预约
+        infos (list[str]): 已转义的预约信息
+        longterm_infos (list[str]): 对应预约所属长期预约的信息，不属于长期预约时为空
+    '''
+    room_id: str
+    first_day: date
+    start: time
+    status: np.ndarray
+    info: np.ndarray
+    infos: list[str]
+    longterm_infos: list[str]
+
+    @property
+    def days(self) -> int:
+        return self.status.shape[0]
+
+    @property
+    def slots(self) -> int:
+        return self.status.shape[1]
+
+    def origin(self, day: int = 0) -> datetime:
+        '''第day天第0个时段的开始时间'''
+        return datetime.combine(self.first_day + timedelta(days=day), self.start)
+
+    def labels(self) -> list[str]:
+        '''每个时段开始时间的可读表达，不足半小时的开始时间向上取整'''
+        round_up = int(self.start.minute >= 30)
+        return [
+            f'{self.start.hour + (i + round_up) // 2:02d}:{(i + round_up) % 2 * 30:02d}'
+            for i in range(self.slots)
+        ]
+
+    def statuses(self, longterm: bool = False, now: datetime | None = None) -> np.ndarray:
+        '''
+        获取用户看到的时段状态
+
+        :param longterm: 用户是否可以看到长期预约，否则长期预约显示为普通预约
+        :type longterm: bool
+        :param now: 当前时间，开始时间不晚于当前时间的时段显示为已过期
+        :type now: datetime | None, optional
+        :return: (天数, 时段数)的时段状态，可以修改
+        :rtype: np.ndarray
+        '''
+        status = self.status.copy()
+        if not longterm:
+            status[status == TimeStatus.LONGTERM] = TimeStatus.NORMAL
+        if now is not None:
+            passed = (now - self.origin()).total_seconds() // SLOT_SECONDS + 1
+            # 每天的第0个时段相差SLOTS_PER_DAY个时段
+            cutoffs = np.clip(passed - SLOTS_PER_DAY * np.arange(self.days), 0, self.slots)
+            status[np.arange(self.slots) < cutoffs[:, None]] = TimeStatus.PASSED
+        return status
+
+    def display(self, day: int, slot: int, longterm: bool = False) -> str:
+        '''时段的预约信息，没有预约时为空字符串'''
+        index = self.info[day, slot]
+        if index < 0:
+            return ''
+        if longterm and self.longterm_infos[index]:
+            return f'{self.infos[index]}<br/>{self.longterm_infos[index]}'
+        return self.infos[index]
+
+    @staticmethod
+    def encode(status: np.ndarray) -> list[str]:
+        '''将时段状态编码为每天一个的字符串，第i个字符为第i个时段的状态'''
+        if status.size == 0:
+            return [''] * status.shape[0]
+        codes = (status.astype(np.uint8) + ord('0')).tobytes().decode()
+        width = status.shape[1]
+        return [codes[i:i + width] for i in range(0, len(codes), width)]
+
+
+def _fill(grid: RoomGrid, appoints: list[tuple]) -> None:
+    if not appoints:
+        return
+    origin = grid.origin()
+    starts = np.array([(a[1] - origin).total_seconds() for a in appoints])
+    finishes = np.array([(a[2] - origin).total_seconds() for a in appoints])
+    # 预约覆盖的时段为[lo, hi)，以第一天的第0个时段为基准
+    lo = np.floor(starts / SLOT_SECONDS).astype(np.int64)
+    hi = np.ceil(finishes / SLOT_SECONDS).astype(np.int64)
+    shifts = SLOTS_PER_DAY * np.arange(grid.days)
+    lo = np.clip(lo[:, None] - shifts, 0, grid.slots)
+    hi = np.clip(hi[:, None] - shifts, 0, grid.slots)
+    # 按预约编号的顺序赋值，重叠时以后创建的为准
+    for index, day in zip(*np.nonzero(lo < hi)):
+        Atype = appoints[index][3]
+        status = (TimeStatus.LONGTERM if Atype == Appoint.Type.LONGTERM
+                  else TimeStatus.NORMAL)
+        grid.status[day, lo[index, day]:hi[index, day]] = status
+        grid.info[day, lo[index, day]:hi[index, day]] = index
+
+
+def _infos(room_id: str, appoints: list[tuple]) -> tuple[list[str], list[str]]:
+    infos = [
+        '<br/>'.join([
+            html.escape(usage or '').replace('\n', '<br/>'),
+            f'预约者：{html.escape(name or "")}',
+        ])
+        for _, _, _, _, usage, name in appoints
+    ]
+    longterm_infos = [''] * len(appoints)
+    if any(Atype == Appoint.Type.LONGTERM for _, _, _, Atype, _, _ in appoints):
+        occupancy = room_occupancy(room_id)
+        for i, (Aid, _, _, Atype, _, _) in enumerate(appoints):
+            if Atype != Appoint.Type.LONGTERM:
+                continue
+            slot = occupancy.get(Aid)
+            series = occupancy.owner(slot) if slot is not None else None
+            if series is not None:
+                longterm_infos[i] = jobs.get_longterm_display(
+                    times=series.times, interval_week=series.interval, type='inline')
+    return infos, longterm_infos
+
+
+def _build(rooms: list[Room], first_day: date, days: int) -> dict[str, RoomGrid]:
+    grids: dict[str, RoomGrid] = {}
+    for room in rooms:
+        shape = (days, _slot_count(room))
+        grids[room.Rid] = RoomGrid(
+            room.Rid, first_day, room.Rstart,
+            np.full(shape, TimeStatus.AVAILABLE, dtype=np.uint8),
+            np.full(shape, -1, dtype=np.int32), [], [])
+    begin = datetime.combine(first_day, time.min)
+    appoints: dict[str, list[tuple]] = {room.Rid: [] for room in rooms}
+    for Rid, *values in Appoint.objects.not_canceled().filter(
+        Room_id__in=appoints, Afinish__gt=begin,
+        Astart__lt=begin + timedelta(days=days),
+    ).order_by('Aid').values_list(
+        'Room_id', 'Aid', 'Astart', 'Afinish', 'Atype',
+        'Ausage', 'major_student__Sid__name',
+    ):
+        appoints[Rid].append(tuple(values))
+    for Rid, grid in grids.items():
+        _fill(grid, appoints[Rid])
+        grid.infos, grid.longterm_infos = _infos(Rid, appoints[Rid])
+    return grids
+
+
+def room_grids(rooms: list[Room], first_day: date, days: int = 7) -> list[RoomGrid]:
+    '''
+    批量获取房间从first_day开始days天的时段网格，未缓存的房间一起查询
+
+    :param rooms: 房间列表
+    :type rooms: list[Room]
+    :param first_day: 第一天
+    :type first_day: date
+    :param days: 天数, defaults to 7
+    :type days: int, optional
+    :return: 与rooms顺序一致的时段网格
+    :rtype: list[RoomGrid]
+    '''
+    if not shared_cache():
+        built = _build(rooms, first_day, days)
+        return [built[room.Rid] for room in rooms]
+    keys = {
+        room.Rid: _CACHE_KEY.format(room.Rid, first_day, days, room_version(room.Rid))
+        for room in rooms
+    }
+    cached: dict[str, RoomGrid] = cache.get_many(list(keys.values()))
+    grids = {Rid: cached[key] for Rid, key in keys.items() if key in cached}
+    # 房间的开放时间修改后重新构建
+    missing = [
+        room for room in rooms
+        if room.Rid not in grids or grids[room.Rid].start != room.Rstart
+        or grids[room.Rid].slots != _slot_count(room)
+    ]
+    if missing:
+        built = _build(missing, first_day, days)
+        cache.set_many({keys[Rid]: grid for Rid, grid in built.items()}, CACHE_TIMEOUT)
+        grids.update(built)
+    return [grids[room.Rid] for room in rooms]
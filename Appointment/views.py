@@ -1,6 +1,7 @@
 import json
-import html
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta
+
+import numpy as np
 
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect
@@ -27,6 +28,7 @@ from Appointment.utils.utils import (
 )
 from Appointment.utils.log import logger, get_user_logger
 import Appointment.utils.web_func as web_func
+from Appointment.utils.slot_grid import TimeStatus, room_grids
 from Appointment.utils.identity import (
     get_avatar, get_member_ids, get_auditor_ids,
     get_participant, identity_check,
@@ -447,94 +449,24 @@ def arrange_time(request: HttpRequest):
     dayrange_list, start_day, end_next_day = web_func.get_dayrange(
         day_offset=start_week * 7)
 
-    # 获取预约时间的最大时间块id
-    max_stamp_id = web_func.get_time_id(room, room.Rfinish, mode="leftopen")
-
-    # 定义时间块状态，与预约状态并不完全一致，时间块状态暂定为以下值，可能需要重新规划
-
-    class TimeStatus:
-        AVAILABLE = 0   # 可预约
-        PASSED = 1      # 已过期
-        NORMAL = 2      # 已被普通预约
-        LONGTERM = 3    # 已被长期预约
-
-    for day in dayrange_list:
-        timesections = []
-        start_hour = room.Rstart.hour
-        round_up = int(room.Rstart.minute >= 30)
-
-        for i in range(max_stamp_id + 1):
-            timesection = {}
-            # 获取时间的可读表达
-            timesection['starttime'] = str(
-                start_hour + (i + round_up) // 2).zfill(2) + ":" + str(
-                    (i + round_up) % 2 * 30).zfill(2)
-            timesection['status'] = TimeStatus.AVAILABLE
-            timesection['id'] = i
-            timesections.append(timesection)
-        day['timesection'] = timesections
-
-    # 筛选已经存在的预约
-    appoints: QuerySet[Appoint] = Appoint.objects.not_canceled().filter(
-        Room_id=Rid, Afinish__gte=start_day, Astart__date__lt=end_next_day)
-
-    start_day = dayrange_list[0]
-    start_day = date(start_day['year'], start_day['month'], start_day['day'])
-    # 给出已有预约的信息
-    # TODO: 后续可优化
-    for appoint in appoints:
-        change_id_list = web_func.timerange2idlist(Rid, appoint.Astart,
-                                                   appoint.Afinish,
-                                                   max_stamp_id)
-        appoint_usage = html.escape(appoint.Ausage).replace('\n', '<br/>')
-        appointer_name = html.escape(appoint.major_student.name)
-
-        date_id = (appoint.Astart.date() - start_day).days
-        day = dayrange_list[date_id]
-
-        display_info = [
-            f'{appoint_usage}',
-            f'预约者：{appointer_name}',
+    # 时段网格在用户间共享，已过去的时段和长期预约的显示每次处理
+    [grid] = room_grids([room], start_day)
+    status = grid.statuses(has_longterm_permission, datetime.now())
+    labels = grid.labels()
+    for day_id, day in enumerate(dayrange_list):
+        day['timesection'] = [
+            {
+                'id': i,
+                'starttime': label,
+                'status': int(status[day_id, i]),
+                'display_info': grid.display(day_id, i, has_longterm_permission),
+            }
+            for i, label in enumerate(labels)
         ]
-        # 根据预约类型标记该时间块的状态和信息
-        time_status = TimeStatus.NORMAL
-        if has_longterm_permission and appoint.Atype == Appoint.Type.LONGTERM:
-            # 查找对应的长期预约
-            time_status = TimeStatus.LONGTERM
-            max_week = CONFIG.longterm_max_week
-            potential_appoints = get_conflict_appoints(
-                appoint, times=max_week, week_offset=1 - max_week,
-            ).filter(major_student=appoint.major_student)
-            potential_longterms = LongTermAppoint.objects.filter(
-                appoint__in=potential_appoints)
-            related_longterm_appoint = None
-            for longterm_appoint in potential_longterms:
-                if appoint in longterm_appoint.sub_appoints():
-                    related_longterm_appoint = longterm_appoint
-                    break
-
-            if related_longterm_appoint is not None:
-                display_info.append(
-                    jobs.get_longterm_display(
-                        times=related_longterm_appoint.times,
-                        interval_week=related_longterm_appoint.interval,
-                        type="inline",
-                    )
-                )
-        display_info = '<br/>'.join(display_info)
-
-        for i in change_id_list:
-            day['timesection'][i]['status'] = time_status
-            day['timesection'][i]['display_info'] = display_info
-
-    # 删去今天已经过去的时间
-    if start_week == 0:
-        curr_stamp_id = web_func.get_time_id(room, datetime.now().time())
-        for i in range(min(max_stamp_id, curr_stamp_id) + 1):
-            dayrange_list[0]['timesection'][i]['status'] = TimeStatus.PASSED
-
-    # 转换成方便前端使用的形式
-    js_dayrange_list = json.dumps(dayrange_list)
+
+    # 前端脚本只需要每天的时段状态
+    js_day_status = json.dumps(dict(zip(
+        [day['weekday'] for day in dayrange_list], grid.encode(status))))
 
     # 获取房间信息，以支持房间切换的功能
     function_room_list = Room.objects.function_rooms().order_by('Rid')
@@ -571,73 +503,49 @@ def arrange_talk_room(request):
         room_list = Room.objects.talk_rooms().basement_only().order_by('Rmin', 'Rid')
     else:  # type == "russ"
         room_list = Room.objects.russian_rooms().order_by('Rid')
-    # YHT: added for russian search
-    Rids = [room.Rid for room in room_list]
+    room_list = list(room_list)
     t_start, t_finish = web_func.get_talkroom_timerange(
         room_list)  # 对所有讨论室都有一个统一的时间id标准
     t_start = web_func.time2datetime(year, month, day, t_start)  # 转换成datetime类
     t_finish = web_func.time2datetime(year, month, day, t_finish)
     t_range = int(((t_finish - timedelta(minutes=1)) -
                    t_start).total_seconds()) // 1800 + 1  # 加一是因为结束时间不是整点
-    rooms_time_list = []  # [[{}] * t_range] * len(Rids)
 
     width = 100 / len(room_list)
 
-    for sequence, room in enumerate(room_list):
-        rooms_time_list.append([])
-        for time_id in range(t_range):  # 对每半小时
-            rooms_time_list[-1].append({})
-            rooms_time_list[sequence][time_id]['status'] = 1  # 初始设置为1（不可预约）
-            rooms_time_list[sequence][time_id]['time_id'] = time_id
-            rooms_time_list[sequence][time_id]['Rid'] = Rids[sequence]
-            temp_hour, temp_minute = t_start.hour, int(t_start.minute >= 30)
-            rooms_time_list[sequence][time_id]['starttime'] = str(
-                temp_hour + (time_id + temp_minute) // 2).zfill(2) + ":" + str(
-                    (time_id + temp_minute) % 2 * 30).zfill(2)
-
-    # 考虑三部分不可预约时间 1：不在房间的预约时间内 2：present_time之前的时间 3：冲突预约
-    # 可能冲突的预约
-    appoints = Appoint.objects.not_canceled().filter(Room_id__in=Rids,
-                                                     Astart__gte=t_start,
-                                                     Afinish__lte=t_finish)
-
-    present_time_id = int(
-        (datetime.now() - t_start).total_seconds()) // 1800  # 每半小时计 左闭右开
-
-    for sequence, room in enumerate(room_list):
-        # case 1
-        start_id = int((web_func.time2datetime(year, month, day, room.Rstart) -
-                        t_start).total_seconds()) // 1800
-        finish_id = int(
-            ((web_func.time2datetime(year, month, day, room.Rfinish) -
-              timedelta(minutes=1)) - t_start).total_seconds()) // 1800
-
-        for time_id in range(start_id, finish_id + 1):
-            rooms_time_list[sequence][time_id]['status'] = 0
-
-        # case 2
-        for time_id in range(min(present_time_id + 1, t_range)):
-            rooms_time_list[sequence][time_id]['status'] = 1
-
-        # case 3
-        for appointment in appoints:
-            if appointment.Room.Rid == room.Rid:
-                start_id = int(
-                    (appointment.Astart - t_start).total_seconds()) // 1800
-                finish_id = int(((appointment.Afinish - timedelta(minutes=1)) -
-                                 t_start).total_seconds()) // 1800
-                appointer_name = html.escape(appointment.major_student.name)
-                appoint_usage = html.escape(
-                    appointment.Ausage).replace('\n', '<br/>')
-
-                for time_id in range(start_id, finish_id + 1):
-                    rooms_time_list[sequence][time_id]['status'] = 1
-                    rooms_time_list[sequence][time_id]['display_info'] = '<br/>'.join([
-                        f'{appoint_usage}',
-                        f'预约者：{appointer_name}',
-                    ])
-
-    js_rooms_time_list = json.dumps(rooms_time_list)
+    # 与预约时间页面共用本周的时段网格，取出当天的一行
+    today = datetime.now().date()
+    day_id = (re_time.date() - today).days
+    grids = room_grids(room_list, today)
+    temp_hour, temp_minute = t_start.hour, int(t_start.minute >= 30)
+    labels = [
+        f'{temp_hour + (time_id + temp_minute) // 2:02d}:{(time_id + temp_minute) % 2 * 30:02d}'
+        for time_id in range(t_range)
+    ]
+
+    # 不在房间的预约时间内、已经过去和已被预约的时段都不可预约
+    rooms_time_list = []
+    rooms_status = {}
+    for room, grid in zip(room_list, grids):
+        offset = int((grid.origin(day_id) - t_start).total_seconds()) // 1800
+        status = np.ones(t_range, dtype=np.uint8)
+        row = grid.statuses(now=datetime.now())[day_id]
+        lo, hi = max(offset, 0), min(offset + grid.slots, t_range)
+        status[lo:hi] = row[lo - offset:hi - offset]
+        rooms_status[room.Rid] = grid.encode(status[None, :])[0]
+        rooms_time_list.append([
+            {
+                'status': int(status[time_id]),
+                'time_id': time_id,
+                'Rid': room.Rid,
+                'starttime': labels[time_id],
+                'display_info': (grid.display(day_id, time_id - offset)
+                                 if lo <= time_id < hi else ''),
+            }
+            for time_id in range(t_range)
+        ])
+
+    js_rooms_status = json.dumps(rooms_status)
     js_weekday = json.dumps(
         {'weekday': wklist[datetime(year, month, day).weekday()]})
 
@@ -3,12 +3,12 @@
 '''
 from datetime import datetime, date
 
-from django.db.models import Sum
+from django.db.models import Sum, Q, F, QuerySet
 
 import utils.models.query as SQ
-from generic.models import User
+from generic.models import User, YQPointRecord
 from app.models import CourseRecord, Course, NaturalPerson as Person
-from achievement.models import Achievement
+from achievement.models import Achievement, AchievementUnlock
 from achievement.utils import trigger_achievement, bulk_add_achievement_record, get_students_without_credit_record
 
 
@@ -16,6 +16,7 @@ __all__ = [
     'unlock_achievement',
     'unlock_course_achievements',
     'unlock_YQPoint_achievements',
+    'bulk_unlock_YQPoint_achievements',
     'unlock_signin_achievements',
     'unlock_credit_achievements',
 ]
@@ -100,6 +101,21 @@ def unlock_course_achievements(user: User) -> None:
 
 ''' 元气满满 '''
 
+INCOME_ACHIEVEMENTS = [
+    (1, '首次获得元气值'),
+    (10, '学期内获得10元气值'),
+    (30, '学期内获得30元气值'),
+    (50, '学期内获得50元气值'),
+    (100, '学期内获得100元气值'),
+]
+EXPENDITURE_ACHIEVEMENTS = [
+    (1, '首次消费元气值'),
+    (10, '学期内消费10元气值'),
+    (30, '学期内消费30元气值'),
+    (50, '学期内消费50元气值'),
+    (100, '学期内消费100元气值'),
+]
+
 
 def unlock_YQPoint_achievements(user: User, start_time: datetime, end_time: datetime) -> None:
     '''
@@ -116,20 +132,46 @@ def unlock_YQPoint_achievements(user: User, start_time: datetime, end_time: date
     # TODO: 存在循环引用，暂时放在这里，后续改为信号控制的方式后可改回
     from app.YQPoint_utils import get_income_expenditure
     income, expenditure = get_income_expenditure(user, start_time, end_time)
-    _unlock_by_value(user, income, [
-        (1, '首次获得元气值'),
-        (10, '学期内获得10元气值'),
-        (30, '学期内获得30元气值'),
-        (50, '学期内获得50元气值'),
-        (100, '学期内获得100元气值'),
-    ])
-    _unlock_by_value(user, expenditure, [
-        (1, '首次消费元气值'),
-        (10, '学期内消费10元气值'),
-        (30, '学期内消费30元气值'),
-        (50, '学期内消费50元气值'),
-        (100, '学期内消费100元气值'),
-    ])
+    _unlock_by_value(user, income, INCOME_ACHIEVEMENTS)
+    _unlock_by_value(user, expenditure, EXPENDITURE_ACHIEVEMENTS)
+
+
+def bulk_unlock_YQPoint_achievements(users: QuerySet[User],
+                                     start_time: datetime, end_time: datetime) -> None:
+    '''
+    批量解锁元气满满系列成就，结果与对每个用户调用unlock_YQPoint_achievements相同
+
+    收支在一次聚合查询中统计，只对达到阈值且尚未解锁的成就逐个解锁
+
+    :param users: 要检查的用户
+    :type users: QuerySet[User]
+    :param start_time: 开始时间
+    :type start_time: datetime
+    :param end_time: 结束时间
+    :type end_time: datetime
+    '''
+    totals = YQPointRecord.objects.filter(
+        user__in=users, time__gte=start_time, time__lte=end_time,
+    ).values('user').annotate(
+        income=Sum('delta', filter=Q(delta__gte=0), default=0),
+        expenditure=Sum(-F('delta'), filter=Q(delta__lt=0), default=0),
+    )
+    unlocked = set(AchievementUnlock.objects.filter(
+        user__in=users,
+        achievement__name__in=[name for _, name in INCOME_ACHIEVEMENTS + EXPENDITURE_ACHIEVEMENTS],
+    ).values_list('user__username', 'achievement__name'))
+    # 元气值记录以用户名关联用户
+    pending: dict[str, list[str]] = {}
+    for total in totals:
+        reached = [name for bound, name in INCOME_ACHIEVEMENTS if total['income'] >= bound]
+        reached += [name for bound, name in EXPENDITURE_ACHIEVEMENTS
+                    if total['expenditure'] >= bound]
+        names = [name for name in reached if (total['user'], name) not in unlocked]
+        if names:
+            pending[total['user']] = names
+    for user in User.objects.filter(username__in=pending):
+        for name in pending[user.username]:
+            unlock_achievement(user, name)
 
 
 ''' 三五成群 : 全部外部录入 '''
@@ -1,15 +1,21 @@
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 
 from scheduler.periodic import periodical
 from achievement.models import Achievement
 from achievement.utils import bulk_add_achievement_record, get_students_by_grade
-from achievement.api import unlock_credit_achievements
+from generic.models import User
+from achievement.api import (
+    unlock_achievement,
+    unlock_credit_achievements,
+    bulk_unlock_YQPoint_achievements,
+)
 from semester.api import current_semester
 
 
 __all__ = [
     'unlock_credit_achievements',
     'new_school_year_achievements',
+    'unlock_visit_achievements',
 ]
 
 
@@ -49,3 +55,27 @@ def new_school_year_achievements():
     for i, name in zip(range(2, 7), ['二', '三', '四', '五', '六']):
         achievement = Achievement.objects.get(name=f'开启大学生活第{name}年')
         bulk_add_achievement_record(get_students_by_grade(i), achievement)
+
+
+@periodical('interval', job_id='解锁访问首页成就', hours=1)
+def unlock_visit_achievements():
+    '''
+    原先访问首页时检查的成就：注册智慧书院和元气满满系列
+
+    访问由首页每天首次访问时更新的last_time_login记录，首页不再额外写入，
+    每小时批量检查一天内访问过的用户，错过一次运行不会遗漏，重复检查不会重复解锁
+    '''
+    users = User.objects.filter(
+        naturalperson__last_time_login__gte=datetime.now() - timedelta(days=1))
+    # 解锁成就-注册智慧书院
+    # 如果放在注册页面结束判定 则已经注册好的用户获取不到该成就
+    registered = Achievement.objects.filter(name='注册智慧书院').first()
+    if registered is not None:
+        for user in users.exclude(achievementunlock__achievement=registered):
+            unlock_achievement(user, registered.name)
+
+    # 元气满满系列更新
+    semester = current_semester()
+    start_datetime = datetime.combine(semester.start_date, datetime.min.time())
+    end_datetime = datetime.combine(semester.end_date, datetime.max.time())
+    bulk_unlock_YQPoint_achievements(users, start_datetime, end_datetime)
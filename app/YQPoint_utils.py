@@ -1,12 +1,13 @@
 import random
-from typing import List, Dict, Optional, Tuple
+from typing import Dict, Tuple
 from datetime import datetime, timedelta, date
 
-from django.db.models import QuerySet, Q, Exists, OuterRef
+from django.db.models import QuerySet, Q, F, Exists, OuterRef
 from django.forms.models import model_to_dict
 
 from generic.models import User, YQPointRecord
 from app.config import CONFIG
+from app.log import logger
 from app.utils_dependency import *
 from app.models import (
     Pool,
@@ -17,7 +18,8 @@ from app.models import (
     Participation,
 )
 from app.extern.wechat import WechatApp, WechatMessageLevel
-from app.notification_utils import bulk_notification_create, notification_create
+from app.notification_utils import bulk_notification_create_batches
+from app.prize_sampler import pool_sampler
 from achievement.api import unlock_signin_achievements
 
 
@@ -59,7 +61,9 @@ def get_signin_infos(user: User, detailed_days: int = MAX_CHECK_DAYS,
         today = datetime.now().date()
     day_check_kws = {}
     if check_days is not None:
-        day_check_kws.update(time__date__gt=today - timedelta(days=check_days))
+        # 按时间范围而不是日期筛选，可以使用(用户, 来源类型, 时间)索引
+        first_day = today - timedelta(days=check_days - 1)
+        day_check_kws.update(time__gte=datetime.combine(first_day, datetime.min.time()))
     signin_days = set(YQPointRecord.objects.filter(
         user=user,
         source_type=YQPointRecord.SourceType.CHECK_IN,
@@ -432,43 +436,6 @@ def buy_lottery_pool(user: User, pool_id: str) -> MESSAGECONTEXT:
     return succeed('成功进行一次抽奖!您可以在抽奖时间结束后查看抽奖结果~')
 
 
-def select_random_prize(poolitems: QuerySet[PoolItem], select_num: Optional[int] = None) -> List[int]:
-    """
-    实现无放回随机抽取select_num个PoolItem（的id）,初始时每种PoolItem有origin_num-consumed_num个
-
-    :param poolitems: 待抽取的PoolItem构成的QuerySet（每个元素表示一种PoolItem而非一个）
-    :type poolitems: QuerySet[PoolItem]
-    :param select_num: 抽几个，若为None则抽取所有奖品，也即对poolitems做一次shuffle, defaults to None
-    :type select_num: Optional[int], optional
-    :return: 抽出的poolitem的id组成的list，长度等于select_num
-    :rtype: List[int]
-    """
-    assert poolitems.count() > 0
-
-    num_all_items = 0  # 奖品的总数
-    item_dict = {}  # int: PoolItem，实现把一个自然数区间映射到一种奖品
-    for item in poolitems:
-        if item.origin_num - item.consumed_num <= 0:
-            continue
-        item_dict[num_all_items] = item
-        num_all_items += item.origin_num - item.consumed_num
-
-    if select_num is None:  # 不给出select_num就默认抽取所有奖品，也即对poolitems做一次shuffle
-        select_num = num_all_items
-    assert select_num <= num_all_items
-
-    selected_idx = random.sample(
-        range(num_all_items), select_num)  # 选出select_num个序号
-    selected_items_id = []
-    for idx in selected_idx:
-        for key in sorted(item_dict.keys(), reverse=True):
-            if idx >= key:  # 寻找idx落入的区间
-                selected_items_id.append(
-                    item_dict[key].id)  # 把idx映射为PoolItem.id
-                break
-    return selected_items_id
-
-
 def buy_random_pool(user: User, pool_id: str) -> Tuple[MESSAGECONTEXT, int, int]:
     """
     购买盲盒
@@ -512,11 +479,12 @@ def buy_random_pool(user: User, pool_id: str) -> Tuple[MESSAGECONTEXT, int, int]
             assert capacity > total_entry_time, '盲盒已售罄!'
 
             # 开盒，修改poolitem记录，创建poolrecord记录
-            items = pool.items.select_for_update().all()
-            real_item_id = select_random_prize(items, 1)[0]
-            modify_item: PoolItem = PoolItem.objects.select_for_update().get(id=real_item_id)
-            modify_item.consumed_num += 1
-            modify_item.save()
+            # 奖池已锁定，抽样器与数据库同步后直接抽取
+            real_item_id = pool_sampler(pool).draw()
+            PoolItem.objects.filter(id=real_item_id).update(
+                consumed_num=F('consumed_num') + 1)
+            modify_item: PoolItem = PoolItem.objects.select_related(
+                'prize').get(id=real_item_id)
 
             if modify_item.is_empty:  # 如果是空盲盒，没法兑奖，record的状态记为NOT_LUCKY
                 item_status = PoolRecord.Status.NOT_LUCKY
@@ -557,112 +525,94 @@ def buy_random_pool(user: User, pool_id: str) -> Tuple[MESSAGECONTEXT, int, int]
 
 
 @transaction.atomic
-def run_lottery(pool_id: int):
+def run_lottery(pool_id: int, seed: int | None = None) -> int:
     """
     抽奖；更新PoolRecord表和PoolItem表；给所有参与者发送通知
 
+    在内存中完成全部抽签：按剩余数量无放回地抽取奖品，再按结果分组写回记录，
+    奖品相同的中奖者合并为一批通知
+
     :param pool_id: 待抽取的抽奖奖池id
     :type pool_id: int
+    :param seed: 随机种子，默认随机生成，记入日志用于复现
+    :type seed: int | None, optional
+    :return: 本次抽奖使用的随机种子
+    :rtype: int
     """
     # 部分参考了course_utils.py的draw_lots函数
+    if seed is None:
+        seed = random.SystemRandom().randrange(1 << 32)
+    rng = random.Random(seed)
     pool = Pool.objects.select_for_update().get(id=pool_id, type=Pool.Type.LOTTERY)
     assert not PoolRecord.objects.filter(  # 此时pool关联的所有records都应该是LOTTERING
         pool=pool).exclude(status=PoolRecord.Status.LOTTERING).exists()
-    related_records = PoolRecord.objects.filter(
-        pool=pool, status=PoolRecord.Status.LOTTERING)
-    records_num = related_records.count()
-    if records_num == 0:
-        return
+    records = list(PoolRecord.objects.filter(
+        pool=pool, status=PoolRecord.Status.LOTTERING).order_by('id'))
+    if not records:
+        return seed
 
     # 抽奖
-    record_ids_and_participant_ids = list(
-        related_records.values("id", "user__id"))
-    items = pool.items.all()
-    user2prize_names = {d["user__id"]: []
-                        for d in record_ids_and_participant_ids}  # 便于发通知
-    winner_record_id2item_id = {}  # poolrecord.id: poolitem.id，便于更新poolrecord
-    loser_record_ids = []  # poolrecord.id，便于更新poolrecord
-    num_all_items = 0  # 该奖池中奖品总数
-    for item in items:
-        num_all_items += item.origin_num - item.consumed_num
-    if num_all_items >= records_num:  # 抽奖记录数少于或等于奖品数，人人有奖，给每个记录分配一个随机奖品
-        shuffled_items = select_random_prize(
-            items, records_num)  # 随机选出待发放的奖品
-        for i in range(records_num):  # 遍历所有记录，每个记录都有奖品
-            user2prize_names[record_ids_and_participant_ids[i]["user__id"]].append(
-                items.get(id=shuffled_items[i]).prize.name
-            )
-            winner_record_id2item_id[record_ids_and_participant_ids[i]
-                                        ["id"]] = shuffled_items[i]
-    else:  # 抽奖记录数多于奖品数，给每个奖品分配一个中奖者
-        for item in items:  # 遍历所有奖品，每个奖品都会送给一个记录
-            for i in range(item.origin_num - item.consumed_num):
-                winner_record_index = random.randint(
-                    0, len(record_ids_and_participant_ids) - 1)
-                user2prize_names[record_ids_and_participant_ids[winner_record_index]["user__id"]].append(
-                    item.prize.name)
-                winner_record_id2item_id[record_ids_and_participant_ids[winner_record_index]["id"]] = item.id
-                # 因为记录多，奖品少，这里肯定不会pop成空列表
-                record_ids_and_participant_ids.pop(winner_record_index)
-        # pop剩下的就是没中奖的那些记录
-        loser_record_ids = [d["id"]
-                            for d in record_ids_and_participant_ids]
-
-    # 更新数据库
-    for winner_record_id, poolitem_id in winner_record_id2item_id.items():
-        record = PoolRecord.objects.select_for_update().get(id=winner_record_id)
-        item = PoolItem.objects.select_for_update().get(id=poolitem_id)
-        record.status = PoolRecord.Status.UN_REDEEM
-        record.prize = item.prize
-        record.time = datetime.now()
+    items = {item.id: item for item in pool.items.select_for_update().select_related('prize')}
+    item_ids = [item_id for item_id, item in items.items()
+                if item.origin_num > item.consumed_num]
+    remaining = [items[item_id].origin_num - items[item_id].consumed_num
+                 for item_id in item_ids]
+    prize_num = min(len(records), sum(remaining))
+    # 按剩余数量无放回抽取奖品，顺序随机，再随机选出同样数量的中奖记录
+    # 记录数少于或等于奖品数时人人有奖
+    drawn_items = rng.sample(item_ids, prize_num, counts=remaining)
+    winners = rng.sample(records, prize_num)
+
+    # 更新数据库，结果相同的记录一起更新
+    now = datetime.now()
+    user2prize_names: dict[int, list[str]] = {}
+    prize2record_ids: dict[int, list[int]] = {}
+    for record, item_id in zip(winners, drawn_items):
+        item = items[item_id]
         item.consumed_num += 1
-        record.save()
-        item.save()
-    for loser_record_id in loser_record_ids:
-        record = PoolRecord.objects.select_for_update().get(id=loser_record_id)
-        record.status = PoolRecord.Status.NOT_LUCKY
-        record.time = datetime.now()
-        record.save()
-
-    # 给中奖的同学发送通知
+        prize2record_ids.setdefault(item.prize_id, []).append(record.id)
+        user2prize_names.setdefault(record.user_id, []).append(item.prize.name)
+    winner_ids = {record.id for record in winners}
+    losers = [record for record in records if record.id not in winner_ids]
+    prize2record_ids[None] = [record.id for record in losers]
+    for prize_id, record_ids in prize2record_ids.items():
+        status = (PoolRecord.Status.NOT_LUCKY if prize_id is None
+                  else PoolRecord.Status.UN_REDEEM)
+        for i in range(0, len(record_ids), 1000):
+            PoolRecord.objects.filter(id__in=record_ids[i : i + 1000]).update(
+                status=status, prize_id=prize_id, time=now)
+    PoolItem.objects.bulk_update(items.values(), ['consumed_num'])
+    logger.info(f'奖池{pool.title}抽奖完成：{len(records)}条记录，'
+                f'{len(winners)}条中奖，随机种子为{seed}')
+
+    # 给中奖和没中奖的同学发送通知，中奖内容相同的合并为一批
     sender = Organization.objects.get(
         oname=CONFIG.yqpoint.org_name).get_user()
-    for user_id in user2prize_names.keys():
-        receiver = User.objects.get(id=user_id)
-        typename = Notification.Type.NEEDREAD
-        title = Notification.Title.LOTTERY_INFORM
+    common = dict(
+        sender=sender,
+        typename=Notification.Type.NEEDREAD,
+        title=Notification.Title.LOTTERY_INFORM,
+        # URL=f'', # TODO: 我的奖品页面？
+    )
+    content2users: dict[str, list[int]] = {}
+    for user_id, prize_names in user2prize_names.items():
         content = f"恭喜您在奖池【{pool.title}】中抽中奖品"
-        for prize_name in user2prize_names[user_id]:
-            content += f"【{prize_name}】"  # 可能出现重复，即一种奖品中了好几次，不过感觉问题也不太大
-        notification_create(
-            receiver=receiver,
-            sender=sender,
-            typename=typename,
-            title=title,
-            content=content,
-            # URL=f'', # TODO: 我的奖品页面？
-            to_wechat=dict(app=WechatApp.TO_PARTICIPANT,
-                            level=WechatMessageLevel.IMPORTANT),
-        )
-
-    # 给没中奖的同学发送通知
-    receivers = PoolRecord.objects.filter(
-        id__in=loser_record_ids,
-    ).values_list("user", flat=True)
-    receivers = User.objects.filter(id__in=receivers)
-    content = f"很抱歉通知您，您在奖池【{pool.title}】中没有中奖"
-
-    if len(receivers) > 0:
-        bulk_notification_create(
-            receivers=receivers,
-            sender=sender,
-            typename=typename,
-            title=title,
-            content=content,
-            # URL=f'', # TODO: 我的奖品页面？
-            to_wechat=dict(app=WechatApp.TO_PARTICIPANT,
-                            level=WechatMessageLevel.IMPORTANT),
-        )
+        # 可能出现重复，即一种奖品中了好几次，不过感觉问题也不太大
+        content += ''.join(f"【{prize_name}】" for prize_name in sorted(prize_names))
+        content2users.setdefault(content, []).append(user_id)
+    batches = [dict(receivers=receivers, content=content, **common)
+               for content, receivers in content2users.items()]
+    batches.append(dict(
+        receivers=sorted({record.user_id for record in losers}),
+        content=f"很抱歉通知您，您在奖池【{pool.title}】中没有中奖",
+        **common,
+    ))
+    bulk_notification_create_batches(
+        batches,
+        to_wechat=dict(app=WechatApp.TO_PARTICIPANT,
+                       level=WechatMessageLevel.IMPORTANT),
+    )
+    return seed
 
 
 def get_income_expenditure(
@@ -0,0 +1,168 @@
+"""
+activity_transition.py
+
+活动状态的转换引擎，取代为每个活动的每个阶段单独添加的定时任务
+
+- 报名中 -> 等待中 -> 进行中 -> 已结束 三个转换分别由报名截止、开始、结束时间触发
+- 活动表在(状态, 触发时间)上有联合索引，待转换的活动即索引上的一段前缀
+- 每次执行批量处理所有到期的转换，更新时检查原状态，重复执行不会重复转换
+- 长期未执行时，一次执行可连续推进多个阶段
+- 抽签结果等通知在事务提交后发送
+- 未发布的活动仍由发布时的定时任务转换，管理员修改状态仍使用changeActivityStatus
+- 管理员可以关闭单个活动的自动转换（Activity.auto_transition），之后只能手动修改状态
+
+upcoming_transitions: 按时间顺序列出即将发生的转换
+apply_due_transitions: 执行所有到期的转换
+"""
+from datetime import datetime
+from typing import NamedTuple
+
+from django.db import transaction
+
+import utils.models.query as SQ
+from app.models import Activity, Participation
+from app.activity_utils import draw_lots
+from app.homepage_feed import invalidate_homepage_feed
+from app.log import logger
+
+
+__all__ = [
+    'Transition',
+    'TRANSITIONS',
+    'upcoming_transitions',
+    'apply_due_transitions',
+]
+
+
+class Transition(NamedTuple):
+    activity_id: int
+    current: Activity.Status
+    next: Activity.Status
+    due: datetime
+
+
+# (原状态, 新状态, 触发时间字段)，按执行顺序排列
+TRANSITIONS: list[tuple[Activity.Status, Activity.Status, str]] = [
+    (Activity.Status.APPLYING, Activity.Status.WAITING, 'apply_end'),
+    (Activity.Status.WAITING, Activity.Status.PROGRESSING, 'start'),
+    (Activity.Status.PROGRESSING, Activity.Status.END, 'end'),
+]
+# 每个事务最多转换的活动数，避免长时间锁表
+BATCH_SIZE = 200
+
+
+def _due(current: Activity.Status, field: str, until: datetime):
+    return Activity.objects.filter(
+        status=current, auto_transition=True, **{f'{field}__lte': until})
+
+
+def upcoming_transitions(until: datetime) -> list[Transition]:
+    '''
+    按时间顺序列出截至until应发生的下一步转换，每个活动只列出当前状态的下一步
+
+    :param until: 截止时间，早于当前时间时即已到期的转换
+    :type until: datetime
+    :return: 按触发时间排序的转换
+    :rtype: list[Transition]
+    '''
+    transitions = [
+        Transition(activity_id, current, next, due)
+        for current, next, field in TRANSITIONS
+        for activity_id, due in _due(current, field, until).values_list('id', field)
+    ]
+    transitions.sort(key=lambda t: t.due)
+    return transitions
+
+
+def _on_waiting(activities: list[Activity]):
+    '''报名截止，为需要抽签的活动抽签，抽签结果的通知在提交后发送'''
+    bidding = [activity for activity in activities if activity.bidding]
+    for activity in bidding:
+        draw_lots(activity)
+    Activity.objects.bulk_update(bidding, ['current_participants'])
+
+
+def _on_progressing(activities: list[Activity]):
+    '''活动开始，报名成功者需要签到时记为未签到，否则直接记为已参与'''
+    checkin = [activity.id for activity in activities if activity.need_checkin]
+    others = [activity.id for activity in activities if not activity.need_checkin]
+    unchecked = Participation.objects.filter(
+        status=Participation.AttendStatus.APPLYSUCCESS)
+    unchecked.filter(SQ.mq(Participation.activity, IN=checkin)).update(
+        status=Participation.AttendStatus.UNATTENDED)
+    unchecked.filter(SQ.mq(Participation.activity, IN=others)).update(
+        status=Participation.AttendStatus.ATTENDED)
+
+
+def _on_end(activities: list[Activity]):
+    '''活动结束，课程活动以外的活动结算元气值'''
+    for activity in activities:
+        if activity.category != Activity.ActivityCategory.COURSE:
+            activity.settle_yqpoint(status=Activity.Status.END)
+
+
+_SIDE_EFFECTS = {
+    Activity.Status.WAITING: _on_waiting,
+    Activity.Status.PROGRESSING: _on_progressing,
+    Activity.Status.END: _on_end,
+}
+
+
+@transaction.atomic
+def _apply_batch(current: Activity.Status, next: Activity.Status,
+                 field: str, now: datetime, ids: list[int] | None = None) -> list[int]:
+    due = _due(current, field, now).select_for_update().order_by(field, 'id')
+    if ids is not None:
+        due = due.filter(id__in=ids)
+    activities = list(due[:BATCH_SIZE])
+    if not activities:
+        return []
+    _SIDE_EFFECTS[next](activities)
+    # 只转换仍处于原状态的活动，与其他修改并发时不会重复转换
+    ids = [activity.id for activity in activities]
+    Activity.objects.filter(id__in=ids, status=current).update(status=next)
+    return ids
+
+
+def _apply_each(current: Activity.Status, next: Activity.Status,
+                field: str, now: datetime) -> int:
+    '''批量转换失败时逐个转换，跳过出错的活动，它们在下次执行时重试'''
+    ids = list(_due(current, field, now).order_by(field, 'id').values_list(
+        'id', flat=True)[:BATCH_SIZE])
+    count = 0
+    for activity_id in ids:
+        try:
+            count += len(_apply_batch(current, next, field, now, [activity_id]))
+        except Exception:
+            logger.exception(f'活动{activity_id}转换到{next.label}失败')
+    return count
+
+
+def apply_due_transitions(now: datetime | None = None) -> dict[Activity.Status, int]:
+    '''
+    执行所有到期的转换，幂等
+
+    :param now: 当前时间，默认为系统时间
+    :type now: datetime | None
+    :return: 转换到各状态的活动数
+    :rtype: dict[Activity.Status, int]
+    '''
+    if now is None:
+        now = datetime.now()
+    applied = {}
+    for current, next, field in TRANSITIONS:
+        applied[next] = 0
+        while True:
+            try:
+                count = len(_apply_batch(current, next, field, now))
+            except Exception:
+                count = _apply_each(current, next, field, now)
+                applied[next] += count
+                break
+            applied[next] += count
+            if count < BATCH_SIZE:
+                break
+    if any(applied.values()):
+        # 批量更新不触发保存信号
+        invalidate_homepage_feed()
+    return applied
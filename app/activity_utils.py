@@ -12,6 +12,7 @@ scheduler_func 依赖于 wechat_send 依赖于 utils
 import io
 import base64
 import random
+from functools import partial
 from typing import Iterable
 from datetime import datetime, timedelta
 
@@ -41,6 +42,7 @@ from app.notification_utils import (
     bulk_notification_create,
     notification_status_change,
 )
+from app.sidebar_cache import invalidate_unread
 from app.extern.wechat import WechatApp, WechatMessageLevel
 from app.log import logger
 
@@ -174,6 +176,12 @@ def draw_lots(activity: Activity):
             else:
                 participant.status = Participation.AttendStatus.APPLYFAILED
             participant.save()
+    # 事务提交后再通知，回滚时不会发出错误的抽签结果
+    transaction.on_commit(partial(_notify_draw_result, activity))
+
+
+def _notify_draw_result(activity: Activity):
+    participation = SQ.sfilter(Participation.activity, activity)
     # 签到成功的转发通知和微信通知
     receivers = SQ.qsvlist(participation.filter(
         status=Participation.AttendStatus.APPLYSUCCESS
@@ -459,23 +467,19 @@ def activity_base_check(request, edit=False):
     return context
 
 
-def _set_change_status(activity: Activity, current, next, time, replace):
-    ScheduleAdder(changeActivityStatus, id=f'activity_{activity.id}_{next}',
-                  run_time=time, replace=replace)(activity.id, current, next)
-
-
 def _set_jobs_to_status(activity: Activity, replace: bool) -> Activity.Status:
+    '''
+    返回活动当前应处的状态，并添加活动开始前的提醒任务
+    报名截止、开始和结束时的状态转换由activity_transition统一执行，不再单独添加任务
+    '''
     now_time = datetime.now()
     status = Activity.Status.END
     if now_time < activity.end:
-        status, next = Activity.Status.PROGRESSING, Activity.Status.END
-        _set_change_status(activity, status, next, activity.end, replace)
+        status = Activity.Status.PROGRESSING
     if now_time < activity.start:
-        status, next = Activity.Status.WAITING, Activity.Status.PROGRESSING
-        _set_change_status(activity, status, next, activity.start, replace)
+        status = Activity.Status.WAITING
     if now_time < activity.apply_end:
-        status, next = Activity.Status.APPLYING, Activity.Status.WAITING
-        _set_change_status(activity, status, next, activity.apply_end, replace)
+        status = Activity.Status.APPLYING
     if now_time < activity.start - timedelta(minutes=15):
         reminder = ScheduleAdder(notifyActivity, id=f'activity_{activity.id}_remind',
                                  run_time=activity.start - timedelta(minutes=15), replace=replace)
@@ -740,14 +744,9 @@ def accept_activity(request, activity):
     activity.save()
 
 
-def _remove_jobs(activity: Activity, *jobs):
-    for job in jobs:
-        remove_job(f"activity_{activity.id}_{job}")
-
-
 def _remove_activity_jobs(activity: Activity):
-    _remove_jobs(activity, 'remind', Activity.Status.WAITING,
-                 Activity.Status.PROGRESSING, Activity.Status.END)
+    # 状态转换由activity_transition按状态进行，取消后的活动不会再被转换
+    remove_job(f"activity_{activity.id}_remind")
 
 
 def reject_activity(request, activity):
@@ -765,9 +764,10 @@ def reject_activity(request, activity):
     if activity.status == Activity.Status.REVIEWING:
         activity.status = Activity.Status.REJECT
     else:
-        Notification.objects.filter(
-            relate_instance=activity
-        ).update(status=Notification.Status.DELETE)
+        notifications = Notification.objects.filter(relate_instance=activity)
+        receiver_ids = list(notifications.values_list('receiver_id', flat=True))
+        notifications.update(status=Notification.Status.DELETE)
+        invalidate_unread(receiver_ids)
         # 曾将所有报名的人的状态改为申请失败
         notifyActivity(activity.id, "modification_par",
                        f"您报名的活动{activity.title}已取消。")
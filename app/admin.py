@@ -11,6 +11,7 @@ from app.models import *
 from scheduler.cancel import remove_job
 from app.YQPoint_utils import run_lottery
 from app.org_utils import accept_modifyorg_submit
+from app.sidebar_cache import invalidate_unread
 
 # 通用内联模型
 @readonly_inline
@@ -376,7 +377,7 @@ class ActivityAdmin(admin.ModelAdmin):
         "status",
         'year', 'semester', 'category',
         "organization_id__otype",
-        "inner", "need_checkin", "valid",
+        "inner", "need_checkin", "valid", "auto_transition",
         ErrorFilter,
         'endbefore',
         "publish_time", 'start', 'end',
@@ -417,10 +418,7 @@ class ActivityAdmin(admin.ModelAdmin):
     def _change_status(self, activity, from_status, to_status):
         from app.activity_utils import changeActivityStatus
         changeActivityStatus(activity.id, from_status, to_status)
-        if remove_job(f'activity_{activity.id}_{to_status}'):
-            return '修改成功, 并移除了定时任务!'
-        else:
-            return '修改成功!'
+        return '修改成功!'
 
     @as_action("进入 等待中 状态", actions, single=True)
     def to_waiting(self, request, queryset):
@@ -440,33 +438,23 @@ class ActivityAdmin(admin.ModelAdmin):
         msg = self._change_status(queryset[0], _from, _to)
         return self.message_user(request, msg)
 
-    @as_action("取消 定时任务", actions)
+    @as_action("取消 定时任务", actions, update=True)
     def cancel_scheduler(self, request, queryset):
-        success_list = []
-        failed_list = []
-        CANCEL_STATUSES = [
-            'remind',
-            Activity.Status.END,
-            Activity.Status.PROGRESSING,
-            Activity.Status.WAITING,
-        ]
+        # 状态转换不再有单独的定时任务，关闭自动转换后只能手动修改状态
         for activity in queryset:
-            failed_statuses = []
-            for status in CANCEL_STATUSES:
-                if not remove_job(f'activity_{activity.id}_{status}'):
-                    failed_statuses.append(status)
-            if failed_statuses:
-                if len(failed_statuses) != len(CANCEL_STATUSES):
-                    failed_list.append(f'{activity.id}: {",".join(failed_statuses)}')
-                else:
-                    failed_list.append(f'{activity.id}')
-            else:
-                success_list.append(f'{activity.id}')
-        
-        msg = f'成功取消{len(success_list)}项活动的定时任务!' if success_list else '未能完全取消任何任务'
-        if failed_list:
-            msg += f'\n{len(failed_list)}项活动取消失败：\n{";".join(failed_list)}'
-        return self.message_user(request=request, message=msg)
+            remove_job(f'activity_{activity.id}_remind')
+            remove_job(f'activity_{activity.id}_{Activity.Status.APPLYING}')
+        count = queryset.update(auto_transition=False)
+        return self.message_user(
+            request=request,
+            message=f'已取消{count}项活动的定时任务，并关闭了自动转换状态!')
+
+    @as_action("恢复 自动转换状态", actions, update=True)
+    def resume_transition(self, request, queryset):
+        count = queryset.update(auto_transition=True)
+        return self.message_user(
+            request=request,
+            message=f'已恢复{count}项活动的自动转换状态，提醒不会恢复!')
 
 
 @admin.register(Participation)
@@ -496,7 +484,9 @@ class NotificationAdmin(admin.ModelAdmin):
 
     @as_action("设置状态为 删除", update=True)
     def set_delete(self, request, queryset):
+        receiver_ids = list(queryset.values_list('receiver_id', flat=True))
         queryset.update(status=Notification.Status.DELETE)
+        invalidate_unread(receiver_ids)
         return self.message_user(request=request,
                                  message='修改成功!')
 
@@ -527,21 +517,28 @@ class NotificationAdmin(admin.ModelAdmin):
             return self.message_user(request=request,
                                      message='一次只能选择一个通知!',
                                      level='error')
-        bulk_identifier = queryset[0].bulk_identifier
+        notification = queryset[0]
+        bulk_identifier = notification.bulk_identifier
         if not bulk_identifier:
             return self.message_user(request=request,
                                      message='该通知不存在批次标识!',
                                      level='error')
         try:
-            from app.extern.wechat import publish_notifications
+            from app.extern.wechat import (
+                publish_notifications, publish_notification_batch)
         except Exception as e:
             return self.message_user(request=request,
                                      message=f'导入失败, 原因: {e}',
                                      level='error')
-        if not publish_notifications(
-            filter_kws={'bulk_identifier': bulk_identifier},
-            app=app,
-            ):
+        if notification.batch_id is not None:
+            # 内容相同的批次识别码相同，按通知所属的批次重发
+            published = publish_notification_batch(
+                notification.batch_id, app=app, force=True)
+        else:
+            # 早期的通知没有批次记录
+            published = publish_notifications(
+                filter_kws={'bulk_identifier': bulk_identifier}, app=app)
+        if not published:
             return self.message_user(request=request,
                                      message='发送失败!请检查通知内容!',
                                      level='error')
@@ -572,6 +569,13 @@ class NotificationAdmin(admin.ModelAdmin):
         return self.republish_bulk(request, queryset, app)
 
 
+@admin.register(NotificationBatch)
+class NotificationBatchAdmin(admin.ModelAdmin):
+    list_display = ["id", "identifier", "sender", "title", "create_time", "publish_time"]
+    search_fields = ("identifier", "sender__username", "title")
+    list_filter = ("create_time", "typename")
+
+
 @admin.register(Help)
 class HelpAdmin(admin.ModelAdmin):
     list_display = ["id", "title"]
@@ -90,5 +90,11 @@ class CourseConfig(Config):
     least_record_hours = LazySetting('valid_hours', float, default=8.0)
     audit_teachers = LazySetting('auditors', mapping(list, str), type=list[str])
 
+    # Selection Ledger
+    use_ledger = LazySetting('ledger/enable', default=False)
+    ledger_cache = LazySetting('ledger/cache', default='default')
+    ledger_batch = LazySetting('ledger/batch', default=64)
+    ledger_flush_interval = LazySetting('ledger/flush_interval', float, default=2.0)
+
 
 CONFIG = ProfileConfig(ROOT_CONFIG, '')
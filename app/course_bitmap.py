@@ -0,0 +1,91 @@
+"""
+course_bitmap.py
+
+课程每周上课时间的位图，用于选课时的时间冲突检测
+
+- 一周按分钟划分为7*1440个时间片，上课时间覆盖的时间片置1，位图用Python整数表示
+- 两门课程时间冲突当且仅当位图按位与不为0，学生已选课程的位图按位或即为其占用时间
+- 课程位图在首次使用时批量构建并缓存，CourseTime保存或删除时失效（见models.py）
+    - 失效在事务提交前后各进行一次，避免并发的请求用提交前的数据重建并长期缓存
+    - 缓存后端不在进程间共享时不缓存，见utils/cache.py
+
+get_bitmaps: 批量获取课程位图
+union_bitmap: 获取多门课程占用时间的并集
+"""
+from app.models import CourseTime
+
+from datetime import datetime
+from functools import reduce
+from operator import or_
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+
+from utils.cache import shared_cache
+
+__all__ = [
+    'week_minute',
+    'time_bitmap',
+    'get_bitmaps',
+    'union_bitmap',
+    'invalidate_bitmap',
+]
+
+WEEK_MINUTES = 7 * 1440
+
+
+def week_minute(time: datetime) -> int:
+    '''时间在一周内的分钟数，周一零点为0'''
+    return time.weekday() * 1440 + time.hour * 60 + time.minute
+
+
+def time_bitmap(start: datetime, end: datetime) -> int:
+    '''一次上课时间的位图，左闭右开，跨越周日零点时回绕到周一'''
+    begin, finish = week_minute(start), week_minute(end)
+    if finish >= begin:
+        return ((1 << (finish - begin)) - 1) << begin
+    return (((1 << (WEEK_MINUTES - begin)) - 1) << begin) | ((1 << finish) - 1)
+
+
+def _cache_key(course_id: int) -> str:
+    return f'course_bitmap:{course_id}'
+
+
+def get_bitmaps(course_ids: Iterable[int]) -> dict[int, int]:
+    '''
+    批量获取课程位图，未缓存的课程一次查询全部构建
+
+    :param course_ids: 课程id
+    :type course_ids: Iterable[int]
+    :return: 课程id到位图的映射，没有上课时间的课程位图为0
+    :rtype: dict[int, int]
+    '''
+    keys = {_cache_key(course_id): course_id for course_id in course_ids}
+    enabled = shared_cache()
+    bitmaps = {}
+    if enabled:
+        bitmaps = {keys[key]: bitmap for key, bitmap in cache.get_many(keys).items()}
+    missing = [course_id for course_id in keys.values() if course_id not in bitmaps]
+    if missing:
+        built = dict.fromkeys(missing, 0)
+        for course_id, start, end in CourseTime.objects.filter(
+                course_id__in=missing).values_list('course_id', 'start', 'end'):
+            built[course_id] |= time_bitmap(start, end)
+        if enabled:
+            cache.set_many({_cache_key(course_id): bitmap
+                            for course_id, bitmap in built.items()}, None)
+        bitmaps.update(built)
+    return bitmaps
+
+
+def union_bitmap(course_ids: Iterable[int]) -> int:
+    '''多门课程占用时间的并集'''
+    return reduce(or_, get_bitmaps(course_ids).values(), 0)
+
+
+def invalidate_bitmap(course_id: int) -> None:
+    '''上课时间改变后使课程位图失效，事务提交后再次失效'''
+    key = _cache_key(course_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
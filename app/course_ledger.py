@@ -0,0 +1,320 @@
+"""
+course_ledger.py
+
+选课账本：预选和补退选阶段，用缓存代替课程行锁完成选课的准入判断，结果批量写回数据库
+
+- 课程信息、剩余名额和学生的选课状态保存在缓存中，每次点击只访问缓存
+    - 时间冲突使用课程位图检测，见course_bitmap.py
+    - 剩余名额使用缓存的原子操作decr扣减，扣为负数时立即退还，保证不超过课程容量
+    - 同一学生的操作通过缓存锁串行化，保证门数、时间冲突和状态变化的检查与数据库一致
+- 准入的操作按顺序记入账本日志，由flush_ledger批量写回CourseParticipant和current_participants
+    - 已分配序号但尚未写入的日志留待下次写回，下次写回时仍缺失则跳过，不阻塞之后的日志
+- 缓存键按学年、学期和选课阶段隔离，阶段切换前必须调用flush_ledger写回全部日志
+- 缓存的状态缺失时从数据库重新加载，加载前等待此前的日志写回，超时未写回时拒绝加载
+- 账本使用的缓存（CONFIG.course.ledger_cache）必须是共享缓存，如Redis，
+  进程内缓存不能跨进程共享且会淘汰条目，此时不启用账本，见utils/cache.py
+
+SelectionLedger: 某一选课阶段的账本
+flush_ledger: 将账本日志批量写回数据库
+flush_ledger_if_due: 日志积累到批量大小或超过写回间隔时写回
+"""
+from app.utils_dependency import *
+from app.models import (
+    Course,
+    CourseParticipant,
+)
+from app.log import logger
+
+import time
+from functools import reduce
+from operator import or_
+from contextlib import contextmanager
+from typing import TypedDict
+
+from django.core.cache import caches
+
+from utils.cache import shared_cache
+from django.db.models import Q, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+__all__ = [
+    'LedgerBusy',
+    'CourseInfo',
+    'SelectionLedger',
+    'ledger_enabled',
+    'flush_ledger',
+    'flush_ledger_if_due',
+]
+
+APP_CONFIG = CONFIG.course
+
+# 学生锁的过期时间和最长等待时间（秒），过期时间避免进程异常退出导致死锁
+PERSON_LOCK_TIMEOUT = 5
+PERSON_LOCK_WAIT = 1.0
+# 写回锁的过期时间（秒）
+FLUSH_LOCK_TIMEOUT = 60
+# 从数据库加载前等待日志写回的最长时间（秒），须短于学生锁的过期时间
+RELOAD_WAIT = 2.0
+
+
+class LedgerBusy(Exception):
+    '''同一学生的操作过于密集，未能在等待时间内获得锁'''
+
+
+class CourseInfo(TypedDict):
+    name: str
+    capacity: int
+
+
+def ledger_enabled() -> bool:
+    '''是否启用选课账本，账本使用的缓存不在进程间共享时不启用'''
+    return APP_CONFIG.use_ledger and shared_cache(APP_CONFIG.ledger_cache)
+
+
+def _cache():
+    return caches[APP_CONFIG.ledger_cache]
+
+
+def _semester_prefix() -> str:
+    return f'course_ledger:{GLOBAL_CONFIG.acadamic_year}:{GLOBAL_CONFIG.semester.value}'
+
+
+def _journal_key(name: str | int) -> str:
+    return f'{_semester_prefix()}:journal:{name}'
+
+
+class SelectionLedger:
+    '''
+    某一选课阶段的选课账本
+
+    缓存中的数据在首次访问时从数据库加载，此后只由账本维护，直到该阶段结束
+    '''
+    def __init__(self, stage: Course.Status):
+        self.stage = stage
+        self.cache = _cache()
+        self.prefix = f'{_semester_prefix()}:{stage}'
+
+    def _key(self, *names) -> str:
+        return ':'.join(map(str, (self.prefix, *names)))
+
+    def _check_reload(self):
+        '''
+        缓存的状态缺失，需要从数据库加载前调用，调用者必须持有相关的锁或只读取
+
+        已记入的日志写回前数据库落后于账本，等待写回到当前的日志序号，
+        超时未写回时抛出LedgerBusy
+        '''
+        head = self.cache.get(_journal_key('head'), 0)
+        deadline = time.monotonic() + RELOAD_WAIT
+        while self.cache.get(_journal_key('flushed'), 0) < head:
+            if time.monotonic() > deadline:
+                raise LedgerBusy('选课账本尚有未写回的日志，暂不能从数据库加载')
+            if not flush_ledger():
+                time.sleep(0.01)
+
+    @contextmanager
+    def person_lock(self, person_id: int):
+        '''串行化同一学生的选课操作，超时未获得锁时抛出LedgerBusy'''
+        key = self._key('lock', person_id)
+        deadline = time.monotonic() + PERSON_LOCK_WAIT
+        while not self.cache.add(key, 1, PERSON_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise LedgerBusy(f'学生{person_id}的选课操作过于频繁')
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            self.cache.delete(key)
+
+    def course_info(self, course: Course) -> CourseInfo:
+        '''课程的名称和容量'''
+        return self.course_infos([course.id])[course.id]
+
+    def course_infos(self, course_ids) -> dict[int, CourseInfo]:
+        '''批量获取课程信息，缺失的课程从数据库加载'''
+        course_ids = list(course_ids)
+        keys = {self._key('course', course_id): course_id
+                for course_id in course_ids}
+        cached = self.cache.get_many(keys)
+        infos = {keys[key]: info for key, info in cached.items()}
+        missing = [course_id for course_id in course_ids
+                   if course_id not in infos]
+        if missing:
+            for course_id, name, capacity in Course.objects.filter(
+                    id__in=missing).values_list('id', 'name', 'capacity'):
+                info = CourseInfo(name=name, capacity=capacity)
+                self.cache.add(self._key('course', course_id), info, None)
+                infos[course_id] = info
+        return infos
+
+    def selection(self, person_id: int) -> dict[int, int]:
+        '''学生在本学期各课程的选课状态，不含未选课的课程'''
+        key = self._key('person', person_id)
+        selection = self.cache.get(key)
+        if selection is None:
+            self._check_reload()
+            selection = dict(CourseParticipant.objects.filter(
+                person_id=person_id,
+                course__in=Course.objects.activated(),
+            ).exclude(
+                status=CourseParticipant.Status.UNSELECT,
+            ).values_list('course_id', 'status'))
+            self.cache.add(key, selection, None)
+        return selection
+
+    def set_selection(self, person_id: int, selection: dict[int, int]):
+        '''更新学生的选课状态，调用者必须持有该学生的锁'''
+        self.cache.set(self._key('person', person_id), selection, None)
+
+    def _seat_key(self, course_id: int) -> str:
+        return self._key('seats', course_id)
+
+    def _load_seats(self, course_id: int, capacity: int) -> str:
+        key = self._seat_key(course_id)
+        if key not in self.cache:
+            self._check_reload()
+            taken = CourseParticipant.objects.filter(
+                course_id=course_id,
+                status=CourseParticipant.Status.SUCCESS,
+            ).count()
+            self.cache.add(key, capacity - taken, None)
+        return key
+
+    def take_seat(self, course_id: int, info: CourseInfo) -> bool:
+        '''尝试占用一个名额，名额已满时返回False'''
+        key = self._load_seats(course_id, info['capacity'])
+        if self.cache.decr(key) < 0:
+            self.cache.incr(key)
+            return False
+        return True
+
+    def release_seat(self, course_id: int, info: CourseInfo):
+        '''退还一个名额'''
+        self.cache.incr(self._load_seats(course_id, info['capacity']))
+
+    def taken_seats(self, infos: dict[int, CourseInfo]) -> dict[int, int]:
+        '''已加载名额的课程的已选人数，未加载的课程不在结果中'''
+        keys = {self._seat_key(course_id): course_id for course_id in infos}
+        return {
+            keys[key]: infos[keys[key]]['capacity'] - remaining
+            for key, remaining in self.cache.get_many(keys).items()
+        }
+
+    def record(self, course_id: int, person_id: int,
+               to_status: CourseParticipant.Status) -> int:
+        '''将一次选课状态变化记入日志，返回日志序号'''
+        self.cache.add(_journal_key('head'), 0, None)
+        seq = self.cache.incr(_journal_key('head'))
+        self.cache.set(_journal_key(seq),
+                       (course_id, person_id, int(to_status)), None)
+        return seq
+
+
+def _apply_entries(entries: list[tuple[int, int, int]]) -> None:
+    '''将一批日志的最终结果写入数据库，重复执行的结果相同'''
+    final: dict[tuple[int, int], int] = {}
+    for course_id, person_id, status in entries:
+        final[course_id, person_id] = status
+
+    removed = [pair for pair, status in final.items()
+               if status == CourseParticipant.Status.UNSELECT]
+    if removed:
+        CourseParticipant.objects.filter(reduce(or_, (
+            Q(course_id=course_id, person_id=person_id)
+            for course_id, person_id in removed
+        ))).delete()
+
+    changed = {pair: status for pair, status in final.items()
+               if status != CourseParticipant.Status.UNSELECT}
+    if changed:
+        existing = CourseParticipant.objects.filter(
+            course_id__in={course_id for course_id, _ in changed},
+            person_id__in={person_id for _, person_id in changed},
+        )
+        updated = []
+        for participant in existing:
+            pair = (participant.course_id, participant.person_id)
+            if pair not in changed:
+                continue
+            participant.status = changed.pop(pair)
+            updated.append(participant)
+        CourseParticipant.objects.bulk_update(updated, ['status'])
+        CourseParticipant.objects.bulk_create([
+            CourseParticipant(course_id=course_id, person_id=person_id,
+                              status=status)
+            for (course_id, person_id), status in changed.items()
+        ])
+
+    # 与逐条增减的结果一致：当前人数为已选课和选课成功的人数
+    participant_num = CourseParticipant.objects.filter(
+        course=OuterRef('pk'),
+        status__in=[CourseParticipant.Status.SELECT,
+                    CourseParticipant.Status.SUCCESS],
+    ).values('course').annotate(num=Count('id')).values('num')
+    Course.objects.filter(
+        id__in={course_id for course_id, _ in final}
+    ).update(current_participants=Coalesce(Subquery(participant_num), Value(0)))
+
+
+def flush_ledger(wait: bool = False) -> int:
+    '''
+    将账本日志按顺序批量写回数据库
+
+    已分配序号但尚未写入的日志留待下次写回，下次写回时仍缺失则跳过
+
+    :param wait: 阶段切换前的最终写回，等待其它进程写回完成，并跳过缺失的日志,
+                 defaults to False
+    :type wait: bool, optional
+    :return: 写回的日志条数
+    :rtype: int
+    '''
+    cache = _cache()
+    lock_key = _journal_key('lock')
+    while not cache.add(lock_key, 1, FLUSH_LOCK_TIMEOUT):
+        if not wait:
+            return 0
+        time.sleep(0.01)
+    try:
+        cache.add(_journal_key('flushed'), 0, None)
+        head = cache.get(_journal_key('head'), 0)
+        flushed = cache.get(_journal_key('flushed'), 0)
+        missing = cache.get(_journal_key('missing'), 0)
+        keys = [_journal_key(seq) for seq in range(flushed + 1, head + 1)]
+        found = cache.get_many(keys)
+        entries, done = [], 0
+        for index, key in enumerate(keys):
+            if key in found:
+                entries.append(found[key])
+            elif not wait and flushed + index + 1 > missing:
+                # 可能正在写入，记录位置，下次写回时仍缺失说明写入的进程已异常退出
+                cache.set(_journal_key('missing'), flushed + index + 1, None)
+                break
+            # 等待写回时已无新的操作，缺失的日志来自异常退出的进程，跳过
+            done = index + 1
+        if done:
+            with transaction.atomic():
+                _apply_entries(entries)
+            cache.set(_journal_key('flushed'), flushed + done, None)
+            cache.delete_many(keys[:done])
+        cache.set(_journal_key('last_flush'), time.time(), None)
+        return done
+    except:
+        logger.exception('选课账本写回失败')
+        raise
+    finally:
+        cache.delete(lock_key)
+
+
+def flush_ledger_if_due() -> int:
+    '''日志积累到批量大小或距上次写回超过间隔时写回，返回写回的日志条数'''
+    cache = _cache()
+    values = cache.get_many([_journal_key(name) for name in
+                             ('head', 'flushed', 'last_flush')])
+    pending = (values.get(_journal_key('head'), 0)
+               - values.get(_journal_key('flushed'), 0))
+    if pending <= 0:
+        return 0
+    elapsed = time.time() - values.get(_journal_key('last_flush'), 0)
+    if pending >= APP_CONFIG.ledger_batch or elapsed >= APP_CONFIG.ledger_flush_interval:
+        return flush_ledger()
+    return 0
@@ -11,6 +11,7 @@ change_course_status: 改变课程的选课阶段
 remaining_willingness_point（暂不启用）: 计算学生剩余的意愿点数
 process_time: 把datetime对象转换成人类可读的时间表示
 check_course_time_conflict: 检查当前选择的课是否与已选的课上课时间冲突
+ledger_status_change: 选课账本模式下改变学生选课状态
 """
 from app.utils_dependency import *
 from app.models import (
@@ -33,6 +34,7 @@ from app.utils import (
 )
 from app.notification_utils import (
     bulk_notification_create,
+    bulk_notification_create_batches,
     notification_create,
     notification_status_change,
 )
@@ -41,12 +43,20 @@ from app.activity_utils import (
     notifyActivity,
     create_participate_infos,
 )
+from app.course_bitmap import get_bitmaps, union_bitmap
+from app.course_ledger import (
+    LedgerBusy,
+    SelectionLedger,
+    ledger_enabled,
+    flush_ledger,
+    flush_ledger_if_due,
+)
 from app.extern.wechat import WechatApp, WechatMessageLevel
 from app.log import logger
 
 import openpyxl
 import openpyxl.worksheet.worksheet
-from random import sample
+from random import Random, SystemRandom
 from urllib.parse import quote
 from collections import Counter
 from datetime import datetime, timedelta
@@ -54,9 +64,9 @@ from typing import Tuple, List
 
 from django.http import HttpRequest, HttpResponse
 from django.db import transaction
-from django.db.models import F, Q, Sum, Prefetch
+from django.db.models import F, Q, Sum, Prefetch, Case, When, Value
 
-from scheduler.adder import ScheduleAdder, MultipleAdder
+from scheduler.adder import ScheduleAdder, MultipleAdder, schedule_batch
 from scheduler.cancel import remove_job
 from utils.config.cast import str_to_time
 from achievement.api import unlock_achievement
@@ -68,6 +78,7 @@ __all__ = [
     'modify_course_activity',
     'cancel_course_activity',
     'registration_status_change',
+    'get_selection_ledger',
     'course_to_display',
     'change_course_status',
     'course_base_check',
@@ -80,6 +91,8 @@ __all__ = [
 ]
 
 APP_CONFIG = CONFIG.course
+# 每位同学同时预选或选上的课程数上限
+MAX_SELECTED_COURSES = 6
 
 
 def check_ac_time_course(start_time: datetime, end_time: datetime) -> bool:
@@ -242,25 +255,21 @@ def create_single_course_activity(request: HttpRequest) -> Tuple[int, bool]:
         activity.save()
 
     # 在活动发布时通知参与成员,创建定时任务并修改活动状态
-    if activity.need_apply:
-        ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.APPLYING}",
-                      run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.APPLYING)  # OK
-        ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.WAITING}",
-                      run_time=activity.start - timedelta(hours=1))(activity.id, Activity.Status.APPLYING, Activity.Status.WAITING)  # OK
-    else:
-        ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.WAITING}",
-                      run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.WAITING)  # OK
-
-    ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_newCourseActivity",
-                  run_time=activity.publish_time)(activity.id, "newCourseActivity")  # OK
-
-    # 引入定时任务：提前15min提醒、活动状态由WAITING变PROGRESSING再变END
-    ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_remind",
-                  run_time=activity.start - timedelta(minutes=15))(activity.id, "remind")  # OK
-    ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.PROGRESSING}",
-                  run_time=activity.start)(activity.id, Activity.Status.WAITING, Activity.Status.PROGRESSING)
-    ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.END}",
-                  run_time=activity.end)(activity.id, Activity.Status.PROGRESSING, Activity.Status.END)
+    # 发布后的状态转换由activity_transition根据活动时间执行
+    with schedule_batch():
+        if activity.need_apply:
+            ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.APPLYING}",
+                          run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.APPLYING)  # OK
+        else:
+            ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.WAITING}",
+                          run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.WAITING)  # OK
+
+        ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_newCourseActivity",
+                      run_time=activity.publish_time)(activity.id, "newCourseActivity")  # OK
+
+        # 引入定时任务：提前15min提醒
+        ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_remind",
+                      run_time=activity.start - timedelta(minutes=15))(activity.id, "remind")  # OK
     activity.save()
 
     # 设置活动照片
@@ -368,23 +377,18 @@ def modify_course_activity(request: HttpRequest, activity: Activity):
         # 删除报名中的状态阶段
         remove_job(job_id=f"activity_{activity.id}_{Activity.Status.APPLYING}")
 
-    if activity.need_apply:
-        ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.APPLYING}",
-                      run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.APPLYING)  # OK
-        ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.WAITING}",
-                      run_time=activity.start - timedelta(hours=1))(activity.id, Activity.Status.APPLYING, Activity.Status.WAITING)  # OK
-    else:
-        ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.WAITING}",
-                      run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.WAITING)  # OK
-
-    ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_newCourseActivity",
-                  run_time=activity.publish_time)(activity.id, "newCourseActivity")  # OK
-    ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_remind",
-                  run_time=activity.start - timedelta(minutes=15))(activity.id, "remind")  # OK
-    ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.PROGRESSING}",
-                  run_time=activity.start)(activity.id, Activity.Status.WAITING, Activity.Status.PROGRESSING)  # OK
-    ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.END}",
-                  run_time=activity.end)(activity.id, Activity.Status.PROGRESSING, Activity.Status.END)  # OK
+    with schedule_batch():
+        if activity.need_apply:
+            ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.APPLYING}",
+                          run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.APPLYING)  # OK
+        else:
+            ScheduleAdder(changeActivityStatus, id=f"activity_{activity.id}_{Activity.Status.WAITING}",
+                          run_time=activity.publish_time)(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.WAITING)  # OK
+
+        ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_newCourseActivity",
+                      run_time=activity.publish_time)(activity.id, "newCourseActivity")  # OK
+        ScheduleAdder(notifyActivity, id=f"activity_{activity.id}_remind",
+                      run_time=activity.start - timedelta(minutes=15))(activity.id, "remind")  # OK
 
     # 发通知
     # notifyActivity(activity.id, "modification_par", "\n".join(to_participants))
@@ -435,13 +439,9 @@ def cancel_course_activity(request: HttpRequest, activity: Activity, cancel_all:
     )
     notification_status_change(notification, Notification.Status.DELETE)
 
-    # 取消定时任务（需要先判断一下是否已经被执行了）
+    # 取消提醒的定时任务（需要先判断一下是否已经被执行了），状态转换不需要取消
     if activity.start - timedelta(minutes=15) > datetime.now():
         remove_job(f"activity_{activity.id}_remind")
-    if activity.start > datetime.now():
-        remove_job(f"activity_{activity.id}_{Activity.Status.PROGRESSING}")
-    if activity.end > datetime.now():
-        remove_job(f"activity_{activity.id}_{Activity.Status.END}")
 
     activity.save()
 
@@ -517,6 +517,8 @@ def check_course_time_conflict(current_course: Course,
     """
     检查当前选择课程的时间和已选课程是否冲突
 
+    使用课程的每周时间位图，按位与不为0即冲突
+
     :param current_course: 用户当前想选的课程
     :type current_course: Course
     :param user: 当前用户
@@ -524,63 +526,21 @@ def check_course_time_conflict(current_course: Course,
     :return: 是否冲突、发生冲突的具体原因
     :rtype: Tuple[bool, str]
     """
-    selected_courses = Course.objects.selected(
-        user, unfailed=True).prefetch_related("time_set")
-
-    def time_hash(time: datetime):
-        return time.weekday() * 1440 + time.hour * 60 + time.minute
-
-    # 因为选择的课最多只能有6门，所以暂时用暴力算法
-    for current_course_time in current_course.time_set.all():
-
-        # 当前选择课程的上课时间
-        current_start_time = current_course_time.start
-        current_end_time = current_course_time.end
-
-        for course in selected_courses:
-            for course_time in course.time_set.all():
-                start_time = course_time.start
-                end_time = course_time.end
-
-                # 效率不高，有待改进
-                if not (time_hash(current_start_time) >= time_hash(end_time) or
-                        time_hash(current_end_time) <= time_hash(start_time)):
-                    # 发生冲突
-                    return True, \
-                        f"《{current_course.name}》和《{course.name}》的上课时间发生冲突！"
-
-    # 没有冲突
+    selected_courses = Course.objects.selected(user, unfailed=True).exclude(
+        id=current_course.id).values_list('id', 'name')
+    return _find_time_conflict(current_course, dict(selected_courses))
+
+
+def _find_time_conflict(current_course: Course,
+                        selected_names: dict[int, str]) -> Tuple[bool, str]:
+    """检查课程与已选课程（id到名称的映射）的时间冲突"""
+    bitmaps = get_bitmaps([current_course.id, *selected_names])
+    current_bitmap = bitmaps[current_course.id]
+    for course_id, name in selected_names.items():
+        if current_bitmap & bitmaps[course_id]:
+            return True, \
+                f"《{current_course.name}》和《{name}》的上课时间发生冲突！"
     return False, ""
-    '''
-    # 循环较少的写法
-    from django.db.models import Q
-    conflict_course_names = set()
-    for current_course_time in current_course.time_set.all():
-        # 冲突时间
-        conflict_times = CourseTime.objects.filter(
-            # 已选的课程
-            Q(course__in=selected_courses),
-            # 开始比当前的结束时间早
-            (Q(start__week_day=current_course_time.end.weekday() + 1,
-               start__time__lte=current_course_time.end.time())
-             | Q(start__week_day__lt=current_course_time.end.weekday() + 1))
-            # 结束比当前的开始时间晚
-            & (Q(end__week_day=current_course_time.start.weekday() + 1,
-                 end__time__gte=current_course_time.start.time())
-               | Q(end__week_day__gt=current_course_time.start.weekday() + 1))
-        )
-        if conflict_times.exists():
-            # return True, f'《{conflict_times.first().course.name}》'
-            conflict_course_names.union(
-                conflict_times.values_list('course__name', flat=True))
-
-    conflict_count = len(conflict_course_names)
-    # 有冲突
-    if conflict_count:
-        return conflict_count, f'《{"》《".join(conflict_course_names)}》'
-    # 没有冲突
-    return conflict_count, ""
-    '''
 
 
 @logger.secure_func()
@@ -608,6 +568,9 @@ def registration_status_change(course_id: int, user: NaturalPerson,
             and course_status != Course.Status.STAGE2):
         return wrong("在非选课阶段不能选课！")
 
+    if ledger_enabled():
+        return ledger_status_change(course, user, action)
+
     need_to_create = False
 
     if action == "select":
@@ -626,7 +589,8 @@ def registration_status_change(course_id: int, user: NaturalPerson,
             to_status = CourseParticipant.Status.SUCCESS
 
         # 选课不能超过6门
-        if Course.objects.selected(user, unfailed=True).count() >= 6:
+        if (Course.objects.selected(user, unfailed=True).count()
+                >= MAX_SELECTED_COURSES):
             return wrong("每位同学同时预选或选上的课程数最多为6门！")
 
         # 检查选课时间是否冲突
@@ -696,6 +660,95 @@ def registration_status_change(course_id: int, user: NaturalPerson,
     return context
 
 
+def ledger_status_change(course: Course, user: NaturalPerson,
+                         action: str) -> MESSAGECONTEXT:
+    """
+    选课账本模式下，更改学生的选课状态，检查规则与registration_status_change相同
+
+    准入判断只访问账本缓存，通过的操作记入账本日志，随后批量写回数据库
+
+    :param course: 当前课程，须处于预选或补退选阶段
+    :type course: Course
+    :param user: 当前用户
+    :type user: NaturalPerson
+    :param action: 希望进行的操作，可能为"select"或"cancel"
+    :type action: str
+    :return: 操作是否成功执行
+    :rtype: MESSAGECONTEXT
+    """
+    ledger = SelectionLedger(course.status)
+    info = ledger.course_info(course)
+    try:
+        with ledger.person_lock(user.id):
+            selection = ledger.selection(user.id)
+            cur_status = selection.get(course.id,
+                                       CourseParticipant.Status.UNSELECT)
+            if action == "select":
+                if course.status == Course.Status.STAGE1:
+                    to_status = CourseParticipant.Status.SELECT
+                else:
+                    to_status = CourseParticipant.Status.SUCCESS
+                unfailed = [
+                    course_id for course_id, status in selection.items()
+                    if status != CourseParticipant.Status.FAILED
+                ]
+                if len(unfailed) >= MAX_SELECTED_COURSES:
+                    return wrong("每位同学同时预选或选上的课程数最多为6门！")
+                selected_infos = ledger.course_infos(
+                    course_id for course_id in unfailed if course_id != course.id)
+                is_conflict, message = _find_time_conflict(course, {
+                    course_id: selected['name']
+                    for course_id, selected in selected_infos.items()
+                })
+                if is_conflict:
+                    return wrong(message)
+                unlock_achievement(user, '首次报名书院课程')
+            else:
+                if course.id not in selection:
+                    return wrong("在修改选课状态的过程中发生错误，请联系管理员！")
+                to_status = CourseParticipant.Status.UNSELECT
+
+            try:
+                registration_status_check(course.status, cur_status, to_status)
+            except AssertionError:
+                return wrong("非法的选课状态修改！")
+
+            if to_status == CourseParticipant.Status.UNSELECT:
+                if course.status == Course.Status.STAGE2:
+                    ledger.release_seat(course.id, info)
+                selection.pop(course.id)
+                context = succeed("成功取消选课！")
+            else:
+                if (course.status == Course.Status.STAGE2
+                        and not ledger.take_seat(course.id, info)):
+                    return wrong("选课人数已满！")
+                selection[course.id] = to_status
+                context = succeed("选课成功！")
+            ledger.record(course.id, user.id, to_status)
+            ledger.set_selection(user.id, selection)
+    except LedgerBusy:
+        return wrong("操作过于频繁，请稍后再试！")
+    flush_ledger_if_due()
+    return context
+
+
+def get_selection_ledger() -> SelectionLedger | None:
+    """
+    获取当前选课阶段的选课账本
+
+    :return: 启用账本且处于预选或补退选阶段时返回账本，否则为None
+    :rtype: SelectionLedger | None
+    """
+    if not ledger_enabled():
+        return None
+    stage = Course.objects.activated().filter(
+        status__in=[Course.Status.STAGE1, Course.Status.STAGE2],
+    ).values_list('status', flat=True).first()
+    if stage is None:
+        return None
+    return SelectionLedger(stage)
+
+
 def process_time(start: datetime, end: datetime) -> str:
     """
     把datetime对象转换成可读的时间表示
@@ -715,7 +768,8 @@ def process_time(start: datetime, end: datetime) -> str:
 
 def course_to_display(courses: QuerySet[Course],
                       user: NaturalPerson,
-                      detail: bool = False) -> List[dict]:
+                      detail: bool = False,
+                      ledger: SelectionLedger | None = None) -> List[dict]:
     """
     将课程信息转换为列表，方便前端呈现
 
@@ -725,7 +779,10 @@ def course_to_display(courses: QuerySet[Course],
     :type user: NaturalPerson
     :param detail: 是否显示课程的详细信息, defaults to False
     :type detail: bool
-    :return: 课程信息列表，用一个字典来传递课程的全部信息
+    :param ledger: 选课账本，提供时以账本中尚未写回的选课状态和人数为准, defaults to None
+    :type ledger: SelectionLedger | None
+    :return: 课程信息列表，用一个字典来传递课程的全部信息，
+             非详情页的conflict字段表示课程与用户已选课程时间冲突
     :rtype: List[dict]
     """
     display = []
@@ -747,6 +804,25 @@ def course_to_display(courses: QuerySet[Course],
             Prefetch('participant_set',
                      queryset=CourseParticipant.objects.filter(person=user),
                      to_attr='participants'), "time_set")
+        courses = list(courses)
+        # 用户已选课程占用的时间，所有课程的冲突检测只需各一次按位与
+        selection, taken_seats = {}, {}
+        if ledger is not None:
+            try:
+                selection = ledger.selection(user.id)
+            except LedgerBusy:
+                # 账本暂时无法加载该学生的状态，以数据库为准
+                ledger = None
+        if ledger is not None:
+            taken_seats = ledger.taken_seats(
+                ledger.course_infos(course.id for course in courses))
+            unfailed = {course_id for course_id, status in selection.items()
+                        if status != CourseParticipant.Status.FAILED}
+        else:
+            unfailed = set(Course.objects.selected(
+                user, unfailed=True).values_list('id', flat=True))
+        occupied = union_bitmap(unfailed)
+        bitmaps = get_bitmaps(course.id for course in courses)
 
     # 获取课程的基本信息
     for course in courses:
@@ -783,14 +859,20 @@ def course_to_display(courses: QuerySet[Course],
 
         course_info["course_id"] = course.id
         course_info["capacity"] = course.capacity
-        course_info["current_participants"] = course.current_participants
+        course_info["current_participants"] = taken_seats.get(
+            course.id, course.current_participants)
         course_info["status"] = course.get_status_display()  # 课程所处的选课阶段
+        course_info["conflict"] = (course.id not in unfailed
+                                   and bool(bitmaps[course.id] & occupied))
 
         # 暂时不启用意愿点机制
         # course_info["bidding"] = int(course.bidding)
 
         # 当前学生的选课状态（注：course.participants是一个list）
-        if course.participants:
+        if ledger is not None:
+            course_info["student_status"] = CourseParticipant.Status(
+                selection.get(course.id, CourseParticipant.Status.UNSELECT)).label
+        elif course.participants:
             course_info["student_status"] = course.participants[
                 0].get_status_display()
         else:
@@ -802,90 +884,136 @@ def course_to_display(courses: QuerySet[Course],
 
 
 @logger.secure_func()
-def draw_lots():
+def draw_lots(seed: int | None = None) -> int:
     """
     等额抽签选出成功选课的学生，并修改学生的选课状态
-    """
-    courses = Course.objects.activated().filter(status=Course.Status.DRAWING)
-    for course in courses:
-        with transaction.atomic():
-            participants = CourseParticipant.objects.filter(
-                course=course, status=CourseParticipant.Status.SELECT)
 
-            participants_num = participants.count()
-            if participants_num <= 0:
-                continue
+    一次读取所有抽签中课程的报名记录，在内存中逐门课程抽签，
+    在一个事务中批量写回选课状态和选课人数，最后合并发送全部通知
 
-            participants_id = list(participants.values_list("id", flat=True))
-            capacity = course.capacity
+    抽签结果只由随机种子和报名记录决定，种子记入日志，用于复现和核查
 
-            if participants_num <= capacity:
-                # 选课人数少于课程容量，不用抽签
-                CourseParticipant.objects.filter(
-                    id__in=participants_id).select_for_update().update(
-                        status=CourseParticipant.Status.SUCCESS)
-                Course.objects.filter(id=course.id).select_for_update().update(
-                    current_participants=participants_num)
-            else:
-                # 抽签；可能实现得有一些麻烦
-                lucky_ones = sample(participants_id, capacity)
-                unlucky_ones = list(
-                    set(participants_id).difference(set(lucky_ones)))
-                # 不确定是否要加悲观锁
-                CourseParticipant.objects.filter(
-                    id__in=lucky_ones).select_for_update().update(
-                        status=CourseParticipant.Status.SUCCESS)
+    :param seed: 随机种子，默认随机生成
+    :type seed: int | None, optional
+    :return: 本次抽签使用的随机种子
+    :rtype: int
+    """
+    if seed is None:
+        seed = SystemRandom().randrange(1 << 32)
+    rng = Random(seed)
+
+    courses = Course.objects.activated().filter(
+        status=Course.Status.DRAWING).select_related('organization__organization_id')
+    courses = {course.id: course for course in courses}
+    # 按主键排序，保证同一种子的抽签结果相同
+    applicants: dict[int, list[tuple[int, int]]] = {}
+    for participant_id, course_id, user_id in CourseParticipant.objects.filter(
+        course_id__in=courses,
+        status=CourseParticipant.Status.SELECT,
+    ).order_by('id').values_list('id', 'course_id', 'person__person_id'):
+        applicants.setdefault(course_id, []).append((participant_id, user_id))
+
+    lucky_ones, unlucky_ones = [], []
+    results: dict[int, tuple[list[int], list[int]]] = {}
+    for course_id in sorted(applicants):
+        participants = applicants[course_id]
+        capacity = courses[course_id].capacity
+        if len(participants) <= capacity:
+            # 选课人数少于课程容量，不用抽签
+            lucky = participants
+        else:
+            lucky = rng.sample(participants, capacity)
+        lucky_set = set(lucky)
+        unlucky = [p for p in participants if p not in lucky_set]
+        lucky_ones.extend(participant_id for participant_id, _ in lucky)
+        unlucky_ones.extend(participant_id for participant_id, _ in unlucky)
+        results[course_id] = ([user_id for _, user_id in lucky],
+                              [user_id for _, user_id in unlucky])
+
+    with transaction.atomic():
+        for ids, status in [(lucky_ones, CourseParticipant.Status.SUCCESS),
+                            (unlucky_ones, CourseParticipant.Status.FAILED)]:
+            for i in range(0, len(ids), 1000):
                 CourseParticipant.objects.filter(
-                    id__in=unlucky_ones).select_for_update().update(
-                        status=CourseParticipant.Status.FAILED)
-                Course.objects.filter(id=course.id).select_for_update().update(
-                    current_participants=capacity)
+                    id__in=ids[i:i + 1000]).update(status=status)
+        if results:
+            Course.objects.filter(id__in=results).update(
+                current_participants=Case(*[
+                    When(id=course_id, then=Value(len(lucky)))
+                    for course_id, (lucky, _) in results.items()
+                ]))
+    logger.info(f'选课抽签完成：{len(results)}门课程，{len(lucky_ones)}人选上，'
+                f'{len(unlucky_ones)}人未选上，随机种子为{seed}')
+
+    # 合并发送选课成功和选课失败的通知
+    batches = []
+    for course_id, (lucky, unlucky) in results.items():
+        course = courses[course_id]
+        common = dict(
+            sender=course.organization.get_user(),
+            typename=Notification.Type.NEEDREAD,
+            title=Notification.Title.ACTIVITY_INFORM,
+            # 课程详情页面
+            URL=f"/viewCourse/?courseid={course.id}",
+        )
+        batches.append(dict(
+            receivers=lucky,
+            content=f"您好！您已成功选上课程《{course.name}》！",
+            **common,
+        ))
+        batches.append(dict(
+            receivers=unlucky,
+            content=f"很抱歉通知您，您未选上课程《{course.name}》。",
+            **common,
+        ))
+    bulk_notification_create_batches(
+        batches,
+        to_wechat=dict(app=WechatApp.TO_PARTICIPANT,
+                       level=WechatMessageLevel.IMPORTANT),
+    )
+    return seed
 
-            # 给选课成功的同学发送通知
-            receivers = SQ.qsvlist(CourseParticipant.objects.filter(
-                course=course,
-                status=CourseParticipant.Status.SUCCESS,
-            ), CourseParticipant.person, NaturalPerson.person_id)
-            receivers = User.objects.filter(id__in=receivers)
-            sender = course.organization.get_user()
-            typename = Notification.Type.NEEDREAD
-            title = Notification.Title.ACTIVITY_INFORM
-            content = f"您好！您已成功选上课程《{course.name}》！"
 
-            # 课程详情页面
-            URL = f"/viewCourse/?courseid={course.id}"
-
-            # 批量发送通知
-            bulk_notification_create(
-                receivers=receivers,
-                sender=sender,
-                typename=typename,
-                title=title,
-                content=content,
-                URL=URL,
-                to_wechat=dict(app=WechatApp.TO_PARTICIPANT,
-                               level=WechatMessageLevel.IMPORTANT)
-            )
-
-            # 给选课失败的同学发送通知
-
-            receivers = SQ.qsvlist(CourseParticipant.objects.filter(
-                course=course,
-                status=CourseParticipant.Status.FAILED,
-            ), CourseParticipant.person, NaturalPerson.person_id)
-            receivers = User.objects.filter(id__in=receivers)
-            content = f"很抱歉通知您，您未选上课程《{course.name}》。"
-            if len(receivers) > 0:
-                bulk_notification_create(
-                    receivers=receivers,
-                    sender=sender,
-                    typename=typename,
-                    title=title,
-                    content=content,
-                    URL=URL,
-                    to_wechat=dict(app=WechatApp.TO_PARTICIPANT,
-                                   level=WechatMessageLevel.IMPORTANT),
-                )
+def _join_course_organizations(courses: QuerySet[Course]) -> None:
+    """
+    将课程选课成功的同学批量加入开课小组，查询次数与人数无关
+
+    已有本学期离职记录的同学恢复为在职成员，已在职的同学不变，其余同学新建职务
+
+    :param courses: 结束选课的课程
+    :type courses: QuerySet[Course]
+    """
+    pairs = set(CourseParticipant.objects.filter(
+        course__in=courses,
+        status=CourseParticipant.Status.SUCCESS,
+    ).values_list('person_id', 'course__organization_id'))
+    if not pairs:
+        return
+    existing = Position.objects.current().filter(
+        person_id__in={person_id for person_id, _ in pairs},
+        org_id__in={org_id for _, org_id in pairs},
+    )
+    departed = []
+    joined = set()
+    for position in existing:
+        pair = (position.person_id, position.org_id)
+        if pair not in pairs:
+            continue
+        if position.status == Position.Status.DEPART:
+            # 如果已有当前的离职状态，改成在职成员
+            position.pos = 10
+            position.is_admin = False
+            position.semester = GLOBAL_CONFIG.semester
+            position.status = Position.Status.INSERVICE
+            departed.append(position)
+        joined.add(pair)
+    Position.objects.bulk_update(
+        departed, ['pos', 'is_admin', 'semester', 'status'], batch_size=500)
+    Position.objects.bulk_create([
+        Position(person_id=person_id, org_id=org_id,
+                 semester=GLOBAL_CONFIG.semester)
+        for person_id, org_id in sorted(pairs - joined)
+    ], batch_size=500)
 
 
 @logger.secure_func()
@@ -922,41 +1050,16 @@ def change_course_status(cur_status: Course.Status, to_status: Course.Status) ->
             raise AssertionError("选课已经结束，不能再变化状态")
     else:
         raise AssertionError("未提供当前状态，不允许进行选课状态修改")
+    if ledger_enabled() and cur_status in (Course.Status.STAGE1,
+                                           Course.Status.STAGE2):
+        # 选课账本的日志必须在阶段切换前全部写回
+        while flush_ledger(wait=True):
+            pass
     courses = Course.objects.activated().filter(status=cur_status)
-    if to_status == Course.Status.SELECT_END:
-        courses = courses.select_related('organization')
     with transaction.atomic():
-        for course in courses:
-            if to_status == Course.Status.SELECT_END:
-                # 选课结束，将选课成功的同学批量加入小组
-                participants = CourseParticipant.objects.filter(
-                    course=course,
-                    status=CourseParticipant.Status.SUCCESS).select_related(
-                        'person')
-                organization = course.organization
-                positions = []
-                for participant in participants:
-                    # 如果已有当前的离职状态，改成在职成员
-                    Position.objects.current().filter(
-                        person=participant.person,
-                        org=organization,
-                        status=Position.Status.DEPART,
-                    ).update(pos=10,
-                             is_admin=False,
-                             semester=GLOBAL_CONFIG.semester,
-                             status=Position.Status.INSERVICE)
-                    # 检查是否已经加入小组
-                    if not Position.objects.activated().filter(
-                            person=participant.person,
-                            org=organization).exists():
-                        position = Position(person=participant.person,
-                                            org=organization,
-                                            semester=GLOBAL_CONFIG.semester)
-
-                        positions.append(position)
-                if positions:
-                    with transaction.atomic():
-                        Position.objects.bulk_create(positions)
+        if to_status == Course.Status.SELECT_END:
+            # 选课结束，将选课成功的同学批量加入小组
+            _join_course_organizations(courses)
         # 更新目标状态
         courses.select_for_update().update(status=to_status)
 
@@ -984,16 +1087,17 @@ def register_selection(wait_for: timedelta | None = None):
     stage2_end = max(stage2_end, now + timedelta(seconds=25))
     # 定时任务：修改课程状态
     adder = MultipleAdder(change_course_status)
-    adder.schedule(f'{year}_{semester}_选课_stage1_start',
-                   run_time=stage1_start)(Course.Status.WAITING, Course.Status.STAGE1)
-    adder.schedule(f'{year}_{semester}_选课_stage1_end',
-                   run_time=stage1_end)(Course.Status.STAGE1, Course.Status.DRAWING)
-    ScheduleAdder(draw_lots, id=f'{year}_{semester}_选课_publish',
-                  run_time=publish_time)()
-    adder.schedule(f'{year}_{semester}_选课_stage2_start',
-                   run_time=stage2_start)(Course.Status.DRAWING, Course.Status.STAGE2)
-    adder.schedule(f'{year}_{semester}_选课_stage2_end',
-                   run_time=stage2_end)(Course.Status.STAGE2, Course.Status.SELECT_END)
+    with adder.bulk():
+        adder.schedule(f'{year}_{semester}_选课_stage1_start',
+                       run_time=stage1_start)(Course.Status.WAITING, Course.Status.STAGE1)
+        adder.schedule(f'{year}_{semester}_选课_stage1_end',
+                       run_time=stage1_end)(Course.Status.STAGE1, Course.Status.DRAWING)
+        ScheduleAdder(draw_lots, id=f'{year}_{semester}_选课_publish',
+                      run_time=publish_time)()
+        adder.schedule(f'{year}_{semester}_选课_stage2_start',
+                       run_time=stage2_start)(Course.Status.DRAWING, Course.Status.STAGE2)
+        adder.schedule(f'{year}_{semester}_选课_stage2_end',
+                       run_time=stage2_end)(Course.Status.STAGE2, Course.Status.SELECT_END)
     # 状态随时间的变化: WAITING-STAGE1-WAITING-STAGE2-END
 
 
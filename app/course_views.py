@@ -10,6 +10,7 @@ from app.models import (
     Semester,
     Activity,
     Course,
+    CourseParticipant,
     CourseRecord,
 )
 from app.course_utils import (
@@ -17,6 +18,7 @@ from app.course_utils import (
     create_single_course_activity,
     modify_course_activity,
     registration_status_change,
+    get_selection_ledger,
     course_to_display,
     create_course,
     cal_participate_num,
@@ -519,18 +521,27 @@ def selectCourse(request: HttpRequest):
     # 选课是否已经全部结束
     # is_end = (datetime.now() > str_to_time(html_display["btx_election_end"]))
 
-    unselected_courses = Course.objects.unselected(me)
-    selected_courses = Course.objects.selected(me)
+    ledger = get_selection_ledger()
+    if ledger is None:
+        unselected_courses = Course.objects.unselected(me)
+        selected_courses = Course.objects.selected(me)
+    else:
+        # 选课账本中可能有尚未写回数据库的选课状态
+        selection = ledger.selection(me.id)
+        unfailed = [course_id for course_id, status in selection.items()
+                    if status != CourseParticipant.Status.FAILED]
+        unselected_courses = Course.objects.activated().exclude(id__in=unfailed)
+        selected_courses = Course.objects.activated().filter(id__in=selection)
+
+    unselected_display = course_to_display(unselected_courses, me, ledger=ledger)
+    selected_display = course_to_display(selected_courses, me, ledger=ledger)
 
     # 未选的课程需要按照课程类型排序
     courses = {}
     for type, label in Course.CourseType.choices:
         # 前端使用键呈现
-        courses[label] = course_to_display(unselected_courses.filter(type=type),
-                                          me)
-
-    unselected_display = course_to_display(unselected_courses, me)
-    selected_display = course_to_display(selected_courses, me)
+        courses[label] = [course for course in unselected_display
+                          if course["type"] == label]
 
     bar_display = utils.get_sidebar_and_navbar(request.user, "书院课程")
     return render(request, "course/select_course.html", locals())
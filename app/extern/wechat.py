@@ -7,7 +7,8 @@ wechat.py
     函数可以假设是异步IO，参数符合条件时不抛出异常
     由于异步假设，函数只返回尝试状态，即是否设置了定时任务，不保证成功发送
 '''
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import Iterable
 
 from extern.wechat import send_wechat, DEFAULT_URL
 from app.extern.config import (
@@ -15,7 +16,9 @@ from app.extern.config import (
     Levels as WechatMessageLevel,
     Apps as WechatApp,
 )
-from app.models import NaturalPerson, Organization, Notification, Position
+from app.models import (
+    NaturalPerson, Organization, Notification, NotificationBatch, Position,
+)
 from app.utils import get_person_or_org
 import utils.models.query as SQ
 from utils.http.utils import build_full_url
@@ -25,6 +28,7 @@ from app.log import logger
 __all__ = [
     'WechatApp', 'WechatMessageLevel',
     'publish_notification', 'publish_notifications',
+    'publish_notification_batch',
 ]
 
 
@@ -100,6 +104,46 @@ def get_person_receivers(all_receiver_ids, level=None):
     return SQ.qsvlist(receivers, NaturalPerson.person_id, 'username')
 
 
+def _build_message(notification: Notification | NotificationBatch,
+                   show_source: bool = True) -> tuple[str, str, dict]:
+    '''生成批量通知的微信消息，返回标题、内容和发送参数'''
+    url = notification.URL
+    if url and url[0] == "/":  # 相对路径变为绝对路径
+        url = build_full_url(url)
+
+    title = notification.get_title_display()
+    messages = []
+    if len(notification.content) < 120:
+        # 卡片类型消息最多显示256字节
+        # 因留白等原因，内容120字左右就超出了
+        kws = {"card": True}
+        if show_source:
+            sender = get_person_or_org(notification.sender)
+            # 通知内容暂时也一起去除了
+            messages += [f'发送者：{str(sender)}', '通知内容：']
+        messages += [notification.content]
+        if url:
+            kws["url"] = url
+            kws["btntxt"] = "查看详情"
+    else:
+        # 超出卡片字数范围的消息使用文本格式发送
+        kws = {"card": False}
+        messages.append('')
+        if show_source:
+            sender = get_person_or_org(notification.sender)
+            # 通知内容暂时也一起去除了
+            messages += ['发送者：' + f'{str(sender)}', '通知内容：']
+        messages += [notification.content]
+        if url:
+            messages += ['', f'<a href="{url}">阅读原文</a>']
+        else:
+            messages += ['', f'<a href="{DEFAULT_URL}">查看详情</a>']
+
+    # 获取完整消息
+    message = '\n'.join(messages)
+    return title, message, kws
+
+
 @logger.secure_func(fail_value=False)
 def publish_notification(notification_or_id,
                         show_source=True,
@@ -175,6 +219,43 @@ def publish_notification(notification_or_id,
     return True
 
 
+def _publish(notification: Notification | NotificationBatch,
+             receiver_ids: Iterable[int],
+             show_source=True, app=None, level=None) -> bool:
+    '''向一批通知的接收者发送相同的微信消息'''
+    title, message, kws = _build_message(notification, show_source)
+
+    # 获得发送应用和消息发送等级
+    if app is None or app == WechatApp.DEFAULT:
+        app = _get_default_app('notification', notification)
+    check_block = app not in CONFIG.unblock_apps
+    if check_block and (level is None or level == WechatMessageLevel.DEFAULT):
+        level = _get_default_level('notification', notification)
+    if not check_block:
+        level = None
+
+    # 获取接收者列表，小组的接收者为其负责人，去重
+    person_receivers = get_person_receivers(receiver_ids, level)
+    wechat_receivers = person_receivers
+    receiver_set = set(wechat_receivers)
+
+    # 接下来是发送给小组的部分
+    org_receivers = Organization.objects.activated().filter(
+        organization_id__in=receiver_ids)
+    for org in org_receivers:
+        managers = [
+            manager for manager in org2receivers(org, level, force=False)
+            if manager not in receiver_set
+        ]
+        wechat_receivers.extend(managers)
+        receiver_set.update(managers)
+    if not wechat_receivers:    # 可能都不接收此等级的消息
+        return True
+
+    send_wechat(wechat_receivers, title, message, api_path=app2path(app), **kws)
+    return True
+
+
 @logger.secure_func(fail_value=False)
 def publish_notifications(
     notifications_or_ids=None, filter_kws=None, exclude_kws=None,
@@ -252,67 +333,36 @@ def publish_notifications(
     except:
         raise Exception("检查失败，发生了未知错误，这里不该发生异常")
 
-    if url and url[0] == "/":  # 相对路径变为绝对路径
-        url = build_full_url(url)
+    receiver_ids = notifications.values_list("receiver_id", flat=True)
+    return _publish(latest_notification, receiver_ids, show_source, app, level)
 
-    title = latest_notification.get_title_display()
-    messages = []
-    if len(latest_notification.content) < 120:
-        # 卡片类型消息最多显示256字节
-        # 因留白等原因，内容120字左右就超出了
-        kws = {"card": True}
-        if show_source:
-            sender = get_person_or_org(latest_notification.sender)
-            # 通知内容暂时也一起去除了
-            messages += [f'发送者：{str(sender)}', '通知内容：']
-        messages += [latest_notification.content]
-        if url:
-            kws["url"] = url
-            kws["btntxt"] = "查看详情"
-    else:
-        # 超出卡片字数范围的消息使用文本格式发送
-        kws = {"card": False}
-        messages.append('')
-        if show_source:
-            sender = get_person_or_org(latest_notification.sender)
-            # 通知内容暂时也一起去除了
-            messages += ['发送者：' + f'{str(sender)}', '通知内容：']
-        messages += [latest_notification.content]
-        if url:
-            messages += ['', f'<a href="{url}">阅读原文</a>']
-        else:
-            messages += ['', f'<a href="{DEFAULT_URL}">查看详情</a>']
 
-    # 获取完整消息
-    message = '\n'.join(messages)
-
-    # 获得发送应用和消息发送等级
-    if app is None or app == WechatApp.DEFAULT:
-        app = _get_default_app('notification', latest_notification)
-    check_block = app not in CONFIG.unblock_apps
-    if check_block and (level is None or level == WechatMessageLevel.DEFAULT):
-        level = _get_default_level('notification', latest_notification)
-    if not check_block:
-        level = None
+@logger.secure_func(fail_value=False)
+def publish_notification_batch(batch: NotificationBatch | int | str,
+                               show_source=True,
+                               app=None, level=None,
+                               *, force=False) -> bool:
+    """
+    向一批通知的全部接收者发送微信，每批只发送一次
 
-    # 获取接收者列表，小组的接收者为其负责人，去重
-    receiver_ids = notifications.values_list("receiver_id", flat=True)
-    person_receivers = get_person_receivers(receiver_ids, level)
-    wechat_receivers = person_receivers
-    receiver_set = set(wechat_receivers)
+    - batch: NotificationBatch | int | str, 批次、主键或批量信息标识，
+      标识对应最新的批次，内容相同的批次标识相同，需要确定的批次时传入批次或主键
+    - show_source, app, level: 同publish_notifications
+    - force: bool, 仅关键字参数，已发送时仍然重发
 
-    # 接下来是发送给小组的部分
-    org_receivers = Organization.objects.activated().filter(
-        organization_id__in=receiver_ids)
-    for org in org_receivers:
-        managers = [
-            manager for manager in org2receivers(org, level, force=False)
-            if manager not in receiver_set
-        ]
-        wechat_receivers.extend(managers)
-        receiver_set.update(managers)
-    if not wechat_receivers:    # 可能都不接收此等级的消息
+    Returns
+    -------
+    - success: bool, 是否尝试了发送或已经发送过，出错时返回False
+    """
+    if isinstance(batch, int):
+        batch = NotificationBatch.objects.get(pk=batch)
+    elif isinstance(batch, str):
+        batch = NotificationBatch.objects.filter(identifier=batch).latest('id')
+    # 先标记为已发送，定时任务重复触发时不会重复发送
+    claimed = NotificationBatch.objects.filter(
+        pk=batch.pk, publish_time__isnull=True,
+    ).update(publish_time=datetime.now())
+    if not claimed and not force:
+        logger.info(f'批量通知{batch.identifier}已发送过微信，跳过')
         return True
-
-    send_wechat(wechat_receivers, title, message, api_path=app2path(app), **kws)
-    return True
+    return _publish(batch, batch.receiver_ids, show_source, app, level)
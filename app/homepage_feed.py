@@ -0,0 +1,146 @@
+"""
+homepage_feed.py
+
+首页中与用户无关的内容，预先计算并缓存，首页请求只需读取缓存
+
+- 包括近期、今日、新发布、即将截止的活动，心愿墙，引导图和天气
+- 内容最多一分钟后过期，活动或心愿保存时立即过期（见models.py）
+- 过期后仍保留旧内容，只有取得重建锁的请求重新计算，其他请求使用旧内容，
+  避免早高峰大量请求同时重建
+- 没有旧内容时（冷启动或缓存被淘汰），其他请求等待取得锁的请求重建完成，
+  等待超时后才自行重建
+- 与当前时间有关的展示（如距截止的小时数、天气更新时间）在渲染时计算
+
+homepage_feed: 获取首页的共享内容
+build_homepage_feed: 重新计算首页的共享内容
+invalidate_homepage_feed: 使首页的共享内容过期
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.core.cache import cache
+
+from app.models import Activity, Wishes
+from app.log import logger
+
+
+__all__ = [
+    'homepage_feed',
+    'build_homepage_feed',
+    'invalidate_homepage_feed',
+]
+
+
+_FEED_KEY = 'homepage:feed'
+_FRESH_KEY = 'homepage:feed:fresh'
+_LOCK_KEY = 'homepage:feed:lock'
+FRESH_TIMEOUT = 60
+# 旧内容的最长保留时间，超过后必须重建，应足够长以减少没有旧内容可用的情况
+STALE_TIMEOUT = 86400
+LOCK_TIMEOUT = 30
+# 没有旧内容时等待其他请求重建的最长时间（秒）
+REBUILD_WAIT = 5.0
+
+GUIDEPIC_DIR = 'static/assets/img/guidepics'
+
+
+def _load_guidepics() -> list[tuple[str, str]]:
+    '''从redirect.json读取要作为引导图的图片，按照原始顺序'''
+    with open(f'{GUIDEPIC_DIR}/redirect.json') as file:
+        img2url = json.load(file)
+    return list(img2url.items())
+
+
+def build_homepage_feed() -> dict[str, Any]:
+    '''
+    重新计算首页的共享内容，活动均已加载所属小组，渲染时不再查询
+
+    :return: 首页的共享内容，键名与模板变量一致
+    :rtype: dict[str, Any]
+    '''
+    nowtime = datetime.now()
+    # 开始时间在前后一周内，除了取消和审核中的活动。按时间逆序排序
+    recentactivity_list = list(Activity.objects.get_recent_activity(
+    ).select_related('organization_id'))
+
+    # 开始时间在今天的活动,且不展示结束的活动。按开始时间由近到远排序
+    activities = Activity.objects.get_today_activity().select_related('organization_id')
+    today_activities = [
+        (activity, activity.start.strftime("%H:%M")) for activity in activities
+    ]
+
+    # 最新一周内发布的活动，按发布的时间逆序
+    newlyreleased_list = list(Activity.objects.get_newlyreleased_activity(
+    ).select_related('organization_id'))
+
+    # 即将截止的活动，按截止时间正序
+    signup_rec = list(Activity.objects.activated().select_related(
+        'organization_id').filter(status=Activity.Status.APPLYING).order_by(
+        "category", "apply_end")[:10])
+
+    # 心愿墙！最近一周的心愿，已经逆序排列，如果超过100个取前100个就可
+    wishes = list(Wishes.objects.filter(time__gt=nowtime - timedelta(days=7))[:100])
+
+    # 原先还会从上周的总结照片中为每个活动选一张展示，但展示已被关闭，不再查询
+    photo_display = ()
+    guidepics = _load_guidepics()
+
+    # TODO: Put get_weather somewhere else
+    from app.jobs import get_weather
+    return dict(
+        recentactivity_list=recentactivity_list,
+        today_activities=today_activities,
+        newlyreleased_list=newlyreleased_list,
+        signup_rec=signup_rec,
+        wishes=wishes,
+        photo_display=photo_display,
+        guidepics=guidepics,
+        weather=get_weather(),
+    )
+
+
+def _wait_for_rebuild() -> dict[str, Any] | None:
+    '''等待取得锁的请求重建，超时或锁已释放仍未重建时返回None'''
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        cached = cache.get_many([_FEED_KEY, _LOCK_KEY])
+        if _FEED_KEY in cached:
+            return cached[_FEED_KEY]
+        if _LOCK_KEY not in cached:
+            return None
+    return None
+
+
+def homepage_feed() -> dict[str, Any]:
+    '''获取首页的共享内容，过期时由一个请求重建，其他请求使用旧内容或等待重建'''
+    cached = cache.get_many([_FEED_KEY, _FRESH_KEY])
+    feed = cached.get(_FEED_KEY)
+    if feed is not None and _FRESH_KEY in cached:
+        return feed
+    locked = cache.add(_LOCK_KEY, True, LOCK_TIMEOUT)
+    if feed is not None and not locked:
+        return feed
+    if not locked:
+        feed = _wait_for_rebuild()
+        if feed is not None:
+            return feed
+    try:
+        feed = build_homepage_feed()
+        cache.set(_FEED_KEY, feed, STALE_TIMEOUT)
+        cache.set(_FRESH_KEY, True, FRESH_TIMEOUT)
+    except Exception:
+        if feed is None:
+            raise
+        logger.exception('首页内容重建失败，继续使用旧内容')
+    finally:
+        if locked:
+            cache.delete(_LOCK_KEY)
+    return feed
+
+
+def invalidate_homepage_feed() -> None:
+    '''使首页的共享内容过期，下次请求时重建'''
+    cache.delete(_FRESH_KEY)
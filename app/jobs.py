@@ -5,14 +5,15 @@ from datetime import datetime, timedelta, date
 from typing import Any, Dict
 
 from django.db import transaction  # 原子化更改数据库
-from django.db.models import F
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 
 from utils.marker import script
 import utils.models.query as SQ
 from boot.config import GLOBAL_CONFIG
 from semester.api import current_semester
-from record.models import PageLog
-from scheduler.adder import MultipleAdder
+from record.activity import rollup_missing, active_days
+from scheduler.adder import MultipleAdder, schedule_batch
 from scheduler.cancel import remove_job
 from scheduler.periodic import periodical
 from app.models import (
@@ -40,6 +41,9 @@ from app.notification_utils import (
     bulk_notification_create,
     notification_create,
 )
+from app.course_ledger import ledger_enabled, flush_ledger
+from app.search_utils import rebuild_search_index
+from app.activity_transition import apply_due_transitions
 from app.extern.wechat import WechatApp, WechatMessageLevel
 from app.log import logger
 from app.config import *
@@ -53,6 +57,7 @@ __all__ = [
     'get_weather_async',
     'update_active_score_per_day',
     'longterm_launch_course',
+    'flush_course_ledger',
     'happy_birthday',
     'weekly_activity_summary_reminder',
 ]
@@ -84,46 +89,16 @@ def send_to_orgs(title, message, url='/index/'):
     )
 
 
-@periodical('interval', job_id='activityStatusUpdater', minutes=5)
+@periodical('interval', job_id='activityStatusUpdater', seconds=10)
 def changeAllActivities():
     """
-    频繁执行，添加更新其他活动的定时任务，主要是为了异步调度
-    对于被多次落下的活动，每次更新一步状态
+    频繁执行，批量完成所有到期的活动状态转换，见activity_transition
+    未到期时只有几次索引查询，对于被多次落下的活动，一次推进到应处的状态
     """
-    def next_time_generator(first: timedelta | datetime, step: timedelta):
-        while True:
-            yield first
-            first += step
-    now = datetime.now()
-    times = next_time_generator(
-        now + timedelta(seconds=20), timedelta(seconds=5))
-    adder = MultipleAdder(changeActivityStatus)
-
-    def _update_all(_cur, _next, activities):
-        for activity in activities:
-            adder.schedule(f'activity_{activity.id}_{_next}',
-                           run_time=next(times))(activity.id, _cur, _next)
-
-    applying_activities = Activity.objects.filter(
-        status=Activity.Status.APPLYING,
-        apply_end__lte=now,
-    )
-    _update_all(Activity.Status.APPLYING,
-                Activity.Status.WAITING, applying_activities)
-
-    waiting_activities = Activity.objects.filter(
-        status=Activity.Status.WAITING,
-        start__lte=now,
-    )
-    _update_all(Activity.Status.WAITING,
-                Activity.Status.PROGRESSING, waiting_activities)
-
-    progressing_activities = Activity.objects.filter(
-        status=Activity.Status.PROGRESSING,
-        end__lte=now,
-    )
-    _update_all(Activity.Status.PROGRESSING,
-                Activity.Status.END, progressing_activities)
+    applied = apply_due_transitions()
+    if any(applied.values()):
+        logger.info('活动状态转换: ' + ', '.join(
+            f'{status.label}{count}个' for status, count in applied.items() if count))
 
 
 @periodical('interval', job_id="get weather per hour", hours=1)
@@ -235,28 +210,20 @@ def add_week_course_activity(course_id: int, weektime_id: int, cur_week: int, co
     changer = MultipleAdder(changeActivityStatus)
     notifier = MultipleAdder(notifyActivity)
     # TODO: 修改UNPUBLISHED状态的诡异逻辑和状态切换
-    if activity.need_apply:
-        changer.schedule(f'activity_{activity.id}_{Activity.Status.APPLYING}',
-                         run_time=activity.publish_time
-                         )(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.APPLYING)
-        changer.schedule(f'activity_{activity.id}_{Activity.Status.WAITING}',
-                         run_time=activity.start - timedelta(hours=1)
-                         )(activity.id, Activity.Status.APPLYING, Activity.Status.WAITING)
-    else:
-        changer.schedule(f'activity_{activity.id}_{Activity.Status.WAITING}',
-                         run_time=activity.publish_time
-                         )(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.WAITING)
-
-    notifier.schedule(f'activity_{activity.id}_newCourseActivity',
-                      run_time=activity.publish_time)(activity.id, "newCourseActivity")
-    notifier.schedule(f'activity_{activity.id}_remind',
-                      run_time=activity.start - timedelta(minutes=15))(activity.id, "remind")
-    changer.schedule(f'activity_{activity.id}_{Activity.Status.PROGRESSING}',
-                     run_time=activity.start
-                     )(activity.id, Activity.Status.WAITING, Activity.Status.PROGRESSING)
-    changer.schedule(f'activity_{activity.id}_{Activity.Status.END}',
-                     run_time=activity.end
-                     )(activity.id, Activity.Status.PROGRESSING, Activity.Status.END)
+    with schedule_batch():
+        if activity.need_apply:
+            changer.schedule(f'activity_{activity.id}_{Activity.Status.APPLYING}',
+                             run_time=activity.publish_time
+                             )(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.APPLYING)
+        else:
+            changer.schedule(f'activity_{activity.id}_{Activity.Status.WAITING}',
+                             run_time=activity.publish_time
+                             )(activity.id, Activity.Status.UNPUBLISHED, Activity.Status.WAITING)
+
+        notifier.schedule(f'activity_{activity.id}_newCourseActivity',
+                          run_time=activity.publish_time)(activity.id, "newCourseActivity")
+        notifier.schedule(f'activity_{activity.id}_remind',
+                          run_time=activity.start - timedelta(minutes=15))(activity.id, "remind")
 
     notification_create(
         receiver=examine_teacher.person_id,
@@ -293,20 +260,34 @@ def longterm_launch_course():
                         course.id, week_time.id, cur_week, course_stage2)
 
 
+@periodical('interval', 'courseLedgerFlusher', minutes=1)
+def flush_course_ledger():
+    '''兜底写回选课账本，选课请求稀疏时日志可能长时间未达到批量大小'''
+    if ledger_enabled():
+        flush_ledger()
+
+
 @periodical('cron', 'active_score_updater', hour=1)
 def update_active_score_per_day(days=14):
-    '''每天计算用户活跃度， 计算前days天（不含今天）内的平均活跃度'''
-    with transaction.atomic():
-        today = datetime.now().date()
-        persons = NaturalPerson.objects.activated().select_for_update()
-        persons.update(active_score=0)
-        for i in range(days):
-            date = today - timedelta(days=i+1)
-            userids = set(PageLog.objects.filter(
-                time__date=date).values_list('user', flat=True))
-            persons.filter(SQ.mq(NaturalPerson.person_id, IN=userids)).update(
-                active_score=F('active_score') + 1 / days)
+    '''
+    每天计算用户活跃度，即前days天（不含今天）内访问过页面的天数占比
 
+    先补齐这些天的每日埋点汇总，再用一条UPDATE由汇总计算全部用户的活跃度
+    '''
+    today = datetime.now().date()
+    rollup_missing(today, days)
+    active_num = active_days(today - timedelta(days=days), today).filter(
+        user=OuterRef(SQ.f(NaturalPerson.person_id)),
+    ).values('user').annotate(num=Count('id')).values('num')
+    NaturalPerson.objects.activated().update(
+        active_score=Coalesce(Subquery(active_num), Value(0)) / Value(float(days)))
+
+
+@periodical('cron', 'search_index_rebuilder', hour=4)
+def rebuild_search_index_per_day():
+    '''每天重建搜索索引，修正批量修改和学期切换导致的偏差'''
+    total = rebuild_search_index()
+    logger.info(f'搜索索引重建完成，共{total}个词元')
 
 # TODO: Move these to schedueler app
 def cancel_related_jobs(instance, extra_ids=None):
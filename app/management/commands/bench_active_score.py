@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+import utils.models.query as SQ
+from app.models import NaturalPerson
+from app.jobs import update_active_score_per_day
+from record.models import PageLog, DailyActivity
+from app.management.synthetic import create_persons, remove_synthetic
+
+
+PREFIX = 'bench_active_'
+
+
+def legacy_update(days: int = 14):
+    '''原活跃度任务：逐天按日期函数扫描PageLog，用IN列表累加'''
+    with transaction.atomic():
+        today = datetime.now().date()
+        persons = NaturalPerson.objects.activated().select_for_update()
+        persons.update(active_score=0)
+        for i in range(days):
+            date = today - timedelta(days=i+1)
+            userids = set(PageLog.objects.filter(
+                time__date=date).values_list('user', flat=True))
+            persons.filter(SQ.mq(NaturalPerson.person_id, IN=userids)).update(
+                active_score=F('active_score') + 1 / days)
+
+
+class Command(BaseCommand):
+    help = '活跃度任务压力测试：比较逐天扫描埋点和由每日汇总计算活跃度的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=30, help='生成埋点的天数')
+        parser.add_argument('--logs', type=int, default=20, help='每个活跃用户每天的埋点数')
+        parser.add_argument('--active', type=float, default=0.4, help='用户每天活跃的概率')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        remove_synthetic(PREFIX)
+        try:
+            persons = create_persons(PREFIX, options['users'])
+            total = self._logs(persons, options, random.Random(options['seed']))
+            self.stdout.write(f'{len(persons)}个用户，{options["days"]}天共{total}条埋点')
+            person_ids = [person.id for person in persons]
+
+            self._report('逐天扫描', legacy_update)
+            expected = self._scores(person_ids)
+            DailyActivity.objects.filter(user__username__startswith=PREFIX).delete()
+            self._report('汇总（首次补齐）', update_active_score_per_day)
+            self._report('汇总（每日增量）', update_active_score_per_day)
+            scores = self._scores(person_ids)
+            diff = max(abs(scores[id] - expected[id]) for id in person_ids)
+            self.stdout.write(f'活跃度最大差异: {diff:.2e}')
+        finally:
+            remove_synthetic(PREFIX)
+
+    def _logs(self, persons, options, rng: random.Random) -> int:
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        logs = []
+        total = 0
+        for day in range(options['days']):
+            start = today - timedelta(days=day + 1)
+            for person in persons:
+                if rng.random() >= options['active']:
+                    continue
+                for _ in range(options['logs']):
+                    logs.append(PageLog(
+                        user_id=person.person_id_id,
+                        type=rng.choice(PageLog.CountType.values),
+                        page='/welcome/',
+                        time=start + timedelta(seconds=rng.randrange(86400)),
+                    ))
+            PageLog.objects.bulk_create(logs, batch_size=2000)
+            total += len(logs)
+            logs.clear()
+        return total
+
+    def _scores(self, person_ids) -> dict[int, float]:
+        return dict(NaturalPerson.objects.filter(
+            id__in=person_ids).values_list('id', 'active_score'))
+
+    def _report(self, name: str, run):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        begin = time.perf_counter()
+        with connection.execute_wrapper(count):
+            run()
+        elapsed = time.perf_counter() - begin
+        self.stdout.write(f'{name}: {elapsed * 1000:.1f}ms, {queries}次查询')
@@ -0,0 +1,172 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from Appointment.config import appointment_config as CONFIG
+from Appointment.models import Room, Participant, Appoint, LongTermAppoint
+from Appointment.utils.utils import get_conflict_appoints
+from Appointment.utils.occupancy import room_occupancy
+from app.management.synthetic import create_persons, remove_synthetic
+
+
+PREFIX = 'bench_appoint_'
+RID = 'BENCH01'
+TALK_RID = 'BENCHT{}'
+
+
+class Command(BaseCommand):
+    help = '预约冲突检测压力测试：比较长期预约检测的数据库与内存实现，统计房间时间表和讨论室页面的渲染'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--per-day', type=int, default=8, help='每天的预约数')
+        parser.add_argument('--longterms', type=int, default=20)
+        parser.add_argument('--talk-rooms', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self._cleanup()
+        try:
+            persons = create_persons(PREFIX, options['users'])
+            users = [person.get_user() for person in persons]
+            Participant.objects.bulk_create([
+                Participant(Sid=user, longterm=True) for user in users])
+            participants = list(Participant.objects.filter(Sid__in=users))
+            room = Room.objects.create(
+                Rid=RID, Rtitle=PREFIX, Rstart=datetime.min.time(),
+                Rfinish=datetime.max.time().replace(microsecond=0))
+            self._create_appoints(room, participants, options['per_day'],
+                                  options['longterms'])
+            self._create_talk_rooms(participants, options['talk_rooms'],
+                                    options['per_day'])
+            cache.clear()
+            # 压力测试在单个进程内运行，进程内缓存也可以启用索引和网格的缓存
+            with mock.patch('Appointment.utils.occupancy.shared_cache', return_value=True), \
+                    mock.patch('Appointment.utils.slot_grid.shared_cache', return_value=True):
+                self._bench_check(room, options['repeat'])
+                today = date.today()
+                self._bench_render(users[0], options['repeat'], '房间时间表',
+                                   f'/underground/arrange_time?Rid={RID}&start_week=0')
+                self._bench_render(users[0], options['repeat'], '讨论室页面',
+                                   f'/underground/arrange_talk?year={today.year}'
+                                   f'&month={today.month}&day={today.day}&type=talk')
+        finally:
+            self._cleanup()
+
+    def _create_appoints(self, room: Room, participants: list[Participant],
+                         per_day: int, longterms: int):
+        rng = random.Random(0)
+        today = datetime.combine(date.today(), datetime.min.time())
+        weeks = CONFIG.longterm_max_week
+        hours = 24 // per_day
+        appoints = []
+        # 普通预约在同一天内不重叠，覆盖前后各longterm_max_week周
+        for day in range(-weeks * 7, weeks * 7):
+            for i in range(per_day):
+                start = today + timedelta(days=day, hours=i * hours)
+                appoints.append(Appoint(
+                    Room=room, Astart=start, Afinish=start + timedelta(hours=hours),
+                    major_student=rng.choice(participants), Aneed_num=1, Ausage=PREFIX,
+                    Atype=Appoint.Type.NORMAL, Astatus=Appoint.Status.APPOINTED))
+        with transaction.atomic():
+            Appoint.objects.bulk_create(appoints, batch_size=1000)
+            # 长期预约占用额外的半小时，与普通预约重叠
+            for _ in range(longterms):
+                student = rng.choice(participants)
+                start = today + timedelta(days=rng.randrange(-weeks * 7, 0),
+                                          hours=rng.randrange(24), minutes=30)
+                interval = rng.randint(1, CONFIG.longterm_max_interval)
+                times = weeks // interval
+                first, *subs = [
+                    Appoint.objects.create(
+                        Room=room, Astart=start + timedelta(weeks=week),
+                        Afinish=start + timedelta(weeks=week, minutes=30),
+                        major_student=student, Aneed_num=1, Ausage=PREFIX,
+                        Atype=Appoint.Type.LONGTERM, Astatus=Appoint.Status.APPOINTED)
+                    for week in range(0, times * interval, interval)
+                ]
+                LongTermAppoint.objects.create(
+                    appoint=first, applicant=student, times=times, interval=interval,
+                    status=LongTermAppoint.Status.APPROVED)
+        self.stdout.write(f'房间共{Appoint.objects.filter(Room=room).count()}个预约')
+
+    def _bench_check(self, room: Room, repeat: int):
+        weeks = CONFIG.longterm_max_week
+        appoint = Appoint.objects.filter(
+            Room=room, Astart__gte=datetime.now()).order_by('Astart').first()
+        args = (appoint.Astart, appoint.Afinish, weeks, 1)
+
+        begin = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(repeat):
+                expected = list(get_conflict_appoints(appoint, weeks, 1).values_list(
+                    'Aid', flat=True))
+        db_time = (time.perf_counter() - begin) / repeat
+        db_queries = len(queries) // repeat
+
+        cache.clear()
+        begin = time.perf_counter()
+        room_occupancy(room.Rid)
+        build_time = time.perf_counter() - begin
+        begin = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(repeat):
+                found = [slot.id for slot in room_occupancy(room.Rid).conflicts(*args)]
+        mem_time = (time.perf_counter() - begin) / repeat
+        assert found == expected, '冲突检测结果不一致'
+        self.stdout.write(
+            f'{weeks}周长期预约冲突检测: 数据库{db_time * 1000:.2f}ms/{db_queries}次查询, '
+            f'索引{mem_time * 1000:.3f}ms/{len(queries) // repeat}次查询, '
+            f'构建索引{build_time * 1000:.1f}ms')
+
+    def _create_talk_rooms(self, participants: list[Participant], num: int,
+                           per_day: int):
+        rng = random.Random(1)
+        today = datetime.combine(date.today(), datetime.min.time())
+        appoints = []
+        for i in range(num):
+            room = Room.objects.create(
+                Rid=TALK_RID.format(i), Rtitle=f'{PREFIX}研讨室',
+                Rstart=datetime.min.time().replace(hour=8),
+                Rfinish=datetime.min.time().replace(hour=23))
+            for day in range(7):
+                for hour in rng.sample(range(8, 22), per_day):
+                    start = today + timedelta(days=day, hours=hour)
+                    appoints.append(Appoint(
+                        Room=room, Astart=start, Afinish=start + timedelta(hours=1),
+                        major_student=rng.choice(participants), Aneed_num=1,
+                        Ausage=PREFIX, Atype=Appoint.Type.NORMAL,
+                        Astatus=Appoint.Status.APPOINTED))
+        Appoint.objects.bulk_create(appoints, batch_size=1000)
+
+    def _bench_render(self, user, repeat: int, name: str, url: str):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        for label, clear in [('冷缓存', True), ('热缓存', False)]:
+            total = 0.0
+            for _ in range(repeat):
+                if clear:
+                    cache.clear()
+                    client.force_login(user)
+                begin = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                total += time.perf_counter() - begin
+                assert response.status_code == 200, response.status_code
+            self.stdout.write(
+                f'{name}（{label}）: {total / repeat * 1000:.1f}ms, '
+                f'{len(queries)}次查询')
+        client.logout()
+
+    def _cleanup(self):
+        rooms = Room.objects.filter(Rid__startswith='BENCH')
+        Appoint.objects.filter(Room__in=rooms).delete()
+        rooms.delete()
+        remove_synthetic(PREFIX)
@@ -0,0 +1,125 @@
+import random
+import time
+from datetime import datetime, timedelta
+from threading import Thread
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Q
+
+from app.config import CONFIG
+from app.models import Course, CourseTime, CourseParticipant
+from app.course_ledger import flush_ledger
+from app.course_utils import registration_status_change
+from app.management.synthetic import create_persons, create_orgs, remove_synthetic
+
+
+PREFIX = 'bench_sel_'
+
+
+class Command(BaseCommand):
+    help = '选课压力测试：模拟大量学生在补退选阶段并发选课，比较选课账本和行锁两种模式'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--capacity', type=int, default=40)
+        parser.add_argument('--clicks', type=int, default=3, help='每位学生的点击次数')
+        parser.add_argument('--threads', type=int, default=32, help='并发线程数')
+        parser.add_argument('--mode', choices=['ledger', 'lock', 'both'], default='both')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        remove_synthetic(PREFIX)
+        try:
+            persons = create_persons(PREFIX, options['students'])
+            org = create_orgs(PREFIX, 1)[0]
+            courses = self._create_courses(org, options['courses'], options['capacity'])
+            rng = random.Random(options['seed'])
+            # 热门课程集中在前几门，模拟抢课
+            weights = [1 / (i + 1) for i in range(len(courses))]
+            clicks = [(person, course.id) for person in persons
+                      for course in rng.choices(courses, weights, k=options['clicks'])]
+            rng.shuffle(clicks)
+            modes = ['ledger', 'lock'] if options['mode'] == 'both' else [options['mode']]
+            for mode in modes:
+                self._reset(courses)
+                self._run(mode, clicks, options['threads'])
+                self._verify(courses)
+        finally:
+            remove_synthetic(PREFIX)
+
+    def _create_courses(self, org, num: int, capacity: int) -> list[Course]:
+        Course.objects.bulk_create([
+            Course(name=f'{PREFIX}{i}', organization=org, capacity=capacity,
+                   type=Course.CourseType.MORAL, status=Course.Status.STAGE2)
+            for i in range(num)
+        ])
+        courses = list(Course.objects.filter(organization=org).order_by('id'))
+        monday = datetime(2023, 2, 20, 8)
+        CourseTime.objects.bulk_create([
+            CourseTime(course=course,
+                       start=monday + timedelta(hours=3 * (i % 28)),
+                       end=monday + timedelta(hours=3 * (i % 28) + 2))
+            for i, course in enumerate(courses)
+        ])
+        return courses
+
+    def _reset(self, courses: list[Course]):
+        CourseParticipant.objects.filter(course__in=courses).delete()
+        Course.objects.filter(id__in=[c.id for c in courses]).update(
+            current_participants=0)
+        caches[CONFIG.course.ledger_cache].clear()
+
+    def _run(self, mode: str, clicks: list, threads: int):
+        latencies = []
+        results = []
+
+        def worker(part):
+            for person, course_id in part:
+                start = time.perf_counter()
+                context = registration_status_change(course_id, person, 'select')
+                latencies.append(time.perf_counter() - start)
+                results.append(context.get('warn_message', ''))
+            connection.close()
+
+        # 压力测试在单个进程内运行，进程内缓存也可以启用账本
+        with mock.patch('app.course_utils.ledger_enabled', return_value=mode == 'ledger'):
+            workers = [Thread(target=worker, args=(clicks[i::threads],))
+                       for i in range(threads)]
+            begin = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - begin
+            if mode == 'ledger':
+                while flush_ledger(wait=True):
+                    pass
+            total = time.perf_counter() - begin
+
+        latencies.sort()
+
+        def pct(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f'[{mode}] {len(clicks)}次点击 {threads}线程: '
+            f'{len(clicks) / elapsed:.0f}次/秒 (含写回{total:.2f}秒), '
+            f'p50={pct(0.5):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms, '
+            f'成功{results.count("选课成功！")}次, 已满{results.count("选课人数已满！")}次'
+        )
+
+    def _verify(self, courses: list[Course]):
+        counts = Course.objects.filter(id__in=[c.id for c in courses]).annotate(
+            success=Count('participant_set', filter=Q(
+                participant_set__status=CourseParticipant.Status.SUCCESS)))
+        for course in counts:
+            if course.success > course.capacity or course.success != course.current_participants:
+                self.stderr.write(
+                    f'课程{course.name}不一致: 容量{course.capacity}, '
+                    f'选上{course.success}, 记录人数{course.current_participants}')
+                return
+        self.stdout.write('一致性检查通过：选上人数不超过容量，且与记录人数一致')
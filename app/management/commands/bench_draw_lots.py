@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+
+from app.models import Course, CourseParticipant, Notification
+from app.course_utils import draw_lots
+from app.management.synthetic import create_persons, create_orgs, remove_synthetic
+
+
+PREFIX = 'bench_draw_'
+
+
+class Command(BaseCommand):
+    help = '抽签压力测试：为大量课程生成预选记录，统计一次抽签的耗时和查询次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=4000)
+        parser.add_argument('--courses', type=int, default=500)
+        parser.add_argument('--selections', type=int, default=20000)
+        parser.add_argument('--capacity', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        remove_synthetic(PREFIX)
+        try:
+            persons = create_persons(PREFIX, options['students'])
+            org = create_orgs(PREFIX, 1)[0]
+            courses = self._create_courses(org, options['courses'], options['capacity'])
+            self._create_selections(persons, courses, options['selections'],
+                                    random.Random(options['seed']))
+            with CaptureQueriesContext(connection) as queries:
+                begin = time.perf_counter()
+                seed = draw_lots(options['seed'])
+                elapsed = time.perf_counter() - begin
+            self.stdout.write(
+                f'{len(courses)}门课程 {options["selections"]}条预选记录: '
+                f'抽签耗时{elapsed:.2f}秒, {len(queries)}次查询, 随机种子{seed}')
+            self._verify(courses)
+        finally:
+            Notification.objects.filter(sender__username__startswith=PREFIX).delete()
+            remove_synthetic(PREFIX)
+
+    def _create_courses(self, org, num: int, capacity: int) -> list[Course]:
+        Course.objects.bulk_create([
+            Course(name=f'{PREFIX}{i}', organization=org, capacity=capacity,
+                   type=Course.CourseType.MORAL, status=Course.Status.DRAWING)
+            for i in range(num)
+        ])
+        return list(Course.objects.filter(organization=org).order_by('id'))
+
+    def _create_selections(self, persons, courses, num: int, rng: random.Random):
+        # 热门课程集中在前几门，部分课程需要抽签
+        weights = [1 / (i + 1) ** 0.5 for i in range(len(courses))]
+        pairs = set()
+        while len(pairs) < min(num, len(persons) * len(courses)):
+            pairs.add((rng.randrange(len(persons)),
+                       rng.choices(range(len(courses)), weights)[0]))
+        CourseParticipant.objects.bulk_create([
+            CourseParticipant(person=persons[p], course=courses[c],
+                              status=CourseParticipant.Status.SELECT)
+            for p, c in pairs
+        ], batch_size=1000)
+
+    def _verify(self, courses: list[Course]):
+        counts = Course.objects.filter(id__in=[c.id for c in courses]).annotate(
+            success=Count('participant_set', filter=Q(
+                participant_set__status=CourseParticipant.Status.SUCCESS)),
+            pending=Count('participant_set', filter=Q(
+                participant_set__status=CourseParticipant.Status.SELECT)))
+        for course in counts:
+            if (course.pending or course.success > course.capacity
+                    or course.success != course.current_participants):
+                self.stderr.write(
+                    f'课程{course.name}不一致: 容量{course.capacity}, 选上{course.success}, '
+                    f'未抽签{course.pending}, 记录人数{course.current_participants}')
+                return
+        self.stdout.write('一致性检查通过：全部完成抽签，选上人数不超过容量且与记录人数一致')
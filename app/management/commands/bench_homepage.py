@@ -0,0 +1,98 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from statistics import quantiles
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from generic.models import User
+from semester.models import SemesterType, Semester
+from app.models import NaturalPerson, Activity, Wishes
+from app.management.synthetic import create_persons, create_orgs, remove_synthetic
+
+
+PREFIX = 'bench_homepage_'
+
+
+class Command(BaseCommand):
+    help = '首页压力测试：模拟早八大量用户同时登录，统计首页渲染时间的p50/p95'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--visits', type=int, default=3, help='每个用户的访问次数')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--activities', type=int, default=100)
+
+    def handle(self, *args, **options):
+        self._cleanup()
+        try:
+            persons = create_persons(PREFIX, options['users'])
+            users = [person.get_user() for person in persons]
+            User.objects.filter(id__in=[user.id for user in users]).update(is_newuser=False)
+            self._create_feed(persons[0], options['activities'])
+            clients = []
+            for user in users:
+                client = Client(HTTP_HOST='localhost')
+                client.force_login(user)
+                clients.append(client)
+            cache.clear()
+
+            # 每个用户依次访问，第一次访问为当天首次登录
+            jobs = [client for _ in range(options['visits']) for client in clients]
+            with ThreadPoolExecutor(options['threads']) as executor:
+                begin = time.perf_counter()
+                results = list(executor.map(self._visit, jobs))
+                elapsed = time.perf_counter() - begin
+            latencies = [latency for latency, ok in results if ok]
+            p = quantiles(latencies, n=100)
+            self.stdout.write(
+                f'{len(jobs)}次访问 {options["threads"]}线程: 总耗时{elapsed:.2f}秒, '
+                f'p50 {p[49] * 1000:.1f}ms, p95 {p[94] * 1000:.1f}ms, '
+                f'{len(jobs) - len(latencies)}次出错（SQLite并发写入时可能锁库）')
+            with CaptureQueriesContext(connection) as queries:
+                self._visit(clients[0])
+            self.stdout.write(f'非首次访问的查询次数（含会话和用户）: {len(queries)}')
+            for client in clients:
+                client.logout()
+        finally:
+            self._cleanup()
+
+    def _visit(self, client: Client) -> tuple[float, bool]:
+        begin = time.perf_counter()
+        try:
+            # 出错时重定向到带有错误信息的页面
+            ok = client.get('/welcome/').status_code == 200
+        finally:
+            connections.close_all()
+        return time.perf_counter() - begin, ok
+
+    def _create_feed(self, person: NaturalPerson, num: int):
+        org = create_orgs(PREFIX, 1)[0]
+        now = datetime.now()
+        # 活动是多表继承的模型，不能批量创建
+        with transaction.atomic():
+            for i in range(num):
+                Activity.objects.create(
+                    title=f'{PREFIX}{i}', organization_id=org, examine_teacher=person,
+                    status=Activity.Status.APPLYING,
+                    start=now + timedelta(hours=i % 48 - 12),
+                    end=now + timedelta(hours=i % 48 - 10),
+                    apply_end=now + timedelta(hours=i % 12), publish_time=now,
+                )
+        Wishes.objects.bulk_create([Wishes(text=f'{PREFIX}{i}') for i in range(100)])
+        # 元气满满系列成就需要当前学期
+        today = date.today()
+        if not Semester.objects.filter(start_date__lte=today, end_date__gt=today).exists():
+            Semester.objects.create(
+                year=today.year, type=SemesterType.objects.create(name=PREFIX),
+                start_date=today - timedelta(days=30), end_date=today + timedelta(days=30))
+
+    def _cleanup(self):
+        Activity.objects.filter(title__startswith=PREFIX).delete()
+        Wishes.objects.filter(text__startswith=PREFIX).delete()
+        SemesterType.objects.filter(name=PREFIX).delete()
+        remove_synthetic(PREFIX)
@@ -0,0 +1,92 @@
+import random
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, F
+from django.test.utils import CaptureQueriesContext
+
+from app.config import CONFIG
+from app.models import Organization, Prize, Pool, PoolItem, PoolRecord, Notification
+from app.YQPoint_utils import run_lottery
+from app.management.synthetic import create_persons, create_orgs, remove_synthetic
+
+
+PREFIX = 'bench_lottery_'
+
+
+class Command(BaseCommand):
+    help = '抽奖压力测试：为一个奖池生成大量抽奖记录，统计一次开奖的耗时和查询次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3000)
+        parser.add_argument('--records', type=int, default=10000)
+        parser.add_argument('--prizes', type=int, default=20, help='奖品种类数')
+        parser.add_argument('--items', type=int, default=4000, help='奖品总数')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self._cleanup()
+        rng = random.Random(options['seed'])
+        try:
+            users = [person.get_user() for person in create_persons(PREFIX, options['users'])]
+            sender = create_orgs(PREFIX, 1)[0]
+            if not Organization.objects.filter(oname=CONFIG.yqpoint.org_name).exists():
+                sender.oname = CONFIG.yqpoint.org_name
+                sender.save(update_fields=['oname'])
+            pool = self._create_pool(options['prizes'], options['items'], rng)
+            PoolRecord.objects.bulk_create([
+                PoolRecord(user=rng.choice(users), pool=pool,
+                           status=PoolRecord.Status.LOTTERING)
+                for _ in range(options['records'])
+            ], batch_size=1000)
+
+            with CaptureQueriesContext(connection) as queries:
+                begin = time.perf_counter()
+                seed = run_lottery(pool.id, options['seed'])
+                elapsed = time.perf_counter() - begin
+            self.stdout.write(
+                f'{options["records"]}条抽奖记录 {options["items"]}个奖品: '
+                f'开奖耗时{elapsed:.2f}秒, {len(queries)}次查询, 随机种子{seed}')
+            self._verify(pool, min(options['records'], options['items']))
+        finally:
+            self._cleanup()
+
+    def _create_pool(self, num_prizes: int, num_items: int, rng: random.Random) -> Pool:
+        pool = Pool.objects.create(title=f'{PREFIX}奖池', type=Pool.Type.LOTTERY,
+                                   start=datetime.now())
+        Prize.objects.bulk_create([
+            Prize(name=f'{PREFIX}{i}', reference_price=10) for i in range(num_prizes)
+        ])
+        prizes = list(Prize.objects.filter(name__startswith=PREFIX))
+        # 随机划分奖品数量，每种至少一个
+        cuts = sorted(rng.sample(range(1, num_items), len(prizes) - 1))
+        counts = [b - a for a, b in zip([0] + cuts, cuts + [num_items])]
+        PoolItem.objects.bulk_create([
+            PoolItem(pool=pool, prize=prize, origin_num=count)
+            for prize, count in zip(prizes, counts)
+        ])
+        return pool
+
+    def _verify(self, pool: Pool, expected: int):
+        won = PoolRecord.objects.filter(
+            pool=pool, status=PoolRecord.Status.UN_REDEEM).count()
+        left = PoolRecord.objects.filter(pool=pool, status=PoolRecord.Status.LOTTERING).count()
+        overdrawn = [
+            item for item in PoolItem.objects.filter(pool=pool)
+            if item.consumed_num > item.origin_num
+        ]
+        mismatched = PoolItem.objects.filter(pool=pool).annotate(
+            won=Count('prize__poolrecord')).exclude(won=F('consumed_num')).count()
+        if won == expected and not left and not overdrawn and not mismatched:
+            self.stdout.write(f'核对通过：{won}条记录中奖，奖品均未超发')
+        else:
+            self.stderr.write(f'核对失败：{won}条中奖（应为{expected}），{left}条未开奖，'
+                              f'{len(overdrawn)}种奖品超发，{mismatched}种奖品数量不一致')
+
+    def _cleanup(self):
+        Notification.objects.filter(receiver__username__startswith=PREFIX).delete()
+        Pool.objects.filter(title__startswith=PREFIX).delete()
+        Prize.objects.filter(name__startswith=PREFIX).delete()
+        remove_synthetic(PREFIX)
@@ -0,0 +1,97 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.models import NaturalPerson, Organization, OrganizationTag
+from app.org_utils import get_promote_receiver
+from app.promote_matrix import promote_probability, invalidate_promote_matrix
+from app.management.synthetic import create_persons, create_orgs, remove_synthetic
+
+
+PREFIX = 'bench_pro_'
+
+
+def legacy_delta(person: NaturalPerson, org: Organization, beta: float) -> float:
+    '''原实现中单个学生的概率增量，逐个组织查询标签'''
+    org_tags = org.tags.all()
+    Max = 0.0
+    for organization in Organization.objects.activated().exclude(
+            id__in=person.unsubscribe_list.all()):
+        organization_tags = list(organization.tags.all())
+        if len(organization_tags):
+            Max = max(Max, beta * len([
+                tag for tag in org_tags if tag in organization_tags
+            ]) / len(organization_tags))
+    return Max
+
+
+class Command(BaseCommand):
+    help = '推广消息压力测试：比较原实现和矩阵实现计算推广接收者的耗时，并核对概率'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--persons', type=int, default=5000)
+        parser.add_argument('--orgs', type=int, default=300)
+        parser.add_argument('--tags', type=int, default=30)
+        parser.add_argument('--unsubscribe', type=float, default=0.05, help='退订比例')
+        parser.add_argument('--legacy-sample', type=int, default=5,
+                            help='原实现只计算部分学生，按比例估算总耗时')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        remove_synthetic(PREFIX)
+        OrganizationTag.objects.filter(name__startswith=PREFIX).delete()
+        rng = random.Random(options['seed'])
+        try:
+            persons = create_persons(PREFIX, options['persons'])
+            orgs = create_orgs(PREFIX, options['orgs'])
+            self._relate(persons, orgs, options['tags'], options['unsubscribe'], rng)
+            target = orgs[0]
+
+            with CaptureQueriesContext(connection) as queries:
+                begin = time.perf_counter()
+                receivers = get_promote_receiver(target, seed=options['seed'])
+                elapsed = time.perf_counter() - begin
+            self.stdout.write(
+                f'[matrix] {len(persons)}学生 {len(orgs)}组织: 耗时{elapsed:.3f}秒, '
+                f'{len(queries)}次查询, 选中{len(receivers)}人')
+
+            person_ids, prob = promote_probability(target)
+            sample = rng.sample(persons, options['legacy_sample'])
+            with CaptureQueriesContext(connection) as queries:
+                begin = time.perf_counter()
+                deltas = [legacy_delta(person, target, 0.1) for person in sample]
+                elapsed = time.perf_counter() - begin
+            scale = len(person_ids) / len(sample)
+            self.stdout.write(
+                f'[legacy] {len(sample)}学生: 耗时{elapsed:.2f}秒, {len(queries)}次查询, '
+                f'估算全部{elapsed * scale:.0f}秒, {len(queries) * scale:.0f}次查询')
+            index = np.searchsorted(person_ids, [person.id for person in sample])
+            if np.allclose(prob[index], 0.1 + np.array(deltas)):
+                self.stdout.write('概率核对通过：抽样学生的概率与原实现一致')
+            else:
+                self.stderr.write('概率核对失败：抽样学生的概率与原实现不一致')
+        finally:
+            remove_synthetic(PREFIX)
+            OrganizationTag.objects.filter(name__startswith=PREFIX).delete()
+
+    def _relate(self, persons, orgs, num_tags: int, unsubscribe: float, rng: random.Random):
+        OrganizationTag.objects.bulk_create([
+            OrganizationTag(name=f'{PREFIX}{i}', color=OrganizationTag.ColorChoice.grey)
+            for i in range(num_tags)
+        ])
+        tags = list(OrganizationTag.objects.filter(name__startswith=PREFIX))
+        Organization.tags.through.objects.bulk_create([
+            Organization.tags.through(organization_id=org.id, organizationtag_id=tag.id)
+            for org in orgs for tag in rng.sample(tags, rng.randint(0, 4))
+        ], batch_size=1000)
+        NaturalPerson.unsubscribe_list.through.objects.bulk_create([
+            NaturalPerson.unsubscribe_list.through(
+                naturalperson_id=person.id, organization_id=org.id)
+            for person in persons for org in orgs if rng.random() < unsubscribe
+        ], batch_size=1000)
+        # 直接写入关联表不会触发缓存失效
+        invalidate_promote_matrix()
@@ -0,0 +1,72 @@
+import random
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.models import Notification
+from app.notification_utils import bulk_notification_create
+from app.sidebar_cache import sidebar_stats
+from app.utils import get_sidebar_and_navbar
+from app.management.synthetic import create_persons, remove_synthetic
+
+
+PREFIX = 'bench_sidebar_'
+
+
+class Command(BaseCommand):
+    help = '侧边栏压力测试：模拟用户浏览页面并收到通知，统计侧边栏的查询次数和缓存命中率'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--pages', type=int, default=5000, help='浏览的页面数')
+        parser.add_argument('--notify-every', type=int, default=50,
+                            help='每浏览多少个页面群发一次通知')
+        parser.add_argument('--seed', type=int, default=0)
+
+    # 压力测试在单个进程内运行，进程内缓存也可以启用侧边栏缓存
+    @mock.patch('app.sidebar_cache.shared_cache', new=lambda alias='default': True)
+    def handle(self, *args, **options):
+        self._cleanup()
+        rng = random.Random(options['seed'])
+        try:
+            users = [person.get_user() for person in create_persons(PREFIX, options['users'])]
+            cache.clear()
+            stats = sidebar_stats()
+            base_requests, base_saved = stats.requests, stats.queries_saved
+            with CaptureQueriesContext(connection) as queries:
+                begin = time.perf_counter()
+                for i in range(options['pages']):
+                    if i % options['notify_every'] == 0:
+                        bulk_notification_create(
+                            rng.sample(users, len(users) // 10), users[0],
+                            Notification.Type.NEEDREAD,
+                            Notification.Title.ACTIVITY_INFORM, f'{PREFIX}{i}')
+                    get_sidebar_and_navbar(rng.choice(users), navbar_name='通知信箱')
+                elapsed = time.perf_counter() - begin
+            pages = stats.requests - base_requests
+            self.stdout.write(
+                f'{pages}次页面渲染: 耗时{elapsed:.2f}秒, 共{len(queries)}次查询（含通知创建）, '
+                f'节省{stats.queries_saved - base_saved}次查询')
+            self.stdout.write(f'本进程累计: {stats}')
+            self._verify(users)
+        finally:
+            self._cleanup()
+
+    def _verify(self, users):
+        wrong_users = [
+            user for user in users
+            if get_sidebar_and_navbar(user)['mail_num'] != Notification.objects.filter(
+                receiver=user, status=Notification.Status.UNDONE).count()
+        ]
+        if wrong_users:
+            self.stderr.write(f'核对失败：{len(wrong_users)}个用户的未读数与数据库不一致')
+        else:
+            self.stdout.write('核对通过：所有用户的未读数与数据库一致')
+
+    def _cleanup(self):
+        Notification.objects.filter(receiver__username__startswith=PREFIX).delete()
+        remove_synthetic(PREFIX)
@@ -0,0 +1,102 @@
+import json
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+
+from record.models import PageLog, ModuleLog
+from record.tracking import parse_beacons, save_events, record_events, flush_spool
+from app.management.synthetic import create_persons, remove_synthetic
+
+
+PREFIX = 'bench_tracking_'
+PAGES = ['/welcome/', '/stuinfo/', '/viewActivity/', '/orginfo/', '/underground/']
+MODULES = ['即将截止', '账户设置', '查看帮助', '我的借阅']
+
+
+class Command(BaseCommand):
+    help = ('埋点写入压力测试：模拟登录高峰时的页面和模块埋点，比较逐条写入、'
+            '按请求批量写入和暂存后批量写回的吞吐量')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--beacons', type=int, default=10, help='每个用户的埋点数')
+        parser.add_argument('--per-request', type=int, default=5,
+                            help='批量发送时每个请求的埋点数')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        remove_synthetic(PREFIX)
+        try:
+            users = [person.get_user() for person in create_persons(PREFIX, options['users'])]
+            beacons = self._beacons(users, options['beacons'], random.Random(options['seed']))
+            total = len(beacons)
+            self.stdout.write(f'{len(users)}个用户，共{total}个埋点')
+
+            requests = [(user_id, QueryDict(mutable=True)) for user_id, _ in beacons]
+            for (_, data), (_, beacon) in zip(requests, beacons):
+                data.update(beacon)
+            self._report('逐条写入', total, lambda: [
+                save_events(parse_beacons(data, user_id)) for user_id, data in requests])
+
+            self._report(f'每请求{options["per_request"]}个', total, lambda: [
+                save_events(parse_beacons(data, user_id))
+                for user_id, data in self._batched(beacons, options['per_request'])])
+
+            with tempfile.TemporaryDirectory() as spool_dir:
+                def spooled():
+                    for user_id, data in self._batched(beacons, options['per_request']):
+                        record_events(parse_beacons(data, user_id), spool_dir)
+                    flush_spool(spool_dir, idle=0)
+                self._report('暂存后批量写回', total, spooled)
+        finally:
+            remove_synthetic(PREFIX)
+
+    def _beacons(self, users, num: int, rng: random.Random) -> list[tuple[int, dict]]:
+        '''按用户交错排列的埋点，与登录高峰时多个用户同时访问一致'''
+        now = int(time.time() * 1000)
+        beacons = []
+        for i in range(num):
+            for user in users:
+                beacon = {
+                    'Time': str(now + i * 1000), 'Url': rng.choice(PAGES),
+                    'Platform': 'Win32', 'Explore': 'Chrome 120.0',
+                }
+                if rng.random() < 0.3:
+                    beacon.update(Type=str(ModuleLog.CountType.MC), Name=rng.choice(MODULES))
+                else:
+                    beacon.update(Type=str(rng.choice(PageLog.CountType.values)))
+                beacons.append((user.id, beacon))
+        return beacons
+
+    def _batched(self, beacons, size: int):
+        by_user: dict[int, list[dict]] = {}
+        for user_id, beacon in beacons:
+            by_user.setdefault(user_id, []).append(beacon)
+            if len(by_user[user_id]) == size:
+                yield user_id, {'Events': json.dumps(by_user.pop(user_id))}
+        for user_id, rest in by_user.items():
+            yield user_id, {'Events': json.dumps(rest)}
+
+    def _report(self, name: str, total: int, run):
+        PageLog.objects.filter(user__username__startswith=PREFIX).delete()
+        ModuleLog.objects.filter(user__username__startswith=PREFIX).delete()
+        inserts = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal inserts
+            inserts += sql.lstrip().upper().startswith('INSERT')
+            return execute(sql, params, many, context)
+
+        begin = time.perf_counter()
+        with connection.execute_wrapper(count):
+            run()
+        elapsed = time.perf_counter() - begin
+        saved = (PageLog.objects.filter(user__username__startswith=PREFIX).count()
+                 + ModuleLog.objects.filter(user__username__startswith=PREFIX).count())
+        self.stdout.write(
+            f'{name}: {elapsed * 1000:.1f}ms, {total / elapsed:.0f}条/秒, '
+            f'{inserts}次INSERT, 写入{saved}/{total}条')
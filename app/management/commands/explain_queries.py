@@ -0,0 +1,82 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import get_runner
+from django.conf import settings
+
+from utils.models.explain import QueryPattern, QueryRecorder, full_scans
+
+
+class Command(BaseCommand):
+    help = '索引检查：运行测试并记录执行的查询，逐一EXPLAIN，报告全表扫描的查询'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_labels', nargs='*',
+                            help='要运行的测试，默认运行全部测试')
+        parser.add_argument('--top', type=int, default=20,
+                            help='最多报告的查询数，按执行次数排序')
+        parser.add_argument('--ignore', nargs='*', default=[],
+                            help='忽略的表，如数据量很小的配置表')
+        parser.add_argument('--save', help='将记录的查询保存为JSON文件')
+        parser.add_argument('--load', help='不运行测试，在当前数据库回放JSON文件中的查询，'
+                            '格式同--save或connection.queries')
+
+    def handle(self, *args, **options):
+        if options['load']:
+            patterns = self._load(options['load'])
+            return self._report(patterns, options['top'], set(options['ignore']))
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            suite = runner.build_suite(options['test_labels'])
+            with QueryRecorder() as recorder:
+                result = runner.run_suite(suite)
+            if not result.wasSuccessful():
+                self.stderr.write('部分测试失败，记录的查询可能不完整')
+            patterns = recorder.patterns()
+            if options['save']:
+                self._save(patterns, options['save'])
+            self._report(patterns, options['top'], set(options['ignore']))
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+    def _report(self, patterns: list[QueryPattern], top: int, ignore: set[str]):
+        reported = 0
+        for pattern in patterns:
+            try:
+                scans = full_scans(pattern.sql, pattern.params)
+            except Exception as e:
+                self.stderr.write(f'无法分析: {e}: {pattern.sql[:100]}')
+                continue
+            scans = [table for table in scans if table not in ignore]
+            if not scans:
+                continue
+            reported += 1
+            if reported <= top:
+                self.stdout.write(
+                    f'[{pattern.count}次, {pattern.time * 1000:.1f}ms] '
+                    f'全表扫描{", ".join(scans)}\n    {pattern.sql}')
+        self.stdout.write(
+            f'共记录{len(patterns)}类查询，其中{reported}类存在全表扫描')
+
+    def _load(self, path: str) -> list[QueryPattern]:
+        with open(path, encoding='utf-8') as file:
+            records = json.load(file)
+        patterns: dict[str, QueryPattern] = {}
+        for record in records:
+            sql = record['sql']
+            # connection.queries中的SQL已代入参数
+            params = record.get('params')
+            pattern = patterns.setdefault(sql, QueryPattern(sql, params))
+            pattern.count += record.get('count', 1)
+            pattern.time += float(record.get('time', 0))
+        return sorted(patterns.values(), key=lambda p: p.count, reverse=True)
+
+    def _save(self, patterns: list[QueryPattern], path: str):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump([
+                dict(sql=p.sql, params=list(p.params), count=p.count, time=p.time)
+                for p in patterns
+            ], file, ensure_ascii=False, default=str, indent=2)
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.search_utils import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = '重建全站搜索索引，首次部署或批量导入数据后运行'
+
+    def handle(self, *args, **options):
+        begin = time.perf_counter()
+        total = rebuild_search_index()
+        self.stdout.write(
+            f'搜索索引重建完成：{total}个词元, 耗时{time.perf_counter() - begin:.2f}秒')
@@ -0,0 +1,73 @@
+'''
+synthetic.py
+
+压力测试命令共用的合成数据
+
+- 所有合成用户的用户名以相同前缀开头，测试结束后调用remove_synthetic清理
+- 使用bulk_create批量创建，不设置密码，合成用户无法登录
+- 仅应在测试或开发数据库上使用
+'''
+from django.db import transaction
+from django.db.models import Max
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+)
+
+__all__ = [
+    'create_persons',
+    'create_orgs',
+    'remove_synthetic',
+]
+
+
+def _create_users(prefix: str, num: int, utype: User.Type) -> list[User]:
+    users = []
+    for i in range(num):
+        user = User(username=f'{prefix}{utype.value}{i}', name=f'{prefix}{i}',
+                    utype=utype)
+        user.set_unusable_password()
+        users.append(user)
+    User.objects.bulk_create(users, batch_size=1000)
+    # MySQL的bulk_create不返回主键，需要重新查询
+    return list(User.objects.filter(
+        username__startswith=f'{prefix}{utype.value}').order_by('id'))
+
+
+@transaction.atomic
+def create_persons(prefix: str, num: int) -> list[NaturalPerson]:
+    '''创建num个合成学生'''
+    users = _create_users(prefix, num, User.Type.STUDENT)
+    NaturalPerson.objects.bulk_create([
+        NaturalPerson(person_id=user, name=user.name[:10], stu_grade='2023')
+        for user in users
+    ], batch_size=1000)
+    return list(NaturalPerson.objects.filter(
+        person_id__in=users).select_related('person_id').order_by('id'))
+
+
+@transaction.atomic
+def create_orgs(prefix: str, num: int) -> list[Organization]:
+    '''创建num个合成组织，属于同一个新的合成组织类型'''
+    otype_id = (OrganizationType.objects.aggregate(
+        max_id=Max('otype_id'))['max_id'] or 0) + 1
+    otype = OrganizationType.objects.create(
+        otype_id=otype_id, otype_name=f'{prefix}类型',
+        job_name_list=['负责人', '成员'])
+    users = _create_users(prefix, num, User.Type.ORG)
+    Organization.objects.bulk_create([
+        Organization(organization_id=user, oname=f'{prefix}组织{i}', otype=otype)
+        for i, user in enumerate(users)
+    ], batch_size=1000)
+    return list(Organization.objects.filter(
+        organization_id__in=users).select_related('organization_id').order_by('id'))
+
+
+@transaction.atomic
+def remove_synthetic(prefix: str) -> None:
+    '''删除前缀创建的全部合成数据，关联对象随用户级联删除'''
+    OrganizationType.objects.filter(otype_name=f'{prefix}类型').delete()
+    User.objects.filter(username__startswith=prefix).delete()
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_pool_activity_alter_poolitem_exchange_attributes_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.CharField(db_index=True, max_length=64, verbose_name='批量信息标识')),
+                ('typename', models.SmallIntegerField(choices=[(0, '知晓类'), (1, '处理类')])),
+                ('title', models.CharField(blank=True, max_length=50, null=True, verbose_name='通知标题')),
+                ('content', models.TextField(blank=True, verbose_name='通知内容')),
+                ('URL', models.URLField(blank=True, max_length=1024, null=True, verbose_name='相关网址')),
+                ('receiver_ids', models.JSONField(default=list, verbose_name='接收者')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('publish_time', models.DateTimeField(blank=True, null=True, verbose_name='微信发送时间')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'o.批量通知',
+                'verbose_name_plural': 'o.批量通知',
+            },
+        ),
+    ]
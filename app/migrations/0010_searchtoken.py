@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_notificationbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, verbose_name='词元')),
+                ('kind', models.CharField(choices=[('person', '人员'), ('org', '小组'), ('activity', '活动'), ('atag', '学术地图标签'), ('atext', '学术地图文本')], max_length=8, verbose_name='类型')),
+                ('object_id', models.IntegerField(verbose_name='对象编号')),
+                ('weight', models.SmallIntegerField(default=1, verbose_name='权重')),
+            ],
+            options={
+                'verbose_name': '~S.搜索索引',
+                'verbose_name_plural': '~S.搜索索引',
+                'indexes': [models.Index(fields=['token', 'kind'], name='app_searcht_token_7bda98_idx'), models.Index(fields=['kind', 'object_id'], name='app_searcht_kind_cb641c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['status', 'apply_end'], name='app_activit_status_5b3271_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['status', 'start'], name='app_activit_status_f5c11d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['status', 'end'], name='app_activit_status_2713ca_idx'),
+        ),
+    ]
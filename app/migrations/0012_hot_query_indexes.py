@@ -0,0 +1,49 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_activity_transition_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='bulk_identifier',
+            field=models.CharField(default='', max_length=64, verbose_name='批量信息标识'),
+        ),
+        migrations.AlterField(
+            model_name='notificationbatch',
+            name='identifier',
+            field=models.CharField(max_length=64, verbose_name='批量信息标识'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['receiver', 'status'], name='app_notific_receive_b71233_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['bulk_identifier', 'start_time'], name='app_notific_bulk_id_213bf4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['sender', 'typename', 'title', 'start_time'], name='app_notific_sender__a5aca5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationbatch',
+            index=models.Index(fields=['identifier', 'create_time'], name='app_notific_identif_b94204_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['activity', 'status'], name='app_partici_activit_1a5c4c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participation',
+            index=models.Index(fields=['person', 'status'], name='app_partici_person__a5318a_idx'),
+        ),
+    ]
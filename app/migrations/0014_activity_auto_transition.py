@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:15
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+# 状态转换引擎取代了这些定时任务，遗留的任务执行时只会因状态不符而报错
+LEGACY_STATUSES = ['等待中', '进行中', '已结束']
+
+
+def remove_legacy_status_jobs(apps, schema_editor):
+    DjangoJob = apps.get_model('django_apscheduler', 'DjangoJob')
+    legacy = Q()
+    for status in LEGACY_STATUSES:
+        legacy |= Q(id__endswith=f'_{status}')
+    DjangoJob.objects.filter(legacy, id__startswith='activity_').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_notification_batch_fk'),
+        ('django_apscheduler', '0009_djangojobexecution_unique_job_executions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='auto_transition',
+            field=models.BooleanField(default=True, verbose_name='自动转换状态'),
+        ),
+        migrations.RunPython(remove_legacy_status_jobs, migrations.RunPython.noop),
+    ]
@@ -43,6 +43,8 @@ from typing import TypeAlias
 
 from django.db import models, transaction
 from django.db.models import Q, QuerySet, Sum
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django_mysql.models.fields import ListCharField
 from typing_extensions import Self
 
@@ -70,6 +72,7 @@ __all__ = [
     'ActivityPhoto',
     'Participation',
     'Notification',
+    'NotificationBatch',
     'Comment',
     'CommentPhoto',
     'ModifyOrganization',
@@ -93,6 +96,7 @@ __all__ = [
     'PoolItem',
     'PoolRecord',
     'ActivitySummary',
+    'SearchToken',
 ]
 
 
@@ -615,6 +619,26 @@ class Organization(models.Model):
         return NaturalPerson.objects.all().count() - self.unsubscribers.count()
 
 
+@receiver([post_save, post_delete], sender=NaturalPerson)
+@receiver([post_save, post_delete], sender=Organization)
+def invalidate_sidebar_profile(sender, instance: NaturalPerson | Organization, **kwargs):
+    '''个人或小组变化时，使侧边栏的资料缓存失效'''
+    from app.sidebar_cache import invalidate_profile
+    if isinstance(instance, NaturalPerson):
+        invalidate_profile(instance.person_id_id)
+    else:
+        invalidate_profile(instance.organization_id_id)
+
+
+@receiver(m2m_changed, sender=NaturalPerson.unsubscribe_list.through)
+@receiver(m2m_changed, sender=Organization.tags.through)
+def invalidate_promote_matrix(sender, action: str, **kwargs):
+    '''退订关系或组织标签变化时，使推广计算的缓存失效'''
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        from app.promote_matrix import invalidate_promote_matrix
+        invalidate_promote_matrix()
+
+
 class PositionManager(models.Manager['Position']):
     def current(self):
         return select_current(self, 'year', 'semester')
@@ -871,6 +895,12 @@ class Activity(CommentBase):
     class Meta:
         verbose_name = "3.活动"
         verbose_name_plural = verbose_name
+        # 状态转换按(状态, 触发时间)查找到期的活动，见activity_transition
+        indexes = [
+            models.Index(fields=['status', 'apply_end']),
+            models.Index(fields=['status', 'start']),
+            models.Index(fields=['status', 'end']),
+        ]
 
     """
     Jul 30晚, Activity类经历了较大的更新, 请阅读群里[活动发起逻辑]文档，看一下活动发起需要用到的变量
@@ -978,6 +1008,8 @@ class Activity(CommentBase):
     status = models.CharField(
         "活动状态", choices=Status.choices, default=Status.REVIEWING, max_length=32
     )
+    # 关闭后状态转换引擎跳过该活动，状态只能由管理员修改，见activity_transition
+    auto_transition = models.BooleanField("自动转换状态", default=True)
 
     objects: ActivityManager = ActivityManager()
 
@@ -1106,6 +1138,10 @@ class Participation(models.Model):
         verbose_name = "3.活动参与情况"
         verbose_name_plural = verbose_name
         ordering = ["activity_id"]
+        indexes = [
+            models.Index(fields=['activity', 'status']),
+            models.Index(fields=['person', 'status']),
+        ]
 
     activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='+')
     person = models.ForeignKey(NaturalPerson, on_delete=models.CASCADE, related_name='+')
@@ -1142,6 +1178,13 @@ class Notification(models.Model):
         verbose_name = "o.通知消息"
         verbose_name_plural = verbose_name
         ordering = ["id"]
+        indexes = [
+            # 未读数和通知列表
+            models.Index(fields=['receiver', 'status']),
+            models.Index(fields=['bulk_identifier', 'start_time']),
+            # publish_notifications按最新通知筛选同批通知
+            models.Index(fields=['sender', 'typename', 'title', 'start_time']),
+        ]
 
     receiver = models.ForeignKey(
         User, related_name="recv_notice", on_delete=models.CASCADE
@@ -1182,8 +1225,15 @@ class Notification(models.Model):
     finish_time = models.DateTimeField("通知处理时间", blank=True, null=True)
     typename = models.SmallIntegerField(choices=Type.choices, default=0)
     URL = models.URLField("相关网址", null=True, blank=True, max_length=1024)
-    bulk_identifier = models.CharField("批量信息标识", max_length=64, default="",
-                                       db_index=True)
+    bulk_identifier = models.CharField("批量信息标识", max_length=64, default="")
+    # 识别码由内容确定，内容相同的批次识别码相同，重发等操作按所属批次进行
+    batch = models.ForeignKey(
+        "NotificationBatch",
+        related_name="notifications",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
     anonymous_flag = models.BooleanField("是否匿名", default=False)
     relate_instance = models.ForeignKey(
         CommentBase,
@@ -1199,6 +1249,41 @@ class Notification(models.Model):
         return str(self.title)
 
 
+@receiver(post_delete, sender=Notification)
+def invalidate_unread_count(sender, instance: Notification, **kwargs):
+    '''删除未读通知（包括级联删除）时，使接收者的未读数失效'''
+    if instance.status == Notification.Status.UNDONE:
+        from app.sidebar_cache import invalidate_unread
+        invalidate_unread([instance.receiver_id])
+
+
+class NotificationBatch(models.Model):
+    """
+    批量通知的批次，bulk_notification_create每次创建一批
+
+    识别码由通知内容和可选的业务键确定，用于短时间内的重复检查
+    记录接收者名单和微信发送状态，发送微信时不必再查询通知
+    """
+    class Meta:
+        verbose_name = "o.批量通知"
+        verbose_name_plural = verbose_name
+        # 重复检查按识别码查找近期的批次
+        indexes = [models.Index(fields=['identifier', 'create_time'])]
+
+    identifier = models.CharField("批量信息标识", max_length=64)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE)
+    typename = models.SmallIntegerField(choices=Notification.Type.choices)
+    title = models.CharField("通知标题", blank=True, null=True, max_length=50)
+    content = models.TextField("通知内容", blank=True)
+    URL = models.URLField("相关网址", null=True, blank=True, max_length=1024)
+    receiver_ids = models.JSONField("接收者", default=list)
+    create_time = models.DateTimeField("创建时间", auto_now_add=True)
+    publish_time = models.DateTimeField("微信发送时间", blank=True, null=True)
+
+    def get_title_display(self):
+        return str(self.title)
+
+
 class Comment(models.Model):
     class Meta:
         verbose_name = "2.评论"
@@ -1397,6 +1482,13 @@ class Help(models.Model):
         return self.title
 
 
+@receiver([post_save, post_delete], sender=Help)
+def invalidate_help(sender, **kwargs):
+    '''页面帮助变化时，使侧边栏的帮助缓存失效'''
+    from app.sidebar_cache import invalidate_help
+    invalidate_help()
+
+
 class Wishes(models.Model):
     class Meta:
         verbose_name = "~A.心愿"
@@ -1417,6 +1509,14 @@ class Wishes(models.Model):
     background = models.TextField("颜色编码", default=rand_color)
 
 
+@receiver([post_save, post_delete], sender=Activity)
+@receiver([post_save, post_delete], sender=Wishes)
+def invalidate_homepage_feed(sender, **kwargs):
+    '''活动或心愿变化时，使首页的共享内容过期'''
+    from app.homepage_feed import invalidate_homepage_feed
+    invalidate_homepage_feed()
+
+
 class ModifyRecord(models.Model):
     # 仅用作记录，之后大概会删除吧，所以条件都设得很宽松
     class Meta:
@@ -1573,6 +1673,13 @@ class CourseTime(models.Model):
     end_week = models.IntegerField("总周数", default=16)
 
 
+@receiver([post_save, post_delete], sender=CourseTime)
+def invalidate_course_bitmap(sender, instance: CourseTime, **kwargs):
+    '''上课时间变化时，使课程的每周时间位图失效'''
+    from app.course_bitmap import invalidate_bitmap
+    invalidate_bitmap(instance.course_id)
+
+
 class CourseParticipant(models.Model):
     """
     学生的选课情况
@@ -1936,3 +2043,44 @@ class ActivitySummary(models.Model):
     @necessary_for_frontend('activity.title', '__str__')
     def get_audit_display(self):
         return f'{self.activity.title}总结'
+
+
+class SearchToken(models.Model):
+    """
+    全站搜索的倒排索引，每个对象的每个词元一行
+
+    词元和权重由app.search_utils生成，对象变化时由信号更新，每天全部重建一次
+    """
+    class Meta:
+        verbose_name = "~S.搜索索引"
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['token', 'kind']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+    class Kind(models.TextChoices):
+        PERSON = ('person', '人员')
+        ORGANIZATION = ('org', '小组')
+        ACTIVITY = ('activity', '活动')
+        ACADEMIC_TAG = ('atag', '学术地图标签')
+        ACADEMIC_TEXT = ('atext', '学术地图文本')
+
+    token = models.CharField('词元', max_length=32)
+    kind = models.CharField('类型', choices=Kind.choices, max_length=8)
+    object_id = models.IntegerField('对象编号')
+    weight = models.SmallIntegerField('权重', default=1)
+
+
+@receiver([post_save, post_delete], sender=NaturalPerson)
+@receiver([post_save, post_delete], sender=Organization)
+@receiver([post_save, post_delete], sender=Position)
+@receiver([post_save, post_delete], sender=Activity)
+@receiver([post_save, post_delete], sender=AcademicTagEntry)
+@receiver([post_save, post_delete], sender=AcademicTextEntry)
+def update_search_index(sender, instance, raw: bool = False, **kwargs):
+    '''可搜索的对象变化时更新其索引，批量修改不触发信号，由每天的重建兜底'''
+    if raw:
+        return
+    from app.search_utils import reindex_instance
+    reindex_instance(instance)
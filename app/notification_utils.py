@@ -1,17 +1,19 @@
-from random import random
 from typing import Union, List
+from collections import Counter
 from datetime import datetime, timedelta
 
 from generic.models import User
 from boot.config import GLOBAL_CONFIG
 from app.utils_dependency import *
-from app.models import Notification
+from app.models import Notification, NotificationBatch
 from app.extern.wechat import (
     publish_notification,
     publish_notifications,
+    publish_notification_batch,
     WechatApp,
     WechatMessageLevel,
 )
+from app.sidebar_cache import adjust_unread
 from app.log import logger
 
 
@@ -21,6 +23,7 @@ __all__ = [
     'notification_status_change',
     'notification_create',
     'bulk_notification_create',
+    'bulk_notification_create_batches',
     'notification2Display',
 ]
 
@@ -83,6 +86,10 @@ def notification_status_change(
             and notification.status != to_status
         ):
             return wrong("不能修改已删除的通知！", context)
+        if notification.status == Notification.Status.UNDONE:
+            adjust_unread({notification.receiver_id: -1})
+        elif to_status == Notification.Status.UNDONE:
+            adjust_unread({notification.receiver_id: 1})
         if to_status == Notification.Status.DONE:
             notification.status = Notification.Status.DONE
             notification.finish_time = datetime.now()  # 通知完成时间
@@ -140,6 +147,7 @@ def notification_create(
         relate_instance=relate_instance,
         anonymous_flag=anonymous_flag,
     )
+    adjust_unread({notification.receiver_id: 1})
     if to_wechat is True or isinstance(to_wechat, dict):
         if to_wechat is True:
             publish_kws = {}
@@ -187,6 +195,7 @@ def bulk_notification_create(
         URL=None,
         relate_instance=None,
         *,
+        batch_key: str | None = None,
         duplicate_behavior='ok',
         to_wechat: bool | dict = False,
 ):
@@ -203,45 +212,50 @@ def bulk_notification_create(
         to_wechat: bool | dict 仅关键字参数
         - 在线程锁或原子锁内时，不要发送
         - 字典视为发送给微信的额外参数，主要是应用和发送等级，参考publish_notifications即可
+        batch_key: str 仅关键字参数
+        - 区分内容相同的不同批次，如活动id，识别码由通知内容和该值确定
+        - 识别码只用于重复检查，不唯一确定批次，通知所属的批次见Notification.batch
         duplicate_behavior: str 仅关键字参数
         - 重复通知的处理行为，可选值包括: ok, fail, success, remove, report, log
-        - 除了ok之外，这些值都会进行识别码重复检查，分别代表直接失败/成功/移除重复值/报告/记录
+        - 除了ok之外，这些值都会检查5分钟内是否有识别码相同的批次，
+          分别代表直接失败/成功/移除重复值/报告/记录
         - 移除重复值也会进行记录
-        - 希望这个函数是幂等的
+        - 识别码不含随机成分，重试时使用remove可以保证幂等
+
+    返回值：
+        (success, batch): 是否成功和本次创建的NotificationBatch，未创建批次时为None
 
     现在，你应该在不急于等待的时候显式调用publish_notification(s)这两个函数，
         具体选择哪个取决于你创建的通知是一批类似通知还是单个通知
+        批量通知可以调用publish_notification_batch，传入返回的批次即可
     """
 
     start_time = datetime.now()
     cur_status = '获取识别码'
     bulk_identifier = None
+    batch = None
     try:
-        # 暂时仍用随机，未来必须可以反向还原，且同一条通知在相近时间必须生成相同识别码
-        # 建议的行为是禁用extra_str
         bulk_identifier = get_bulk_identifier(
             sender=sender, typename=typename, title=title,
-            content=content, URL=URL,
-            extra_str=str(start_time) + str(random()),
+            content=content, URL=URL, extra_str=batch_key,
         )
+        receiver_ids = [getattr(receiver, 'id', receiver) for receiver in receivers]
         if duplicate_behavior in ['fail', 'success', 'remove', 'report', 'log']:
             cur_status = '检查已存在通知'
-            exist_note = Notification.objects.filter(
-                bulk_identifier=bulk_identifier,
-                start_time__gt=start_time - timedelta(minutes=5),
-            )
-            if exist_note.exists():
+            exist_batches = list(NotificationBatch.objects.filter(
+                identifier=bulk_identifier,
+                create_time__gt=start_time - timedelta(minutes=5),
+            ).values_list('receiver_ids', flat=True))
+            if exist_batches:
                 if duplicate_behavior == 'fail':
-                    return False, bulk_identifier
+                    return False, None
                 if duplicate_behavior == 'success':
-                    return True, bulk_identifier
+                    return True, None
 
                 cur_status = '计算已接收名单'
-                exist_userids = exist_note.values_list(
-                    'receiver_id', flat=True).distinct()
-                receiver_ids = [receiver.id for receiver in receivers]
-                received_ids = exist_note.filter(
-                    receiver_id__in=receiver_ids).values_list('receiver_id', flat=True).distinct()
+                exist_userids = set().union(*exist_batches)
+                received_ids = [receiver_id for receiver_id in receiver_ids
+                                if receiver_id in exist_userids]
 
                 cur_status = '重复处理'
 
@@ -255,19 +269,18 @@ def bulk_notification_create(
                         log_msg) if duplicate_behavior == 'report' else logger.warning(log_msg)
                 if duplicate_behavior == 'remove':
                     cur_status = '移除已有接收者'
-                    received_id_set = set(received_ids)
-                    receivers = [receiver for receiver in receivers
-                                 if receiver.id not in received_id_set]
+                    receiver_ids = [receiver_id for receiver_id in receiver_ids
+                                    if receiver_id not in exist_userids]
                     log_msg = f'批量创建通知时通知已存在, 识别码为{bulk_identifier}'
-                    log_msg += f'：已移除{_short(received_ids)}已通知用户，剩余{len(receivers)}个'
+                    log_msg += f'：已移除{_short(received_ids)}已通知用户，剩余{len(receiver_ids)}个'
                     logger.warning(log_msg)
-                    if not receivers:
-                        return True, bulk_identifier
+                    if not receiver_ids:
+                        return True, None
 
         cur_status = '生成通知'
         notifications = [
             Notification(
-                receiver=receiver,
+                receiver_id=receiver_id,
                 sender=sender,
                 typename=typename,
                 title=title,
@@ -276,51 +289,110 @@ def bulk_notification_create(
                 bulk_identifier=bulk_identifier,
                 relate_instance=relate_instance,
                 # start_time=start_time, # 该参数无效，bulk_create会分批生成并覆盖auto_now的字段
-            ) for receiver in receivers
+            ) for receiver_id in receiver_ids
         ]
         # 测试表明bulk以50为batch大小时两次创建间的时差为1ms-10ms左右，未来请做测试
         # 注意：bulk_create会分批生成并覆盖auto_now的字段（因此大于start_time），每一批该字段相同
-        # 但一批大小多半不为batch_size，暂未确定具体范围，仅保证不大于
+        # 批次记录了接收者名单，发送微信和重复检查不再依赖通知的创建时间
         cur_status = '批量创建通知'
-        Notification.objects.bulk_create(notifications, 50)
-        # TODO:
-        # try:
-        #     # 重设bulk_create覆盖的auto_now字段
-        #     # 暂时非必要，不加锁，允许失败
-        #     cur_status = '更新通知时间'
-        #     Notification.objects.filter(
-        #         bulk_identifier=bulk_identifier,
-        #         start_time__gt=start_time,
-        #         ).update(start_time=start_time)
-        # except:
-        #     logger.exception(f'更新通知创建时间时失败, 识别码为{bulk_identifier}, 创建时间为{start_time}')
+        with transaction.atomic():
+            batch = NotificationBatch.objects.create(
+                identifier=bulk_identifier,
+                sender=sender,
+                typename=typename,
+                title=title,
+                content=content,
+                URL=URL,
+                receiver_ids=receiver_ids,
+            )
+            for notification in notifications:
+                notification.batch = batch
+            Notification.objects.bulk_create(notifications, 50)
+            adjust_unread(Counter(receiver_ids))
         success = True
         if to_wechat is True or isinstance(to_wechat, dict):
             cur_status = '发送微信'
-            # TODO:
-            # 由于识别码将不再是批量创建的唯一值，未来发送微信需要增加参数
-            # 当前进度：和原先保持一致，通知重复处理有效，但如果部分已收到通知，其微信会收到多次
-            # 可能的实现：增加receiver_ids限制，或者增加start_time精确值（需要保证start_time）
-            # 思路1：bulk_create不分批，创建时间统一但与start_time变量不同，无法反向还原
-            # 思路2：保证update有效且范围精确，上文中注释了一个不精确的update
-            # 思路3：放弃精确，发送所有start_time之后创建的预约
-            # 思路4：限制receiver，但定时任务重复触发仍会多次发送
-            filter_kws = {
-                "bulk_identifier": bulk_identifier,
-                # "start_time": start_time,
-                # "start_time__gte": start_time,
-                # "receiver_id__in": [receiver.id for receiver in receivers],
-            }
             if to_wechat is True:
                 publish_kws = {}
             else:
                 publish_kws = to_wechat
-            success = publish_notifications(
-                filter_kws=filter_kws, **publish_kws)
+            success = publish_notification_batch(batch, **publish_kws)
     except Exception as e:
         success = False
         logger.exception(f'在{cur_status}时发生错误：识别码为{bulk_identifier}')
-    return success, bulk_identifier
+    return success, batch
+
+
+def bulk_notification_create_batches(
+        batches: list[dict],
+        *,
+        to_wechat: bool | dict = False,
+) -> bool:
+    """
+    一次性创建多批内容不同的通知，所有通知一次批量写入，再逐批发送微信
+        batches: 每批的参数与bulk_notification_create相同，为字典形式:
+            receivers, sender, typename, title, content, URL, relate_instance, batch_key
+            receivers可以是User或其主键，空批次将被忽略
+
+    注意事项：
+        to_wechat: bool | dict 仅关键字参数，所有批次相同
+        - 在线程锁或原子锁内时，不要发送
+        - 不检查重复通知，需要去重时使用bulk_notification_create
+    """
+    records = []
+    notifications = []
+    cur_status = '生成通知'
+    try:
+        for batch in batches:
+            receiver_ids = [getattr(receiver, 'id', receiver)
+                            for receiver in batch['receivers']]
+            if not receiver_ids:
+                continue
+            bulk_identifier = get_bulk_identifier(
+                sender=batch['sender'], typename=batch['typename'],
+                title=batch['title'], content=batch['content'],
+                URL=batch.get('URL'), extra_str=batch.get('batch_key'),
+            )
+            record = NotificationBatch(
+                identifier=bulk_identifier,
+                sender=batch['sender'],
+                typename=batch['typename'],
+                title=batch['title'],
+                content=batch['content'],
+                URL=batch.get('URL'),
+                receiver_ids=receiver_ids,
+            )
+            records.append(record)
+            notifications.extend(
+                Notification(
+                    receiver_id=receiver_id,
+                    sender=batch['sender'],
+                    typename=batch['typename'],
+                    title=batch['title'],
+                    content=batch['content'],
+                    URL=batch.get('URL'),
+                    bulk_identifier=bulk_identifier,
+                    batch=record,
+                    relate_instance=batch.get('relate_instance'),
+                ) for receiver_id in receiver_ids
+            )
+        cur_status = '批量创建通知'
+        with transaction.atomic():
+            # 逐批创建以获得主键（MySQL的bulk_create不返回主键），通知仍一次批量写入
+            for record in records:
+                record.save()
+            Notification.objects.bulk_create(notifications, 500)
+            adjust_unread(Counter(n.receiver_id for n in notifications))
+        success = True
+        if to_wechat is True or isinstance(to_wechat, dict):
+            cur_status = '发送微信'
+            publish_kws = {} if to_wechat is True else to_wechat
+            for record in records:
+                success &= publish_notification_batch(record, **publish_kws)
+    except Exception as e:
+        success = False
+        logger.exception(f'在{cur_status}时发生错误：共{len(records)}批通知')
+    return success
 
 
 # 对一个已经完成的申请, 构建相关的通知和对应的微信消息, 将有关的事务设为已完成
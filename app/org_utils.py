@@ -1,6 +1,6 @@
-import random
 from datetime import datetime, timedelta
 
+import numpy as np
 from django.db.models import Q
 
 from app.utils_dependency import *
@@ -22,10 +22,11 @@ from app.notification_utils import (
     notification_status_change,
 )
 from app.extern.wechat import (
-    publish_notifications,
+    publish_notification_batch,
     WechatApp,
     WechatMessageLevel,
 )
+from app.promote_matrix import promote_probability
 from app.utils import (
     get_person_or_org,
     if_image,
@@ -619,7 +620,7 @@ def send_message_check(me: Organization, request):
         receivers = [receiver.person_id for receiver in receivers]
 
         # 创建通知
-        success, bulk_identifier = bulk_notification_create(
+        success, batch = bulk_notification_create(
                 receivers=receivers,
                 sender=sender,
                 typename=typename,
@@ -637,8 +638,7 @@ def send_message_check(me: Organization, request):
             wechat_kws['app'] = WechatApp.TO_MEMBER
         else:
             wechat_kws['app'] = WechatApp.TO_SUBSCRIBER
-        wechat_kws['filter_kws'] = {'bulk_identifier': bulk_identifier}
-        assert publish_notifications(**wechat_kws)
+        assert publish_notification_batch(batch, **wechat_kws)
     except:
         return wrong("发送微信的过程出现错误！请联系管理员！")
 
@@ -649,29 +649,17 @@ def send_message_check(me: Organization, request):
 
 
 # 查看前推广算法: commit b7d6ac7d358589f61db99a3990b1ecbe2a4ca039
-def get_promote_receiver(org: Organization, alpha=0.1, beta=0.1):
+def get_promote_receiver(org: Organization, alpha=0.1, beta=0.1,
+                         *, seed: int | None = None) -> list[NaturalPerson]:
     '''
     每个人收到推送的概率= 0.1 + 0.1 * max（for 组织in person的关注）（(组织的tag与org的tag的交集数）/ 该组织tag数）
+    概率计算见promote_matrix.py，seed用于复现抽样结果
     '''
-    # 准备发送对象：接受推广的np列表
-    raw_np_lst = list(NaturalPerson.objects.activated().filter(accept_promote=True))
-    # 初始化概率列表、tag比重列表
-    delta_lst = []
-    # org的tag列表
-    org_tags: QuerySet[OrganizationTag] = org.tags.all()
-    for np in raw_np_lst:
-        Max = 0.0
-        for organization in Organization.objects.activated().exclude(
-                id__in=np.unsubscribe_list.all()):
-            # organization的tag列表
-            organization_tags = list(organization.tags.all())
-            if len(organization_tags):
-                Max = max(Max, beta * len([
-                    tag for tag in org_tags if tag in organization_tags
-                ]) / len(organization_tags))
-        delta_lst.append(Max)
-    prob_lst = [alpha + delta for delta in delta_lst]
-    return [raw_np_lst[i] for i in range(len(raw_np_lst)) if prob_lst[i] >= random.random()]
+    person_ids, prob = promote_probability(org, alpha, beta)
+    rng = np.random.default_rng(seed)
+    selected = person_ids[prob >= rng.random(len(person_ids))]
+    return list(NaturalPerson.objects.filter(id__in=selected.tolist()).select_related(
+        SQ.f(NaturalPerson.person_id)).order_by('id'))
 
 
 def get_tags(tag_names: str):
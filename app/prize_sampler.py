@@ -0,0 +1,132 @@
+"""
+prize_sampler.py
+
+按剩余数量加权的奖品抽样，用于盲盒开盒和无放回抽奖
+
+- 剩余数量保存在树状数组中，抽取一个奖品和修改一种奖品的数量都是O(log n)
+- 每个奖池的抽样器缓存在进程内，使用前按数据库中的数量同步，只更新变化的奖品
+- 同步在奖池的行锁内进行，多进程或回滚的事务导致的缓存偏差会在下次同步时修正
+
+PrizeSampler: 加权无放回抽样器
+pool_sampler: 获取与数据库同步的奖池抽样器
+"""
+import random
+from typing import Iterable
+
+from app.models import Pool
+
+
+__all__ = [
+    'PrizeSampler',
+    'pool_sampler',
+]
+
+
+class PrizeSampler:
+    '''
+    加权抽样器，每个键的权重为其剩余数量，抽中一次数量减一
+
+    用法::
+
+        sampler = PrizeSampler({item.id: item.origin_num - item.consumed_num
+                                for item in items})
+        item_id = sampler.draw()
+    '''
+    def __init__(self, counts: dict[int, int]):
+        self._keys = list(counts)
+        self._index = {key: i for i, key in enumerate(self._keys)}
+        self._counts = [max(count, 0) for count in counts.values()]
+        # 树状数组，下标从1开始，线性时间建树
+        tree = [0] + self._counts
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._total = sum(self._counts)
+        self._top = 1 << (len(self._keys).bit_length() - 1) if self._keys else 0
+
+    @property
+    def total(self) -> int:
+        '''剩余总数'''
+        return self._total
+
+    def count(self, key: int) -> int:
+        return self._counts[self._index[key]]
+
+    def keys(self) -> list[int]:
+        return list(self._keys)
+
+    def _add(self, i: int, delta: int) -> None:
+        self._counts[i] += delta
+        self._total += delta
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def set(self, key: int, count: int) -> None:
+        '''修改一个键的剩余数量'''
+        i = self._index[key]
+        self._add(i, max(count, 0) - self._counts[i])
+
+    def sample(self, rng: random.Random | None = None) -> int:
+        '''按剩余数量抽取一个键，不修改数量'''
+        total = self.total
+        assert total > 0, '奖品已抽完'
+        target = (rng or random).randrange(total)
+        # 在树上二分查找前缀和首次超过target的位置
+        pos = 0
+        step = self._top
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return self._keys[pos]
+
+    def draw(self, rng: random.Random | None = None) -> int:
+        '''无放回地抽取一个键，其剩余数量减一'''
+        key = self.sample(rng)
+        self._add(self._index[key], -1)
+        return key
+
+    def draw_many(self, num: int, rng: random.Random | None = None) -> list[int]:
+        '''无放回地抽取num个键'''
+        assert num <= self.total
+        return [self.draw(rng) for _ in range(num)]
+
+    def sync(self, counts: Iterable[tuple[int, int]]) -> bool:
+        '''
+        按最新的剩余数量同步，只更新变化的键
+
+        :return: 键集合是否不变，变化时需要重建，返回False且不修改
+        :rtype: bool
+        '''
+        counts = list(counts)
+        if len(counts) != len(self._keys) or any(
+                key not in self._index for key, _ in counts):
+            return False
+        for key, count in counts:
+            if self.count(key) != max(count, 0):
+                self.set(key, count)
+        return True
+
+
+_samplers: dict[int, PrizeSampler] = {}
+
+
+def pool_sampler(pool: Pool) -> PrizeSampler:
+    '''
+    获取奖池的抽样器，数量与数据库一致
+
+    调用者应已锁定奖池，抽取后需要自行写回consumed_num；
+    写回失败时缓存的数量会在下次获取时修正
+    '''
+    counts = [(item_id, origin_num - consumed_num) for item_id, origin_num, consumed_num
+              in pool.items.values_list('id', 'origin_num', 'consumed_num')]
+    sampler = _samplers.get(pool.id)
+    if sampler is None or not sampler.sync(counts):
+        sampler = _samplers[pool.id] = PrizeSampler(dict(counts))
+    return sampler
@@ -0,0 +1,90 @@
+"""
+promote_matrix.py
+
+推广消息的接收者计算，所需的学生-组织、组织-标签关系以矩阵形式一次算出
+
+- 退订关系和组织标签以(左主键, 右主键)数组的形式缓存，关系变化时失效（见models.py），最多缓存一小时
+- 学生和组织的有效范围每次重新查询，按主键排序后映射为矩阵下标
+- 推广概率的定义见promote_probability，所有学生的概率一次向量化计算
+
+promote_probability: 计算所有接受推广的学生收到某组织推广的概率
+invalidate_promote_matrix: 退订关系或组织标签变化后使缓存失效
+"""
+import numpy as np
+from django.core.cache import cache
+
+from app.models import NaturalPerson, Organization
+
+
+__all__ = [
+    'promote_probability',
+    'invalidate_promote_matrix',
+]
+
+
+_UNSUBSCRIBE_KEY = 'promote_matrix:unsubscribe'
+_TAG_KEY = 'promote_matrix:tag'
+
+
+def _pairs(key: str, through, left: str, right: str) -> np.ndarray:
+    pairs = cache.get(key)
+    if pairs is None:
+        pairs = np.array(list(through.objects.values_list(left, right)),
+                         dtype=np.int64).reshape(-1, 2)
+        # 删除对象时级联删除的关系不触发失效，限制缓存时间
+        cache.set(key, pairs, 3600)
+    return pairs
+
+
+def _incidence(pairs: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    '''将关系对转为布尔矩阵，rows和cols为有序主键，不在范围内的关系被忽略'''
+    matrix = np.zeros((len(rows), len(cols)), dtype=bool)
+    if len(pairs) and len(rows) and len(cols):
+        i = np.minimum(np.searchsorted(rows, pairs[:, 0]), len(rows) - 1)
+        j = np.minimum(np.searchsorted(cols, pairs[:, 1]), len(cols) - 1)
+        valid = (rows[i] == pairs[:, 0]) & (cols[j] == pairs[:, 1])
+        matrix[i[valid], j[valid]] = True
+    return matrix
+
+
+def promote_probability(org: Organization, alpha: float = 0.1,
+                        beta: float = 0.1) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    计算所有接受推广的学生收到组织推广的概率
+
+    概率 = alpha + beta * max(学生关注的组织o: |o的标签 ∩ org的标签| / |o的标签|)
+
+    :param org: 发送推广的组织
+    :type org: Organization
+    :return: 学生主键数组（有序）和对应的概率数组
+    :rtype: tuple[np.ndarray, np.ndarray]
+    '''
+    person_ids = np.array(sorted(NaturalPerson.objects.activated().filter(
+        accept_promote=True).values_list('id', flat=True)), dtype=np.int64)
+    org_ids = np.array(sorted(Organization.objects.activated().values_list(
+        'id', flat=True)), dtype=np.int64)
+    tag_pairs = _pairs(_TAG_KEY, Organization.tags.through,
+                       'organization_id', 'organizationtag_id')
+    tag_ids = np.unique(tag_pairs[:, 1])
+    org_tags = _incidence(tag_pairs, org_ids, tag_ids)
+    target = _incidence(tag_pairs[tag_pairs[:, 0] == org.id],
+                        np.array([org.id], dtype=np.int64), tag_ids)[0]
+
+    # 每个组织与org的标签重合比例，没有标签的组织为0
+    tag_counts = org_tags.sum(axis=1)
+    overlap = (org_tags & target).sum(axis=1)
+    weight = np.divide(overlap, tag_counts, out=np.zeros(len(org_ids)),
+                       where=tag_counts > 0)
+
+    unsubscribed = _incidence(
+        _pairs(_UNSUBSCRIBE_KEY, NaturalPerson.unsubscribe_list.through,
+               'naturalperson_id', 'organization_id'),
+        person_ids, org_ids)
+    # 学生的得分为未退订组织的最大权重
+    best = np.where(unsubscribed, 0.0, weight).max(axis=1, initial=0.0)
+    return person_ids, alpha + beta * best
+
+
+def invalidate_promote_matrix() -> None:
+    '''退订关系或组织标签变化后使缓存失效'''
+    cache.delete_many([_UNSUBSCRIBE_KEY, _TAG_KEY])
@@ -0,0 +1,389 @@
+"""
+search_utils.py
+
+全站搜索：人员、小组、活动和学术地图共用一张倒排索引（SearchToken）
+
+- 中文按单字和相邻两字切分，字母数字按词切分并索引全部前缀
+- 含中文的人名和小组名额外索引拼音和首字母缩写的前缀，可以用拼音搜索
+- 建立索引时即按可见性筛选：未公开的昵称、专业和学术地图条目不进入索引
+- 对象保存或删除时由信号更新索引（见models.py），每天全部重建一次，
+  修正批量修改和学期切换导致的偏差
+- 查询时所有词元都必须命中，按权重之和排序，一次查询得到每类结果的一页和总数
+
+search: 搜索并返回每类结果的当前页
+hydrate_*: 按搜索结果的顺序读取展示所需的对象
+reindex_instance: 对象变化后更新相关的索引
+rebuild_search_index: 重建全部索引
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Q, F, Count, Sum, Window
+from django.db.models.functions import RowNumber
+
+from generic.models import get_pinyin, to_acronym
+from app.models import (
+    NaturalPerson,
+    Organization,
+    Position,
+    Activity,
+    AcademicEntry,
+    AcademicTag,
+    AcademicTagEntry,
+    AcademicTextEntry,
+    SearchToken,
+)
+
+
+__all__ = [
+    'SEARCH_PAGE_SIZE',
+    'SearchResult',
+    'search',
+    'hydrate_people',
+    'hydrate_orgs',
+    'hydrate_activities',
+    'hydrate_academic',
+    'reindex_instance',
+    'rebuild_search_index',
+]
+
+
+Kind = SearchToken.Kind
+
+# 索引的词前缀最大长度，更长的查询词按前缀匹配
+MAX_PREFIX = 20
+# 查询最多使用的词元数
+MAX_QUERY_TOKENS = 16
+CHUNK_SIZE = 500
+# 搜索页每类结果每页的数量
+SEARCH_PAGE_SIZE = 50
+
+# 各字段的权重，同一词元在多个字段出现时权重相加
+NAME_WEIGHT = 8
+PINYIN_WEIGHT = 4
+SECONDARY_WEIGHT = 2
+MINOR_WEIGHT = 1
+
+_CJK = '\u3400-\u9fff\uf900-\ufaff'
+_SEGMENT = re.compile(f'([{_CJK}]+)|([^\\W_{_CJK}]+)')
+
+
+def _segments(text: str) -> Iterable[tuple[bool, str]]:
+    '''切分为中文片段和字母数字片段'''
+    for match in _SEGMENT.finditer(text.lower()):
+        cjk, word = match.groups()
+        yield (True, cjk) if cjk else (False, word)
+
+
+def index_tokens(text: str | None) -> set[str]:
+    '''文本的索引词元：中文单字和两字组合，字母数字词的全部前缀'''
+    tokens = set()
+    for is_cjk, segment in _segments(text or ''):
+        if is_cjk:
+            tokens.update(segment)
+            tokens.update(segment[i : i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.update(segment[:i] for i in range(1, min(len(segment), MAX_PREFIX) + 1))
+    return tokens
+
+
+def query_tokens(query: str) -> list[str]:
+    '''查询的词元：中文按两字组合（单字时为单字），字母数字词取前缀'''
+    tokens = []
+    for is_cjk, segment in _segments(query):
+        if not is_cjk:
+            tokens.append(segment[:MAX_PREFIX])
+        elif len(segment) == 1:
+            tokens.append(segment)
+        else:
+            tokens.extend(segment[i : i + 2] for i in range(len(segment) - 1))
+    return list(dict.fromkeys(tokens))[:MAX_QUERY_TOKENS]
+
+
+def _pinyin_tokens(name: str) -> set[str]:
+    '''含中文的名称的拼音和首字母缩写前缀'''
+    if not re.search(f'[{_CJK}]', name):
+        return set()
+    tokens = set()
+    for is_cjk, word in _segments(''.join(get_pinyin(name))):
+        if not is_cjk:
+            tokens |= index_tokens(word)
+    for is_cjk, word in _segments(to_acronym(name)):
+        if not is_cjk:
+            tokens |= index_tokens(word)
+    return tokens
+
+
+class _Tokens(defaultdict):
+    '''词元到权重的映射'''
+    def __init__(self):
+        super().__init__(int)
+
+    def add(self, tokens: Iterable[str], weight: int) -> None:
+        for token in tokens:
+            self[token] += weight
+
+    def add_name(self, name: str | None, weight: int = NAME_WEIGHT) -> None:
+        self.add(index_tokens(name), weight)
+        self.add(_pinyin_tokens(name or ''), PINYIN_WEIGHT)
+
+
+def _person_tokens(persons: Iterable[NaturalPerson]) -> dict[int, _Tokens]:
+    result = {}
+    for person in persons:
+        tokens = result[person.id] = _Tokens()
+        tokens.add_name(person.name)
+        if person.show_nickname:
+            tokens.add(index_tokens(person.nickname), SECONDARY_WEIGHT)
+        if person.show_major:
+            tokens.add(index_tokens(person.stu_major), MINOR_WEIGHT)
+    return result
+
+
+def _org_tokens(orgs: Iterable[Organization]) -> dict[int, _Tokens]:
+    result = {}
+    for org in orgs:
+        tokens = result[org.id] = _Tokens()
+        tokens.add_name(org.oname)
+        tokens.add(index_tokens(org.otype.otype_name), SECONDARY_WEIGHT)
+    # 公开职务或担任负责人的成员姓名
+    members = Position.objects.activated().filter(
+        Q(show_post=True) | Q(is_admin=True),
+        org__in=list(result),
+    ).values_list('org_id', 'person__name')
+    for org_id, name in members:
+        result[org_id].add(index_tokens(name), MINOR_WEIGHT)
+    return result
+
+
+def _activity_tokens(activities: Iterable[Activity]) -> dict[int, _Tokens]:
+    result = {}
+    for activity in activities:
+        tokens = result[activity.id] = _Tokens()
+        tokens.add(index_tokens(activity.title), NAME_WEIGHT)
+        # 按小组搜到的活动不包括已取消的
+        if activity.status != Activity.Status.CANCELED:
+            tokens.add(index_tokens(activity.organization_id.oname), SECONDARY_WEIGHT)
+    return result
+
+
+def _academic_tag_tokens(entries: Iterable[AcademicTagEntry]) -> dict[int, _Tokens]:
+    result = {}
+    for entry in entries:
+        tokens = result[entry.id] = _Tokens()
+        tokens.add(index_tokens(entry.tag.tag_content), MINOR_WEIGHT)
+    return result
+
+
+def _academic_text_tokens(entries: Iterable[AcademicTextEntry]) -> dict[int, _Tokens]:
+    result = {}
+    for entry in entries:
+        tokens = result[entry.id] = _Tokens()
+        tokens.add(index_tokens(entry.content), MINOR_WEIGHT)
+    return result
+
+
+# 每类对象的可索引范围和词元生成函数
+_SOURCES = {
+    Kind.PERSON: (
+        lambda: NaturalPerson.objects.all(),
+        _person_tokens,
+    ),
+    Kind.ORGANIZATION: (
+        lambda: Organization.objects.select_related('otype'),
+        _org_tokens,
+    ),
+    Kind.ACTIVITY: (
+        lambda: Activity.objects.activated().select_related('organization_id'),
+        _activity_tokens,
+    ),
+    Kind.ACADEMIC_TAG: (
+        lambda: AcademicTagEntry.objects.filter(
+            status=AcademicEntry.EntryStatus.PUBLIC).select_related('tag'),
+        _academic_tag_tokens,
+    ),
+    Kind.ACADEMIC_TEXT: (
+        lambda: AcademicTextEntry.objects.filter(
+            status=AcademicEntry.EntryStatus.PUBLIC),
+        _academic_text_tokens,
+    ),
+}
+
+
+def _rows(kind: str, tokens: dict[int, _Tokens]) -> list[SearchToken]:
+    return [
+        SearchToken(token=token[:32], kind=kind, object_id=object_id, weight=weight)
+        for object_id, object_tokens in tokens.items()
+        for token, weight in object_tokens.items()
+    ]
+
+
+def reindex(kind: str, ids: Iterable[int]) -> None:
+    '''重建部分对象的索引，已删除或不再可见的对象被移出索引'''
+    ids = list(ids)
+    if not ids:
+        return
+    queryset, build = _SOURCES[kind]
+    with transaction.atomic():
+        SearchToken.objects.filter(kind=kind, object_id__in=ids).delete()
+        SearchToken.objects.bulk_create(
+            _rows(kind, build(queryset().filter(id__in=ids))), batch_size=2000)
+
+
+def reindex_instance(instance) -> None:
+    '''对象保存或删除后更新相关的索引'''
+    match instance:
+        case NaturalPerson():
+            reindex(Kind.PERSON, [instance.id])
+        case Organization():
+            reindex(Kind.ORGANIZATION, [instance.id])
+            reindex(Kind.ACTIVITY, Activity.objects.filter(
+                organization_id=instance).values_list('id', flat=True))
+        case Position():
+            reindex(Kind.ORGANIZATION, [instance.org_id])
+        case Activity():
+            reindex(Kind.ACTIVITY, [instance.id])
+        case AcademicTagEntry():
+            reindex(Kind.ACADEMIC_TAG, [instance.id])
+        case AcademicTextEntry():
+            reindex(Kind.ACADEMIC_TEXT, [instance.id])
+
+
+def rebuild_search_index() -> int:
+    '''
+    重建全部索引
+
+    :return: 索引的词元行数
+    :rtype: int
+    '''
+    total = 0
+    with transaction.atomic():
+        SearchToken.objects.all().delete()
+        for kind, (queryset, build) in _SOURCES.items():
+            objects = list(queryset().order_by('id'))
+            for i in range(0, len(objects), CHUNK_SIZE):
+                rows = _rows(kind, build(objects[i : i + CHUNK_SIZE]))
+                SearchToken.objects.bulk_create(rows, batch_size=2000)
+                total += len(rows)
+    return total
+
+
+@dataclass
+class SearchResult:
+    '''一类结果的当前页，ids按相关度排序'''
+    ids: list[int] = field(default_factory=list)
+    total: int = 0
+
+
+def search(query: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE) -> dict[str, SearchResult]:
+    '''
+    搜索全部类型，每类返回第page页
+
+    :param query: 查询文本，所有词元都需命中
+    :param page: 页码，从1开始
+    :param page_size: 每类每页的结果数
+    :return: 类型到结果的映射，没有结果的类型也存在
+    :rtype: dict[str, SearchResult]
+    '''
+    results = {kind: SearchResult() for kind in Kind.values}
+    tokens = query_tokens(query)
+    if not tokens:
+        return results
+    start = (max(page, 1) - 1) * page_size
+    matches = SearchToken.objects.filter(token__in=tokens).values(
+        'kind', 'object_id',
+    ).annotate(
+        hits=Count('id'), score=Sum('weight'),
+    ).filter(hits=len(tokens)).annotate(
+        rank=Window(RowNumber(), partition_by=F('kind'),
+                    order_by=[F('score').desc(), F('object_id')]),
+        total=Window(Count('*'), partition_by=F('kind')),
+    ).filter(rank__lte=start + page_size).order_by('kind', 'rank')
+    # 前几页的行也被读取，以便页码超出范围时仍能得到总数
+    for match in matches:
+        result = results[match['kind']]
+        result.total = match['total']
+        if match['rank'] > start:
+            result.ids.append(match['object_id'])
+    return results
+
+
+def _in_order(objects: Iterable, ids: list[int]) -> list:
+    order = {object_id: i for i, object_id in enumerate(ids)}
+    return sorted(objects, key=lambda obj: order[obj.id])
+
+
+def hydrate_people(ids: list[int]) -> list[NaturalPerson]:
+    return _in_order(NaturalPerson.objects.filter(id__in=ids), ids)
+
+
+def hydrate_orgs(ids: list[int], recent: int = 3) -> list[dict]:
+    '''小组及其负责人和时间最近的recent个活动，查询数与小组数无关'''
+    orgs = _in_order(Organization.objects.filter(
+        id__in=ids).select_related('otype'), ids)
+    admins = defaultdict(list)
+    for position in Position.objects.activated().filter(
+            is_admin=True, org__in=ids,
+            person__in=NaturalPerson.objects.activated(),
+    ).select_related('person'):
+        admins[position.org_id].append(position.person)
+
+    # 分别取开始时间在此前和此后最近的活动，再合并取最近的
+    now = datetime.now()
+    candidates = defaultdict(list)
+    activities = Activity.objects.activated().filter(organization_id__in=ids).exclude(
+        status__in=[Activity.Status.CANCELED, Activity.Status.REJECT])
+    for after in [True, False]:
+        nearest = activities.filter(
+            **{'start__gte' if after else 'start__lt': now}
+        ).annotate(
+            nearest=Window(RowNumber(), partition_by=F('organization_id'),
+                           order_by=F('start').asc() if after else F('start').desc()),
+        ).filter(nearest__lte=recent)
+        for activity in nearest:
+            candidates[activity.organization_id_id].append(activity)
+
+    display = []
+    for org in orgs:
+        recent_activities = sorted(candidates[org.id],
+                                   key=lambda activity: abs(now - activity.start))
+        display.append(dict(
+            oname=org.oname,
+            otype=org.otype,
+            pos0=admins[org.id],
+            activities=recent_activities[:recent] or None,
+            get_user_ava=org.get_user_ava(),
+        ))
+    return display
+
+
+def hydrate_activities(ids: list[int]) -> list[Activity]:
+    return _in_order(Activity.objects.activated().filter(
+        id__in=ids).select_related('organization_id'), ids)
+
+
+def hydrate_academic(tag_ids: list[int], text_ids: list[int]) -> list[tuple[dict, dict]]:
+    '''学术地图条目按人整合，格式与academic_utils.get_search_results的展示一致'''
+    people: dict[int, tuple[dict, dict[str, list[str]]]] = {}
+
+    def collect(person: NaturalPerson, label: str, content: str):
+        if person.id not in people:
+            people[person.id] = (dict(
+                ref=person.get_absolute_url() + '#tab=academic_map',
+                sname=person.name,
+                avatar=person.get_user_ava(),
+            ), {})
+        people[person.id][1].setdefault(label, []).append(content)
+
+    for entry in _in_order(AcademicTagEntry.objects.filter(
+            id__in=tag_ids).select_related('person', 'tag'), tag_ids):
+        collect(entry.person, AcademicTag.Type(entry.tag.atype).label,
+                entry.tag.tag_content)
+    for entry in _in_order(AcademicTextEntry.objects.filter(
+            id__in=text_ids).select_related('person'), text_ids):
+        collect(entry.person, AcademicTextEntry.Type(entry.atype).label, entry.content)
+    return list(people.values())
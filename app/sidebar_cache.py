@@ -0,0 +1,186 @@
+"""
+sidebar_cache.py
+
+侧边栏和导航栏的缓存，每个页面渲染时都会调用，热路径不访问数据库
+
+- 用户的侧边栏资料（头像、名称、身份等）按用户缓存，个人或小组保存或删除时失效（见models.py）
+- 未读通知数按用户缓存为计数器，创建通知和修改状态时在事务提交后增量调整
+  只调整已缓存的计数，未缓存的用户在下次访问时重新计数
+  批量修改状态、删除通知等无法精确调整的操作使计数失效，计数最多缓存十分钟作为兜底
+- 页面帮助的全部内容缓存为一个字典，帮助保存或删除时失效（见models.py）
+- 通知可能由定时任务等其它进程创建，缓存只在缓存后端跨进程共享时启用，
+  默认的进程内缓存无法被其它进程失效，此时直接查询数据库，见utils/cache.py
+- 进程内统计命中率和节省的查询次数，见sidebar_stats
+
+SidebarStats: 侧边栏缓存的统计
+cached_profile: 获取用户的侧边栏资料
+unread_count: 获取用户的未读通知数
+adjust_unread: 提交后调整用户的未读通知数
+invalidate_unread: 提交后使用户的未读通知数失效
+invalidate_profile: 使用户的侧边栏资料失效
+help_content: 获取页面帮助的内容
+invalidate_help: 使页面帮助的缓存失效
+sidebar_stats: 当前进程的统计
+"""
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+
+from utils.cache import shared_cache
+from app.models import Notification, Help
+
+
+__all__ = [
+    'SidebarStats',
+    'cached_profile',
+    'unread_count',
+    'adjust_unread',
+    'invalidate_unread',
+    'invalidate_profile',
+    'help_content',
+    'invalidate_help',
+    'sidebar_stats',
+]
+
+
+_PROFILE_KEY = 'sidebar:profile:{}'
+_UNREAD_KEY = 'sidebar:unread:{}'
+_HELP_KEY = 'sidebar:help'
+PROFILE_TIMEOUT = 3600
+UNREAD_TIMEOUT = 600
+
+
+@dataclass
+class SidebarStats:
+    '''缓存命中次数和命中时节省的查询次数'''
+    requests: int = 0
+    hits: int = 0
+    misses: int = 0
+    queries_saved: int = 0
+
+    def record(self, hit: bool, queries: int = 1) -> None:
+        if hit:
+            self.hits += 1
+            self.queries_saved += queries
+        else:
+            self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def saved_per_request(self) -> float:
+        return self.queries_saved / self.requests if self.requests else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.requests}次请求, 命中率{self.hit_rate:.1%}, '
+                f'平均每次请求节省{self.saved_per_request:.2f}次查询')
+
+
+_stats = SidebarStats()
+
+
+def sidebar_stats() -> SidebarStats:
+    '''当前进程的统计，请求次数由get_sidebar_and_navbar记录'''
+    return _stats
+
+
+def cached_profile(user_id: int, build: Callable[[], tuple[dict, int]]) -> dict:
+    '''
+    获取用户的侧边栏资料
+
+    :param build: 未命中时生成资料，返回资料和所用的查询次数
+    :type build: Callable[[], tuple[dict, int]]
+    '''
+    if not shared_cache():
+        profile, _ = build()
+        _stats.record(False)
+        return profile
+    key = _PROFILE_KEY.format(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        profile, queries = cached
+        _stats.record(True, queries)
+        return profile
+    profile, queries = build()
+    cache.set(key, (profile, queries), PROFILE_TIMEOUT)
+    _stats.record(False)
+    return profile
+
+
+def invalidate_profile(user_id: int) -> None:
+    '''使用户的侧边栏资料失效，用户可能被重建，未读数一并失效'''
+    cache.delete_many([_PROFILE_KEY.format(user_id), _UNREAD_KEY.format(user_id)])
+
+
+def unread_count(user_id: int) -> int:
+    '''获取用户的未读通知数'''
+    key = _UNREAD_KEY.format(user_id)
+    enabled = shared_cache()
+    count = cache.get(key) if enabled else None
+    if count is not None:
+        _stats.record(True)
+        return count
+    count = Notification.objects.filter(
+        receiver_id=user_id, status=Notification.Status.UNDONE).count()
+    if enabled:
+        # 不覆盖并发写入的计数
+        cache.add(key, count, UNREAD_TIMEOUT)
+    _stats.record(False)
+    return count
+
+
+def adjust_unread(deltas: dict[int, int]) -> None:
+    '''
+    在事务提交后调整已缓存的未读通知数，事务回滚时不调整
+
+    :param deltas: 用户主键到未读数变化量的映射
+    :type deltas: dict[int, int]
+    '''
+    keys = {_UNREAD_KEY.format(user_id): delta
+            for user_id, delta in deltas.items() if delta}
+    if not keys or not shared_cache():
+        return
+
+    def _adjust():
+        for key in cache.get_many(keys):
+            try:
+                cache.incr(key, keys[key])
+            except ValueError:
+                # 读取后恰好过期
+                pass
+
+    transaction.on_commit(_adjust)
+
+
+def invalidate_unread(user_ids: Iterable[int]) -> None:
+    '''在事务提交后使用户的未读通知数失效，用于批量修改通知状态'''
+    keys = [_UNREAD_KEY.format(user_id) for user_id in set(user_ids)]
+    if keys and shared_cache():
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def help_content(title: str) -> str:
+    '''获取页面帮助的内容，不存在时返回空字符串'''
+    enabled = shared_cache()
+    helps = cache.get(_HELP_KEY) if enabled else None
+    if helps is not None:
+        _stats.record(True)
+    else:
+        helps = {}
+        # 标题相同时与原先一样取第一条
+        for help_title, content in Help.objects.order_by('-pk').values_list(
+                'title', 'content'):
+            helps[help_title] = content
+        if enabled:
+            cache.set(_HELP_KEY, helps, None)
+        _stats.record(False)
+    return helps.get(title, '')
+
+
+def invalidate_help() -> None:
+    cache.delete(_HELP_KEY)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from app.models import User, NaturalPerson
+from app.jobs import update_active_score_per_day
+from record.models import PageLog, ModuleLog, DailyActivity
+from record.activity import rollup_day, rollup_missing
+
+
+class ActiveScoreTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = []
+        for i in range(3):
+            user = User.objects.create_user(f'210000000{i}', f'学生{i}')
+            cls.persons.append(NaturalPerson.objects.create(user, name=f'学生{i}'))
+        cls.today = datetime.now().date()
+
+    def log(self, person, days_ago, type=PageLog.CountType.PV, hour=12):
+        time = datetime.combine(self.today, datetime.min.time()) - timedelta(
+            days=days_ago) + timedelta(hours=hour)
+        if type in ModuleLog.CountType.values:
+            return ModuleLog.objects.create(user=person.get_user(), type=type,
+                                            time=time, module_name='查看帮助')
+        return PageLog.objects.create(user=person.get_user(), type=type, time=time)
+
+    def test_rollup_day(self):
+        first, second, _ = self.persons
+        self.log(first, 1, hour=0)
+        self.log(first, 1, PageLog.CountType.PD, hour=23)
+        self.log(first, 1, ModuleLog.CountType.MC)
+        self.log(first, 2)
+        self.log(second, 1, ModuleLog.CountType.MV)
+        day = self.today - timedelta(days=1)
+        self.assertEqual(rollup_day(day), 2)
+        activity = DailyActivity.objects.get(user=first.get_user(), date=day)
+        self.assertEqual((activity.pv, activity.pd, activity.mv, activity.mc), (1, 1, 0, 1))
+        # 重复汇总时替换，计入迟到的埋点
+        self.log(first, 1)
+        self.assertEqual(rollup_day(day), 2)
+        self.assertEqual(DailyActivity.objects.get(user=first.get_user(), date=day).pv, 2)
+
+    def test_rollup_missing(self):
+        self.log(self.persons[0], 1)
+        self.log(self.persons[0], 3)
+        self.assertEqual(len(rollup_missing(self.today, 14)), 14)
+        # 已有汇总的日期不再扫描，前一天总是重新汇总
+        self.assertListEqual(rollup_missing(self.today, 14), [
+            self.today - timedelta(days=i) for i in range(14, 3, -1)
+        ] + [self.today - timedelta(days=i) for i in (2, 1)])
+
+    def test_active_score(self):
+        first, second, third = self.persons
+        for days_ago in (0, 1, 1, 2, 14, 15):
+            self.log(first, days_ago)
+        # 只有模块埋点不计入活跃度
+        self.log(second, 3, ModuleLog.CountType.MC)
+        self.log(second, 5, PageLog.CountType.PD)
+        third.active_score = 0.5
+        third.save()
+        update_active_score_per_day()
+        scores = dict(NaturalPerson.objects.values_list('id', 'active_score'))
+        self.assertAlmostEqual(scores[first.id], 3 / 14)
+        self.assertAlmostEqual(scores[second.id], 1 / 14)
+        self.assertEqual(scores[third.id], 0)
@@ -0,0 +1,160 @@
+import random
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Activity,
+    Participation,
+    Notification,
+)
+from app.activity_transition import upcoming_transitions, apply_due_transitions
+
+
+class ActivityTransitionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = [
+            NaturalPerson.objects.create(
+                User.objects.create_user(f'200000000{i}', f'学生{i}', User.Type.STUDENT),
+                name=f'学生{i}')
+            for i in range(4)
+        ]
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='学生小组', incharge=cls.persons[0])
+        cls.org = Organization.objects.create(
+            organization_id=User.objects.create_user('zz00001', '围棋社'),
+            oname='围棋社', otype=otype)
+        cls.semester_start = datetime(2024, 9, 9, 8)
+
+    @classmethod
+    def create_activity(cls, start: datetime, hours: float = 2,
+                        status=Activity.Status.APPLYING, **kwargs) -> Activity:
+        return Activity.objects.create(
+            title='活动', organization_id=cls.org, examine_teacher=cls.persons[0],
+            status=status, publish_time=start - timedelta(days=7),
+            apply_end=start - timedelta(hours=12), start=start,
+            end=start + timedelta(hours=hours), **kwargs)
+
+    def participate(self, activity: Activity, person: NaturalPerson, status):
+        return Participation.objects.create(activity=activity, person=person, status=status)
+
+    @staticmethod
+    def expected_status(activity: Activity, now: datetime) -> str:
+        if now < activity.apply_end:
+            return Activity.Status.APPLYING
+        if now < activity.start:
+            return Activity.Status.WAITING
+        if now < activity.end:
+            return Activity.Status.PROGRESSING
+        return Activity.Status.END
+
+    def test_semester(self):
+        rng = random.Random(0)
+        activities = [
+            self.create_activity(
+                self.semester_start + timedelta(hours=rng.randrange(16 * 7 * 24)),
+                hours=rng.choice([1, 2, 3, 8]))
+            for _ in range(200)
+        ]
+        canceled = self.create_activity(self.semester_start + timedelta(days=3),
+                                        status=Activity.Status.CANCELED)
+        now = self.semester_start - timedelta(days=1)
+        upcoming = upcoming_transitions(now + timedelta(days=7))
+        self.assertListEqual([t.due for t in upcoming], sorted(t.due for t in upcoming))
+        self.assertTrue(all(t.current == Activity.Status.APPLYING for t in upcoming))
+        self.assertNotIn(canceled.id, [t.activity_id for t in upcoming])
+
+        total = 0
+        while now < self.semester_start + timedelta(weeks=17):
+            applied = apply_due_transitions(now)
+            total += sum(applied.values())
+            self.assertFalse(upcoming_transitions(now))
+            statuses = dict(Activity.objects.values_list('id', 'status'))
+            for activity in activities:
+                self.assertEqual(statuses[activity.id],
+                                 self.expected_status(activity, now))
+            self.assertEqual(statuses[canceled.id], Activity.Status.CANCELED)
+            now += timedelta(hours=5)
+        self.assertEqual(total, 3 * len(activities))
+        # 幂等
+        self.assertFalse(any(apply_due_transitions(now).values()))
+
+    def test_catch_up(self):
+        activity = self.create_activity(self.semester_start)
+        # 长时间未执行时一次推进到结束
+        applied = apply_due_transitions(self.semester_start + timedelta(days=1))
+        self.assertDictEqual(applied, {
+            Activity.Status.WAITING: 1,
+            Activity.Status.PROGRESSING: 1,
+            Activity.Status.END: 1,
+        })
+        activity.refresh_from_db()
+        self.assertEqual(activity.status, Activity.Status.END)
+
+    def test_side_effects(self):
+        lottery = self.create_activity(self.semester_start, bidding=True, capacity=1)
+        for person in self.persons[1:]:
+            self.participate(lottery, person, Participation.AttendStatus.APPLYING)
+        checkin = self.create_activity(self.semester_start, need_checkin=True)
+        unchecked = self.participate(checkin, self.persons[1],
+                                     Participation.AttendStatus.APPLYSUCCESS)
+        lecture = self.create_activity(self.semester_start, hours=2)
+        attended = self.participate(lecture, self.persons[0],
+                                    Participation.AttendStatus.APPLYSUCCESS)
+
+        # 抽签结果在事务提交后通知
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_due_transitions(self.semester_start - timedelta(hours=1))
+            self.assertFalse(Notification.objects.exists())
+        for callback in callbacks:
+            callback()
+        lottery.refresh_from_db()
+        self.assertEqual(lottery.current_participants, 1)
+        results = list(Participation.objects.filter(activity=lottery).values_list(
+            'status', flat=True))
+        self.assertEqual(results.count(Participation.AttendStatus.APPLYSUCCESS), 1)
+        self.assertEqual(results.count(Participation.AttendStatus.APPLYFAILED), 2)
+        self.assertEqual(Notification.objects.count(), 3)
+
+        apply_due_transitions(self.semester_start)
+        unchecked.refresh_from_db()
+        attended.refresh_from_db()
+        self.assertEqual(unchecked.status, Participation.AttendStatus.UNATTENDED)
+        self.assertEqual(attended.status, Participation.AttendStatus.ATTENDED)
+
+        user = self.persons[0].get_user()
+        apply_due_transitions(self.semester_start + timedelta(hours=3))
+        user.refresh_from_db()
+        self.assertEqual(user.YQpoint, lecture.eval_point())
+        # 重复执行不会重复结算
+        apply_due_transitions(self.semester_start + timedelta(hours=4))
+        user.refresh_from_db()
+        self.assertEqual(user.YQpoint, lecture.eval_point())
+
+    def test_opt_out(self):
+        manual = self.create_activity(self.semester_start, auto_transition=False)
+        auto = self.create_activity(self.semester_start)
+        now = self.semester_start + timedelta(days=1)
+        self.assertNotIn(manual.id, [t.activity_id for t in upcoming_transitions(now)])
+        apply_due_transitions(now)
+        manual.refresh_from_db()
+        auto.refresh_from_db()
+        self.assertEqual(manual.status, Activity.Status.APPLYING)
+        self.assertEqual(auto.status, Activity.Status.END)
+
+        # 管理员取消定时任务后不再自动转换
+        admin = User.objects.create_superuser('admin', '管理员', password='admin')
+        self.client.force_login(admin)
+        self.client.post('/admin/app/activity/', {
+            'action': 'resume_transition', '_selected_action': [manual.pk]})
+        apply_due_transitions(now)
+        manual.refresh_from_db()
+        self.assertEqual(manual.status, Activity.Status.END)
+        self.client.post('/admin/app/activity/', {
+            'action': 'cancel_scheduler', '_selected_action': [manual.pk, auto.pk]})
+        self.assertFalse(Activity.objects.filter(auto_transition=True).exists())
@@ -0,0 +1,66 @@
+from datetime import datetime
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Course,
+    CourseTime,
+)
+from app.course_bitmap import time_bitmap, get_bitmaps, union_bitmap
+
+
+class TimeBitmapTest(SimpleTestCase):
+    def test_overlap(self):
+        # 2023-02-20是周一
+        morning = time_bitmap(datetime(2023, 2, 20, 8), datetime(2023, 2, 20, 10))
+        touching = time_bitmap(datetime(2023, 2, 20, 10), datetime(2023, 2, 20, 12))
+        overlap = time_bitmap(datetime(2023, 2, 20, 9, 59), datetime(2023, 2, 20, 11))
+        next_week = time_bitmap(datetime(2023, 2, 27, 9), datetime(2023, 2, 27, 9, 30))
+        self.assertEqual(morning & touching, 0)
+        self.assertNotEqual(morning & overlap, 0)
+        self.assertNotEqual(morning & next_week, 0)
+
+    def test_wrap_around(self):
+        sunday_night = time_bitmap(datetime(2023, 2, 26, 23), datetime(2023, 2, 27, 1))
+        monday = time_bitmap(datetime(2023, 2, 20, 0, 30), datetime(2023, 2, 20, 2))
+        self.assertNotEqual(sunday_night & monday, 0)
+
+
+class CourseBitmapTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('2000000000', '学生')
+        person = NaturalPerson.objects.create(user, name='学生')
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='书院课程', incharge=person)
+        org = Organization.objects.create(
+            organization_id=User.objects.create_user('zz00001', '课程组织'),
+            oname='课程组织', otype=otype)
+        cls.course = Course.objects.create(
+            name='课程', organization=org, type=Course.CourseType.MORAL)
+        cls.time = CourseTime.objects.create(
+            course=cls.course,
+            start=datetime(2023, 2, 20, 8), end=datetime(2023, 2, 20, 10))
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('app.course_bitmap.shared_cache', return_value=True)
+    def test_cached_and_invalidated(self, shared):
+        bitmap = get_bitmaps([self.course.id])[self.course.id]
+        with self.assertNumQueries(0):
+            self.assertEqual(union_bitmap([self.course.id]), bitmap)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.time.end = datetime(2023, 2, 20, 11)
+            self.time.save()
+            # 并发的请求在提交前用旧数据重建位图，提交后再次失效
+            cache.set(f'course_bitmap:{self.course.id}', bitmap, None)
+        self.assertNotEqual(get_bitmaps([self.course.id])[self.course.id], bitmap)
+        self.time.delete()
+        self.assertEqual(get_bitmaps([self.course.id])[self.course.id], 0)
@@ -0,0 +1,136 @@
+from datetime import datetime
+from threading import Thread
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Course,
+    CourseTime,
+    CourseParticipant,
+)
+from app.course_ledger import SelectionLedger, flush_ledger, _journal_key
+from app.course_utils import registration_status_change
+from app.config import *
+
+
+@mock.patch('app.course_utils.ledger_enabled', return_value=True)
+class CourseLedgerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = []
+        for i in range(4):
+            user = User.objects.create_user(f'200000000{i}', f'学生{i}')
+            cls.persons.append(NaturalPerson.objects.create(user, name=f'学生{i}'))
+        incharge = cls.persons[0]
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='书院课程', incharge=incharge)
+        org_user = User.objects.create_user('zz00001', '课程组织')
+        org = Organization.objects.create(
+            organization_id=org_user, oname='课程组织', otype=otype)
+
+        def create_course(name, capacity, start_hour):
+            course = Course.objects.create(
+                name=name, organization=org, type=Course.CourseType.MORAL,
+                capacity=capacity, status=Course.Status.STAGE2)
+            CourseTime.objects.create(
+                course=course,
+                start=datetime(2023, 2, 20, start_hour),
+                end=datetime(2023, 2, 20, start_hour + 2))
+            return course
+        cls.small = create_course('小班课', 2, 8)
+        cls.overlap = create_course('冲突课', 10, 9)
+        cls.other = create_course('晚课', 10, 19)
+
+    def setUp(self):
+        caches[CONFIG.course.ledger_cache].clear()
+
+    def test_capacity(self, _):
+        results = [registration_status_change(self.small.id, person, 'select')
+                   for person in self.persons[:3]]
+        self.assertEqual([r['warn_code'] for r in results],
+                         [SUCCEED, SUCCEED, WRONG])
+        self.assertIn('已满', results[2]['warn_message'])
+        flush_ledger(wait=True)
+        self.assertEqual(CourseParticipant.objects.filter(
+            course=self.small, status=CourseParticipant.Status.SUCCESS).count(), 2)
+        self.small.refresh_from_db()
+        self.assertEqual(self.small.current_participants, 2)
+
+    def test_conflict_and_cancel(self, _):
+        person = self.persons[0]
+        result = registration_status_change(self.small.id, person, 'select')
+        self.assertEqual(result['warn_code'], SUCCEED)
+        result = registration_status_change(self.overlap.id, person, 'select')
+        self.assertEqual(result['warn_code'], WRONG)
+        self.assertIn('冲突', result['warn_message'])
+        result = registration_status_change(self.other.id, person, 'select')
+        self.assertEqual(result['warn_code'], SUCCEED)
+        result = registration_status_change(self.small.id, person, 'cancel')
+        self.assertEqual(result['warn_code'], SUCCEED)
+        # 退选后名额退还，且可以选择原先冲突的课程
+        result = registration_status_change(self.overlap.id, person, 'select')
+        self.assertEqual(result['warn_code'], SUCCEED)
+        flush_ledger(wait=True)
+        self.assertSetEqual(
+            set(CourseParticipant.objects.filter(person=person).values_list(
+                'course_id', flat=True)),
+            {self.other.id, self.overlap.id})
+        self.small.refresh_from_db()
+        self.assertEqual(self.small.current_participants, 0)
+
+    def test_concurrent_seats(self, _):
+        ledger = SelectionLedger(Course.Status.STAGE2)
+        info = ledger.course_info(self.other)
+        # 首次占用名额时从数据库加载，其余的并发请求只访问缓存
+        self.assertTrue(ledger.take_seat(self.other.id, info))
+        results = []
+        threads = [Thread(target=lambda: results.append(
+            ledger.take_seat(self.other.id, info))) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), info['capacity'] - 1)
+
+    def test_journal_hole(self, _):
+        cache = caches[CONFIG.course.ledger_cache]
+        # 分配序号后未写入日志的进程异常退出
+        cache.add(_journal_key('head'), 0, None)
+        cache.incr(_journal_key('head'))
+        person = self.persons[0]
+        ledger = SelectionLedger(Course.Status.STAGE2)
+        ledger.record(self.other.id, person.id, CourseParticipant.Status.SUCCESS)
+        # 首次写回时等待缺失的日志，再次写回时跳过，不阻塞之后的日志
+        self.assertEqual(flush_ledger(), 0)
+        self.assertEqual(flush_ledger(), 2)
+        self.assertTrue(CourseParticipant.objects.filter(
+            course=self.other, person=person).exists())
+
+    @mock.patch.object(CONFIG.course, 'ledger_flush_interval', 3600)
+    @mock.patch('app.course_ledger.RELOAD_WAIT', 0.1)
+    def test_reload(self, _):
+        cache = caches[CONFIG.course.ledger_cache]
+        first, second = self.persons[:2]
+        registration_status_change(self.small.id, first, 'select')
+        registration_status_change(self.small.id, second, 'select')
+        ledger = SelectionLedger(Course.Status.STAGE2)
+        # 缓存的状态被淘汰，且日志尚未写回
+        cache.delete_many([ledger._key('person', second.id),
+                           ledger._key('seats', self.small.id)])
+        cache.add(_journal_key('lock'), 1)
+        result = registration_status_change(self.small.id, second, 'cancel')
+        self.assertEqual(result['warn_code'], WRONG)
+        cache.delete(_journal_key('lock'))
+        # 写回后从数据库加载的状态与账本一致
+        result = registration_status_change(self.small.id, second, 'cancel')
+        self.assertEqual(result['warn_code'], SUCCEED)
+        result = registration_status_change(self.small.id, self.persons[2], 'select')
+        self.assertEqual(result['warn_code'], SUCCEED)
+        result = registration_status_change(self.small.id, self.persons[3], 'select')
+        self.assertEqual(result['warn_code'], WRONG)
@@ -0,0 +1,63 @@
+from django.test import TestCase
+
+from boot.config import GLOBAL_CONFIG
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Position,
+    Course,
+    CourseParticipant,
+)
+from app.course_utils import change_course_status
+
+
+class SelectEndTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = []
+        for i in range(6):
+            user = User.objects.create_user(f'200000000{i}', f'学生{i}')
+            cls.persons.append(NaturalPerson.objects.create(user, name=f'学生{i}'))
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='书院课程', incharge=cls.persons[0])
+        cls.org = Organization.objects.create(
+            organization_id=User.objects.create_user('zz00001', '课程组织'),
+            oname='课程组织', otype=otype)
+        courses = [Course.objects.create(
+            name=f'课程{i}', organization=cls.org, type=Course.CourseType.MORAL,
+            status=Course.Status.STAGE2) for i in range(2)]
+        # 学生0在两门课程都选上，学生5未选上
+        for course, persons in zip(courses, [cls.persons[:3], cls.persons[:1] + cls.persons[3:]]):
+            for person in persons:
+                status = (CourseParticipant.Status.FAILED if person == cls.persons[5]
+                          else CourseParticipant.Status.SUCCESS)
+                CourseParticipant.objects.create(course=course, person=person, status=status)
+        # 学生1已离职，学生2已在职
+        Position.objects.create(person=cls.persons[1], org=cls.org, pos=2,
+                                is_admin=True, status=Position.Status.DEPART)
+        Position.objects.create(person=cls.persons[2], org=cls.org, pos=0, is_admin=True)
+
+    def test_join(self):
+        change_course_status(Course.Status.STAGE2, Course.Status.SELECT_END)
+        positions = Position.objects.activated().filter(org=self.org)
+        self.assertEqual(positions.count(), 5)
+        self.assertEqual(Position.objects.filter(org=self.org).count(), 5)
+        self.assertFalse(positions.filter(person=self.persons[5]).exists())
+        rejoined = positions.get(person=self.persons[1])
+        self.assertEqual((rejoined.pos, rejoined.is_admin), (10, False))
+        self.assertEqual(rejoined.semester, GLOBAL_CONFIG.semester)
+        self.assertEqual(positions.get(person=self.persons[2]).pos, 0)
+        self.assertFalse(Course.objects.exclude(status=Course.Status.SELECT_END).exists())
+
+    def test_constant_queries(self):
+        for i in range(20):
+            user = User.objects.create_user(f'210000000{i:02d}', f'新生{i}')
+            person = NaturalPerson.objects.create(user, name=f'新生{i}')
+            CourseParticipant.objects.create(
+                course=Course.objects.first(), person=person,
+                status=CourseParticipant.Status.SUCCESS)
+        # 读取选课结果、已有职务，批量更新、批量创建，更新课程状态，以及事务的保存点
+        with self.assertNumQueries(7):
+            change_course_status(Course.Status.STAGE2, Course.Status.SELECT_END)
@@ -0,0 +1,63 @@
+from django.test import TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Course,
+    CourseParticipant,
+    Notification,
+)
+from app.course_utils import draw_lots
+
+
+class DrawLotsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = []
+        for i in range(5):
+            user = User.objects.create_user(f'200000000{i}', f'学生{i}')
+            cls.persons.append(NaturalPerson.objects.create(user, name=f'学生{i}'))
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='书院课程', incharge=cls.persons[0])
+        org = Organization.objects.create(
+            organization_id=User.objects.create_user('zz00001', '课程组织'),
+            oname='课程组织', otype=otype)
+        cls.hot = Course.objects.create(
+            name='热门课', organization=org, type=Course.CourseType.MORAL,
+            capacity=2, status=Course.Status.DRAWING)
+        cls.cold = Course.objects.create(
+            name='冷门课', organization=org, type=Course.CourseType.MORAL,
+            capacity=10, status=Course.Status.DRAWING)
+        for person in cls.persons:
+            CourseParticipant.objects.create(
+                course=cls.hot, person=person, status=CourseParticipant.Status.SELECT)
+        CourseParticipant.objects.create(
+            course=cls.cold, person=cls.persons[0],
+            status=CourseParticipant.Status.SELECT)
+
+    def winners(self, course: Course) -> set[int]:
+        return set(CourseParticipant.objects.filter(
+            course=course, status=CourseParticipant.Status.SUCCESS,
+        ).values_list('person_id', flat=True))
+
+    def test_draw(self):
+        self.assertEqual(draw_lots(42), 42)
+        self.assertEqual(len(self.winners(self.hot)), 2)
+        self.assertSetEqual(self.winners(self.cold), {self.persons[0].id})
+        self.assertEqual(CourseParticipant.objects.filter(
+            status=CourseParticipant.Status.FAILED).count(), 3)
+        self.hot.refresh_from_db()
+        self.cold.refresh_from_db()
+        self.assertEqual(self.hot.current_participants, 2)
+        self.assertEqual(self.cold.current_participants, 1)
+        # 热门课5条通知，冷门课只有选上的1条
+        self.assertEqual(Notification.objects.count(), 6)
+
+    def test_reproducible(self):
+        draw_lots(7)
+        winners = self.winners(self.hot)
+        CourseParticipant.objects.update(status=CourseParticipant.Status.SELECT)
+        draw_lots(7)
+        self.assertSetEqual(self.winners(self.hot), winners)
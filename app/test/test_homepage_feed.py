@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from threading import Timer
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Activity,
+    Wishes,
+)
+from boot.config import GLOBAL_CONFIG
+from generic.models import YQPointRecord
+from achievement.models import AchievementType, Achievement, AchievementUnlock
+from achievement.jobs import unlock_visit_achievements
+from app.homepage_feed import homepage_feed
+
+
+class HomepageFeedTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('2000000000', '学生', User.Type.STUDENT)
+        User.objects.filter(id=user.id).update(is_newuser=False)
+        cls.person = NaturalPerson.objects.create(user, name='学生')
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='学生小组', incharge=cls.person)
+        cls.org = Organization.objects.create(
+            organization_id=User.objects.create_user('zz00001', '围棋社'),
+            oname='围棋社', otype=otype)
+        cls.activity = cls.create_activity('围棋入门讲座')
+
+    @classmethod
+    def create_activity(cls, title: str) -> Activity:
+        now = datetime.now()
+        return Activity.objects.create(
+            title=title, organization_id=cls.org, examine_teacher=cls.person,
+            status=Activity.Status.APPLYING, start=now + timedelta(hours=2),
+            end=now + timedelta(hours=4), apply_end=now + timedelta(hours=1),
+            publish_time=now,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached(self):
+        feed = homepage_feed()
+        self.assertListEqual(feed['signup_rec'], [self.activity])
+        with self.assertNumQueries(0):
+            feed = homepage_feed()
+            # 所属小组已预先加载
+            str(feed['signup_rec'][0].organization_id)
+        # 活动或心愿变化后重建
+        self.create_activity('围棋比赛')
+        Wishes.objects.create(text='心愿')
+        feed = homepage_feed()
+        self.assertEqual(len(feed['signup_rec']), 2)
+        self.assertEqual(len(feed['wishes']), 1)
+
+    def test_stale_while_rebuilding(self):
+        homepage_feed()
+        self.create_activity('围棋比赛')
+        # 其他请求正在重建时使用旧内容
+        cache.set('homepage:feed:lock', True)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(homepage_feed()['signup_rec']), 1)
+        cache.delete('homepage:feed:lock')
+        self.assertEqual(len(homepage_feed()['signup_rec']), 2)
+
+    @mock.patch('app.homepage_feed.build_homepage_feed', return_value={'wishes': []})
+    def test_wait_for_rebuild(self, build):
+        # 没有旧内容时等待正在重建的请求，不再重复计算
+        cache.set('homepage:feed:lock', True)
+        timer = Timer(0.1, cache.set, ['homepage:feed', {'wishes': ['心愿']}])
+        timer.start()
+        self.assertDictEqual(homepage_feed(), {'wishes': ['心愿']})
+        timer.join()
+        build.assert_not_called()
+        # 重建的请求失败释放锁后自行重建
+        cache.clear()
+        cache.set('homepage:feed:lock', True)
+        timer = Timer(0.1, cache.delete, ['homepage:feed:lock'])
+        timer.start()
+        self.assertDictEqual(homepage_feed(), {'wishes': []})
+        timer.join()
+        build.assert_called_once()
+
+    def test_homepage(self):
+        self.client.force_login(self.person.get_user())
+        response = self.client.get('/welcome/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['html_display'].get('first_signin'))
+        self.assertContains(response, '围棋入门讲座')
+        response = self.client.get('/welcome/', HTTP_HOST='localhost')
+        self.assertNotIn('first_signin', response.context['html_display'])
+
+    def test_visit_achievements(self):
+        # 解锁通知的默认发送者
+        User.objects.create_user(GLOBAL_CONFIG.official_uid, '官方')
+        achievement_type = AchievementType.objects.create(title='元气人生')
+        for name in ['注册智慧书院', '首次获得元气值', '学期内获得10元气值', '首次消费元气值']:
+            Achievement.objects.create(name=name, achievement_type=achievement_type)
+        user = self.person.get_user()
+        other = User.objects.create_user('2000000001', '学生', User.Type.STUDENT)
+        NaturalPerson.objects.create(other, name='学生')
+        for record_user, delta in [(user, 3), (user, 4), (user, -2), (other, 5)]:
+            YQPointRecord.objects.create(user=record_user, delta=delta,
+                                         source_type=YQPointRecord.SourceType.CHECK_IN)
+        self.client.force_login(user)
+        self.client.get('/welcome/', HTTP_HOST='localhost')
+        today = datetime.now().date()
+        semester = SimpleNamespace(start_date=today - timedelta(days=30),
+                                   end_date=today + timedelta(days=30))
+        with mock.patch('achievement.jobs.current_semester', return_value=semester):
+            unlock_visit_achievements()
+            # 只检查一天内访问过首页的用户，已解锁的成就不再解锁
+            unlock_visit_achievements()
+        self.assertSetEqual(set(AchievementUnlock.objects.values_list(
+            'user', 'achievement__name')), {
+            (user.id, '注册智慧书院'), (user.id, '首次获得元气值'), (user.id, '首次消费元气值'),
+        })
@@ -0,0 +1,70 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from app.models import User, NaturalPerson, Notification
+from app.notification_utils import bulk_notification_create
+from app.extern.wechat import publish_notification_batch
+
+
+class NotificationBatchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for i in range(4):
+            user = User.objects.create_user(f'200000000{i}', f'学生{i}', User.Type.STUDENT)
+            NaturalPerson.objects.create(user, name=f'学生{i}')
+            cls.users.append(user)
+
+    def create(self, receivers, **kwargs):
+        return bulk_notification_create(
+            receivers=receivers, sender=self.users[0],
+            typename=Notification.Type.NEEDREAD,
+            title=Notification.Title.ACTIVITY_INFORM,
+            content='活动开始了', URL='/viewActivity/?activityid=1', **kwargs)
+
+    def test_idempotent(self):
+        success, batch = self.create(self.users[:3])
+        self.assertTrue(success)
+        # 重试时识别码相同，已通知的用户被移除
+        success, retry = self.create(self.users, duplicate_behavior='remove')
+        self.assertTrue(success)
+        self.assertEqual(batch.identifier, retry.identifier)
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertEqual(retry.receiver_ids, [self.users[3].id])
+        self.assertTupleEqual(self.create(self.users, duplicate_behavior='fail'), (False, None))
+        # 业务键不同的批次不受影响
+        _, other = self.create(self.users, batch_key='2', duplicate_behavior='fail')
+        self.assertNotEqual(other.identifier, batch.identifier)
+        self.assertEqual(Notification.objects.count(), 8)
+
+    @mock.patch('app.extern.wechat.send_wechat')
+    def test_publish_once(self, send_wechat):
+        _, batch = self.create(self.users, to_wechat=True)
+        send_wechat.assert_called_once()
+        self.assertCountEqual(send_wechat.call_args.args[0],
+                              [user.username for user in self.users])
+        # 定时任务重复触发时不会重复发送
+        self.assertTrue(publish_notification_batch(batch.pk))
+        send_wechat.assert_called_once()
+        self.assertTrue(publish_notification_batch(batch, force=True))
+        self.assertEqual(send_wechat.call_count, 2)
+
+    @mock.patch('app.extern.wechat.send_wechat')
+    def test_republish_older_batch(self, send_wechat):
+        # 内容相同的两批通知识别码相同，重发时按通知所属的批次
+        _, batch = self.create(self.users[:2])
+        _, later = self.create(self.users[2:])
+        self.assertEqual(batch.identifier, later.identifier)
+        older = Notification.objects.get(receiver=self.users[0])
+        self.assertEqual(older.batch.receiver_ids, [user.id for user in self.users[:2]])
+
+        admin = User.objects.create_superuser('admin', '管理员', password='admin')
+        self.client.force_login(admin)
+        self.client.post('/admin/app/notification/', {
+            'action': 'republish_bulk_at_message',
+            '_selected_action': [older.pk],
+        })
+        send_wechat.assert_called_once()
+        self.assertCountEqual(send_wechat.call_args.args[0],
+                              [user.username for user in self.users[:2]])
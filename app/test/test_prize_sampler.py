@@ -0,0 +1,106 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.test import TestCase, SimpleTestCase
+
+from app.models import User, Prize, Pool, PoolItem, PoolRecord
+from app.prize_sampler import PrizeSampler, pool_sampler
+from app.YQPoint_utils import buy_random_pool
+
+
+def legacy_select(counts: dict[int, int], rng: random.Random) -> int:
+    '''原实现：把自然数区间映射到奖品，均匀抽取一个序号'''
+    intervals, total = [], 0
+    for key, count in counts.items():
+        if count > 0:
+            intervals.append((total, key))
+            total += count
+    idx = rng.randrange(total)
+    return next(key for start, key in reversed(intervals) if idx >= start)
+
+
+def chi_square(observed: Counter, counts: dict[int, int], n: int) -> float:
+    total = sum(counts.values())
+    return sum((observed[key] - n * count / total) ** 2 / (n * count / total)
+               for key, count in counts.items() if count > 0)
+
+
+class PrizeSamplerTestCase(SimpleTestCase):
+    COUNTS = {11: 50, 12: 0, 13: 30, 14: 15, 15: 4, 16: 1}
+    # 自由度为4（有效的5种奖品），显著性水平0.001
+    CRITICAL = 18.47
+
+    def test_distribution(self):
+        sampler = PrizeSampler(self.COUNTS)
+        n = 40000
+        rng = random.Random(0)
+        observed = Counter(sampler.sample(rng) for _ in range(n))
+        self.assertNotIn(12, observed)
+        self.assertLess(chi_square(observed, self.COUNTS, n), self.CRITICAL)
+        legacy = Counter(legacy_select(self.COUNTS, rng) for _ in range(n))
+        self.assertLess(chi_square(legacy, self.COUNTS, n), self.CRITICAL)
+        # 两种实现的分布一致（2×5列联表的卡方检验）
+        stat = 0.0
+        for key in observed | legacy:
+            expected = (observed[key] + legacy[key]) / 2
+            stat += ((observed[key] - expected) ** 2 + (legacy[key] - expected) ** 2) / expected
+        self.assertLess(stat, self.CRITICAL)
+
+    def test_without_replacement(self):
+        sampler = PrizeSampler(self.COUNTS)
+        drawn = sampler.draw_many(sampler.total, random.Random(1))
+        self.assertEqual(Counter(drawn), +Counter(self.COUNTS))
+        self.assertEqual(sampler.total, 0)
+        with self.assertRaises(AssertionError):
+            sampler.draw()
+
+    def test_incremental_update(self):
+        sampler = PrizeSampler(self.COUNTS)
+        sampler.set(11, 0)
+        sampler.set(12, 3)
+        self.assertEqual(sampler.total, 53)
+        self.assertTrue(sampler.sync([(11, 0), (12, 3), (13, 30), (14, 15), (15, 4), (16, 0)]))
+        self.assertEqual(sampler.total, 52)
+        self.assertFalse(sampler.sync([(11, 1)]))
+        rng = random.Random(2)
+        observed = Counter(sampler.sample(rng) for _ in range(2000))
+        self.assertEqual(set(observed), {12, 13, 14, 15})
+
+
+class PoolSamplerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('11', '1', User.Type.STUDENT)
+        cls.pool = Pool.objects.create(
+            title='盲盒', type=Pool.Type.RANDOM, entry_time=10,
+            start=datetime.now() - timedelta(days=1),
+        )
+        prize = Prize.objects.create(name='明信片', reference_price=10)
+        cls.items = [
+            PoolItem.objects.create(pool=cls.pool, prize=prize, origin_num=3),
+            PoolItem.objects.create(pool=cls.pool, origin_num=2),
+        ]
+
+    def test_sync_with_database(self):
+        sampler = pool_sampler(self.pool)
+        self.assertEqual(sampler.total, 5)
+        sampler.draw()
+        # 未写回数据库的抽取在下次获取时被修正
+        self.assertIs(pool_sampler(self.pool), sampler)
+        self.assertEqual(sampler.total, 5)
+        PoolItem.objects.filter(id=self.items[0].id).update(consumed_num=3)
+        self.assertEqual(pool_sampler(self.pool).total, 2)
+        PoolItem.objects.create(pool=self.pool, origin_num=1)
+        self.assertEqual(pool_sampler(self.pool).total, 3)
+
+    def test_buy_random_pool(self):
+        for _ in range(5):
+            context, _, _ = buy_random_pool(self.user, str(self.pool.id))
+            self.assertEqual(context['warn_code'], 2, context['warn_message'])
+        self.assertListEqual(
+            list(PoolItem.objects.filter(pool=self.pool).order_by('id')
+                 .values_list('consumed_num', flat=True)), [3, 2])
+        self.assertEqual(PoolRecord.objects.filter(
+            pool=self.pool, status=PoolRecord.Status.UN_REDEEM).count(), 3)
+        self.assertEqual(pool_sampler(self.pool).total, 0)
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    OrganizationTag,
+)
+from app.org_utils import get_promote_receiver
+from app.promote_matrix import promote_probability
+
+
+class PromoteReceiverTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = []
+        for i in range(3):
+            user = User.objects.create_user(f'200000000{i}', f'学生{i}')
+            cls.persons.append(NaturalPerson.objects.create(user, name=f'学生{i}'))
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='学生小组', incharge=cls.persons[0])
+        cls.orgs = [Organization.objects.create(
+            organization_id=User.objects.create_user(f'zz0000{i}', f'小组{i}'),
+            oname=f'小组{i}', otype=otype) for i in range(3)]
+        cls.tags = [OrganizationTag.objects.create(name=f'标签{i}') for i in range(3)]
+        cls.orgs[0].tags.set(cls.tags[:2])
+        cls.orgs[1].tags.set(cls.tags[:1])
+        cls.orgs[2].tags.set(cls.tags[1:])
+        cls.persons[1].unsubscribe_list.add(cls.orgs[1])
+        cls.persons[2].unsubscribe_list.add(*cls.orgs)
+
+    def setUp(self):
+        cache.clear()
+
+    def probability(self) -> list[float]:
+        person_ids, prob = promote_probability(self.orgs[0], 0.1, 0.1)
+        self.assertListEqual(person_ids.tolist(), [p.id for p in self.persons])
+        return prob.round(6).tolist()
+
+    def test_probability(self):
+        # 小组1的标签全部属于小组0，小组2有一半标签重合，全部退订时没有增量
+        self.assertListEqual(self.probability(), [0.2, 0.2, 0.1])
+        self.persons[0].unsubscribe_list.add(self.orgs[0], self.orgs[1])
+        self.assertListEqual(self.probability(), [0.15, 0.2, 0.1])
+        self.orgs[2].tags.remove(self.tags[2])
+        self.assertListEqual(self.probability(), [0.2, 0.2, 0.1])
+
+    def test_seed(self):
+        receivers = get_promote_receiver(self.orgs[0], 0.5, 0.5, seed=1)
+        self.assertListEqual(receivers, get_promote_receiver(self.orgs[0], 0.5, 0.5, seed=1))
+        self.assertListEqual(get_promote_receiver(self.orgs[0], 1, 0, seed=2), self.persons)
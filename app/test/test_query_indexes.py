@@ -0,0 +1,58 @@
+from datetime import datetime
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase
+
+from utils.models.explain import explain, full_scans
+from generic.models import YQPointRecord
+from Appointment.models import Appoint
+from app.models import Notification, NotificationBatch, Participation
+
+
+@skipUnless(connection.vendor == 'sqlite', '执行计划的格式与数据库有关')
+class HotQueryIndexTestCase(TestCase):
+    '''高频查询应使用联合索引，新增高频查询时在此补充'''
+
+    def assertIndexed(self, queryset: QuerySet, condition: str):
+        self.assertListEqual(full_scans(queryset), [])
+        details = [row['detail'] for row in explain(queryset)]
+        self.assertTrue(any(condition in detail for detail in details), details)
+
+    def test_notification(self):
+        now = datetime.now()
+        self.assertIndexed(
+            Notification.objects.filter(receiver_id=1, status=Notification.Status.UNDONE),
+            'receiver_id=? AND status=?')
+        self.assertIndexed(
+            Notification.objects.filter(bulk_identifier='x', start_time__gte=now),
+            'bulk_identifier=? AND start_time>?')
+        self.assertIndexed(
+            Notification.objects.filter(sender_id=1, typename=0, title='x',
+                                        start_time__gte=now),
+            'sender_id=? AND typename=? AND title=? AND start_time>?')
+        self.assertIndexed(
+            NotificationBatch.objects.filter(identifier='x', create_time__gt=now),
+            'identifier=? AND create_time>?')
+
+    def test_participation(self):
+        self.assertIndexed(
+            Participation.objects.filter(activity_id=1, status='x'),
+            'activity_id=? AND status=?')
+        self.assertIndexed(
+            Participation.objects.filter(person_id=1, status='x'),
+            'person_id=? AND status=?')
+
+    def test_appoint(self):
+        now = datetime.now()
+        self.assertIndexed(
+            Appoint.objects.filter(Room_id='B101', Astart__lte=now, Afinish__gte=now),
+            'Room_id=? AND Astart<?')
+
+    def test_signin(self):
+        self.assertIndexed(
+            YQPointRecord.objects.filter(
+                user_id='2000000000', source_type=YQPointRecord.SourceType.CHECK_IN,
+                time__gte=datetime.now()),
+            'user_id=? AND source_type=? AND time>?')
@@ -228,3 +228,14 @@ class RunLotteryTestCase(TestCase):
         self.assertEqual(count_prize1, 5)
         self.assertEqual(count_prize5, 1)
         self.assertEqual(count_prize6, 2)
+
+    def test_seed_reproducible(self):  # 相同的随机种子抽奖结果相同
+        pool = Pool.objects.get(title="抽奖2：人多于奖")
+        records = PoolRecord.objects.filter(pool=pool).order_by("id")
+        results = []
+        for _ in range(2):
+            records.update(status=PoolRecord.Status.LOTTERING, prize=None)
+            PoolItem.objects.filter(pool=pool).update(consumed_num=0)
+            self.assertEqual(run_lottery(pool.id, seed=2023), 2023)
+            results.append(list(records.values_list("status", "prize")))
+        self.assertEqual(results[0], results[1])
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from app.models import (
+    User,
+    NaturalPerson,
+    Organization,
+    OrganizationType,
+    Position,
+    Activity,
+    AcademicTag,
+    AcademicEntry,
+    AcademicTagEntry,
+    SearchToken,
+)
+from app.search_utils import (
+    search,
+    hydrate_orgs,
+    hydrate_academic,
+    query_tokens,
+    rebuild_search_index,
+)
+
+
+Kind = SearchToken.Kind
+
+
+class SearchIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        names = ['张三', '李四', '张三丰']
+        cls.persons = [NaturalPerson.objects.create(
+            User.objects.create_user(f'200000000{i}', name),
+            name=name, stu_major='数学', show_major=False,
+        ) for i, name in enumerate(names)]
+        otype = OrganizationType.objects.create(
+            otype_id=1, otype_name='学生小组', incharge=cls.persons[0])
+        cls.org = Organization.objects.create(
+            organization_id=User.objects.create_user('zz00001', '围棋社'),
+            oname='围棋社', otype=otype)
+        Position.objects.create(person=cls.persons[1], org=cls.org, pos=0, is_admin=True)
+        now = datetime.now()
+        cls.activities = [Activity.objects.create(
+            title=title, organization_id=cls.org, examine_teacher=cls.persons[0],
+            status=status, start=now + timedelta(days=days),
+        ) for title, status, days in [
+            ('围棋入门讲座', Activity.Status.APPLYING, 1),
+            ('围棋比赛', Activity.Status.CANCELED, -1),
+            ('秘密活动', Activity.Status.REVIEWING, 2),
+        ]]
+        tag = AcademicTag.objects.create(atype=AcademicTag.Type.MAJOR, tag_content='数学')
+        for person, status in zip(cls.persons, [AcademicEntry.EntryStatus.PUBLIC,
+                                                AcademicEntry.EntryStatus.PRIVATE]):
+            AcademicTagEntry.objects.create(person=person, tag=tag, status=status)
+
+    def ids(self, query: str, kind: str) -> list[int]:
+        return search(query)[kind].ids
+
+    def test_tokens(self):
+        self.assertListEqual(query_tokens('张三丰 ZS'), ['张三', '三丰', 'zs'])
+        self.assertListEqual(query_tokens('张'), ['张'])
+        self.assertListEqual(query_tokens('!!'), [])
+
+    def test_person(self):
+        zhang, li, zhangsanfeng = [person.id for person in self.persons]
+        self.assertListEqual(self.ids('张三', Kind.PERSON), [zhang, zhangsanfeng])
+        self.assertListEqual(self.ids('三丰', Kind.PERSON), [zhangsanfeng])
+        self.assertListEqual(self.ids('zhangs', Kind.PERSON), [zhang, zhangsanfeng])
+        self.assertListEqual(self.ids('zsf', Kind.PERSON), [zhangsanfeng])
+        # 未公开的专业不能搜索，公开后由信号更新索引
+        self.assertListEqual(self.ids('数学', Kind.PERSON), [])
+        self.persons[1].show_major = True
+        self.persons[1].save()
+        self.assertListEqual(self.ids('数学', Kind.PERSON), [li])
+
+    def test_organization(self):
+        self.assertListEqual(self.ids('围棋', Kind.ORGANIZATION), [self.org.id])
+        # 负责人的姓名可以搜到小组
+        self.assertListEqual(self.ids('李四', Kind.ORGANIZATION), [self.org.id])
+        # 批量修改不触发信号，由重建修正
+        Position.objects.filter(org=self.org).update(status=Position.Status.DEPART)
+        self.assertListEqual(self.ids('李四', Kind.ORGANIZATION), [self.org.id])
+        rebuild_search_index()
+        self.assertListEqual(self.ids('李四', Kind.ORGANIZATION), [])
+
+        display = hydrate_orgs([self.org.id])[0]
+        self.assertListEqual([a.id for a in display['activities']],
+                             [self.activities[0].id])
+
+    def test_activity(self):
+        lecture, match, secret = [activity.id for activity in self.activities]
+        self.assertListEqual(self.ids('围棋', Kind.ACTIVITY), [lecture, match])
+        # 按小组名只能搜到未取消的活动，审核中的活动不可见
+        self.assertListEqual(self.ids('棋社', Kind.ACTIVITY), [lecture])
+        self.assertListEqual(self.ids('秘密', Kind.ACTIVITY), [])
+        self.activities[1].delete()
+        self.assertListEqual(self.ids('比赛', Kind.ACTIVITY), [])
+
+    def test_academic(self):
+        results = search('数学')
+        self.assertEqual(results[Kind.ACADEMIC_TAG].total, 1)
+        academic = hydrate_academic(results[Kind.ACADEMIC_TAG].ids,
+                                    results[Kind.ACADEMIC_TEXT].ids)
+        self.assertEqual(len(academic), 1)
+        info, contents = academic[0]
+        self.assertEqual(info['sname'], '张三')
+        self.assertDictEqual(contents, {'主修专业': ['数学']})
+
+    def test_pagination(self):
+        zhang, _, zhangsanfeng = [person.id for person in self.persons]
+        first = search('张', page=1, page_size=1)[Kind.PERSON]
+        second = search('张', page=2, page_size=1)[Kind.PERSON]
+        beyond = search('张', page=3, page_size=1)[Kind.PERSON]
+        self.assertEqual(first.total, 2)
+        self.assertListEqual(first.ids + second.ids, [zhang, zhangsanfeng])
+        self.assertListEqual(beyond.ids, [])
+        self.assertEqual(beyond.total, 2)
+
+    def test_query_count(self):
+        with self.assertNumQueries(1):
+            search('张三 zs')
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from app.models import User, NaturalPerson, Notification, Help
+from app.notification_utils import (
+    notification_create,
+    bulk_notification_create,
+    notification_status_change,
+)
+from app.sidebar_cache import sidebar_stats
+from app.utils import get_sidebar_and_navbar
+
+
+@mock.patch('app.sidebar_cache.shared_cache', return_value=True)
+class SidebarCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for i in range(2):
+            user = User.objects.create_user(f'200000000{i}', f'学生{i}', User.Type.STUDENT)
+            NaturalPerson.objects.create(user, name=f'学生{i}')
+            cls.users.append(user)
+        cls.user = cls.users[0]
+        Help.objects.create(title='通知信箱', content='帮助内容')
+
+    def setUp(self):
+        cache.clear()
+
+    def bar(self):
+        return get_sidebar_and_navbar(self.user, navbar_name='通知信箱')
+
+    def notify(self):
+        return notification_create(
+            self.user, self.users[1], Notification.Type.NEEDREAD,
+            Notification.Title.ACTIVITY_INFORM, '活动开始了')
+
+    def test_warm_path(self, shared):
+        cold = self.bar()
+        self.assertEqual(cold['name'], '学生0')
+        self.assertEqual(cold['help_paragraphs'], '帮助内容')
+        stats = sidebar_stats()
+        saved = stats.queries_saved
+        with self.assertNumQueries(0):
+            self.assertDictEqual(self.bar(), cold)
+        # 资料、未读数和帮助各节省一次查询
+        self.assertEqual(stats.queries_saved - saved, 3)
+        self.assertGreater(stats.hit_rate, 0)
+
+    def test_unread_counter(self, shared):
+        self.notify()
+        self.assertEqual(self.bar()['mail_num'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = self.notify()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_notification_create(
+                self.users, self.users[1], Notification.Type.NEEDREAD,
+                Notification.Title.ACTIVITY_INFORM, '活动取消了')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.bar()['mail_num'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            notification_status_change(notification)
+        self.assertEqual(self.bar()['mail_num'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            notification_status_change(notification, Notification.Status.UNDONE)
+        self.assertEqual(self.bar()['mail_num'], 3)
+        # 事务未提交时不调整计数
+        with self.captureOnCommitCallbacks(execute=False):
+            self.notify()
+        self.assertEqual(self.bar()['mail_num'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            notification.delete()
+        self.assertEqual(self.bar()['mail_num'], Notification.objects.filter(
+            receiver=self.user, status=Notification.Status.UNDONE).count())
+
+    def test_invalidation(self, shared):
+        self.bar()
+        person = NaturalPerson.objects.get_by_user(self.user)
+        person.name = '学生甲'
+        person.save()
+        Help.objects.filter(title='通知信箱').first().delete()
+        bar = self.bar()
+        self.assertEqual(bar['name'], '学生甲')
+        self.assertEqual(bar['help_paragraphs'], '')
+
+    def test_process_local_cache(self, shared):
+        shared.return_value = False
+        self.assertEqual(self.bar()['mail_num'], 0)
+        # 模拟其它进程创建通知，不经过本进程的计数调整
+        Notification.objects.create(
+            receiver=self.user, sender=self.users[1], typename=Notification.Type.NEEDREAD,
+            title=Notification.Title.ACTIVITY_INFORM, content='活动开始了')
+        self.assertEqual(self.bar()['mail_num'], 1)
@@ -3,7 +3,7 @@ import random
 import urllib.parse
 from io import BytesIO
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import wraps, cache
 from typing import cast, overload, Literal
 
 import xlwt
@@ -15,13 +15,15 @@ from utils.http.dependency import HttpResponse, HttpRequest, UserRequest
 from utils.http.utils import get_ip
 from app.utils_dependency import *
 from app.log import logger
+from app.sidebar_cache import (
+    cached_profile, unread_count, help_content, sidebar_stats,
+)
 from app.models import (
     User,
     NaturalPerson,
     Organization,
     Position,
     Notification,
-    Help,
     Participation,
     ModifyRecord,
 )
@@ -183,6 +185,29 @@ def get_inform_share(me: ClassifiedUser, is_myself=True):
     return False, alert_message
 
 
+def _sidebar_profile(user: User) -> tuple[dict, int]:
+    '''侧边栏中与用户资料相关的内容，返回内容和所用的查询次数'''
+    me = get_person_or_org(user)  # 获得对应的对象
+    profile = dict(avatar_path=get_user_ava(me))  # 头像
+    if user.is_person():
+        me = cast(NaturalPerson, me)
+        profile.update(
+            profile_name="个人主页",
+            profile_url="/stuinfo/",
+            name=me.get_display_name(),
+            person_type=me.identity,
+            is_auditor=me.is_teacher(),
+        )
+        return profile, 1
+    me = cast(Organization, me)
+    profile.update(
+        profile_name="小组主页",
+        profile_url="/orginfo/",
+        is_course=me.otype.otype_name == CONFIG.course.type_name,
+    )
+    return profile, 2
+
+
 def get_sidebar_and_navbar(user: User, navbar_name="", title_name=""):
     '''
     YWolfeee Aug 16
@@ -207,38 +232,16 @@ def get_sidebar_and_navbar(user: User, navbar_name="", title_name=""):
         # TODO: 支持未认证用户
         raise AssertionError(f"非法的用户类型：“{_utype}”")
 
-    me = get_person_or_org(user)  # 获得对应的对象
+    sidebar_stats().requests += 1
     bar_display["user_type"] = _utype
     if user.is_staff:
         bar_display["is_staff"] = True
     bar_display["user_active"] = user.active
 
     # 接下来填补各种前端呈现信息
-
-    # 头像
-    bar_display["avatar_path"] = get_user_ava(me)
-
-    # 信箱数量
-    bar_display["mail_num"] = Notification.objects.filter(
-        receiver=user, status=Notification.Status.UNDONE
-    ).count()
-
-    if user.is_person():
-        me = cast(NaturalPerson, me)
-        bar_display.update(
-            profile_name="个人主页",
-            profile_url="/stuinfo/",
-            name=me.get_display_name(),
-            person_type=me.identity,
-            is_auditor=me.is_teacher(),
-        )
-    elif user.is_org():
-        me = cast(Organization, me)
-        bar_display.update(
-            profile_name="小组主页",
-            profile_url="/orginfo/",
-            is_course=me.otype.otype_name == CONFIG.course.type_name,
-        )
+    # 头像、名称等资料和信箱数量均有缓存，热路径不访问数据库
+    bar_display.update(cached_profile(user.id, lambda: _sidebar_profile(user)))
+    bar_display["mail_num"] = unread_count(user.id)
 
     # 个人组织都可以预约
     # 页面标题默认与侧边栏相同
@@ -252,10 +255,9 @@ def get_sidebar_and_navbar(user: User, navbar_name="", title_name=""):
         help_key = navbar_name
         if help_key == "我的元气值":
             help_key += _utype.lower()
-        help_info = Help.objects.filter(title=navbar_name).first()
         bar_display.update(
             help_message=CONFIG.help_message.get(help_key, ""),
-            help_paragraphs=help_info.content if help_info is not None else "",
+            help_paragraphs=help_content(navbar_name),
         )
 
     return bar_display
@@ -325,6 +327,7 @@ def get_std_url(arg_url: str, site_url: str, path_dir=None, match_func=None):
     return False, arg_url
 
 
+@cache
 def get_underground_site_url():
     from django.urls import reverse
     return reverse('Appointment:root')
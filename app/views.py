@@ -25,7 +25,6 @@ from app.models import (
     OrganizationTag,
     OrganizationType,
     Activity,
-    ActivityPhoto,
     Participation,
     Notification,
     Wishes,
@@ -33,6 +32,7 @@ from app.models import (
     CourseRecord,
     Semester,
     AcademicQA,
+    SearchToken,
 )
 from app.utils import (
     get_person_or_org,
@@ -48,8 +48,17 @@ from app.notification_utils import (
     notification2Display,
 )
 from app.YQPoint_utils import add_signin_point
+from app.sidebar_cache import invalidate_unread
+from app.homepage_feed import homepage_feed
+from app.search_utils import (
+    SEARCH_PAGE_SIZE,
+    search as search_index,
+    hydrate_people,
+    hydrate_orgs,
+    hydrate_activities,
+    hydrate_academic,
+)
 from app.academic_utils import (
-    get_search_results,
     comments2display,
     get_js_tag_list,
     get_text_list,
@@ -59,8 +68,7 @@ from app.academic_utils import (
 )
 
 from achievement.utils import personal_achievements
-from achievement.api import unlock_achievement, unlock_YQPoint_achievements
-from semester.api import current_semester
+from achievement.api import unlock_achievement
 
 
 
@@ -793,45 +801,25 @@ def homepage(request: UserRequest):
         with transaction.atomic():
             np = NaturalPerson.objects.get_by_user(request.user, update=True)
             if np.last_time_login is None or np.last_time_login.date() != nowtime.date():
-                np.last_time_login = nowtime
-                np.save()
+                # 只更新登录时间，不触发搜索索引和侧边栏缓存的更新
+                NaturalPerson.objects.filter(pk=np.pk).update(last_time_login=nowtime)
                 add_point, html_display['signin_display'] = add_signin_point(
                     request.user)
                 html_display['first_signin'] = True  # 前端显示
 
-    # 解锁成就-注册智慧书院
-    # 如果放在注册页面结束判定 则已经注册好的用户获取不到该成就
-    unlock_achievement(request.user, '注册智慧书院')
-
-    # 元气满满系列更新
-    semester = current_semester()
-    start_datetime = datetime.combine(semester.start_date, datetime.min.time())
-    end_datetime = datetime.combine(semester.end_date, datetime.max.time())
-    unlock_YQPoint_achievements(request.user, start_datetime, end_datetime)
-
-    # 开始时间在前后一周内，除了取消和审核中的活动。按时间逆序排序
-    recentactivity_list = Activity.objects.get_recent_activity(
-    ).select_related('organization_id')
-
-    # 开始时间在今天的活动,且不展示结束的活动。按开始时间由近到远排序
-    activities = Activity.objects.get_today_activity().select_related('organization_id')
-    activities_start = [
-        activity.start.strftime("%H:%M") for activity in activities
-    ]
-    html_display['today_activities'] = list(
-        zip(activities, activities_start)) or None
+    # 注册智慧书院和元气满满系列成就由定时任务检查一天内访问过的用户，见achievement.jobs
 
-    # 最新一周内发布的活动，按发布的时间逆序
-    newlyreleased_list = Activity.objects.get_newlyreleased_activity(
-    ).select_related('organization_id')
+    # 活动列表、心愿墙、引导图和天气与用户无关，从缓存读取
+    feed = homepage_feed()
+    recentactivity_list = feed['recentactivity_list']
+    html_display['today_activities'] = feed['today_activities'] or None
+    newlyreleased_list = feed['newlyreleased_list']
 
     # 即将截止的活动，按截止时间正序
     prepare_times = Activity.EndBeforeHours.prepare_times
 
     signup_list = []
-    signup_rec = Activity.objects.activated().select_related(
-        'organization_id').filter(status=Activity.Status.APPLYING).order_by("category", "apply_end")[:10]
-    for act in signup_rec:
+    for act in feed['signup_rec']:
         deadline = act.apply_end
         dictmp = {}
         dictmp["deadline"] = deadline
@@ -853,12 +841,11 @@ def homepage(request: UserRequest):
                 print(f"心愿背景颜色{bg}不合规")
         new_wish = Wishes.objects.create(text=wishtext, background=background)
         new_wish.save()
+        # 新的心愿立即展示
+        feed = homepage_feed()
 
     # 心愿墙！！！！!最近一周的心愿，已经逆序排列，如果超过100个取前100个就可
-    wishes = Wishes.objects.filter(
-        time__gt=nowtime - timedelta(days=7)
-    )
-    wishes = wishes[:100]
+    wishes = feed['wishes']
 
     # 心愿墙背景图片
     colors = Wishes.COLORS
@@ -869,50 +856,15 @@ def homepage(request: UserRequest):
         } for i, color in enumerate(colors)
     ]
 
-    # 从redirect.json读取要作为引导图的图片，按照原始顺序
-    guidepicdir = "static/assets/img/guidepics"
-    with open(f"{guidepicdir}/redirect.json") as file:
-        img2url = json.load(file)
-    guidepics = list(img2url.items())
-    # (firstpic, firsturl), guidepics = guidepics[0], guidepics[1:]
+    # 从redirect.json读取的引导图，按照原始顺序
+    guidepics = feed['guidepics']
     # firstpic是第一个导航图，不是第一张图片，现在把这个逻辑在模板处理了
-
-    """ 
-        取出过去一周的所有活动，filter出上传了照片的活动，从每个活动的照片中随机选择一张
-        如果列表为空，那么添加一张default，否则什么都不加。
-    """
-    all_photo_display = ActivityPhoto.objects.filter(
-        type=ActivityPhoto.PhotoType.SUMMARY).order_by('-time')
-    photo_display, _aid_set = list(), set()  # 实例的哈希值未定义，不可靠
-    count = 9 - len(guidepics)  # 算第一张导航图
-    for photo in all_photo_display:
-        # 不用activity，因为外键需要访问数据库
-        if photo.activity_id not in _aid_set and photo.image:
-            # 数据库设成了image可以为空而不是空字符串，str的判断对None没有意义
-
-            photo.image = MEDIA_URL + str(photo.image)
-            photo_display.append(photo)
-            _aid_set.add(photo.activity_id)
-            count -= 1
-
-            if count <= 0:  # 目前至少能显示一个，应该也合理吧
-                break
-    photo_display = ()
+    photo_display = feed['photo_display']
     if photo_display:
         guidepics = guidepics[1:]   # 第一张只是封面图，如果有需要呈现的内容就不显示
 
-    """ 暂时不需要这些，目前逻辑是取photo_display的前四个，如果没有也没问题
-    if len(photo_display) == 0: # 这个分类是为了前端显示的便利，就不采用append了
-        homepagephoto = "/static/assets/img/taskboard.jpg"
-    else:
-        firstpic = photo_display[0]
-        photos = photo_display[1:]
-    """
-
     # -----------------------------天气---------------------------------
-    # TODO: Put get_weather somewhere else
-    from app.jobs import get_weather
-    _weather = get_weather()
+    _weather = feed['weather']
     if _weather.get('modify_time') is None:
         update_time_delta = timedelta(0)
     else:
@@ -1308,16 +1260,17 @@ def search(request: HttpRequest):
         return redirect(message_url(wrong('请填写有效的搜索信息!')))
 
     not_found_message = "找不到符合搜索的信息或相关内容未公开！"
-    # 首先搜索个人, 允许搜索姓名或者公开的专业, 删去小名搜索
-    people_list = NaturalPerson.objects.filter(
-        Q(name__icontains=query)
-        | (  # (Q(nickname__icontains=query) & Q(show_nickname=True)) |
-            Q(stu_major__icontains=query) & Q(show_major=True)
-        )
-        | (
-            Q(nickname__icontains=query) & Q(show_nickname=True)
-        )
-    )
+    # 一次索引查询得到每类结果的当前页，再按页读取展示所需的对象
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    results = search_index(query, page, SEARCH_PAGE_SIZE)
+    Kind = SearchToken.Kind
+
+    # 首先搜索个人, 允许搜索姓名或者公开的专业、昵称
+    people_list = hydrate_people(results[Kind.PERSON].ids)
+    people_total = results[Kind.PERSON].total
 
     # 接下来准备呈现的内容
     # 首先是准备搜索个人信息的部分
@@ -1336,59 +1289,16 @@ def search(request: HttpRequest):
     ]  # 感觉将年级和班级分开呈现会简洁很多
 
     # 搜索小组
-    # 先查找query作为姓名包含在字段中的职务信息, 选的是post为true或者职务等级为0
-    pos_list = Position.objects.activated().filter(person__name__icontains=query).filter(
-        Q(show_post=True) | Q(is_admin=True))
-    # 通过小组名、小组类名、和上述的职务信息对应的小组信息
-    organization_list = Organization.objects.filter(
-        Q(oname__icontains=query)
-        | Q(otype__otype_name__icontains=query)
-        | Q(id__in=pos_list.values("org"))
-    ).prefetch_related("position_set")
-
-    now = datetime.now()
-
-    def get_recent_activity(org):
-        activities = Activity.objects.activated().filter(Q(organization_id=org.id)
-                                                         & ~Q(status=Activity.Status.CANCELED)
-                                                         & ~Q(status=Activity.Status.REJECT))
-        activities = list(activities)
-        activities.sort(key=lambda activity: abs(now - activity.start))
-        return None if len(activities) == 0 else activities[0:3]
-
-    org_display_list = []
-    for org in organization_list:
-        org_display_list.append(
-            {
-                "oname": org.oname,
-                "otype": org.otype,
-                "pos0": NaturalPerson.objects.activated().filter(
-                    id__in=Position.objects.activated().filter(
-                        is_admin=True, org=org).values("person")
-                ),  # TODO:直接查到一个NaturalPerson的Query_set
-                # [
-                #     w["person__name"]
-                #     for w in list(
-                #         org.position_set.activated()
-                #             .filter(pos=0)
-                #             .values("person__name")
-                #     )
-                # ],
-                "activities": get_recent_activity(org),
-                "get_user_ava": org.get_user_ava()
-            }
-        )
+    # 通过小组名、小组类名、和公开职务或负责人的姓名搜索小组
+    org_display_list = hydrate_orgs(results[Kind.ORGANIZATION].ids)
+    org_total = results[Kind.ORGANIZATION].total
 
     # 小组要呈现的具体内容
     organization_field = ["小组名称", "小组类型", "负责人", "近期活动"]
 
     # 搜索活动
-    activity_list = Activity.objects.activated().filter(
-        Q(title__icontains=query) | Q(organization_id__oname__icontains=query) & ~Q(
-            status=Activity.Status.CANCELED)
-        & ~Q(status=Activity.Status.REJECT)
-        & ~Q(status=Activity.Status.REVIEWING) & ~Q(status=Activity.Status.ABORT)
-    )
+    activity_list = hydrate_activities(results[Kind.ACTIVITY].ids)
+    activity_total = results[Kind.ACTIVITY].total
 
     # 活动要呈现的内容
     activity_field = ["活动名称", "承办小组", "状态"]
@@ -1404,16 +1314,12 @@ def search(request: HttpRequest):
     # )
 
     # 学术地图内容
-    academic_map_dict = get_search_results(query)
-    academic_list = []
-    for username, contents in academic_map_dict.items():
-        np: NaturalPerson = SQ.mget(NaturalPerson.person_id, username=username)
-        info = dict(
-            ref=np.get_absolute_url() + '#tab=academic_map',
-            sname=np.name,
-            avatar=np.get_user_ava(),
-        )
-        academic_list.append((info, contents))
+    academic_list = hydrate_academic(results[Kind.ACADEMIC_TAG].ids,
+                                     results[Kind.ACADEMIC_TEXT].ids)
+
+    # 任意一类还有下一页时显示翻页
+    has_next = any(result.total > page * SEARCH_PAGE_SIZE for result in results.values())
+    has_previous = page > 1
 
     # 新版侧边栏, 顶栏等的呈现，采用 bar_display, 必须放在render前最后一步
     bar_display = utils.get_sidebar_and_navbar(request.user, "信息搜索")
@@ -1766,6 +1672,7 @@ def notifications(request: HttpRequest):
             count = notificaiton_set.count()
             notificaiton_set.update(
                 status=Notification.Status.DONE, finish_time=datetime.now())
+            invalidate_unread([request.user.id])
             succeed(f"成功将{count}条通知设为已读！", html_display)
         elif get_name == "deleteall":
             notificaiton_set = Notification.objects.activated().filter(
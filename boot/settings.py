@@ -22,6 +22,12 @@ class SettingConfig(Config):
     secret_key = ('k+8az5x&aq_!*@%v17(ptpeo@gp2$u-uc30^fze3u_+rqhb#@9'
                   if config.DEBUG else os.environ['SESSION_KEY'])
     static_dir = os.getenv('STATIC_DIR') or config.BASE_DIR
+    caches = LazySetting('caches', default={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    })
 
 
 _configurables = SettingConfig(config.ROOT_CONFIG, 'django')
@@ -72,6 +78,7 @@ INSTALLED_APPS = [
     "dormitory",
     "feedback",
     "achievement",
+    "extern",
 ]
 
 
@@ -133,6 +140,13 @@ DATABASES = {
 }
 
 
+# Cache
+# 默认为进程内缓存，多进程部署时，共享状态（如选课账本）需要在config.json中配置共享缓存
+# 进程内缓存无法被其它进程失效，依赖跨进程失效的缓存在此时不启用，见utils/cache.py
+# 如Redis: {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", ...}}
+CACHES = _configurables.caches
+
+
 # 两类文件URL配置在生产环境失效，在urls.py查看开发环境如何配置
 
 # Static files (CSS, JavaScript, Images)
@@ -11,6 +11,7 @@ from django.db.models import (
 import utils.models.query as SQ
 from generic.models import *
 from record.models import *
+from record.archive import read_logs
 from app.models import *
 from feedback.models import Feedback
 from Appointment.models import Appoint
@@ -52,35 +53,50 @@ class BaseDump():
 
 
 class PageTrackingDump(BaseDump):
+    """页面埋点，包括已归档的埋点"""
 
     @classmethod
     def dump(cls, hash_func: Callable = None, **options) -> pd.DataFrame:
-        user_page_data = pd.DataFrame(
-            cls.time_filter(PageLog, options.get('start_time', None),
-                            options.get('end_time', None))
-                .values_list('user__username', 'type',
-                            'url', 'time', 'platform'),
-            columns=('用户', '类型', '页面', '时间', '平台'))
+        user_page_data = read_logs(
+            PageLog, options.get('start_time', None), options.get('end_time', None),
+        )[['user', 'type', 'page', 'time', 'platform']].set_axis(
+            ['用户', '类型', '页面', '时间', '平台'], axis=1)
         if hash_func is not None:
-            user_page_data['用户'].map(hash_func)
+            user_page_data['用户'] = user_page_data['用户'].map(hash_func)
         return user_page_data
 
 
 class ModuleTrackingDump(BaseDump):
+    """模块埋点，包括已归档的埋点"""
 
     @classmethod
     def dump(cls, hash_func: Callable = None, **options) -> pd.DataFrame:
-        user_module_data = pd.DataFrame(
-            cls.time_filter(PageLog, options.get('start_time', None),
-                            options.get('end_time', None))
-                .values_list('user__username', 'type', 'module_name',
-                            'url', 'time', 'platform'),
-            columns=('用户', '类型', '模块', '页面', '时间', '平台'))
+        user_module_data = read_logs(
+            ModuleLog, options.get('start_time', None), options.get('end_time', None),
+        )[['user', 'type', 'module_name', 'page', 'time', 'platform']].set_axis(
+            ['用户', '类型', '模块', '页面', '时间', '平台'], axis=1)
         if hash_func is not None:
-            user_module_data['用户'].map(hash_func)
+            user_module_data['用户'] = user_module_data['用户'].map(hash_func)
         return user_module_data
 
 
+class DailyActivityDump(BaseDump):
+    """用户每天的埋点汇总，比逐条导出埋点小得多"""
+
+    @classmethod
+    def dump(cls, hash_func: Callable = None, **options) -> pd.DataFrame:
+        daily_data = pd.DataFrame(
+            cls.time_filter(DailyActivity, options.get('start_time', None),
+                            options.get('end_time', None),
+                            start_time_field='date', end_time_field='date')
+                .order_by('date', 'user__username')
+                .values_list('user__username', 'date', 'pv', 'pd', 'mv', 'mc'),
+            columns=('用户', '日期', '页面浏览', '页面离开', '模块浏览', '模块点击'))
+        if hash_func is not None:
+            daily_data['用户'] = daily_data['用户'].map(hash_func)
+        return daily_data
+
+
 class AppointmentDump(BaseDump):
 
     @classmethod
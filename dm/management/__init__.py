@@ -47,6 +47,7 @@ def register_dump_groups(group: str, tasks: List[str]):
 
 register_dump('page', PageTrackingDump)
 register_dump('module', ModuleTrackingDump)
+register_dump('daily_activity', DailyActivityDump)
 register_dump('appointment', AppointmentDump)
 register_dump('org_activity', OrgActivityDump)
 register_dump('person_position', PersonPosDump, accept_params=['year', 'semester'])
@@ -54,7 +55,7 @@ register_dump('person_activity', PersonActivityDump, accept_params=['year', 'sem
 register_dump('person_feedback', PersonFeedbackDump)
 register_dump('person_course', PersonCourseDump, accept_params=['year', 'semester'])
 
-register_dump_groups('tracking', ['page', 'module'])
+register_dump_groups('tracking', ['page', 'module', 'daily_activity'])
 register_dump_groups('activity', ['org_activity', 'person_activity'])
 register_dump_groups('underground', ['appointment'])
 register_dump_groups('org', ['org_activity'])
@@ -7,6 +7,10 @@ import pandas as pd
 from django.core.management.base import BaseCommand
 from tqdm import trange
 
+from dormitory.optimizer import BEDS, encode, optimize
+from questionnaire.models import Survey
+from questionnaire.api import export_header, export_rows
+
 '''
 有关reference文件夹的说明：
 reference文件夹用于存放宿舍分配时的参考信息。
@@ -127,11 +131,17 @@ class Dormitory:
         return score
 
 
-def read_info() -> list[Freshman]:
-    '''返回一个Freshman的list'''
+def read_results(title: str) -> pd.DataFrame:
+    '''从数据库读取问卷结果，列名为题目简介，与results.xlsx一致'''
+    survey = Survey.objects.get(title=title)
+    return pd.DataFrame(export_rows(survey), columns=export_header(survey))
+
+
+def read_info(results: pd.DataFrame | None = None) -> list[Freshman]:
+    '''返回一个Freshman的list，results为问卷结果，默认读取results.xlsx'''
     freshmen = []
 
-    df = pd.read_excel("/workspace/dormitory/references/results.xlsx")
+    df = results if results is not None else pd.read_excel("/workspace/dormitory/references/results.xlsx")
     df2 = pd.read_excel("/workspace/dormitory/references/info.xlsx")
 
     for index, stu in df.iterrows():
@@ -243,51 +253,20 @@ def read_dorm() -> tuple[list[Dormitory], list[Dormitory]]:
 
     return read_from_sheet("男生宿舍"), read_from_sheet("女生宿舍")
 
-def assign_dorm() -> list[Dormitory]:
+def swap_legacy(dorms: list[Dormitory], iterations: int, epsilon: float = 0.3):
     '''
-    分配宿舍算法：
-    执行若干次（250000次）随机交换（选取任一宿舍，选取任一床位），
-    衡量交换前后两宿舍得分之和，使得总得分最大化
+    原有的交换算法，每次深拷贝两个宿舍后尝试调换和交换，只接受得分提高的结果，
+    已由optimizer替代，保留用于基准对比
     '''
-    freshmen = read_info()
-    male_dorm, female_dorm = read_dorm()
+    for episode in trange(iterations):
 
-    # 初始随机分配
-    # TODO: 如果运气很烂，最后剩余4人无法分到同一宿舍，可能导致算法卡死。
-    for stu in freshmen:
-        assigned = False
-        while not assigned:
-            male_vacant = [d for d in male_dorm if d.remain > 0]
-            female_vacant = [d for d in female_dorm if d.remain > 0]
-            if stu.data['gender'] == "男":
-                dorm = random.choice(male_vacant)
-                dorm.add(stu)
-                if dorm.check_must():
-                    dorm.remain -= 1
-                    assigned = True
-                else:
-                    dorm.stu.pop()
-            else:
-                dorm = random.choice(female_vacant)
-                dorm.add(stu)
-                if dorm.check_must():
-                    dorm.remain -= 1
-                    assigned = True
-                else:
-                    dorm.stu.pop()
-
-    # 随机交换
-    print('\033[36mProcessing male dormitories...\033[0m')
-    epsilon = 0.3
-    for episode in trange(250000):
-
-        rid1 = random.randint(0, len(male_dorm) - 1)
-        rid2 = random.randint(0, len(male_dorm) - 1)
+        rid1 = random.randint(0, len(dorms) - 1)
+        rid2 = random.randint(0, len(dorms) - 1)
         if rid1 == rid2:
             continue
 
-        room1: Dormitory = copy.deepcopy(male_dorm[rid1])
-        room2: Dormitory = copy.deepcopy(male_dorm[rid2])
+        room1: Dormitory = copy.deepcopy(dorms[rid1])
+        room2: Dormitory = copy.deepcopy(dorms[rid2])
         if len(room1.stu) == 0 or len(room2.stu) == 0:
             continue
         o_score = room1.check_better() + room2.check_better()
@@ -295,8 +274,8 @@ def assign_dorm() -> list[Dormitory]:
         temp1: Dormitory = copy.deepcopy(room1)
         temp2: Dormitory = copy.deepcopy(room2)
 
-        del male_dorm[max(rid1, rid2)]
-        del male_dorm[min(rid1, rid2)]
+        del dorms[max(rid1, rid2)]
+        del dorms[min(rid1, rid2)]
 
         if random.random() < epsilon:
             if len(room1.stu) != 4 and len(room2.stu) != 4:
@@ -307,8 +286,8 @@ def assign_dorm() -> list[Dormitory]:
                     o_score = room1.check_better() + room2.check_better()
 
         if len(room1.stu) == 0 or len(room2.stu) == 0:
-            male_dorm.append(room1)
-            male_dorm.append(room2)
+            dorms.append(room1)
+            dorms.append(room2)
             continue
 
         temp1: Dormitory = copy.deepcopy(room1)
@@ -319,61 +298,43 @@ def assign_dorm() -> list[Dormitory]:
 
         temp1.stu[bid1], temp2.stu[bid2] = temp2.stu[bid2], temp1.stu[bid1]
         if temp1.check_must() and temp2.check_must() and (temp1.check_better() + temp2.check_better() > o_score):
-            male_dorm.append(temp1)
-            male_dorm.append(temp2)
+            dorms.append(temp1)
+            dorms.append(temp2)
         else:
-            male_dorm.append(room1)
-            male_dorm.append(room2)
+            dorms.append(room1)
+            dorms.append(room2)
 
-    print("\033[35mProcessing female dormitories...\033[0m")
-    for episode in trange(250000):
+    dorms.sort(key=lambda d: d.id)
 
-        rid1 = random.randint(0, len(female_dorm) - 1)
-        rid2 = random.randint(0, len(female_dorm) - 1)
-        if rid1 == rid2:
-            continue
-
-        room1: Dormitory = copy.deepcopy(female_dorm[rid1])
-        room2: Dormitory = copy.deepcopy(female_dorm[rid2])
-        if len(room1.stu) == 0 or len(room2.stu) == 0:
-            continue
-        o_score = room1.check_better() + room2.check_better()
 
-        temp1: Dormitory = copy.deepcopy(room1)
-        temp2: Dormitory = copy.deepcopy(room2)
+def fill_dorms(dorms: list[Dormitory], freshmen: list[Freshman], beds: np.ndarray):
+    '''按optimizer的床位数组将新生放入宿舍'''
+    for dorm, row in zip(dorms, beds):
+        dorm.stu = [freshmen[i] for i in row if i >= 0]
+        dorm.remain = BEDS - len(dorm.stu)
 
-        del female_dorm[max(rid1, rid2)]
-        del female_dorm[min(rid1, rid2)]
 
-        if random.random() < epsilon:
-            if len(room1.stu) != 4 and len(room2.stu) != 4:
-                temp2.add(temp1.stu.pop())
-                if temp1.check_must() and temp2.check_must() and (temp1.check_better() + temp2.check_better() > o_score):
-                    room1 = temp1
-                    room2 = temp2
-                    o_score = room1.check_better() + room2.check_better()
-
-        if len(room1.stu) == 0 or len(room2.stu) == 0:
-            female_dorm.append(room1)
-            female_dorm.append(room2)
-            continue
-
-        temp1: Dormitory = copy.deepcopy(room1)
-        temp2: Dormitory = copy.deepcopy(room2)
-
-        bid1 = random.randint(0, len(room1.stu) - 1)
-        bid2 = random.randint(0, len(room2.stu) - 1)
-
-        temp1.stu[bid1], temp2.stu[bid2] = temp2.stu[bid2], temp1.stu[bid1]
-        if temp1.check_must() and temp2.check_must() and (temp1.check_better() + temp2.check_better() > o_score):
-            female_dorm.append(temp1)
-            female_dorm.append(temp2)
-        else:
-            female_dorm.append(room1)
-            female_dorm.append(room2)
+def assign_dorm(iterations: int = 250000, chains: int = 4,
+                workers: int | None = None, seed: int | None = None,
+                survey: str | None = None) -> list[Dormitory]:
+    '''
+    分配宿舍算法：
+    男女生分别编码为特征矩阵，由optimizer运行若干条退火链，
+    每条链执行若干次（250000次）随机交换（选取任两个宿舍，各选取一个床位），
+    只重新计算交换涉及的宿舍的得分，使得总得分最大化，取得分最高的链的结果
+    指定survey时从数据库读取该标题的问卷结果，否则读取results.xlsx
+    '''
+    freshmen = read_info(read_results(survey) if survey else None)
+    male_dorm, female_dorm = read_dorm()
 
-    male_dorm.sort(key=lambda d: d.id)
-    female_dorm.sort(key=lambda d: d.id)
+    for name, male, dorms in (('male', True, male_dorm), ('female', False, female_dorm)):
+        print(f'\033[36mProcessing {name} dormitories...\033[0m')
+        students = [stu for stu in freshmen if (stu.data['gender'] == "男") == male]
+        features = encode([stu.data for stu in students])
+        noisy = np.array([d.noisy for d in dorms], dtype=bool)
+        score, beds = optimize(features, noisy, iterations, chains, workers, seed)
+        fill_dorms(dorms, students, beds)
+        print(f'score: {score:.1f}')
 
     dorm_result = male_dorm + female_dorm
     return dorm_result
@@ -425,5 +386,13 @@ def out_as_excel(dorm_result: list[Dormitory]):
 class Command(BaseCommand):
     help = "Assign dormitory."
 
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=250000, help='每条链尝试交换的次数')
+        parser.add_argument('--chains', type=int, default=4, help='并行的退火链数')
+        parser.add_argument('--workers', type=int, help='进程数，默认为CPU核数')
+        parser.add_argument('--seed', type=int, help='随机种子')
+        parser.add_argument('--survey', help='从数据库读取该标题的问卷结果，代替results.xlsx')
+
     def handle(self, *args, **options):
-        out_as_excel(assign_dorm())
+        out_as_excel(assign_dorm(options['iterations'], options['chains'],
+                                 options['workers'], options['seed'], options['survey']))
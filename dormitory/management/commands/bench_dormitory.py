@@ -0,0 +1,106 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from dormitory.optimizer import BEDS, encode, initial_beds, optimize
+from dormitory.management.commands.assign_dormitory import (
+    Freshman, Dormitory, swap_legacy, fill_dorms,
+)
+
+
+PROVINCES = ['北京', '北京', '北京', '上海', '天津', '河北', '山东', '江苏', '浙江', '广东',
+             '四川', '湖北', '湖南', '河南', '安徽', '福建', '陕西', '辽宁', '云南', '新疆']
+
+
+def synthetic_freshmen(num: int, rng: random.Random) -> list[dict]:
+    '''生成问卷数据，取值范围与read_info一致，北京生源偏多'''
+    freshmen = []
+    for i in range(num):
+        origin = rng.choice(PROVINCES)
+        freshmen.append({
+            'name': f'新生{i}',
+            'sid': f'24000{i:05d}',
+            'origin': origin,
+            'high_school': f'{origin}第{rng.randint(1, 4)}中学',
+            'major': rng.randint(0, 1),
+            'international': rng.choice([0, 1, 5]),
+            'wake': rng.randint(0, 5),
+            'sleep': rng.randint(0, 4),
+            'ac_temp': rng.randint(16, 28),
+            'all_night_ac': rng.randint(0, 1),
+            'personality': rng.randint(0, 2),
+            'sleep_quality': rng.randint(0, 1),
+            'environment': rng.randint(0, 1),
+            'expectation': rng.randint(0, 1),
+        })
+    return freshmen
+
+
+def synthetic_dorms(num: int) -> list[Dormitory]:
+    '''生成空宿舍，编号规则与read_dorm一致'''
+    return [Dormitory(rid, BEDS, (rid % 100) in (12, 25, 35, 36, 38, 39, 40, 49, 64))
+            for rid in range(101, 101 + num)]
+
+
+def check_dorms(dorms: list[Dormitory], students: int) -> float:
+    '''检查每名新生恰好分配一次且宿舍满足必要条件，返回总得分'''
+    assigned = sorted(stu.data['sid'] for dorm in dorms for stu in dorm.stu)
+    if len(assigned) != students or len(set(assigned)) != students:
+        raise CommandError('新生没有恰好分配一次')
+    violated = [dorm.id for dorm in dorms if not dorm.check_must()]
+    if violated:
+        raise CommandError(f'宿舍{violated[:10]}不满足必要条件')
+    return sum(dorm.check_better() for dorm in dorms)
+
+
+class Command(BaseCommand):
+    help = '宿舍分配基准测试：在固定种子的合成问卷上比较原有交换算法和并行退火引擎的耗时与得分'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=240)
+        parser.add_argument('--rooms', type=int, default=70)
+        parser.add_argument('--iterations', type=int, default=250000, help='每条链尝试交换的次数')
+        parser.add_argument('--legacy-iterations', type=int, default=20000,
+                            help='原有算法的交换次数，按比例估算完整运行的耗时')
+        parser.add_argument('--chains', type=int, default=4)
+        parser.add_argument('--workers', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        data = synthetic_freshmen(options['students'], random.Random(seed))
+        freshmen = [Freshman(item) for item in data]
+        features = encode(data)
+        dorms = synthetic_dorms(options['rooms'])
+        noisy = np.array([dorm.noisy for dorm in dorms], dtype=bool)
+
+        # 原有算法从相同的初始分配开始
+        fill_dorms(dorms, freshmen, initial_beds(features, noisy, np.random.default_rng(seed)))
+        initial = check_dorms(dorms, len(freshmen))
+        random.seed(seed)
+        begin = time.perf_counter()
+        swap_legacy(dorms, options['legacy_iterations'])
+        legacy_time = time.perf_counter() - begin
+        legacy = check_dorms(dorms, len(freshmen))
+
+        begin = time.perf_counter()
+        score, beds = optimize(features, noisy, options['iterations'], options['chains'],
+                               options['workers'], seed)
+        engine_time = time.perf_counter() - begin
+        dorms = synthetic_dorms(options['rooms'])
+        fill_dorms(dorms, freshmen, beds)
+        checked = check_dorms(dorms, len(freshmen))
+        if not np.isclose(checked, score):
+            raise CommandError(f'引擎得分{score:.1f}与check_better的{checked:.1f}不一致')
+
+        scale = options['iterations'] / max(options['legacy_iterations'], 1)
+        self.stdout.write(f'新生{len(freshmen)}名，宿舍{len(dorms)}个，初始得分{initial:.1f}')
+        self.stdout.write(
+            f'原有算法: {options["legacy_iterations"]}次交换 {legacy_time:.2f}s，'
+            f'得分{legacy:.1f}，估算{options["iterations"]}次需{legacy_time * scale:.1f}s')
+        self.stdout.write(
+            f'退火引擎: {options["chains"]}条链 × {options["iterations"]}次交换 '
+            f'{engine_time:.2f}s，得分{score:.1f}')
+        self.stdout.write('所有宿舍满足必要条件')
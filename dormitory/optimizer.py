@@ -0,0 +1,282 @@
+'''
+optimizer.py
+
+宿舍分配的优化引擎，供assign_dormitory命令使用
+
+- 新生编码为特征矩阵的一行，宿舍以(宿舍数, BEDS)的床位数组表示，元素为新生的下标，-1为空床
+- 每一步将宿舍随机两两配对，各选一个床位交换，空床与新生交换即为调换宿舍；
+  配对的宿舍互不重叠，可以同时原地交换，只重新计算涉及的宿舍的得分，
+  不满足必要条件或不被接受的交换原地换回，不复制宿舍
+- 采用模拟退火，温度从temperature线性降至0，为0时只接受得分提高的交换，记录每条链的最优解
+- 多条链使用不同的随机种子在进程池中独立运行，取得分最高的结果；结果只与种子有关，与进程数无关
+- 得分和必要条件与assign_dormitory中的Dormitory.check_better、Dormitory.check_must一致
+
+encode: 将新生的问卷数据编码为特征矩阵
+room_scores: 计算宿舍的得分和是否满足必要条件
+initial_beds: 随机生成满足必要条件的初始分配
+anneal: 运行一条退火链
+optimize: 并行运行多条退火链，返回得分最高的分配
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+
+__all__ = [
+    'BEDS',
+    'encode',
+    'room_scores',
+    'initial_beds',
+    'anneal',
+    'optimize',
+]
+
+
+# 每个宿舍的床位数
+BEDS = 4
+
+# 特征矩阵的列
+ORIGIN = 0
+HIGH_SCHOOL = 1
+BEIJING = 2
+MAJOR = 3
+PERSONALITY = 4
+AC_TEMP = 5
+ALL_NIGHT_AC = 6
+WAKE = 7
+SLEEP = 8
+SLEEP_QUALITY = 9
+ENVIRONMENT = 10
+EXPECTATION = 11
+_FIELDS = {
+    MAJOR: 'major',
+    PERSONALITY: 'personality',
+    AC_TEMP: 'ac_temp',
+    ALL_NIGHT_AC: 'all_night_ac',
+    WAKE: 'wake',
+    SLEEP: 'sleep',
+    SLEEP_QUALITY: 'sleep_quality',
+    ENVIRONMENT: 'environment',
+    EXPECTATION: 'expectation',
+}
+_COLUMNS = 12
+
+# 同一宿舍内的床位对(i, j)，i < j
+_PAIRS = np.triu(np.ones((BEDS, BEDS), dtype=bool), k=1)
+# 按人数的加分
+_COUNT_BONUS = np.array([0, 0, 0, 400, 600])
+
+
+def encode(freshmen: list[dict]) -> np.ndarray:
+    '''
+    将新生的问卷数据编码为特征矩阵
+
+    :param freshmen: 新生的数据，即Freshman.data
+    :type freshmen: list[dict]
+    :return: (新生数 + 1, 特征数)的矩阵，最后一行全为0，是空床对应的占位行
+    :rtype: np.ndarray
+    '''
+    features = np.zeros((len(freshmen) + 1, _COLUMNS), dtype=np.int64)
+    origins: dict[str, int] = {}
+    high_schools: dict[tuple[str, str], int] = {}
+    for i, data in enumerate(freshmen):
+        features[i, ORIGIN] = origins.setdefault(data['origin'], len(origins))
+        features[i, HIGH_SCHOOL] = high_schools.setdefault(
+            (data['origin'], data['high_school']), len(high_schools))
+        features[i, BEIJING] = data['origin'] == '北京'
+        for column, field in _FIELDS.items():
+            features[i, column] = data[field]
+    return features
+
+
+def room_scores(features: np.ndarray, beds: np.ndarray,
+                noisy: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    批量计算宿舍的得分和是否满足必要条件
+
+    :param features: encode得到的特征矩阵
+    :type features: np.ndarray
+    :param beds: (宿舍数, BEDS)的床位数组
+    :type beds: np.ndarray
+    :param noisy: 宿舍是否靠近盥洗室或楼梯口
+    :type noisy: np.ndarray
+    :return: 每个宿舍的得分和是否满足必要条件
+    :rtype: tuple[np.ndarray, np.ndarray]
+    '''
+    # 空床的下标为-1，对应占位行
+    members = features[beds]
+    present = beds >= 0
+    count = present.sum(axis=1)
+    size = np.maximum(count, 1)
+    pairs = present[:, :, None] & present[:, None, :] & _PAIRS
+
+    def same(column: int) -> np.ndarray:
+        values = members[:, :, column]
+        return pairs & (values[:, :, None] == values[:, None, :])
+
+    def repeated(column: int) -> np.ndarray:
+        # 与之后的某位同学相同的人数，即人数减去不同取值的个数
+        return same(column).any(axis=2).sum(axis=1)
+
+    def total(column: int) -> np.ndarray:
+        return (members[:, :, column] * present).sum(axis=1)
+
+    def var(column: int) -> np.ndarray:
+        values = members[:, :, column].astype(np.float64)
+        mean = (values * present).sum(axis=1) / size
+        return (((values - mean[:, None]) ** 2) * present).sum(axis=1) / size
+
+    # 必要条件：同省的同学至多一对，且不来自同一所高中
+    same_origin = same(ORIGIN)
+    origin_pairs = same_origin.sum(axis=(1, 2))
+    valid = (origin_pairs <= 1) & ~(same_origin & same(HIGH_SCHOOL)).any(axis=(1, 2))
+
+    score = np.zeros(len(beds))
+    score -= 300 * (origin_pairs == 1)
+    score -= 700 * (total(BEIJING) >= 2)
+    major = total(MAJOR)
+    score += np.where(major == 2, 1200, np.where((major == 0) | (major == 4), 800, 0))
+    score -= 600 * (((members[:, :, PERSONALITY] == 0) & present).sum(axis=1) > 2)
+    score -= 20 * var(AC_TEMP) + 400 * (count - repeated(ALL_NIGHT_AC) - 1)
+    score -= 30 * var(WAKE)
+    score -= 30 * var(SLEEP)
+    light_sleeper = ((members[:, :, SLEEP_QUALITY] == 0) & present).any(axis=1)
+    score -= 300 * (noisy & light_sleeper)
+    environment = total(ENVIRONMENT)
+    score += np.where(environment == 2, 200,
+                      np.where((environment == 0) | (environment == 4), 100, 0))
+    score -= 200 * (count - repeated(EXPECTATION) == 1)
+    score += _COUNT_BONUS[count]
+    score[count == 0] = 0
+    return score, valid
+
+
+def initial_beds(features: np.ndarray, noisy: np.ndarray,
+                 rng: np.random.Generator) -> np.ndarray:
+    '''
+    依次为每名新生随机选择有空床的宿舍，跳过加入后不满足必要条件的宿舍
+
+    :raises ValueError: 床位不足，或某名新生无法加入任何有空床的宿舍
+    :return: (宿舍数, BEDS)的床位数组
+    :rtype: np.ndarray
+    '''
+    students = len(features) - 1
+    rooms = len(noisy)
+    if students > rooms * BEDS:
+        raise ValueError(f'{students}名新生超过{rooms}个宿舍的床位数')
+    beds = np.full((rooms, BEDS), -1, dtype=np.int64)
+    filled = np.zeros(rooms, dtype=np.int64)
+    for student in range(students):
+        for room in rng.permutation(np.flatnonzero(filled < BEDS)):
+            beds[room, filled[room]] = student
+            _, valid = room_scores(features, beds[room:room + 1], noisy[room:room + 1])
+            if valid[0]:
+                filled[room] += 1
+                break
+            beds[room, filled[room]] = -1
+        else:
+            raise ValueError(f'第{student}名新生无法加入任何有空床的宿舍')
+    return beds
+
+
+def anneal(features: np.ndarray, noisy: np.ndarray, iterations: int,
+           seed: int | list[int], temperature: float = 0.0) -> tuple[float, np.ndarray]:
+    '''
+    从随机的初始分配开始运行一条退火链
+
+    :param features: encode得到的特征矩阵
+    :type features: np.ndarray
+    :param noisy: 宿舍是否靠近盥洗室或楼梯口
+    :type noisy: np.ndarray
+    :param iterations: 尝试交换的总次数
+    :type iterations: int
+    :param seed: 随机种子
+    :type seed: int | list[int]
+    :param temperature: 初始温度，为0时只接受得分提高的交换, defaults to 0.0
+    :type temperature: float, optional
+    :return: 链上得分最高的总得分和床位数组
+    :rtype: tuple[float, np.ndarray]
+    '''
+    rng = np.random.default_rng(seed)
+    beds = initial_beds(features, noisy, rng)
+    scores, _ = room_scores(features, beds, noisy)
+    rooms = len(beds)
+    batch = rooms // 2
+    if batch == 0:
+        return float(scores.sum()), beds
+    steps = -(-iterations // batch)
+    current = best = scores.sum()
+    best_beds = beds.copy()
+    for step in range(steps):
+        heat = temperature * (1 - step / steps)
+        order = rng.permutation(rooms)
+        left, right = order[:batch], order[batch:2 * batch]
+        left_bed = rng.integers(BEDS, size=batch)
+        right_bed = rng.integers(BEDS, size=batch)
+        left_student = beds[left, left_bed]
+        right_student = beds[right, right_bed]
+        moved = (left_student >= 0) | (right_student >= 0)
+        left, right = left[moved], right[moved]
+        left_bed, right_bed = left_bed[moved], right_bed[moved]
+        left_student, right_student = left_student[moved], right_student[moved]
+
+        # 原地交换，只重新计算涉及的宿舍
+        beds[left, left_bed] = right_student
+        beds[right, right_bed] = left_student
+        touched = np.concatenate([left, right])
+        new_scores, valid = room_scores(features, beds[touched], noisy[touched])
+        pairs = len(left)
+        delta = new_scores[:pairs] + new_scores[pairs:] - scores[left] - scores[right]
+        accept = valid[:pairs] & valid[pairs:]
+        if heat > 0:
+            accept &= (delta > 0) | (rng.random(pairs) < np.exp(np.minimum(delta, 0) / heat))
+        else:
+            accept &= delta > 0
+
+        reject = ~accept
+        beds[left[reject], left_bed[reject]] = left_student[reject]
+        beds[right[reject], right_bed[reject]] = right_student[reject]
+        scores[left[accept]] = new_scores[:pairs][accept]
+        scores[right[accept]] = new_scores[pairs:][accept]
+        current += delta[accept].sum()
+        if current > best:
+            best = current
+            best_beds = beds.copy()
+    # 重新计算，避免累加的误差
+    best_scores, _ = room_scores(features, best_beds, noisy)
+    return float(best_scores.sum()), best_beds
+
+
+def optimize(features: np.ndarray, noisy: np.ndarray, iterations: int = 250000,
+             chains: int = 4, workers: int | None = None, seed: int | None = None,
+             temperature: float = 100.0) -> tuple[float, np.ndarray]:
+    '''
+    并行运行多条退火链，返回得分最高的分配
+
+    :param iterations: 每条链尝试交换的总次数, defaults to 250000
+    :type iterations: int, optional
+    :param chains: 链数, defaults to 4
+    :type chains: int, optional
+    :param workers: 进程数，为1时在当前进程中运行，defaults to None，即CPU核数
+    :type workers: int | None, optional
+    :param seed: 随机种子，defaults to None，即随机选取
+    :type seed: int | None, optional
+    :param temperature: 初始温度, defaults to 100.0
+    :type temperature: float, optional
+    :return: 总得分和床位数组
+    :rtype: tuple[float, np.ndarray]
+    '''
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2 ** 32)
+    seeds = [[seed, chain] for chain in range(chains)]
+    args = (repeat(features), repeat(noisy), repeat(iterations), seeds, repeat(temperature))
+    workers = min(workers or os.cpu_count() or 1, chains)
+    if workers == 1:
+        results = list(map(anneal, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(anneal, *args))
+    # 得分相同时取序号最小的链，保证结果与进程数无关
+    return max(results, key=lambda result: result[0])
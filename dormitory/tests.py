@@ -1,3 +1,62 @@
-from django.test import TestCase
+import random
+from io import StringIO
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from dormitory.optimizer import BEDS, encode, room_scores, initial_beds, optimize
+from dormitory.management.commands.assign_dormitory import Freshman, fill_dorms
+from dormitory.management.commands.bench_dormitory import (
+    synthetic_freshmen, synthetic_dorms, check_dorms,
+)
+
+
+class OptimizerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.data = synthetic_freshmen(90, random.Random(0))
+        self.freshmen = [Freshman(item) for item in self.data]
+        self.features = encode(self.data)
+        self.noisy = np.array([dorm.noisy for dorm in synthetic_dorms(30)], dtype=bool)
+
+    def test_room_scores(self):
+        # 随机分配，包含不满足必要条件和人数不足的宿舍
+        rng = np.random.default_rng(0)
+        beds = np.full(len(self.noisy) * BEDS, -1)
+        beds[rng.choice(beds.size, len(self.data), replace=False)] = np.arange(len(self.data))
+        beds = beds.reshape(-1, BEDS)
+        scores, valid = room_scores(self.features, beds, self.noisy)
+        dorms = synthetic_dorms(len(self.noisy))
+        fill_dorms(dorms, self.freshmen, beds)
+        self.assertFalse(valid.all())
+        for dorm, score, must in zip(dorms, scores, valid):
+            self.assertAlmostEqual(score, dorm.check_better())
+            self.assertEqual(must, dorm.check_must())
+
+    def test_initial_beds(self):
+        beds = initial_beds(self.features, self.noisy, np.random.default_rng(0))
+        self.assertTrue(room_scores(self.features, beds, self.noisy)[1].all())
+        self.assertListEqual(sorted(beds[beds >= 0]), list(range(len(self.data))))
+        with self.assertRaises(ValueError):
+            initial_beds(self.features, self.noisy[:20], np.random.default_rng(0))
+
+    def test_optimize(self):
+        score, beds = optimize(self.features, self.noisy, 5000, chains=2, workers=2, seed=0)
+        dorms = synthetic_dorms(len(self.noisy))
+        fill_dorms(dorms, self.freshmen, beds)
+        # 每名新生恰好分配一次，宿舍都满足必要条件
+        self.assertAlmostEqual(check_dorms(dorms, len(self.freshmen)), score)
+        initial = initial_beds(self.features, self.noisy, np.random.default_rng([0, 0]))
+        self.assertGreater(score, room_scores(self.features, initial, self.noisy)[0].sum())
+        # 结果只与种子有关
+        same_score, same_beds = optimize(self.features, self.noisy, 5000,
+                                         chains=2, workers=1, seed=0)
+        self.assertEqual(same_score, score)
+        np.testing.assert_array_equal(same_beds, beds)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_dormitory', '--students', '40', '--rooms', '12',
+                     '--iterations', '1000', '--legacy-iterations', '100',
+                     '--chains', '2', '--workers', '1', stdout=out, stderr=StringIO())
+        self.assertIn('所有宿舍满足必要条件', out.getvalue())
@@ -1,8 +1,9 @@
-from django.db import transaction
+from django.core.exceptions import ValidationError
 from rest_framework import viewsets
 
 # TODO: Leaky dependency
 from utils.marker import fix_me
+from utils.global_messages import wrong
 from generic.models import User
 from app.models import NaturalPerson
 from app.view.base import ProfileTemplateView
@@ -10,7 +11,8 @@ from dormitory.models import Dormitory, DormitoryAssignment, Agreement
 from dormitory.serializers import (
     DormitoryAssignmentSerializer, DormitorySerializer,
     AgreementSerializerFixme, AgreementSerializer)
-from questionnaire.models import AnswerSheet, AnswerText, Survey
+from questionnaire.models import AnswerSheet, Survey
+from questionnaire.api import submit_answer_sheet
 from semester.api import next_semester
 
 
@@ -62,19 +64,13 @@ class DormitoryRoutineQAView(ProfileTemplateView):
 
     def post(self):
         survey = self.get_survey()
-        assert not AnswerSheet.objects.filter(creator=self.request.user,
-                                              survey=survey).exists()
-        with transaction.atomic():
-            sheet = AnswerSheet.objects.create(creator=self.request.user,
-                                               survey=survey)
-            for question in survey.questions.order_by('order'):
-                answer = self.request.POST.get(str(question.order))
-                if answer is None:
-                    assert not question.required, f"必填题{question.order}未作答"
-                    continue
-                AnswerText.objects.create(question=question,
-                                          answersheet=sheet,
-                                          body=answer)
+        answers = {key: self.request.POST.getlist(key)
+                   for key in self.request.POST if key.isdigit()}
+        try:
+            submit_answer_sheet(survey, self.request.user, answers)
+        except ValidationError as e:
+            wrong(e.messages[0], self.extra_context)
+            return self.get()
         return self.render(submitted=True)
 
 
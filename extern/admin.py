@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from extern.models import *
+
+
+@admin.register(WechatOutbox)
+class WechatOutboxAdmin(admin.ModelAdmin):
+    list_display = ["id", "task_id", "status", "attempts", "next_try", "errmsg"]
+    list_filter = ["status", "next_try"]
+    search_fields = ["task_id", "content"]
@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class ExternConfig(AppConfig):
+    name = 'extern'
+    verbose_name = '~.外部接口'
@@ -33,5 +33,17 @@ class WechatConfig(Config):
     # 单次连接超时时间，响应时间一般为1s或12s（偶尔）
     timeout = LazySetting(multithread, lambda x: 15 if x else 5, type=(int, float))
 
+    # 发件箱设置
+    # 启用后消息先写入发件箱，由独立的发送进程投递（manage.py runwechat）
+    use_outbox = LazySetting('outbox/enable', default=False, type=bool)
+    # 同时发送中的请求数，也是连接池大小
+    max_inflight = LazySetting('outbox/max_inflight', default=16, type=int)
+    # 单批消息最多尝试次数，只重发回应中失败的用户
+    max_attempts = LazySetting('outbox/max_attempts', default=3, type=int)
+    # 重发的基础等待秒数，每次失败后加倍
+    retry_backoff = LazySetting('outbox/retry_backoff', default=10, type=(int, float))
+    # 发件箱为空时的轮询间隔秒数
+    poll_interval = LazySetting('outbox/poll_interval', default=1, type=(int, float))
+
 
 wechat_config = WechatConfig(ROOT_CONFIG, 'wechat')
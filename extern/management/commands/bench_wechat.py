@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+
+from extern.config import wechat_config as CONFIG
+from extern.models import WechatOutbox
+from extern.outbox import enqueue_wechat, deliver_pending
+from extern.wechat import _send_wechat
+from extern.management.wechat_stub import WechatStub
+
+
+TASK_PREFIX = 'bench_wechat_'
+
+
+class Command(BaseCommand):
+    help = '微信发送压力测试：向本地模拟API发送消息，比较发件箱和逐批定时任务两种方式的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100, help='不同内容的消息数')
+        parser.add_argument('--users', type=int, default=1000, help='每条消息的接收者数')
+        parser.add_argument('--batch', type=int, default=100, help='每个请求的接收者数')
+        parser.add_argument('--latency', type=float, default=0.05, help='模拟API的响应秒数')
+        parser.add_argument('--fail-rate', type=float, default=0.01)
+        parser.add_argument('--inflight', type=int, default=CONFIG.max_inflight)
+        parser.add_argument('--mode', choices=['outbox', 'legacy', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        messages = [(f'压力测试<title>消息{i}',
+                     [f'{i % 7}{j:07d}' for j in range(options['users'])])
+                    for i in range(options['messages'])]
+        total = options['messages'] * options['users']
+        modes = ['outbox', 'legacy'] if options['mode'] == 'both' else [options['mode']]
+        with mock.patch.multiple(type(CONFIG), send_batch=options['batch'],
+                                 max_inflight=options['inflight'], retry_backoff=0):
+            for mode in modes:
+                with WechatStub(options['latency'], options['fail_rate']) as stub:
+                    begin = time.perf_counter()
+                    getattr(self, f'_run_{mode}')(messages, stub.url)
+                    elapsed = time.perf_counter() - begin
+                self.stdout.write(
+                    f'[{mode}] {total}条消息 {stub.requests}次请求: 耗时{elapsed:.2f}秒, '
+                    f'{len(stub.received) / elapsed:.0f}条/秒, '
+                    f'送达{len(stub.received)}条, 未送达{total - len(stub.received)}条')
+
+    def _run_outbox(self, messages, url: str):
+        WechatOutbox.objects.filter(task_id__startswith=TASK_PREFIX).delete()
+        try:
+            for i, (content, users) in enumerate(messages):
+                enqueue_wechat(users, content, url, task_id=f'{TASK_PREFIX}{i}')
+            while deliver_pending():
+                pass
+        finally:
+            WechatOutbox.objects.filter(task_id__startswith=TASK_PREFIX).delete()
+
+    def _run_legacy(self, messages, url: str):
+        # 定时任务默认使用10个线程执行，每批一个任务，每次请求新建连接
+        batch = CONFIG.send_batch
+        with ThreadPoolExecutor(10) as executor:
+            for content, users in messages:
+                for i in range(0, len(users), batch):
+                    executor.submit(_send_wechat, users[i : i + batch], content, url)
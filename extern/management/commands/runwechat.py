@@ -0,0 +1,27 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from extern.config import wechat_config as CONFIG
+from extern.outbox import deliver_pending, recover_sending
+from extern.wechat import logger
+
+
+class Command(BaseCommand):
+    help = "Runs the wechat outbox delivery worker."
+
+    def handle(self, *args, **options):
+        recovered = recover_sending()
+        logger.info(f'Starting wechat delivery worker, {recovered} batches recovered')
+        # 其它发送进程异常退出时，其领取的消息超时后重新发送
+        stale = timedelta(seconds=CONFIG.timeout * 10)
+        try:
+            while True:
+                close_old_connections()
+                recover_sending(stale)
+                if not deliver_pending():
+                    time.sleep(CONFIG.poll_interval)
+        except (KeyboardInterrupt, SystemExit):
+            pass
@@ -0,0 +1,87 @@
+'''
+wechat_stub.py
+
+本地模拟的微信发送API，用于压力测试和单元测试
+
+- 回应格式与发送API一致：全部成功时status为200，部分失败时在data.detail中列出失败用户
+- 可设置每个请求的延迟和用户首次发送的失败率，失败过的用户重发时总是成功
+'''
+import json
+import random
+import socket
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+
+__all__ = [
+    'WechatStub',
+]
+
+
+class WechatStub:
+    '''
+    用法::
+
+        with WechatStub(latency=0.05) as stub:
+            send_to(stub.url)
+        stub.received
+    '''
+    def __init__(self, latency: float = 0, fail_rate: float = 0, seed: int = 0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = Lock()
+        self.received: list[str] = []
+        self.failed: set[str] = set()
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # 与常见的API服务器一致，否则长连接上会出现延迟确认导致的停顿
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                users = json.loads(body)['touser']
+                time.sleep(stub.latency)
+                response = json.dumps(stub.respond(users)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, users: list[str]) -> dict:
+        with self.lock:
+            self.requests += 1
+            failed = [user for user in users if user not in self.failed
+                      and self.rng.random() < self.fail_rate]
+            self.failed.update(failed)
+            failed_set = set(failed)
+            self.received.extend(user for user in users if user not in failed_set)
+        if not failed:
+            return {'status': 200, 'data': {}}
+        return {'status': 400, 'data': {'detail': [[user, '模拟失败'] for user in failed]}}
+
+    def __enter__(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:37
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WechatOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('users', models.JSONField(verbose_name='接收者')),
+                ('content', models.TextField(verbose_name='内容')),
+                ('api_url', models.CharField(max_length=256, verbose_name='API地址')),
+                ('card', models.BooleanField(default=True, verbose_name='文本卡片')),
+                ('url', models.CharField(blank=True, max_length=256, null=True, verbose_name='卡片链接')),
+                ('btntxt', models.CharField(blank=True, max_length=16, null=True, verbose_name='卡片提示')),
+                ('task_id', models.CharField(blank=True, db_index=True, max_length=128, verbose_name='任务标识符')),
+                ('status', models.SmallIntegerField(choices=[(0, '待发送'), (1, '发送中'), (2, '发送失败')], default=0, verbose_name='状态')),
+                ('attempts', models.SmallIntegerField(default=0, verbose_name='已尝试次数')),
+                ('next_try', models.DateTimeField(default=datetime.datetime.now, verbose_name='下次发送时间')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('errmsg', models.CharField(blank=True, max_length=256, verbose_name='错误信息')),
+            ],
+            options={
+                'verbose_name': '微信发件箱',
+                'verbose_name_plural': '微信发件箱',
+                'indexes': [models.Index(fields=['status', 'next_try'], name='extern_wech_status_b64925_idx')],
+            },
+        ),
+    ]
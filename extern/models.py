@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from django.db import models
+
+from utils.models.choice import choice
+
+
+__all__ = [
+    'WechatOutbox',
+]
+
+
+class WechatOutbox(models.Model):
+    '''
+    待发送的微信消息，每条记录是内容相同的一批接收者
+
+    由发送进程投递，发送成功后删除，多次失败后保留以便排查
+    '''
+    class Meta:
+        verbose_name = '微信发件箱'
+        verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=['status', 'next_try'])]
+
+    class Status(models.IntegerChoices):
+        PENDING = choice(0, '待发送')
+        SENDING = choice(1, '发送中')
+        FAILED = choice(2, '发送失败')
+
+    users = models.JSONField('接收者')
+    content = models.TextField('内容')
+    api_url = models.CharField('API地址', max_length=256)
+    card = models.BooleanField('文本卡片', default=True)
+    url = models.CharField('卡片链接', max_length=256, null=True, blank=True)
+    btntxt = models.CharField('卡片提示', max_length=16, null=True, blank=True)
+    task_id = models.CharField('任务标识符', max_length=128, blank=True, db_index=True)
+
+    status = models.SmallIntegerField('状态', choices=Status.choices,
+                                      default=Status.PENDING)
+    attempts = models.SmallIntegerField('已尝试次数', default=0)
+    # 发送中的记录为领取时间，用于恢复中断的发送
+    next_try = models.DateTimeField('下次发送时间', default=datetime.now)
+    create_time = models.DateTimeField('创建时间', auto_now_add=True)
+    errmsg = models.CharField('错误信息', max_length=256, blank=True)
@@ -1,13 +1,15 @@
-from typing import Callable, ParamSpec, Any
+from typing import Callable, ParamSpec, Any, ContextManager
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 
 from extern.config import wechat_config as CONFIG
-from scheduler.adder import ScheduleAdder
+from scheduler.adder import ScheduleAdder, schedule_batch
 
 
 __all__ = [
     'scheduler_enabled',
     'get_caller',
+    'caller_batch',
 ]
 
 
@@ -27,3 +29,10 @@ def get_caller(func: Callable[P, None], *, multithread: bool = True,
     # 不应使用返回值，但要确保调用参数正确
     adder: Callable[P, Any]
     return adder  # type: ignore
+
+
+def caller_batch(multithread: bool = True) -> ContextManager[None]:
+    '''多次调用get_caller的结果时，批量添加定时任务'''
+    if not scheduler_enabled(multithread):
+        return nullcontext()
+    return schedule_batch()
@@ -0,0 +1,168 @@
+'''
+outbox.py
+
+微信消息发件箱，替代每批消息一个定时任务的发送方式
+
+- 消息先按批写入发件箱表，由独立的发送进程（manage.py runwechat）投递，重启后不丢失
+- 发送进程复用连接池，并发发送中的请求数不超过max_inflight
+- 回应中失败的用户单独重发，等待时间随失败次数加倍，超过次数后保留失败记录
+- 发送成功的记录直接删除
+'''
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.db import transaction
+
+from extern.config import wechat_config as CONFIG
+from extern.models import WechatOutbox
+from extern.wechat import (
+    logger, ParseResult, CONNECT_ERROR,
+    _build_post_data, _send_parser, _post_and_parse, _log_users,
+)
+
+
+__all__ = [
+    'enqueue_wechat',
+    'deliver_pending',
+    'recover_sending',
+]
+
+
+_session: requests.Session | None = None
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_session() -> requests.Session:
+    '''进程内共享的会话，连接池大小与并发数一致'''
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=CONFIG.max_inflight)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    '''进程内共享的发送线程池，线程数即同时发送中的请求数上限'''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(CONFIG.max_inflight,
+                                       thread_name_prefix='wechat')
+    return _executor
+
+
+def enqueue_wechat(
+    users: list[str],
+    content: str,
+    api_url: str,
+    card: bool = True,
+    url: str | None = None,
+    btntxt: str | None = None,
+    *,
+    run_time: datetime | timedelta | None = None,
+    task_id: str | None = None,
+) -> None:
+    '''
+    按批写入发件箱，参数含义同send_wechat
+
+    提供task_id时，替换同一标识符下尚未发送的消息，与定时任务的行为一致
+    '''
+    if run_time is None:
+        next_try = datetime.now()
+    elif isinstance(run_time, timedelta):
+        next_try = datetime.now() + run_time
+    else:
+        next_try = run_time
+    with transaction.atomic():
+        if task_id:
+            WechatOutbox.objects.filter(
+                task_id=task_id, status=WechatOutbox.Status.PENDING).delete()
+        WechatOutbox.objects.bulk_create([
+            WechatOutbox(users=users[i : i + CONFIG.send_batch], content=content,
+                         api_url=api_url, card=card, url=url, btntxt=btntxt,
+                         task_id=task_id or '', next_try=next_try)
+            for i in range(0, len(users), CONFIG.send_batch)
+        ])
+
+
+def _deliver(message: WechatOutbox) -> ParseResult:
+    post_data = _build_post_data(message.users, message.content,
+                                 message.card, message.url, message.btntxt)
+    return _post_and_parse(message.api_url, post_data, CONFIG.timeout,
+                           _send_parser, session=_get_session())
+
+
+def _claim(limit: int) -> list[WechatOutbox]:
+    '''领取到期的消息，多个发送进程不会领取到同一条'''
+    now = datetime.now()
+    with transaction.atomic():
+        messages = list(WechatOutbox.objects.select_for_update(skip_locked=True).filter(
+            status=WechatOutbox.Status.PENDING, next_try__lte=now,
+        ).order_by('next_try', 'id')[:limit])
+        WechatOutbox.objects.filter(id__in=[m.id for m in messages]).update(
+            status=WechatOutbox.Status.SENDING, next_try=now)
+    return messages
+
+
+def deliver_pending(limit: int | None = None) -> int:
+    '''
+    并发投递一轮到期的消息
+
+    :param limit: 本轮最多领取的批数，默认为并发数的8倍
+    :type limit: int, optional
+    :return: 本轮处理的批数，为0时发件箱没有到期的消息
+    :rtype: int
+    '''
+    messages = _claim(limit or CONFIG.max_inflight * 8)
+    if not messages:
+        return 0
+    results = list(_get_executor().map(_deliver, messages))
+
+    sent, retried = [], []
+    now = datetime.now()
+    for message, (errmsg, retrys) in zip(messages, results):
+        users = message.users
+        message.attempts += 1
+        if errmsg is None:
+            logger.info(f"成功向{_log_users(users)}发送消息")
+            sent.append(message.id)
+            continue
+        if retrys is None and errmsg == CONNECT_ERROR:
+            # 连接失败时整批重发
+            retrys = users
+        message.errmsg = errmsg[:256]
+        if retrys is None or message.attempts >= CONFIG.max_attempts:
+            failed = users if retrys is None else retrys
+            logger.warning(f"向{_log_users(failed)}发送消息失败：{errmsg}")
+            message.users = failed
+            message.status = WechatOutbox.Status.FAILED
+        else:
+            logger.warning(f"向{_log_users(users)}发送时，{_log_users(retrys)}失败：{errmsg}")
+            message.users = retrys
+            message.status = WechatOutbox.Status.PENDING
+            backoff = CONFIG.retry_backoff * 2 ** (message.attempts - 1)
+            message.next_try = now + timedelta(seconds=backoff)
+        retried.append(message)
+    WechatOutbox.objects.filter(id__in=sent).delete()
+    WechatOutbox.objects.bulk_update(
+        retried, ['users', 'attempts', 'status', 'next_try', 'errmsg'])
+    return len(messages)
+
+
+def recover_sending(stale: timedelta | None = None) -> int:
+    '''
+    将中断的发送恢复为待发送，用户可能收到重复消息
+
+    :param stale: 领取超过该时间仍未完成的视为中断，默认恢复全部，仅应在启动时使用
+    :type stale: timedelta, optional
+    :return: 恢复的批数
+    :rtype: int
+    '''
+    messages = WechatOutbox.objects.filter(status=WechatOutbox.Status.SENDING)
+    if stale is not None:
+        messages = messages.filter(next_try__lt=datetime.now() - stale)
+    return messages.update(status=WechatOutbox.Status.PENDING)
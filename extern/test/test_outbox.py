@@ -0,0 +1,46 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from extern.config import wechat_config as CONFIG
+from extern.models import WechatOutbox
+from extern.outbox import enqueue_wechat, deliver_pending, recover_sending
+from extern.management.wechat_stub import WechatStub
+
+
+@mock.patch.multiple(type(CONFIG), send_batch=10, retry_backoff=0, max_attempts=3)
+class WechatOutboxTestCase(TestCase):
+    users = [f'2000{i:06d}' for i in range(35)]
+
+    def test_deliver_and_retry(self):
+        with WechatStub(fail_rate=0.3) as stub:
+            enqueue_wechat(self.users, '标题<title>内容', stub.url)
+            self.assertEqual(WechatOutbox.objects.count(), 4)
+            while deliver_pending():
+                pass
+        self.assertFalse(WechatOutbox.objects.exists())
+        self.assertTrue(stub.failed)
+        # 失败的用户单独重发，其余用户只收到一次
+        self.assertCountEqual(stub.received, self.users)
+
+    def test_replace_task(self):
+        enqueue_wechat(self.users, '旧<title>', 'http://127.0.0.1:1/', task_id='task')
+        enqueue_wechat(self.users[:5], '新<title>', 'http://127.0.0.1:1/', task_id='task')
+        self.assertEqual(list(WechatOutbox.objects.values_list('content', flat=True)),
+                         ['新<title>'])
+
+    def test_connect_failure(self):
+        enqueue_wechat(self.users[:5], '标题<title>', 'http://127.0.0.1:1/')
+        for attempt in range(CONFIG.max_attempts):
+            self.assertEqual(deliver_pending(), 1)
+        self.assertEqual(deliver_pending(), 0)
+        message = WechatOutbox.objects.get()
+        self.assertEqual(message.status, WechatOutbox.Status.FAILED)
+        self.assertEqual(message.users, self.users[:5])
+
+    def test_recover(self):
+        enqueue_wechat(self.users, '标题<title>', 'http://127.0.0.1:1/')
+        WechatOutbox.objects.update(status=WechatOutbox.Status.SENDING)
+        self.assertEqual(recover_sending(), 4)
+        self.assertFalse(WechatOutbox.objects.filter(
+            status=WechatOutbox.Status.SENDING).exists())
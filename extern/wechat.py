@@ -5,6 +5,7 @@ wechat.py
 
 - 可导出函数可以假设是异步IO，参数符合条件时不抛出异常，具体情况见配置文件
 - 异步时，函数只返回尝试状态，即是否设置了定时任务，不保证成功发送
+- 启用发件箱时，异步发送写入发件箱，由发送进程投递，见outbox.py
 - _开头的函数是私有函数，子模块不应调用
 '''
 import requests
@@ -13,7 +14,7 @@ from typing import Iterable, Callable, Any
 from datetime import datetime, timedelta
 
 from extern.config import wechat_config as CONFIG
-from extern.multithread import get_caller, scheduler_enabled
+from extern.multithread import get_caller, caller_batch, scheduler_enabled
 from extern.log import ExternLogger
 from utils.http.utils import build_full_url
 
@@ -42,11 +43,14 @@ def _get_available_users(users: Iterable[str | int]) -> list[str]:
 
 
 ParseResult = tuple[str | None, list[str] | None]
+CONNECT_ERROR = "连接API失败"
 def _post_and_parse(
     post_url: str,
     post_data: dict[str, Any],
     timeout: int | float,
     detail_parser: Callable[[Any], ParseResult] | None = None,
+    *,
+    session: requests.Session | None = None,
 ) -> ParseResult:
     '''
     发送post请求并解析回应，返回解析结果，解析结果
@@ -56,14 +60,16 @@ def _post_and_parse(
         post_data(dict): 请求的数据
         timeout(int | float): 超时时间
         detail_parser(Callable[[Any], ParseResult], optional): 解析回应中细节部分的函数
+        session(requests.Session, optional): 复用连接的会话，默认每次新建连接
     
     Returns:
         parseResult: 解析结果，包含错误信息（成功时为None）和建议重发的失败用户列表
     '''
+    poster = requests if session is None else session
     try: _post_data = json.dumps(post_data)
     except: return "JSON编码失败", None
-    try: raw_response = requests.post(post_url, _post_data, timeout=timeout)
-    except: return "连接API失败", None
+    try: raw_response = poster.post(post_url, _post_data, timeout=timeout)
+    except: return CONNECT_ERROR, None
     try: response: dict[str, Any] = raw_response.json()
     except: return "JSON解析失败", None
     try:
@@ -86,17 +92,13 @@ def _log_users(users: list[str]) -> str:
     return ', '.join(user_display) + f'等{len(users)}用户'
 
 
-def _send_wechat(
+def _build_post_data(
     users: list[str],
     content: str,
-    api_url: str,
     card: bool = True,
     url: str | None = None,
     btntxt: str | None = None,
-    *,
-    retry_times: int = 1,
-):
-    """底层实现发送到微信，是为了方便设置定时任务"""
+) -> dict[str, Any]:
     post_data = {
         "touser": users,
         "content": content,
@@ -109,14 +111,30 @@ def _send_wechat(
             post_data["url"] = url
         if btntxt is not None:
             post_data["btntxt"] = btntxt
+    return post_data
+
+
+def _send_parser(detail: list[tuple[str, str]]) -> ParseResult:
+    '''解析发送消息回应中的失败用户'''
+    retrys = [x[0] for x in detail]
+    errmsg = detail[0][1]             # 失败原因基本相同，取一个即可
+    return errmsg, retrys
 
-    def _parser(detail: list[tuple[str, str]]) -> ParseResult:
-        retrys = [x[0] for x in detail]
-        errmsg = detail[0][1]             # 失败原因基本相同，取一个即可
-        return errmsg, retrys
 
+def _send_wechat(
+    users: list[str],
+    content: str,
+    api_url: str,
+    card: bool = True,
+    url: str | None = None,
+    btntxt: str | None = None,
+    *,
+    retry_times: int = 1,
+):
+    """底层实现发送到微信，是为了方便设置定时任务"""
+    post_data = _build_post_data(users, content, card, url, btntxt)
     for i in range(retry_times):
-        errmsg, retrys = _post_and_parse(api_url, post_data, CONFIG.timeout, _parser)
+        errmsg, retrys = _post_and_parse(api_url, post_data, CONFIG.timeout, _send_parser)
         if errmsg is None:
             logger.info(f"成功向{_log_users(users)}发送消息")
             break
@@ -158,6 +176,7 @@ def send_wechat(
         - default(bool, optional): 填充默认值
         - retry_times(int, optional): 重试次数
         - multithread(bool, optional): 使用多线程（需要启用多线程），不堵塞当前线程
+            启用发件箱时，写入发件箱由发送进程投递，不再使用定时任务
         - run_time(datetime | timedelta, optional): 执行时间，时间或延迟
         - task_id(str, optional): 任务标识符，与定时任务标识符一致
     
@@ -179,6 +198,13 @@ def send_wechat(
     if not CONFIG.retry:
         retry_times = 1
 
+    if multithread and CONFIG.use_outbox:
+        from extern.outbox import enqueue_wechat
+        enqueue_wechat(users, content, build_full_url(api_path, CONFIG.api_url),
+                       card=card, url=url, btntxt=btntxt,
+                       run_time=run_time, task_id=task_id)
+        return
+
     if run_time is not None and not scheduler_enabled(multithread):
         if isinstance(run_time, datetime):
             _schedule_time = run_time.strftime('%Y-%m-%d %H:%M:%S')
@@ -191,13 +217,15 @@ def send_wechat(
     total_ct = len(users)
     caller = get_caller(_send_wechat, multithread=multithread,
                         job_id=task_id, run_time=run_time)
-    for i in range(0, total_ct, CONFIG.send_batch):
-        userids = users[i : i + CONFIG.send_batch]
-        caller(
-            userids, content, build_full_url(api_path, CONFIG.api_url),
-            card=card, url=url, btntxt=btntxt,
-            retry_times=retry_times,
-        )
+    # 每批一个定时任务，一并写入后只唤醒一次执行器
+    with caller_batch(multithread):
+        for i in range(0, total_ct, CONFIG.send_batch):
+            userids = users[i : i + CONFIG.send_batch]
+            caller(
+                userids, content, build_full_url(api_path, CONFIG.api_url),
+                card=card, url=url, btntxt=btntxt,
+                retry_times=retry_times,
+            )
 
 
 def send_verify_code(stu_id: str | int, captcha: str, url: str | None = '/forgetpw/'):
@@ -1,19 +1,85 @@
+from time import time_ns
+
 from django.contrib.auth.backends import AllowAllUsersModelBackend
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import QuerySet
 
 import utils.models.query as SQ
+from utils.cache import shared_cache
 from generic.models import User, PermissionBlacklist
 
 
+__all__ = [
+    'BlacklistBackend',
+    'invalidate_revoked_permissions',
+]
+
+
+# 黑名单的全局版本号，黑名单变化时递增，缓存的版本号不一致时失效
+_VERSION_KEY = 'perm_blacklist:version'
+_REVOKED_KEY = 'perm_blacklist:user:{}'
+REVOKED_TIMEOUT = 3600
+
+
+def _bump_version() -> None:
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        # 版本号不存在时，所有缓存都无法通过版本检查
+        pass
+
+
+def invalidate_revoked_permissions() -> None:
+    '''
+    黑名单变化后使所有用户缓存的被禁止权限失效，由信号调用（见models.py）
+
+    版本号在事务提交后递增，否则并发的请求可能读到新版本号和未提交前的黑名单，
+    并将其缓存REVOKED_TIMEOUT秒
+    '''
+    transaction.on_commit(_bump_version)
+
+
+def _current_version() -> int:
+    # 版本号丢失后以时间为初值，不会与丢失前的版本号重复
+    cache.add(_VERSION_KEY, time_ns(), None)
+    return cache.get(_VERSION_KEY)
+
+
 class BlacklistBackend(AllowAllUsersModelBackend):
     '''
     在django自带的认证后端的基础上，除去在黑名单中记录的用户权限。
+
+    被禁止的权限在请求内缓存在用户对象上，请求间按用户缓存，
+    缓存附带黑名单的版本号，黑名单保存或删除时版本号递增，旧缓存随之失效。
+    缓存后端不在进程间共享时，其它进程无法使本进程的缓存失效，请求间不缓存。
     '''
 
     def _revoked_perms(self, user: User) -> set[str]:
-        return PermissionBlacklist.objects.get_revoked_permissions(user)
+        if hasattr(user, '_revoked_perm_cache'):
+            return user._revoked_perm_cache
+        if user.pk is None:
+            # 匿名用户没有黑名单记录
+            return set()
+        if not shared_cache():
+            perms = PermissionBlacklist.objects.get_revoked_permissions(user)
+            user._revoked_perm_cache = perms
+            return perms
+        key = _REVOKED_KEY.format(user.pk)
+        cached = cache.get_many([_VERSION_KEY, key])
+        version, entry = cached.get(_VERSION_KEY), cached.get(key)
+        if version is not None and entry is not None and entry[0] == version:
+            perms = entry[1]
+        else:
+            if version is None:
+                version = _current_version()
+            # 先读取版本号再查询，查询期间黑名单变化时写入的缓存已过时，不会被使用
+            perms = PermissionBlacklist.objects.get_revoked_permissions(user)
+            cache.set(key, (version, perms), REVOKED_TIMEOUT)
+        user._revoked_perm_cache = perms
+        return perms
 
     def get_user_permissions(self, user: User, obj = None) -> set[str]:
         '''获取用户自身权限，不包括组权限和黑名单中的权限。'''
@@ -67,4 +133,5 @@ class BlacklistBackend(AllowAllUsersModelBackend):
             )
         elif isinstance(perm, Permission):
             banned_records = SQ.sfilter(_M.permission, perm)
-        return users.exclude(pk__in=SQ.qsvlist(banned_records, _M.user, 'pk'))
+        # 被禁止的用户作为子查询排除，不再先取出列表，与用户查询一起执行
+        return users.exclude(pk__in=banned_records.values(SQ.f(_M.user)))
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generic', '0002_alter_yqpointrecord_source_type_permissionblacklist'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='yqpointrecord',
+            index=models.Index(fields=['user', 'source_type', 'time'], name='generic_yqp_user_id_21e7c9_idx'),
+        ),
+    ]
@@ -22,6 +22,8 @@ from django.contrib.auth.models import UserManager as _UserManager
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
 from django.db.models import QuerySet, F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 import pypinyin
 
 import utils.models.query as SQ
@@ -452,6 +454,13 @@ class PermissionBlacklist(models.Model):
     objects: PermissionBlacklistManager = PermissionBlacklistManager()
 
 
+@receiver([post_save, post_delete], sender=PermissionBlacklist)
+def invalidate_revoked_permissions(sender, **kwargs):
+    '''黑名单变化时，使认证后端缓存的被禁止权限失效'''
+    from generic.backend import invalidate_revoked_permissions
+    invalidate_revoked_permissions()
+
+
 class CreditRecord(models.Model):
     '''
     信用分更改记录
@@ -483,6 +492,8 @@ class YQPointRecord(models.Model):
     class Meta:
         verbose_name = '元气值记录'
         verbose_name_plural = verbose_name
+        # 签到记录按用户、来源类型和时间查找
+        indexes = [models.Index(fields=['user', 'source_type', 'time'])]
 
     user = models.ForeignKey(
         User, verbose_name='用户', on_delete=models.CASCADE,
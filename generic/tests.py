@@ -1,3 +1,73 @@
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from generic.backend import BlacklistBackend
+from generic.models import User, PermissionBlacklist
+
+
+@mock.patch('generic.backend.shared_cache', return_value=True)
+class BlacklistBackendTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('2000000000', '学生', User.Type.STUDENT)
+        cls.other = User.objects.create_user('2000000001', '学生', User.Type.STUDENT)
+        group = Group.objects.create(name='管理员')
+        cls.view, cls.change = [
+            Permission.objects.get(content_type__app_label='generic', codename=codename)
+            for codename in ['view_user', 'change_user']
+        ]
+        group.permissions.set([cls.view, cls.change])
+        group.user_set.set([cls.user, cls.other])
+        PermissionBlacklist.objects.create(user=cls.user, permission=cls.change)
+
+    def setUp(self):
+        cache.clear()
+
+    def request_user(self) -> User:
+        '''每个请求重新加载用户对象'''
+        return User.objects.get(pk=self.user.pk)
+
+    def blacklist_queries(self, user: User) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                self.assertTrue(user.has_perm('generic.view_user'))
+                self.assertFalse(user.has_perm('generic.change_user'))
+            self.assertSetEqual(user.get_all_permissions(), {'generic.view_user'})
+            self.assertTrue(user.has_module_perms('generic'))
+        return sum('permissionblacklist' in query['sql'] for query in queries)
+
+    def test_query_count(self, shared):
+        self.assertEqual(self.blacklist_queries(self.request_user()), 1)
+        # 之后的请求使用共享缓存
+        self.assertEqual(self.blacklist_queries(self.request_user()), 0)
+        # 缓存不共享时每个请求重新查询
+        shared.return_value = False
+        self.assertEqual(self.blacklist_queries(self.request_user()), 1)
+        self.assertEqual(self.blacklist_queries(self.request_user()), 1)
+
+    def test_invalidation(self, shared):
+        self.assertTrue(self.request_user().has_perm('generic.view_user'))
+        with self.captureOnCommitCallbacks(execute=True):
+            record = PermissionBlacklist.objects.create(user=self.user, permission=self.view)
+            # 提交前缓存仍然有效
+            self.assertTrue(self.request_user().has_perm('generic.view_user'))
+        self.assertFalse(self.request_user().has_perm('generic.view_user'))
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        self.assertTrue(self.request_user().has_perm('generic.view_user'))
+        # 缓存的版本号丢失时重新查询
+        cache.clear()
+        PermissionBlacklist.objects.filter(user=self.user).delete()
+        self.assertTrue(self.request_user().has_perm('generic.change_user'))
 
-# Create your tests here.
+    def test_with_perm(self, shared):
+        backend = BlacklistBackend()
+        with self.assertNumQueries(1):
+            self.assertListEqual(list(backend.with_perm('generic.change_user')), [self.other])
+        with self.assertNumQueries(1):
+            self.assertSetEqual(set(backend.with_perm(self.view)), {self.user, self.other})
@@ -0,0 +1,195 @@
+'''
+api.py
+
+问卷的批量提交和结果导出，供视图和其它应用使用
+
+- 提交答卷时一次读取问卷的题目和选项，校验全部回答后用bulk_create插入
+- 选择题的回答储存为选项序号，多选题和排序题以逗号分隔，如'1,3'
+- 导出时按答卷编号分块读取，逐行生成，选项序号转换为选项内容，不在内存中保存全部结果
+- 每题的作答人数和每个选项的选择人数在数据库中计数
+- 以往宿舍生活习惯调研的答卷以草稿状态创建，导出和统计默认包括草稿，可以只包括已提交的答卷
+
+clean_answers: 校验回答，生成未保存的AnswerText
+submit_answer_sheet: 校验并提交一份答卷
+export_header: 导出结果的表头
+export_rows: 逐行生成导出结果
+question_stats: 每题的作答统计
+'''
+from typing import Iterator, Mapping, Iterable
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Q
+
+from generic.models import User
+from questionnaire.models import Survey, AnswerSheet, Question, AnswerText
+
+
+__all__ = [
+    'clean_answers',
+    'submit_answer_sheet',
+    'export_header',
+    'export_rows',
+    'question_stats',
+]
+
+
+# 导出时多个选项之间的分隔符
+CHOICE_SEPARATOR = ';'
+EXPORT_CHUNK_SIZE = 500
+
+
+def _questions(survey: Survey) -> list[Question]:
+    return list(survey.questions.order_by('order').prefetch_related('choices'))
+
+
+def clean_answers(survey: Survey,
+                  answers: Mapping[int | str, str | Iterable[str]]) -> list[AnswerText]:
+    '''
+    校验一份答卷的全部回答
+
+    :param survey: 问卷
+    :type survey: Survey
+    :param answers: 题目序号到回答的映射，选择题的回答为选项序号，多选题和排序题可以有多个
+    :type answers: Mapping[int | str, str | Iterable[str]]
+    :raises ValidationError: 题目不存在、必填题未作答或选项不存在
+    :return: 未关联答卷的回答
+    :rtype: list[AnswerText]
+    '''
+    questions = {question.order: question for question in _questions(survey)}
+    cleaned: dict[int, list[str]] = {}
+    for order, value in answers.items():
+        try:
+            question = questions[int(order)]
+        except (KeyError, ValueError):
+            raise ValidationError(f'问卷中没有第{order}题！')
+        values = [value] if isinstance(value, str) else list(value)
+        values = [str(v) for v in values if str(v).strip()]
+        if values:
+            cleaned[question.order] = values
+
+    texts = []
+    for order, question in questions.items():
+        values = cleaned.get(order)
+        if values is None:
+            if question.required:
+                raise ValidationError(f'必填题{order}未作答！')
+            continue
+        if question.type in (Question.Type.TEXT, Question.Type.SINGLE) and len(values) > 1:
+            raise ValidationError(f'第{order}题只能有一个回答！')
+        if question.have_choice():
+            choices = {str(choice.order) for choice in question.choices.all()}
+            if not set(values) <= choices:
+                raise ValidationError(f'第{order}题的选项不存在！')
+            if len(set(values)) != len(values):
+                raise ValidationError(f'第{order}题的选项重复！')
+        texts.append(AnswerText(question=question, body=','.join(values)))
+    return texts
+
+
+def submit_answer_sheet(survey: Survey, user: User,
+                        answers: Mapping[int | str, str | Iterable[str]],
+                        status: AnswerSheet.Status = AnswerSheet.Status.SUBMITTED) -> AnswerSheet:
+    '''
+    校验并在一个事务中提交一份答卷，回答用bulk_create一次插入
+
+    :raises ValidationError: 问卷未发布、重复提交或回答不合法
+    :return: 创建的答卷
+    :rtype: AnswerSheet
+    '''
+    if survey.status != Survey.Status.PUBLISHED:
+        raise ValidationError('只能提交已发布问卷的答卷！')
+    texts = clean_answers(survey, answers)
+    with transaction.atomic():
+        if AnswerSheet.objects.filter(creator=user, survey=survey).exists():
+            raise ValidationError('禁止重复提交答卷！')
+        sheet = AnswerSheet.objects.create(creator=user, survey=survey, status=status)
+        for text in texts:
+            text.answersheet = sheet
+        AnswerText.objects.bulk_create(texts)
+    return sheet
+
+
+def export_header(survey: Survey) -> list[str]:
+    '''导出结果的表头：答卷编号、答卷人、填写时间和每题的简介'''
+    return ['答卷', '答卷人', '填写时间'] + [question.topic for question in _questions(survey)]
+
+
+def _sheets(survey: Survey, submitted_only: bool):
+    sheets = AnswerSheet.objects.filter(survey=survey)
+    if submitted_only:
+        sheets = sheets.filter(status=AnswerSheet.Status.SUBMITTED)
+    return sheets
+
+
+def export_rows(survey: Survey, submitted_only: bool = False,
+                chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    '''
+    按答卷编号的顺序逐行生成答卷的结果，与export_header对应
+
+    每次读取chunk_size份答卷及其回答，未作答的题目为空字符串
+    '''
+    questions = _questions(survey)
+    columns = {question.id: i for i, question in enumerate(questions)}
+    choice_texts = {
+        question.id: {str(choice.order): choice.text for choice in question.choices.all()}
+        for question in questions if question.have_choice()
+    }
+    sheets = _sheets(survey, submitted_only).order_by('id')
+    last = 0
+    while True:
+        chunk = list(sheets.filter(id__gt=last).values_list(
+            'id', 'creator__username', 'create_time')[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1][0]
+        rows = {id: [id, username, create_time] + [''] * len(questions)
+                for id, username, create_time in chunk}
+        for sheet_id, question_id, body in AnswerText.objects.filter(
+            answersheet_id__in=rows, question_id__in=columns,
+        ).values_list('answersheet_id', 'question_id', 'body'):
+            if question_id in choice_texts:
+                texts = choice_texts[question_id]
+                body = CHOICE_SEPARATOR.join(texts.get(v, v) for v in body.split(','))
+            rows[sheet_id][3 + columns[question_id]] = body
+        yield from rows.values()
+
+
+def _selected(order: int) -> Q:
+    # 选项序号是逗号分隔的列表中的一项
+    order = str(order)
+    return (Q(body=order) | Q(body__startswith=f'{order},')
+            | Q(body__endswith=f',{order}') | Q(body__contains=f',{order},'))
+
+
+def question_stats(survey: Survey, submitted_only: bool = False) -> list[dict]:
+    '''
+    每题的作答统计，共两次聚合查询
+
+    :return: 按题目序号排列，包含order, topic, type, answered, choices，
+        其中choices为选项的order, text, count，填空题为空列表
+    :rtype: list[dict]
+    '''
+    questions = _questions(survey)
+    answers = AnswerText.objects.filter(
+        question__survey=survey, answersheet__in=_sheets(survey, submitted_only))
+    answered = dict(answers.order_by().values_list('question_id').annotate(Count('id')))
+    counts = {}
+    aggregates = {
+        f'c{choice.id}': Count('id', filter=Q(question_id=question.id) & _selected(choice.order))
+        for question in questions if question.have_choice()
+        for choice in question.choices.all()
+    }
+    if aggregates:
+        counts = answers.aggregate(**aggregates)
+    return [{
+        'order': question.order,
+        'topic': question.topic,
+        'type': question.type,
+        'answered': answered.get(question.id, 0),
+        'choices': [{
+            'order': choice.order,
+            'text': choice.text,
+            'count': counts[f'c{choice.id}'],
+        } for choice in question.choices.all()] if question.have_choice() else [],
+    } for question in questions]
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from questionnaire.models import Survey, Question, Choice, AnswerText, AnswerSheet
+from questionnaire.api import clean_answers
 
 __all__ = [
     'ChoiceSerializer',
@@ -8,6 +9,7 @@ __all__ = [
     'SurveySerializer',
     'AnswerSheetSerializer',
     'AnswerTextSerializer',
+    'AnswerSheetSubmitSerializer',
 ]
 
 
@@ -53,3 +55,23 @@ class AnswerTextSerializer(serializers.ModelSerializer):
         if attrs['question'].survey != attrs['answersheet'].survey:
             raise serializers.ValidationError("问题与答卷不属于同一问卷！")
         return attrs
+
+
+class AnswerSheetSubmitSerializer(serializers.Serializer):
+    '''一次提交整份答卷，answers为题目序号到回答的映射'''
+    survey = serializers.PrimaryKeyRelatedField(queryset=Survey.objects.all())
+    status = serializers.ChoiceField(choices=AnswerSheet.Status.choices,
+                                     default=AnswerSheet.Status.SUBMITTED)
+    answers = serializers.DictField(child=serializers.JSONField())
+
+    def validate(self, attrs):
+        for value in attrs['answers'].values():
+            if not isinstance(value, (str, int, list)):
+                raise serializers.ValidationError("回答必须是字符串或列表！")
+        attrs['answers'] = {
+            order: [str(v) for v in value] if isinstance(value, list) else str(value)
+            for order, value in attrs['answers'].items()
+        }
+        # 只校验回答，问卷状态和重复提交在保存时检查
+        clean_answers(attrs['survey'], attrs['answers'])
+        return attrs
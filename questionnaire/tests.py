@@ -1,3 +1,104 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from generic.models import User
+from questionnaire.models import Survey, AnswerSheet, Question, Choice, AnswerText
+from questionnaire.api import submit_answer_sheet, export_header, export_rows, question_stats
+
+
+class QuestionnaireTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', '发布人', User.Type.STUDENT)
+        cls.users = [User.objects.create_user(f'2400000{i:03d}', f'学生{i}', User.Type.STUDENT)
+                     for i in range(5)]
+        now = datetime.now()
+        cls.survey = Survey.objects.create(
+            title='测试问卷', creator=cls.owner, status=Survey.Status.PUBLISHED,
+            start_time=now, end_time=now + timedelta(days=1))
+        cls.name = Question.objects.create(survey=cls.survey, order=1, topic='姓名',
+                                           type=Question.Type.TEXT)
+        cls.gender = Question.objects.create(survey=cls.survey, order=2, topic='性别',
+                                             type=Question.Type.SINGLE)
+        cls.hobby = Question.objects.create(survey=cls.survey, order=3, topic='爱好',
+                                            type=Question.Type.MULTIPLE, required=False)
+        for question, texts in ((cls.gender, ['男', '女']), (cls.hobby, ['读书', '运动', '音乐'])):
+            for order, text in enumerate(texts, 1):
+                Choice.objects.create(question=question, order=order, text=text)
+
+    def submit(self, user, gender, hobby=()):
+        return submit_answer_sheet(self.survey, user, {
+            '1': user.name, 2: gender, 3: list(hobby)})
+
+    def test_submit(self):
+        with self.assertNumQueries(7):
+            sheet = self.submit(self.users[0], '1', ['1', '3'])
+        self.assertEqual(sheet.status, AnswerSheet.Status.SUBMITTED)
+        self.assertListEqual(
+            list(AnswerText.objects.filter(answersheet=sheet).order_by('question__order')
+                 .values_list('body', flat=True)),
+            ['学生0', '1', '1,3'])
+        for answers in [{1: '学生1'}, {1: '学生1', 2: ['1', '2']},
+                        {1: '学生1', 2: '3'}, {1: '学生1', 2: '1', 4: 'x'}]:
+            with self.assertRaises(ValidationError):
+                submit_answer_sheet(self.survey, self.users[1], answers)
+        with self.assertRaises(ValidationError):
+            self.submit(self.users[0], '2')
+        self.assertEqual(AnswerSheet.objects.count(), 1)
+
+    def test_export_and_stats(self):
+        self.submit(self.users[0], '1', ['1', '3'])
+        self.submit(self.users[1], '2', ['3'])
+        self.submit(self.users[2], '2')
+        AnswerSheet.objects.create(survey=self.survey, creator=self.users[3])
+        self.assertListEqual(export_header(self.survey)[3:], ['姓名', '性别', '爱好'])
+        rows = list(export_rows(self.survey, submitted_only=True, chunk_size=2))
+        self.assertListEqual([row[1:2] + row[3:] for row in rows], [
+            ['2400000000', '学生0', '男', '读书;音乐'],
+            ['2400000001', '学生1', '女', '音乐'],
+            ['2400000002', '学生2', '女', ''],
+        ])
+        self.assertEqual(len(list(export_rows(self.survey))), 4)
+
+        with self.assertNumQueries(4):
+            stats = question_stats(self.survey, submitted_only=True)
+        self.assertListEqual([item['answered'] for item in stats], [3, 3, 2])
+        self.assertListEqual([choice['count'] for choice in stats[1]['choices']], [1, 2])
+        self.assertListEqual([choice['count'] for choice in stats[2]['choices']], [1, 0, 2])
+
+    def test_api(self):
+        self.client.force_login(self.users[0])
+        response = self.client.post('/questionnaire/answersheet/submit/', {
+            'survey': self.survey.id, 'answers': {'1': '学生0', '2': 1, '3': ['2']},
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/questionnaire/answersheet/submit/', {
+            'survey': self.survey.id, 'answers': {'1': '学生0'},
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/questionnaire/answersheet/submit/', {
+            'survey': self.survey.id, 'answers': {'1': '学生0', '2': '1'},
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('禁止重复提交答卷！', response.json())
+
+        # 只有问卷创建人能导出
+        response = self.client.get(f'/questionnaire/survey/{self.survey.id}/export/')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.owner)
+        response = self.client.get(f'/questionnaire/survey/{self.survey.id}/export/')
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertListEqual(rows[0][3:], ['姓名', '性别', '爱好'])
+        self.assertListEqual(rows[1][3:], ['学生0', '男', '运动'])
+        response = self.client.get(
+            f'/questionnaire/survey/{self.survey.id}/export/?type=ndjson&submitted=1')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['爱好'], '运动')
+        response = self.client.get(f'/questionnaire/survey/{self.survey.id}/stats/')
+        self.assertEqual(response.json()[2]['choices'][1]['count'], 1)
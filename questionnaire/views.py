@@ -1,5 +1,11 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db.models import Q
-from rest_framework import viewsets
+from django.http import StreamingHttpResponse
+from rest_framework import viewsets, status
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
@@ -8,6 +14,21 @@ from rest_framework.response import Response
 from questionnaire.models import *
 from questionnaire.serializers import *
 from questionnaire.permissions import *
+from questionnaire.api import (
+    submit_answer_sheet, export_header, export_rows, question_stats,
+)
+
+
+def _csv_lines(writer, header, rows):
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class _Echo:
+    '''csv.writer的写入目标，直接返回写入的行'''
+    def write(self, value):
+        return value
 
 
 # 用viewsets
@@ -22,6 +43,36 @@ class SurveyViewSet(viewsets.ModelViewSet):
         else:  # 根据发布状态和发布时间来筛选
             return Survey.objects.filter(Q(status=Survey.Status.PUBLISHED) | Q(creator=self.request.user))
 
+    def get_owned_survey(self) -> Survey:
+        survey: Survey = self.get_object()
+        if not (self.request.user.is_staff or survey.creator == self.request.user):
+            raise PermissionDenied("只有问卷创始人能查看结果！")
+        return survey
+
+    def _submitted_only(self) -> bool:
+        return self.request.query_params.get('submitted') == '1'
+
+    @action(detail=True, methods=['GET'])
+    def export(self, request, pk=None):
+        '''流式导出答卷的结果，type=csv（默认）或ndjson，submitted=1时只导出已提交的答卷'''
+        survey = self.get_owned_survey()
+        header = export_header(survey)
+        rows = export_rows(survey, self._submitted_only())
+        if request.query_params.get('type') == 'ndjson':
+            lines = (json.dumps(dict(zip(header, row)), ensure_ascii=False, default=str) + '\n'
+                     for row in rows)
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        writer = csv.writer(_Echo())
+        response = StreamingHttpResponse(
+            _csv_lines(writer, header, rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="survey_{survey.id}.csv"'
+        return response
+
+    @action(detail=True, methods=['GET'])
+    def stats(self, request, pk=None):
+        '''每题的作答人数和每个选项的选择人数'''
+        return Response(question_stats(self.get_owned_survey(), self._submitted_only()))
+
 
 class QuestionViewSet(viewsets.ModelViewSet):
     authentication_classes = [SessionAuthentication]
@@ -157,6 +208,19 @@ class AnswerSheetViewSet(viewsets.ModelViewSet):
         else:
             raise PermissionError("禁止修改答卷！")
 
+    @action(detail=False, methods=['POST'])
+    def submit(self, request):
+        '''一次提交整份答卷，包括全部回答'''
+        serializer = AnswerSheetSubmitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            sheet = submit_answer_sheet(data['survey'], request.user,
+                                        data['answers'], data['status'])
+        except DjangoValidationError as e:
+            raise ValidationError(e.messages)
+        return Response(AnswerSheetSerializer(sheet).data, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['GET'])
     def answer_owner(self, request):
         sheet = AnswerSheet.objects.filter(creator=request.user)
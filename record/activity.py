@@ -0,0 +1,86 @@
+'''
+activity.py
+
+按天汇总埋点：活跃度、导出和年度总结只关心用户每天的访问次数，不需要反复扫描全部埋点
+
+- 每天凌晨将前一天的PageLog和ModuleLog按用户汇总为DailyActivity，每张表一次范围查询，
+  使用埋点时间上的索引
+- 汇总可以重复执行，同一天的汇总整体替换，用于补齐缺失的日期和计入迟到的埋点
+- 没有任何埋点的日期没有汇总，每次补齐时都会重新扫描，有索引时代价很小
+
+rollup_day: 汇总一天的埋点
+rollup_missing: 汇总一段时间内缺失的日期
+active_days: 一段时间内每个用户访问过页面的天数
+'''
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, QuerySet
+
+from record.models import PageLog, ModuleLog, DailyActivity
+
+
+__all__ = [
+    'rollup_day',
+    'rollup_missing',
+    'active_days',
+]
+
+
+_COUNTS = (
+    (PageLog, {'pv': PageLog.CountType.PV, 'pd': PageLog.CountType.PD}),
+    (ModuleLog, {'mv': ModuleLog.CountType.MV, 'mc': ModuleLog.CountType.MC}),
+)
+
+
+def rollup_day(day: date) -> int:
+    '''
+    汇总一天的埋点，替换该日已有的汇总
+
+    :param day: 汇总的日期
+    :type day: date
+    :return: 当天有埋点的用户数
+    :rtype: int
+    '''
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    counts: defaultdict[int, dict[str, int]] = defaultdict(dict)
+    for model, types in _COUNTS:
+        rows = model.objects.filter(time__gte=start, time__lt=end).order_by().values(
+            'user').annotate(**{
+                name: Count('id', filter=Q(type=log_type))
+                for name, log_type in types.items()
+            })
+        for row in rows:
+            counts[row.pop('user')].update(row)
+    activities = [DailyActivity(user_id=user_id, date=day, **row)
+                  for user_id, row in counts.items()]
+    with transaction.atomic():
+        DailyActivity.objects.filter(date=day).delete()
+        DailyActivity.objects.bulk_create(activities, batch_size=500)
+    return len(activities)
+
+
+def rollup_missing(until: date, days: int) -> list[date]:
+    '''
+    汇总[until - days, until)中尚无汇总的日期，前一天总是重新汇总以计入迟到的埋点
+
+    :return: 重新汇总的日期
+    :rtype: list[date]
+    '''
+    start = until - timedelta(days=days)
+    done = set(DailyActivity.objects.filter(
+        date__gte=start, date__lt=until).values_list('date', flat=True).distinct())
+    done.discard(until - timedelta(days=1))
+    missing = [start + timedelta(days=i) for i in range(days)]
+    missing = [day for day in missing if day not in done]
+    for day in missing:
+        rollup_day(day)
+    return missing
+
+
+def active_days(start: date, end: date) -> QuerySet[DailyActivity]:
+    '''[start, end)内访问过页面的汇总记录，可以按用户聚合或作为子查询'''
+    return DailyActivity.objects.filter(
+        Q(pv__gt=0) | Q(pd__gt=0), date__gte=start, date__lt=end)
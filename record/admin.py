@@ -18,3 +18,11 @@ class ModuleLogAdmin(admin.ModelAdmin):
     list_filter = ["type", "module_name", "time", "platform", "page"]
     search_fields = ["user__username", "page", "module_name"]
     date_hierarchy = "time"
+
+
+@admin.register(DailyActivity)
+class DailyActivityAdmin(admin.ModelAdmin):
+    list_display = ["user", "date", "pv", "pd", "mv", "mc"]
+    list_filter = ["date"]
+    search_fields = ["user__username"]
+    date_hierarchy = "date"
@@ -0,0 +1,219 @@
+'''
+archive.py
+
+埋点的归档：PageLog和ModuleLog只在数据库中保留最近CONFIG.retention_days天，
+更早的埋点按月归档到压缩文件，埋点表和时间索引保持较小
+
+- 只归档早于保留期限的整月，每个表每月一个文件，如page-2024-01.csv.gz
+- 归档前先补齐这些日期的每日汇总DailyActivity，归档不影响活跃度和按天的统计
+- 先写入归档文件（写入临时文件后改名），再按主键分批删除已归档的埋点，每批一条DELETE；
+  中途失败后重新归档时，与已有的归档文件合并并按主键去重，埋点不会丢失或重复
+- 一个月的埋点在内存中整体写入，归档文件中的用户为用户名，用户删除后仍可导出
+- 归档格式默认为gzip压缩的CSV，安装pyarrow后可以使用列存储的parquet，读取时按扩展名识别
+- read_logs合并读取归档文件和数据库中的埋点，导出时无需关心埋点是否已归档
+
+archive_logs: 归档早于保留期限的埋点
+read_logs: 读取一段时间内的埋点
+'''
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from django.db.models import Min
+
+from boot.config import absolute_path
+from record.models import PageLog, ModuleLog, DailyActivity
+from record.activity import rollup_day
+from record.config import tracking_config as CONFIG
+from record.log.utils import get_logger
+
+
+__all__ = [
+    'archive_logs',
+    'read_logs',
+]
+
+
+# 保留期限不能短于活跃度的统计范围，否则每日汇总可能在归档后被重新计算
+MIN_RETENTION_DAYS = 30
+FORMATS = ('csv.gz', 'parquet')
+
+_NAMES: dict[type[PageLog | ModuleLog], str] = {PageLog: 'page', ModuleLog: 'module'}
+
+logger = get_logger('tracking')
+
+
+def _columns(model: type[PageLog | ModuleLog]) -> list[str]:
+    return [field.name for field in model._meta.fields]
+
+
+def _values(model: type[PageLog | ModuleLog]) -> list[str]:
+    return [name if name != 'user' else 'user__username' for name in _columns(model)]
+
+
+def _month(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def _archive_dir(archive_dir: str | None = None) -> str:
+    path = absolute_path(archive_dir or CONFIG.archive_dir)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _month_files(model, month: date, archive_dir: str) -> list[str]:
+    paths = [os.path.join(archive_dir, f'{_NAMES[model]}-{month:%Y-%m}.{fmt}')
+             for fmt in FORMATS]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _read_file(model, path: str) -> pd.DataFrame:
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path)
+    else:
+        # 浏览器版本等字段不能被解析为数字
+        frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+        frame = frame.astype({'id': 'int64', 'type': 'int64'})
+    frame['time'] = pd.to_datetime(frame['time'])
+    return frame[_columns(model)]
+
+
+def _read_month(model, month: date, archive_dir: str) -> pd.DataFrame:
+    frames = [_read_file(model, path) for path in _month_files(model, month, archive_dir)]
+    if not frames:
+        return pd.DataFrame(columns=_columns(model))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _write_month(model, month: date, frame: pd.DataFrame,
+                 archive_dir: str, fmt: str) -> None:
+    path = os.path.join(archive_dir, f'{_NAMES[model]}-{month:%Y-%m}.{fmt}')
+    temp = f'{path}.tmp'
+    if fmt == 'parquet':
+        frame.to_parquet(temp, index=False)
+    else:
+        frame.to_csv(temp, index=False, compression='gzip')
+    old_files = _month_files(model, month, archive_dir)
+    os.replace(temp, path)
+    # 切换格式后，旧格式的文件已合并到新文件中
+    for old in old_files:
+        if old != path:
+            os.remove(old)
+
+
+def _archive_month(model, month: date, archive_dir: str, fmt: str, batch: int) -> int:
+    logs = model.objects.filter(time__gte=_start(month), time__lt=_start(_next_month(month)))
+    frame = pd.DataFrame(logs.order_by('id').values_list(*_values(model)),
+                         columns=_columns(model))
+    if frame.empty:
+        return 0
+    ids = frame['id'].tolist()
+    archived = _read_month(model, month, archive_dir)
+    if not archived.empty:
+        frame = pd.concat([archived, frame], ignore_index=True)
+        frame = frame.drop_duplicates('id', keep='last').sort_values('id')
+    _write_month(model, month, frame, archive_dir, fmt)
+    for i in range(0, len(ids), batch):
+        model.objects.filter(id__in=ids[i:i + batch]).delete()
+    return len(ids)
+
+
+def archive_logs(before: date | None = None,
+                 archive_dir: str | None = None) -> dict[str, int]:
+    '''
+    归档并删除before所在月之前各月的埋点
+
+    :param before: 归档的截止日期，默认为今天减去CONFIG.retention_days，
+        且不晚于今天减去MIN_RETENTION_DAYS，未设置保留期限时不归档
+    :type before: date | None
+    :param archive_dir: 归档目录，默认为CONFIG.archive_dir
+    :type archive_dir: str | None
+    :return: 每张表归档的条数
+    :rtype: dict[str, int]
+    '''
+    today = datetime.now().date()
+    if before is None:
+        if not CONFIG.retention_days:
+            return {}
+        before = today - timedelta(days=max(CONFIG.retention_days, MIN_RETENTION_DAYS))
+    before = min(before, today - timedelta(days=MIN_RETENTION_DAYS))
+    fmt = CONFIG.archive_format
+    if fmt not in FORMATS:
+        raise ValueError(f'不支持的归档格式：{fmt}')
+    archive_dir = _archive_dir(archive_dir)
+    batch = CONFIG.delete_batch
+    counts = {name: 0 for name in _NAMES.values()}
+
+    first = [model.objects.aggregate(first=Min('time'))['first'] for model in _NAMES]
+    first = [time for time in first if time is not None]
+    if not first:
+        return counts
+    month, end = _month(min(first).date()), _month(before)
+    while month < end:
+        next_month = _next_month(month)
+        # 归档前补齐当月的每日汇总，已有汇总的日期不再计算
+        rolled = set(DailyActivity.objects.filter(
+            date__gte=month, date__lt=next_month).values_list('date', flat=True).distinct())
+        days = set()
+        for model in _NAMES:
+            days.update(model.objects.filter(
+                time__gte=_start(month), time__lt=_start(next_month)).dates('time', 'day'))
+        for day in sorted(days - rolled):
+            rollup_day(day)
+        for model, name in _NAMES.items():
+            count = _archive_month(model, month, archive_dir, fmt, batch)
+            if count:
+                logger.info(f'归档{month:%Y-%m}的{name}埋点{count}条')
+            counts[name] += count
+        month = next_month
+    return counts
+
+
+def read_logs(model: type[PageLog | ModuleLog],
+              start: datetime | None = None, end: datetime | None = None,
+              archive_dir: str | None = None) -> pd.DataFrame:
+    '''
+    合并读取[start, end)内归档和数据库中的埋点，按时间排序
+
+    :return: 列与模型字段相同，user为用户名
+    :rtype: pd.DataFrame
+    '''
+    archive_dir = _archive_dir(archive_dir)
+    logs = model.objects.all()
+    if start is not None:
+        logs = logs.filter(time__gte=start)
+    if end is not None:
+        logs = logs.filter(time__lt=end)
+    frames = [pd.DataFrame(logs.values_list(*_values(model)), columns=_columns(model))]
+
+    prefix = f'{_NAMES[model]}-'
+    months = set()
+    for file in os.listdir(archive_dir):
+        if file.startswith(prefix) and file.endswith(FORMATS):
+            months.add(datetime.strptime(file[len(prefix):len(prefix) + 7], '%Y-%m').date())
+    for month in sorted(months):
+        if start is not None and _next_month(month) <= start.date():
+            continue
+        if end is not None and month > end.date():
+            continue
+        frame = _read_month(model, month, archive_dir)
+        if start is not None:
+            frame = frame[frame['time'] >= start]
+        if end is not None:
+            frame = frame[frame['time'] < end]
+        frames.append(frame)
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=_columns(model))
+    # 归档后删除前中断时，埋点同时在归档和数据库中
+    result = pd.concat(frames, ignore_index=True).drop_duplicates('id')
+    return result.sort_values(['time', 'id'], ignore_index=True)
@@ -0,0 +1,24 @@
+from boot.config import ROOT_CONFIG
+from utils.config import Config, LazySetting
+
+
+__all__ = [
+    'tracking_config',
+]
+
+
+class TrackingConfig(Config):
+    # 埋点先追加到本机的暂存文件，积累到批量大小或超过写回间隔时批量写入数据库
+    buffer = LazySetting('tracking/buffer', default=False)
+    spool_dir = LazySetting('tracking/spool_dir', default='./spool/tracking')
+    batch = LazySetting('tracking/batch', default=200)
+    flush_interval = LazySetting('tracking/flush_interval', float, default=10.0)
+    # 埋点在数据库中保留的天数，更早的埋点按月归档到压缩文件，0表示不归档
+    retention_days = LazySetting('tracking/retention_days', default=0)
+    archive_dir = LazySetting('tracking/archive_dir', default='./archive/tracking')
+    # csv.gz或parquet，后者需要安装pyarrow
+    archive_format = LazySetting('tracking/archive_format', default='csv.gz')
+    delete_batch = LazySetting('tracking/delete_batch', default=5000)
+
+
+tracking_config = TrackingConfig(ROOT_CONFIG, '')
@@ -0,0 +1,22 @@
+from scheduler.periodic import periodical
+from record.tracking import buffer_enabled, flush_spool
+from record.archive import archive_logs
+
+
+__all__ = [
+    'flush_tracking',
+    'archive_tracking',
+]
+
+
+@periodical('interval', 'trackingFlusher', minutes=1)
+def flush_tracking():
+    '''写回空闲或已退出的进程暂存的埋点，每分钟一次'''
+    if buffer_enabled():
+        flush_spool()
+
+
+@periodical('cron', 'trackingArchiver', hour=3)
+def archive_tracking():
+    '''每天归档超过保留期限的埋点，未设置保留期限时不归档'''
+    archive_logs()
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from record.archive import archive_logs
+
+
+class Command(BaseCommand):
+    help = '归档超过保留期限的页面和模块埋点，首次归档大量历史埋点时可以在低峰期手动执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=str, default=None,
+                            help='归档此日期所在月之前的埋点，格式YYYY-mm-dd，默认由保留期限计算')
+        parser.add_argument('--dir', type=str, default=None, help='归档目录')
+
+    def handle(self, *args, **options):
+        before = options['before']
+        if before is not None:
+            before = datetime.strptime(before, '%Y-%m-%d').date()
+        counts = archive_logs(before, options['dir'])
+        if not counts:
+            self.stdout.write('未设置保留期限，请指定--before')
+            return
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: 归档{count}条')
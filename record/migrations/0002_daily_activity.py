@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('pv', models.IntegerField(default=0, verbose_name='页面浏览')),
+                ('pd', models.IntegerField(default=0, verbose_name='页面离开')),
+                ('mv', models.IntegerField(default=0, verbose_name='模块浏览')),
+                ('mc', models.IntegerField(default=0, verbose_name='模块点击')),
+            ],
+            options={
+                'verbose_name': '埋点记录-每日汇总',
+                'verbose_name_plural': '埋点记录-每日汇总',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='modulelog',
+            index=models.Index(fields=['time'], name='record_modu_time_1f6004_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagelog',
+            index=models.Index(fields=['time'], name='record_page_time_89f01b_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivity',
+            index=models.Index(fields=['date'], name='record_dail_date_adf4ee_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivity',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_activity'),
+        ),
+    ]
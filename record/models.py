@@ -9,6 +9,7 @@ from generic.models import User
 __all__ = [
     'PageLog',
     'ModuleLog',
+    'DailyActivity',
 ]
 
 
@@ -19,6 +20,7 @@ class PageLog(models.Model):
     class Meta:
         verbose_name = "埋点记录-页面"
         verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=['time'])]
 
     class CountType(models.IntegerChoices):
         PV = choice(0, "Page View")
@@ -41,6 +43,7 @@ class ModuleLog(models.Model):
     class Meta:
         verbose_name = "埋点记录-模块"
         verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=['time'])]
 
     class CountType(models.IntegerChoices):
         MV = choice(2, "Module View")
@@ -55,3 +58,23 @@ class ModuleLog(models.Model):
     platform = models.CharField('设备类型', max_length=32, null=True, blank=True)
     explore_name = models.CharField('浏览器类型', max_length=32, null=True, blank=True)
     explore_version = models.CharField('浏览器版本', max_length=32, null=True, blank=True)
+
+
+class DailyActivity(models.Model):
+    '''
+    用户每天的埋点汇总，由PageLog和ModuleLog按天汇总得到，见record.activity
+    '''
+    class Meta:
+        verbose_name = "埋点记录-每日汇总"
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_activity'),
+        ]
+        indexes = [models.Index(fields=['date'])]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField('日期')
+    pv = models.IntegerField('页面浏览', default=0)
+    pd = models.IntegerField('页面离开', default=0)
+    mv = models.IntegerField('模块浏览', default=0)
+    mc = models.IntegerField('模块点击', default=0)
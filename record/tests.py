@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase
+
+from generic.models import User
+from record.models import PageLog, ModuleLog, DailyActivity
+from record import tracking, archive
+from record.tracking import parse_beacons, record_events, flush_spool
+from record.archive import archive_logs, read_logs
+from dm.dump_funcs import PageTrackingDump, ModuleTrackingDump
+
+
+class TrackingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('2000000000', '学生', User.Type.STUDENT)
+
+    def setUp(self):
+        self.spool = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool.cleanup)
+        self.client.force_login(self.user)
+
+    def beacon(self, type, **kwargs):
+        return {'Type': str(type), 'Url': '/welcome/', 'Time': '1700000000000',
+                'Platform': 'Win32', 'Explore': 'Chrome 120.0', **kwargs}
+
+    def test_parse(self):
+        events = parse_beacons({'Events': json.dumps([
+            self.beacon(0), self.beacon(3, Name='帮助' * 50), {'Type': 'x'}, 'x',
+        ])}, self.user.id)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0]['explore_name'], 'Chrome')
+        self.assertEqual(len(events[1]['module_name']), 64)
+        self.assertEqual(parse_beacons({'Events': '{'}, self.user.id), [])
+
+    def test_endpoint(self):
+        response = self.client.post('/eventTrackingFunc/', self.beacon(0))
+        self.assertEqual(response.json(), {'status': 'ok'})
+        # 会话和用户各一次查询，两张表各一次INSERT
+        with self.assertNumQueries(6):
+            self.client.post('/eventTrackingFunc/', {'Events': json.dumps([
+                self.beacon(1), self.beacon(0), self.beacon(3, Name='查看帮助')])})
+        self.assertEqual(PageLog.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(ModuleLog.objects.get(user=self.user).module_name, '查看帮助')
+
+    @mock.patch('record.API.buffer_enabled', return_value=True)
+    @mock.patch('record.API.record_events')
+    def test_buffered_endpoint(self, record, _):
+        # 只有会话和用户的查询
+        with self.assertNumQueries(2):
+            self.client.post('/eventTrackingFunc/', {'Events': json.dumps([self.beacon(0)])})
+        self.assertEqual(len(record.call_args.args[0]), 1)
+
+    def test_spool(self):
+        events = parse_beacons(self.beacon(0), self.user.id)
+        with mock.patch.object(tracking.CONFIG, 'batch', 3), \
+                mock.patch.object(tracking.CONFIG, 'flush_interval', 3600):
+            tracking._pending = 0
+            for _ in range(5):
+                record_events(events, self.spool.name)
+        # 第3条时写回
+        self.assertEqual(PageLog.objects.count(), 3)
+        # 写回间隔内有追加的暂存文件由所属的进程写回
+        self.assertEqual(flush_spool(self.spool.name), 0)
+        with mock.patch('record.tracking.time.time', return_value=time.time() + 60):
+            self.assertEqual(flush_spool(self.spool.name), 2)
+        self.assertEqual(os.listdir(self.spool.name), [])
+
+    def test_stale_batch(self):
+        events = parse_beacons(self.beacon(0), self.user.id)
+        with mock.patch.object(tracking.CONFIG, 'batch', 10 ** 6), \
+                mock.patch.object(tracking.CONFIG, 'flush_interval', 3600):
+            record_events(events * 2, self.spool.name)
+        # 模拟写回时进程退出：批次文件留在目录中
+        path = tracking._spool_path(self.spool.name)
+        batch = tracking._rotate(path)
+        record_events(events, self.spool.name)
+        self.assertEqual(flush_spool(self.spool.name, idle=0), 1)
+        self.assertEqual(os.listdir(self.spool.name), [os.path.basename(batch)])
+        with mock.patch('record.tracking.time.time', return_value=time.time() + 120):
+            self.assertEqual(flush_spool(self.spool.name), 2)
+        self.assertEqual(PageLog.objects.count(), 3)
+        self.assertEqual(os.listdir(self.spool.name), [])
+
+
+class ArchiveTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('2000000000', '学生', User.Type.STUDENT)
+        cls.recent = datetime.now().replace(microsecond=0) - timedelta(days=1)
+        cls.pages = [
+            PageLog.objects.create(user=cls.user, type=PageLog.CountType.PV, time=time,
+                                   page='/welcome/', explore_version='120.0')
+            for time in [datetime(2024, 1, 31, 23), datetime(2024, 2, 1, 8), cls.recent]
+        ]
+        ModuleLog.objects.create(user=cls.user, type=ModuleLog.CountType.MC,
+                                 time=datetime(2024, 1, 2), module_name='查看帮助')
+
+    def setUp(self):
+        self.archive = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive.cleanup)
+
+    def test_archive(self):
+        counts = archive_logs(date(2024, 2, 15), self.archive.name)
+        self.assertEqual(counts, {'page': 1, 'module': 1})
+        self.assertListEqual(sorted(os.listdir(self.archive.name)),
+                             ['module-2024-01.csv.gz', 'page-2024-01.csv.gz'])
+        self.assertEqual(PageLog.objects.count(), 2)
+        self.assertFalse(ModuleLog.objects.exists())
+        # 归档前补齐每日汇总
+        self.assertEqual(DailyActivity.objects.get(date=date(2024, 1, 31)).pv, 1)
+        self.assertEqual(DailyActivity.objects.get(date=date(2024, 1, 2)).mc, 1)
+
+        logs = read_logs(PageLog, archive_dir=self.archive.name)
+        self.assertListEqual(logs['time'].tolist(), [
+            datetime(2024, 1, 31, 23), datetime(2024, 2, 1, 8), self.recent])
+        self.assertListEqual(logs['explore_version'].tolist()[:2], ['120.0', '120.0'])
+        logs = read_logs(PageLog, datetime(2024, 1, 31), datetime(2024, 2, 1),
+                         archive_dir=self.archive.name)
+        self.assertListEqual(logs['user'].tolist(), ['2000000000'])
+
+    def test_resume(self):
+        archive_logs(date(2024, 2, 15), self.archive.name)
+        # 模拟写入归档文件后、删除埋点前中断
+        PageLog.objects.create(id=self.pages[0].id, user=self.user, type=PageLog.CountType.PV,
+                               time=datetime(2024, 1, 31, 23), page='/welcome/')
+        PageLog.objects.create(user=self.user, type=PageLog.CountType.PD,
+                               time=datetime(2024, 1, 31, 23, 30))
+        self.assertEqual(len(read_logs(PageLog, archive_dir=self.archive.name)), 4)
+        with mock.patch.object(archive.CONFIG, 'delete_batch', 1):
+            self.assertEqual(archive_logs(date(2024, 2, 15), self.archive.name)['page'], 2)
+        self.assertEqual(len(read_logs(PageLog, archive_dir=self.archive.name)), 4)
+        # 已有汇总的日期不再计算
+        self.assertEqual(DailyActivity.objects.get(date=date(2024, 1, 31)).pd, 0)
+
+    def test_dump(self):
+        with mock.patch.object(archive.CONFIG, 'archive_dir', self.archive.name):
+            archive_logs(date(2024, 3, 1))
+            pages = PageTrackingDump.dump(hash_func=lambda name: 'x',
+                                          start_time=datetime(2024, 1, 1))
+            modules = ModuleTrackingDump.dump()
+        self.assertListEqual(pages['用户'].tolist(), ['x'] * 3)
+        self.assertListEqual(pages['页面'].tolist()[:2], ['/welcome/'] * 2)
+        self.assertListEqual(modules['模块'].tolist(), ['查看帮助'])
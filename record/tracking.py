@@ -0,0 +1,291 @@
+'''
+tracking.py
+
+埋点的批量写入：页面和模块埋点是系统中最频繁的写操作，每个请求可以携带多个埋点
+
+- 未启用暂存时，每个请求的埋点用一次bulk_create写入
+- 启用暂存时（CONFIG.buffer），埋点按行追加到本进程的暂存文件，积累CONFIG.batch条
+  或距上次写回超过CONFIG.flush_interval秒时，由本进程批量写回
+- 写回前将暂存文件原子地改名为批次文件，写入数据库后删除；写入失败的批次文件保留，
+  由定时任务flush_tracking重试，该任务同时写回空闲或已退出的进程留下的暂存文件，
+  写回间隔内有追加的暂存文件属于活跃的进程，由该进程自己写回
+- 暂存文件在本机磁盘上，进程重启不丢失埋点；进程在写入数据库后、删除批次文件前退出时，
+  该批次会被重复写入一次
+- 追加和改名都持有文件锁，追加时检查文件未被改名，其它进程可以安全地写回本进程的文件
+
+parse_beacons: 解析请求中的埋点
+save_events: 将埋点批量写入数据库
+buffer_enabled: 是否启用暂存
+record_events: 将埋点追加到暂存文件
+flush_spool: 写回暂存目录中的全部埋点
+'''
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Mapping, TypedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows下只在单进程开发环境中使用，不加锁
+    fcntl = None
+
+from django.db import transaction
+
+from boot.config import absolute_path
+from generic.models import User
+from record.models import PageLog, ModuleLog
+from record.config import tracking_config as CONFIG
+from record.log.utils import get_logger
+
+
+__all__ = [
+    'Event',
+    'parse_beacons',
+    'save_events',
+    'buffer_enabled',
+    'record_events',
+    'flush_spool',
+]
+
+
+# 批次文件在此时间（秒）内未被删除，视为写回失败或进程已退出，由定时任务接管
+STALE_BATCH_SECONDS = 60
+# 一次请求最多接受的埋点数
+MAX_BEACONS = 100
+SPOOL_SUFFIX = '.jsonl'
+BATCH_SUFFIX = '.batch'
+
+logger = get_logger('tracking')
+
+
+class Event(TypedDict):
+    user: int
+    type: int
+    page: str
+    time: str
+    platform: str | None
+    explore_name: str | None
+    explore_version: str | None
+    module_name: str
+
+
+_FIELDS = {field.name: field for field in ModuleLog._meta.fields}
+
+
+def _clip(value, field) -> str | None:
+    if value is None:
+        return None
+    return str(value)[:field.max_length]
+
+
+def _parse_event(beacon: Mapping, user_id: int) -> Event | None:
+    try:
+        log_type = int(beacon['Type'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if log_type not in ModuleLog.CountType.values + PageLog.CountType.values:
+        return None
+    try:
+        log_time = datetime.fromtimestamp(int(beacon['Time']) / 1000)
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        log_time = datetime.now()
+    try:
+        explore_name, explore_version = beacon['Explore'].rsplit(maxsplit=1)
+    except (KeyError, AttributeError, ValueError):
+        explore_name, explore_version = None, None
+    return Event(
+        user=user_id,
+        type=log_type,
+        page=_clip(beacon.get('Url', ''), _FIELDS['page']),
+        time=log_time.isoformat(),
+        platform=_clip(beacon.get('Platform'), _FIELDS['platform']),
+        explore_name=_clip(explore_name, _FIELDS['explore_name']),
+        explore_version=_clip(explore_version, _FIELDS['explore_version']),
+        module_name=_clip(beacon.get('Name', ''), _FIELDS['module_name']),
+    )
+
+
+def parse_beacons(data: Mapping, user_id: int) -> list[Event]:
+    '''
+    解析请求中的埋点，忽略类型不合法的埋点
+
+    :param data: 请求的POST数据，Events为埋点对象的JSON数组，否则整个请求为一个埋点
+    :type data: Mapping
+    :param user_id: 发送埋点的用户
+    :type user_id: int
+    :return: 可以直接写入暂存文件的埋点
+    :rtype: list[Event]
+    '''
+    if 'Events' in data:
+        try:
+            beacons = json.loads(data['Events'])
+        except (TypeError, ValueError):
+            return []
+        if not isinstance(beacons, list):
+            return []
+        beacons = [beacon for beacon in beacons[:MAX_BEACONS] if isinstance(beacon, dict)]
+    else:
+        beacons = [data]
+    events = [_parse_event(beacon, user_id) for beacon in beacons]
+    return [event for event in events if event is not None]
+
+
+def save_events(events: list[Event], check_users: bool = False) -> int:
+    '''
+    将埋点批量写入数据库
+
+    :param check_users: 是否忽略已删除用户的埋点，写回暂存文件时使用
+    :type check_users: bool
+    :return: 写入的条数
+    :rtype: int
+    '''
+    if check_users:
+        users = set(User.objects.filter(
+            id__in={event['user'] for event in events}).values_list('id', flat=True))
+        events = [event for event in events if event['user'] in users]
+    page_logs, module_logs = [], []
+    for event in events:
+        kwargs = dict(
+            user_id=event['user'],
+            type=event['type'],
+            page=event['page'],
+            time=datetime.fromisoformat(event['time']),
+            platform=event['platform'],
+            explore_name=event['explore_name'],
+            explore_version=event['explore_version'],
+        )
+        if event['type'] in ModuleLog.CountType.values:
+            module_logs.append(ModuleLog(module_name=event['module_name'], **kwargs))
+        else:
+            page_logs.append(PageLog(**kwargs))
+    with transaction.atomic():
+        PageLog.objects.bulk_create(page_logs, batch_size=500)
+        ModuleLog.objects.bulk_create(module_logs, batch_size=500)
+    return len(page_logs) + len(module_logs)
+
+
+def buffer_enabled() -> bool:
+    '''是否启用埋点暂存'''
+    return CONFIG.buffer
+
+
+def _spool_dir(spool_dir: str | None = None) -> str:
+    path = absolute_path(spool_dir or CONFIG.spool_dir)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _spool_path(spool_dir: str | None = None) -> str:
+    return os.path.join(_spool_dir(spool_dir),
+                        f'{socket.gethostname()}-{os.getpid()}{SPOOL_SUFFIX}')
+
+
+def _lock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+
+# 本进程追加但尚未写回的条数和上次写回的时间
+_pending = 0
+_last_flush = time.monotonic()
+
+
+def record_events(events: list[Event], spool_dir: str | None = None) -> None:
+    '''将埋点追加到本进程的暂存文件，达到批量大小或写回间隔时写回，spool_dir默认为CONFIG.spool_dir'''
+    global _pending, _last_flush
+    if not events:
+        return
+    lines = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+    path = _spool_path(spool_dir)
+    while True:
+        with open(path, 'a', encoding='utf-8') as file:
+            _lock(file)
+            # 加锁前文件可能已被其它进程改名为批次文件
+            try:
+                renamed = os.fstat(file.fileno()).st_ino != os.stat(path).st_ino
+            except FileNotFoundError:
+                renamed = True
+            if not renamed:
+                file.write(lines)
+                break
+    _pending += len(events)
+    if (_pending >= CONFIG.batch
+            or time.monotonic() - _last_flush >= CONFIG.flush_interval):
+        _pending, _last_flush = 0, time.monotonic()
+        try:
+            _flush_file(path)
+        except Exception:
+            # 批次文件保留，由定时任务重试
+            logger.exception('埋点写回失败')
+
+
+def _rotate(path: str) -> str | None:
+    '''将暂存文件改名为批次文件，文件不存在时返回None'''
+    batch = f'{path}.{time.time_ns()}{BATCH_SUFFIX}'
+    try:
+        with open(path, 'r+', encoding='utf-8') as file:
+            _lock(file)
+            # 加锁前文件可能已被其它进程改名
+            if os.fstat(file.fileno()).st_ino != os.stat(path).st_ino:
+                return None
+            os.rename(path, batch)
+    except FileNotFoundError:
+        return None
+    return batch
+
+
+def _write_batch(batch: str) -> int:
+    events = []
+    with open(batch, encoding='utf-8') as file:
+        for line in file:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    count = save_events(events, check_users=True) if events else 0
+    os.remove(batch)
+    return count
+
+
+def _flush_file(path: str) -> int:
+    batch = _rotate(path)
+    return _write_batch(batch) if batch is not None else 0
+
+
+def flush_spool(spool_dir: str | None = None, idle: float | None = None) -> int:
+    '''
+    写回暂存目录中空闲的暂存文件，以及写回失败或进程退出留下的批次文件
+
+    :param idle: 暂存文件在此时间（秒）内没有追加时才写回，默认为CONFIG.flush_interval，
+        0表示写回全部暂存文件
+    :type idle: float | None
+    :return: 写入的条数
+    :rtype: int
+    '''
+    spool_dir = _spool_dir(spool_dir)
+    if idle is None:
+        idle = CONFIG.flush_interval
+    count = 0
+    for name in sorted(os.listdir(spool_dir)):
+        path = os.path.join(spool_dir, name)
+        if name.endswith(SPOOL_SUFFIX):
+            try:
+                if time.time() - os.stat(path).st_mtime < idle:
+                    # 进程仍在追加，达到批量大小或写回间隔时自己写回
+                    continue
+            except FileNotFoundError:
+                continue
+            count += _flush_file(path)
+        elif name.endswith(BATCH_SUFFIX):
+            try:
+                if time.time() - os.stat(path).st_ctime < STALE_BATCH_SECONDS:
+                    continue
+                # 改名以接管批次文件，同时更新ctime
+                claimed = f'{path[:-len(BATCH_SUFFIX)]}.{time.time_ns()}{BATCH_SUFFIX}'
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            count += _write_batch(claimed)
+    return count
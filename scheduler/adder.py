@@ -3,7 +3,8 @@
 本模块实现定时任务添加器，用于添加定时任务，支持多个任务的添加。
 
 :class:`ScheduleAdder` 用于添加单个任务，
-:class:`MultipleAdder` 用于添加多个任务。
+:class:`MultipleAdder` 用于添加多个任务，
+:func:`schedule_batch` 用于批量添加任务。
 
 Examples:
     假设有一个函数，需要在指定时间执行::
@@ -25,15 +26,40 @@ Examples:
         adder_later = job_adder.schedule('later', run_time=timedelta(minutes=5))
         adder_later(4, 5, 6)
         job_adder.schedule()(7, 8, 9)
+
+    批量添加时，任务在同一事务中写入，结束时只唤醒一次执行器::
+
+        with schedule_batch():
+            for i in range(100):
+                ScheduleAdder(func, id=f'func_{i}')(i, i, i)
+
+        with job_adder.bulk():
+            job_adder.schedule('bulk')(1, 2, 3)
 '''
-from typing import Callable, ParamSpec, Generic
+from typing import Callable, ParamSpec, Generic, ContextManager
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 
 from scheduler.scheduler import scheduler
 from scheduler.utils import as_schedule_time
+from scheduler.config import scheduler_config as CONFIG
+
+
+__all__ = ['ScheduleAdder', 'MultipleAdder', 'schedule_batch']
+
 
+def schedule_batch() -> ContextManager[None]:
+    '''批量添加定时任务
 
-__all__ = ['ScheduleAdder', 'MultipleAdder']
+    在上下文中添加的任务在同一事务中写入任务库，事务提交后只唤醒一次执行器，
+    出现异常时任务均不添加。可以嵌套，不启用定时任务时不进行任何操作。
+
+    Returns:
+        ContextManager: 批量添加的上下文
+    '''
+    if not CONFIG.use_scheduler:
+        return nullcontext()
+    return scheduler.batch()  # type: ignore
 
 
 P = ParamSpec('P')
@@ -112,6 +138,7 @@ class MultipleAdder(Generic[P]):
 
     Methods:
         schedule: 获取单次定时任务添加器
+        bulk: 批量添加定时任务的上下文
     '''
     def __init__(self, func: Callable[P, None]):
         self.func = func
@@ -129,3 +156,11 @@ class MultipleAdder(Generic[P]):
             :method:`ScheduleAdder.__init__`
         '''
         return ScheduleAdder(self.func, id=id, name=name, run_time=run_time, replace=replace)
+
+    def bulk(self) -> ContextManager[None]:
+        '''批量添加定时任务
+
+        References:
+            :func:`schedule_batch`
+        '''
+        return schedule_batch()
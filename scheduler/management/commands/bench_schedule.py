@@ -0,0 +1,67 @@
+import time
+from threading import Thread
+from datetime import timedelta
+
+import rpyc
+from django.core.management.base import BaseCommand
+from django_apscheduler.models import DjangoJob
+from rpyc.utils.server import ThreadedServer
+
+from scheduler.scheduler import Scheduler, start_scheduler
+from scheduler.utils import as_schedule_time
+
+
+PREFIX = 'bench_schedule_'
+
+
+def bench_job(i: int):
+    pass
+
+
+class WakeupCounter(rpyc.Service):
+    def __init__(self):
+        self.count = 0
+
+    def exposed_wakeup(self):
+        self.count += 1
+
+
+class Command(BaseCommand):
+    help = '定时任务添加测试：统计逐个添加和批量添加任务的速度及唤醒执行器的次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=1000)
+        parser.add_argument('--port', type=int, default=18862, help='模拟执行器的端口')
+
+    def handle(self, *args, **options):
+        counter = WakeupCounter()
+        server = ThreadedServer(counter, port=options['port'])
+        Thread(target=server.start, daemon=True).start()
+        scheduler = Scheduler(start_scheduler(), rpc_port=options['port'])
+        run_time = as_schedule_time(timedelta(days=365))
+        try:
+            for mode in ['逐个添加', '批量添加']:
+                self._cleanup()
+                counter.count = 0
+                begin = time.perf_counter()
+                if mode == '批量添加':
+                    with scheduler.batch():
+                        self._add(scheduler, options['jobs'], run_time)
+                else:
+                    self._add(scheduler, options['jobs'], run_time)
+                elapsed = time.perf_counter() - begin
+                added = DjangoJob.objects.filter(id__startswith=PREFIX).count()
+                self.stdout.write(
+                    f'{mode}{added}个任务: 耗时{elapsed:.2f}秒, '
+                    f'{added / elapsed:.0f}个/秒, 唤醒执行器{counter.count}次')
+        finally:
+            self._cleanup()
+            server.close()
+
+    def _add(self, scheduler: Scheduler, num: int, run_time):
+        for i in range(num):
+            scheduler.add_job(bench_job, 'date', args=(i,), run_date=run_time,
+                              id=f'{PREFIX}{i}', replace_existing=True)
+
+    def _cleanup(self):
+        DjangoJob.objects.filter(id__startswith=PREFIX).delete()
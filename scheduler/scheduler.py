@@ -15,11 +15,13 @@ See Also:
 """
 
 import six
-from threading import Event
+from threading import Event, Lock, local
+from contextlib import contextmanager
 from functools import update_wrapper
 
 import rpyc
 from django.conf import settings
+from django.db import transaction
 from apscheduler.schedulers.background import BackgroundScheduler
 from django_apscheduler.jobstores import DjangoJobStore
 
@@ -36,13 +38,22 @@ class Scheduler:
     A wrapper around `BackgroundScheduler`
 
     It won't execute the job.
-    When adding the job to database, also try to wakeup the executor
+    When adding the job to database, also try to wakeup the executor.
+    Inside `batch()`, the jobs are written in one transaction
+    and the executor is woken up once on exit.
+    The rpyc connection is kept and reused until it fails.
     """
 
-    def __init__(self, scheduler: BackgroundScheduler, retry_times: int = 3):
+    def __init__(self, scheduler: BackgroundScheduler, retry_times: int = 3,
+                 rpc_port: int | None = None):
         self.wrapped_scheduler = scheduler
+        self.rpc_port = rpc_port
         self.remote_scheduler: BackgroundScheduler | None = None
         self.retry_times = retry_times
+        self._conn: rpyc.Connection | None = None
+        self._conn_lock = Lock()
+        # Batch state is per thread, other threads still wake up immediately
+        self._batch = local()
 
     def __getattr__(self, name: str):
         target_method = getattr(self.wrapped_scheduler, name)
@@ -54,13 +65,51 @@ class Scheduler:
         update_wrapper(wrapper, target_method)
         return wrapper
 
+    @contextmanager
+    def batch(self):
+        """Write jobs in one transaction and wake up the executor once.
+
+        Nested batches are merged into the outermost one.
+        The executor is woken up after the outermost transaction commits,
+        and nothing is woken up if the batch fails.
+        """
+        depth = getattr(self._batch, 'depth', 0)
+        if depth == 0:
+            self._batch.pending = False
+        self._batch.depth = depth + 1
+        try:
+            with transaction.atomic():
+                yield
+        finally:
+            self._batch.depth = depth
+        if depth == 0 and self._batch.pending:
+            self._batch.pending = False
+            transaction.on_commit(self.wakeup_executor)
+
     def wakeup_executor(self):
-        for _ in range(self.retry_times):
-            if self._try_wakeup():
-                break
-            self.connect_remote()
-        if self.remote_scheduler is not None or self.connect_remote():
-            self._try_wakeup()
+        if getattr(self._batch, 'depth', 0):
+            self._batch.pending = True
+            return
+        with self._conn_lock:
+            for _ in range(self.retry_times):
+                if not self._connected() and not self.connect_remote():
+                    continue
+                if self._try_wakeup():
+                    return
+                # The connection is broken, reconnect on next try
+                self._close()
+
+    def _connected(self) -> bool:
+        return self._conn is not None and not self._conn.closed
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self.remote_scheduler = None
 
     def _try_wakeup(self) -> bool:
         try:
@@ -72,8 +121,9 @@ class Scheduler:
     def connect_remote(self) -> bool:
         try:
             conn: rpyc.Connection = rpyc.connect(
-                "localhost", CONFIG.rpc_port,
+                "localhost", self.rpc_port or CONFIG.rpc_port,
                 config={"allow_all_attrs": True})
+            self._conn = conn
             self.remote_scheduler = conn.root
             return True
         except Exception as e:
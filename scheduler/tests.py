@@ -0,0 +1,51 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django_apscheduler.models import DjangoJob
+
+from scheduler.scheduler import Scheduler, start_scheduler
+from scheduler.utils import as_schedule_time
+
+
+def job(i: int):
+    pass
+
+
+class SchedulerBatchTestCase(TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler(start_scheduler())
+        self.wakeup = mock.patch.object(
+            self.scheduler, '_try_wakeup', return_value=True).start()
+        self.connect = mock.patch.object(self.scheduler, 'connect_remote').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def add_jobs(self, num: int):
+        for i in range(num):
+            self.scheduler.add_job(job, 'date', args=(i,), id=f'job_{i}',
+                                   run_date=as_schedule_time(timedelta(days=1)),
+                                   replace_existing=True)
+
+    def test_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.scheduler.batch():
+                self.add_jobs(3)
+                with self.scheduler.batch():
+                    self.add_jobs(5)
+                self.wakeup.assert_not_called()
+        self.assertEqual(DjangoJob.objects.count(), 5)
+        self.wakeup.assert_called_once()
+        # 连接保持可用时复用
+        self.assertEqual(self.connect.call_count, 1)
+        self.scheduler._conn = mock.Mock(closed=False)
+        self.add_jobs(2)
+        self.assertEqual(self.wakeup.call_count, 3)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.scheduler.batch():
+                self.add_jobs(3)
+                raise ValueError
+        self.assertFalse(DjangoJob.objects.exists())
+        self.wakeup.assert_not_called()
@@ -34,43 +34,62 @@ function getExplore(){
     return 'Unknown Unknown';
 }
 
-// Page View, Page Disappear的埋点
-function PageTrackFunction(type){
-    // alert(getExplore())
-    var myDate = new Date();
-    $.ajax({ 
+// 埋点先放入队列，凑满一批或等待一段时间后在一个请求中发送
+// 页面隐藏或关闭时用sendBeacon立即发送，避免丢失PD
+var pendingEvents = [];
+var pendingTimer = null;
+var BATCH_SIZE = 10;
+var BATCH_DELAY = 3000;
+
+function flushTrackEvents(unloading){
+    if (pendingTimer) {
+        clearTimeout(pendingTimer);
+        pendingTimer = null;
+    }
+    if (pendingEvents.length === 0) return;
+    var events = JSON.stringify(pendingEvents);
+    pendingEvents = [];
+    if (unloading && navigator.sendBeacon) {
+        var form = new FormData();
+        form.append('Events', events);
+        if (navigator.sendBeacon("/eventTrackingFunc/", form)) return;
+    }
+    $.ajax({
         type: 'POST',
         url: "/eventTrackingFunc/", // be mindful of url names
-        data: {
-            'Time': myDate.getTime(),
-            'Url': window.location.pathname,
-            'Type': type, // models.PageLog.PV(type=0) or PD(type=1)
-            'Platform': navigator.platform,
-            'Explore': getExplore()
-        },
+        data: {'Events': events},
         success: function(response) {
             status = response.status
         }
     })
 }
 
+function queueTrackEvent(event, unloading){
+    var myDate = new Date();
+    event.Time = myDate.getTime();
+    event.Url = window.location.pathname;
+    event.Platform = navigator.platform;
+    event.Explore = getExplore();
+    pendingEvents.push(event);
+    if (unloading || pendingEvents.length >= BATCH_SIZE) {
+        flushTrackEvents(unloading);
+    } else if (!pendingTimer) {
+        pendingTimer = setTimeout(function(){ flushTrackEvents(false); }, BATCH_DELAY);
+    }
+}
+
+window.addEventListener('pagehide', function(){ flushTrackEvents(true); });
+
+// Page View, Page Disappear的埋点
+function PageTrackFunction(type){
+    // alert(getExplore())
+    // models.PageLog.PV(type=0) or PD(type=1)
+    queueTrackEvent({'Type': type}, type === 1);
+}
+
 // Mudule Click的埋点
 function ModuleTrackFunction(type, name){
     console.log(name)
-    var myDate = new Date();
-    $.ajax({ 
-        type: 'POST',
-        url: "/eventTrackingFunc/", // be mindful of url names
-        data: {
-            'Time': myDate.getTime(),
-            'Url': window.location.pathname,
-            'Name': name,
-            'Type': type, // models.ModuleLog.MV(type=2) or MC(type=3)
-            'Platform': navigator.platform,
-            'Explore': getExplore()
-        },
-        success: function(response) {
-            status = response.status
-        }
-    })
+    // models.ModuleLog.MV(type=2) or MC(type=3)
+    queueTrackEvent({'Type': type, 'Name': name}, false);
 }
@@ -0,0 +1,23 @@
+'''
+cache.py
+
+缓存后端的检查
+
+- 默认的LocMemCache只在本进程内有效，多进程部署时（多个web进程和定时任务进程），
+  一个进程写入或失效的缓存对其它进程不可见，且条目数达到上限时会淘汰任意条目
+- 要求跨进程一致的缓存（失效由其它进程触发）应先调用shared_cache，
+  不共享时不使用跨请求的缓存，直接查询数据库
+- 部署时在config.json的django/caches中配置共享的缓存后端（如Redis或Memcached）即可启用
+'''
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+__all__ = [
+    'shared_cache',
+]
+
+
+def shared_cache(alias: str = 'default') -> bool:
+    '''缓存是否在进程间共享，LocMemCache只在本进程内有效'''
+    return not isinstance(caches[alias], LocMemCache)
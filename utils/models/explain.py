@@ -0,0 +1,140 @@
+'''查询计划分析
+
+- 获取查询的执行计划，支持SQLite和MySQL
+- 从执行计划中找出全表扫描的表
+- 记录执行过的查询，按SQL模板去重，用于回放分析
+
+Example:
+    检查查询集是否使用了索引::
+
+        scans = full_scans(Notification.objects.filter(receiver=user, status=1))
+        assert not scans, f'{scans}被全表扫描'
+
+    记录一段代码执行的查询，并找出全表扫描::
+
+        with QueryRecorder() as recorder:
+            ...
+        for pattern in recorder.patterns():
+            print(pattern.count, full_scans(pattern.sql, pattern.params), pattern.sql)
+'''
+import re
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, Sequence
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+
+
+__all__ = [
+    'QueryPattern',
+    'QueryRecorder',
+    'explain',
+    'full_scans',
+]
+
+
+# 可以分析执行计划的语句
+_EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+# SQLite: SCAN <表名> [AS <别名>]，使用索引时为SCAN <表名> USING [COVERING] INDEX
+# 扫描物化的子查询时为SCAN (subquery-N)，不是全表扫描
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?([^(\s]\S*)(?: AS \S+)?$')
+
+
+@dataclass
+class QueryPattern:
+    '''一类SQL模板相同的查询，保留首次执行的参数用于回放'''
+    sql: str
+    params: Sequence[Any] | None
+    count: int = 0
+    time: float = 0
+
+
+class QueryRecorder:
+    '''
+    记录执行的查询，按SQL模板去重
+
+    作为数据库连接的执行包装器，在上下文中安装到指定连接
+    '''
+    def __init__(self, using: str = DEFAULT_DB_ALIAS):
+        self.using = using
+        self._patterns: dict[str, QueryPattern] = {}
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        begin = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            pattern = self._patterns.get(sql)
+            if pattern is None:
+                pattern = QueryPattern(sql, None if many else params)
+                self._patterns[sql] = pattern
+            pattern.count += 1
+            pattern.time += perf_counter() - begin
+
+    def __enter__(self):
+        self._wrapper = connections[self.using].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+        self._wrapper = None
+
+    def patterns(self, explainable: bool = True) -> list[QueryPattern]:
+        '''按执行次数降序返回记录的查询模板，默认只返回可分析执行计划的查询'''
+        patterns = [
+            pattern for pattern in self._patterns.values()
+            if not explainable or (
+                pattern.params is not None
+                and pattern.sql.lstrip().upper().startswith(_EXPLAINABLE))
+        ]
+        return sorted(patterns, key=lambda p: p.count, reverse=True)
+
+
+def explain(query: QuerySet | str, params: Sequence[Any] | None = None,
+            using: str = DEFAULT_DB_ALIAS) -> list[dict[str, Any]]:
+    '''
+    获取查询的执行计划
+
+    :param query: 查询集或SQL语句
+    :type query: QuerySet | str
+    :param params: SQL语句的参数，查询集时忽略
+    :type params: Sequence[Any] | None
+    :param using: 数据库别名，查询集时使用查询集的数据库
+    :type using: str
+    :return: 执行计划的每一行，列名与数据库的EXPLAIN输出一致
+    :rtype: list[dict[str, Any]]
+    '''
+    if isinstance(query, QuerySet):
+        using = query.db
+        query, params = query.query.sql_with_params()
+    connection = connections[using]
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {query}', params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def full_scans(query: QuerySet | str, params: Sequence[Any] | None = None,
+               using: str = DEFAULT_DB_ALIAS) -> list[str]:
+    '''
+    找出查询中被全表扫描的表
+
+    :return: 全表扫描的表名（SQLite中可能为别名），不支持的数据库返回空列表
+    :rtype: list[str]
+    '''
+    if isinstance(query, QuerySet):
+        using = query.db
+    vendor = connections[using].vendor
+    plan = explain(query, params, using)
+    if vendor == 'sqlite':
+        return [
+            match.group(1) for row in plan
+            if (match := _SQLITE_SCAN.match(row['detail'])) is not None
+        ]
+    if vendor == 'mysql':
+        return [row['table'] for row in plan if row.get('type') == 'ALL']
+    return []
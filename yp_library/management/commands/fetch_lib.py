@@ -1,11 +1,11 @@
 from django.core.management.base import BaseCommand
 
-from yp_library.jobs import update_lib_data
+from yp_library.sync import sync_library
 
 
 
 class Command(BaseCommand):
-    help = '同步书房信息'
+    help = '同步书房信息，输出各阶段的耗时'
 
     def handle(self, *args, **options):
-        update_lib_data()
+        self.stdout.write(str(sync_library()))
@@ -0,0 +1,277 @@
+"""
+sync.py
+
+书房数据库（SQL Server）到本地的增量同步
+
+- 源数据库只需要DB-API 2.0连接，测试时可用SQLite代替pymssql
+- 源数据分块流式读取，与本地数据比较后只写入变化的行
+- 书籍和借阅记录以本地最大编号、最新借出时间为水位线，只读取新增数据
+- 读者信息仍在修订中，全部读取后比较学号，只写入新增和变化的读者
+- 条形码到书籍编号的映射一次读入内存，不再为每条借阅记录查询一次
+- 每个阶段的耗时和行数记入SyncReport
+
+SyncReport: 同步各阶段的统计
+LibrarySource: 源数据库连接的包装
+sync_library: 依次执行全部同步阶段
+"""
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Sequence
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from record.log.utils import get_logger
+from yp_library.models import Reader, Book, LendRecord
+
+
+__all__ = [
+    'SyncReport',
+    'LibrarySource',
+    'connect_library',
+    'sync_readers',
+    'sync_books',
+    'sync_records',
+    'sync_returns',
+    'sync_book_status',
+    'sync_library',
+]
+
+
+logger = get_logger('yp_library')
+
+CHUNK_SIZE = 2000
+# SQL Server单条语句最多2100个参数
+IN_BATCH = 1000
+# 条形码的最后六位为书的编号
+BARCODE_SUFFIX = 6
+
+
+@dataclass
+class StageStat:
+    read: int = 0
+    written: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class SyncReport:
+    '''各阶段读取的源数据行数、写入的本地行数和耗时'''
+    stages: dict[str, StageStat] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStat]:
+        stat = self.stages.setdefault(name, StageStat())
+        begin = time.perf_counter()
+        try:
+            yield stat
+        finally:
+            stat.seconds += time.perf_counter() - begin
+
+    def __str__(self) -> str:
+        return '\n'.join(
+            f'{name}: 读取{stat.read}行, 写入{stat.written}行, 耗时{stat.seconds:.3f}秒'
+            for name, stat in self.stages.items())
+
+
+class LibrarySource:
+    '''
+    源数据库连接，placeholder为连接模块的参数占位符
+
+    pymssql使用%s，sqlite3使用?
+    '''
+    def __init__(self, conn, placeholder: str = '%s'):
+        self.conn = conn
+        self.placeholder = placeholder
+
+    def params(self, num: int) -> str:
+        return ', '.join([self.placeholder] * num)
+
+    def stream(self, sql: str, params: Sequence[Any] = (),
+               chunk_size: int = CHUNK_SIZE) -> Iterator[list[tuple]]:
+        '''分块读取查询结果'''
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, tuple(params))
+            while rows := cursor.fetchmany(chunk_size):
+                yield rows
+        finally:
+            cursor.close()
+
+
+@contextmanager
+def connect_library() -> Iterator[LibrarySource]:
+    '''连接书房数据库，连接信息来自环境变量'''
+    import pymssql
+    with pymssql.connect(server=os.environ["LIB_DB_HOST"],
+                         user=os.environ["LIB_DB_USER"],
+                         password=os.environ["LIB_DB_PASSWORD"],
+                         database=os.environ["LIB_DB"],
+                         login_timeout=5) as conn:
+        yield LibrarySource(conn)
+
+
+def sync_readers(source: LibrarySource, report: SyncReport) -> None:
+    '''同步读者信息，源数据仍在修订，全部读取后只写入新增和学号变化的读者'''
+    with report.stage('readers') as stat:
+        local = dict(Reader.objects.values_list('id', 'student_id'))
+        for rows in source.stream('SELECT ID, IDCardNo FROM Readers'):
+            stat.read += len(rows)
+            changed = [Reader(id=rid, student_id=student_id)
+                       for rid, student_id in rows
+                       if rid not in local or local[rid] != student_id]
+            Reader.objects.bulk_create(
+                changed, update_conflicts=True,
+                unique_fields=['id'], update_fields=['student_id'])
+            stat.written += len(changed)
+
+
+def sync_books(source: LibrarySource, report: SyncReport) -> None:
+    '''同步新增书籍，以本地最大书籍编号为水位线'''
+    with report.stage('books') as stat:
+        largest_id = Book.objects.aggregate(Max('id'))['id__max'] or 0
+        for rows in source.stream(
+                'SELECT MarcID, Title, Author, Publisher, ReqNo FROM CircMarc '
+                f'WHERE MarcID > {source.placeholder} ORDER BY MarcID', [largest_id]):
+            stat.read += len(rows)
+            Book.objects.bulk_create([
+                Book(id=marc_id, identity_code=req_no, title=title,
+                     author=author, publisher=publisher)
+                for marc_id, title, author, publisher, req_no in rows
+            ], ignore_conflicts=True)
+            stat.written += len(rows)
+
+
+def _barcode_key(barcode: str) -> str:
+    return barcode.strip()[-BARCODE_SUFFIX:]
+
+
+def _load_barcode_index(source: LibrarySource, stat: StageStat) -> dict[str, int]:
+    '''
+    条形码后六位到书籍编号的映射，后六位相同时取第一条
+
+    匹配规则与原先不同：原先用LIKE '%xxxxxx%'按子串查找，现在要求条形码的后六位完全相同，
+    只在中间包含这六位的条形码不再匹配
+    '''
+    index = {}
+    for rows in source.stream('SELECT BarCode, MarcID FROM Items'):
+        stat.read += len(rows)
+        for barcode, marc_id in rows:
+            if barcode:
+                index.setdefault(_barcode_key(barcode), marc_id)
+    return index
+
+
+def sync_records(source: LibrarySource, report: SyncReport) -> None:
+    '''同步新增借阅记录，以本地最新借出时间为水位线，读者不存在的记录被跳过'''
+    latest_time = LendRecord.objects.aggregate(Max('lend_time'))['lend_time__max']
+    if latest_time is None:
+        latest_time = datetime.now() - timedelta(days=3650)
+    else:
+        latest_time += timedelta(seconds=1)
+
+    with report.stage('records') as stat:
+        new_rows = []
+        for rows in source.stream(
+                'SELECT ID, ReaderID, BarCode, LendTM, DueTm, IsReturn, ReturnTime '
+                f'FROM LendHist WHERE LendTM > {source.placeholder}', [latest_time]):
+            stat.read += len(rows)
+            new_rows.extend(rows)
+    if not new_rows:
+        return
+
+    with report.stage('barcodes') as stat:
+        barcode_index = _load_barcode_index(source, stat)
+
+    with report.stage('records') as stat:
+        reader_ids = set(Reader.objects.filter(
+            id__in={row[1] for row in new_rows}).values_list('id', flat=True))
+        new_rows = [row for row in new_rows if row[1] in reader_ids]
+        resolved = {row[0]: barcode_index.get(_barcode_key(row[2] or ''))
+                    for row in new_rows}
+        # 只查询本次记录涉及的书籍
+        wanted = list({book_id for book_id in resolved.values() if book_id is not None})
+        book_ids = set()
+        for i in range(0, len(wanted), IN_BATCH):
+            book_ids.update(Book.objects.filter(
+                id__in=wanted[i : i + IN_BATCH]).values_list('id', flat=True))
+        records = []
+        for lid, rid, barcode, lend_time, due_time, is_return, return_time in new_rows:
+            book_id = resolved[lid]
+            records.append(LendRecord(
+                id=lid, reader_id_id=rid,
+                book_id_id=book_id if book_id in book_ids else None,
+                lend_time=lend_time, due_time=due_time,
+                returned=is_return == 1,
+                return_time=return_time if is_return == 1 else None,
+            ))
+        with transaction.atomic():
+            LendRecord.objects.bulk_create(
+                records, batch_size=500, update_conflicts=True, unique_fields=['id'],
+                update_fields=['reader_id', 'book_id', 'lend_time', 'due_time'])
+        stat.written += len(records)
+
+
+def sync_returns(source: LibrarySource, report: SyncReport) -> None:
+    '''同步本地未归还记录的归还状态'''
+    with report.stage('returns') as stat:
+        unreturned = list(LendRecord.objects.filter(
+            returned=False).values_list('id', flat=True))
+        returned = []
+        for i in range(0, len(unreturned), IN_BATCH):
+            ids = unreturned[i : i + IN_BATCH]
+            for rows in source.stream(
+                    'SELECT ID, ReturnTime FROM LendHist '
+                    f'WHERE IsReturn = 1 AND ID IN ({source.params(len(ids))})', ids):
+                stat.read += len(rows)
+                returned.extend(
+                    LendRecord(id=lid, returned=True, return_time=return_time)
+                    for lid, return_time in rows)
+        with transaction.atomic():
+            LendRecord.objects.bulk_update(
+                returned, fields=['returned', 'return_time'], batch_size=500)
+        stat.written += len(returned)
+
+
+def sync_book_status(report: SyncReport) -> None:
+    '''根据一天内的借还记录更新书籍的在架状态'''
+    with report.stage('book_status') as stat:
+        time_lower_bound = datetime.now() - timedelta(days=1)
+        recent_ids = set(LendRecord.objects.filter(
+            Q(lend_time__gt=time_lower_bound) | Q(return_time__gt=time_lower_bound),
+            book_id__isnull=False,
+        ).values_list('book_id', flat=True))
+        lent_ids = set(LendRecord.objects.filter(
+            book_id__in=recent_ids, returned=False).values_list('book_id', flat=True))
+        stat.read = len(recent_ids)
+        with transaction.atomic():
+            stat.written = Book.objects.filter(
+                id__in=lent_ids, returned=True).update(returned=False)
+            stat.written += Book.objects.filter(
+                id__in=recent_ids - lent_ids, returned=False).update(returned=True)
+
+
+def sync_library(source: LibrarySource | None = None) -> SyncReport:
+    '''
+    依次同步读者、书籍、借阅记录、归还状态和书籍状态
+
+    :param source: 源数据库，默认连接书房数据库
+    :type source: LibrarySource, optional
+    :return: 各阶段的统计
+    :rtype: SyncReport
+    '''
+    if source is None:
+        with connect_library() as source:
+            return sync_library(source)
+    report = SyncReport()
+    sync_readers(source, report)
+    sync_books(source, report)
+    sync_records(source, report)
+    sync_returns(source, report)
+    # 在借还记录同步后更新，书籍状态不再滞后一次同步
+    sync_book_status(report)
+    logger.info(f'书房数据同步完成\n{report}')
+    return report
@@ -0,0 +1,86 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from yp_library.models import Book, LendRecord, Reader
+from yp_library.sync import LibrarySource, sync_library
+
+
+SCHEMA = '''
+CREATE TABLE Readers (ID INTEGER PRIMARY KEY, IDCardNo TEXT);
+CREATE TABLE CircMarc (MarcID INTEGER PRIMARY KEY, Title TEXT, Author TEXT,
+                       Publisher TEXT, ReqNo TEXT);
+CREATE TABLE Items (BarCode TEXT, MarcID INTEGER);
+CREATE TABLE LendHist (ID INTEGER PRIMARY KEY, ReaderID INTEGER, BarCode TEXT,
+                       LendTM timestamp, DueTm timestamp, IsReturn INTEGER,
+                       ReturnTime timestamp);
+'''
+
+
+class SyncLibraryTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+        self.conn.executescript(SCHEMA)
+        self.source = LibrarySource(self.conn, placeholder='?')
+        self.now = datetime.now().replace(microsecond=0)
+        self.conn.executemany('INSERT INTO Readers VALUES (?, ?)',
+                              [(1, '1900010000'), (2, '2000010000')])
+        self.conn.executemany('INSERT INTO CircMarc VALUES (?, ?, ?, ?, ?)', [
+            (10, '数学分析I', '伍胜健', '北京大学出版社', 'MATH-1-1'),
+            (11, '高等代数', '丘维声', '清华大学出版社', 'MATH-2'),
+        ])
+        self.conn.executemany('INSERT INTO Items VALUES (?, ?)',
+                              [('211046ZW005377', 10), ('211046ZW005378 ', 11)])
+        self.lend(100, 1, ' 211046ZW005377 ', days_ago=3)
+        self.lend(101, 2, '211046ZW005378', days_ago=0.5)
+        self.lend(102, 3, '211046ZW005378', days_ago=2)  # 读者不存在
+        self.lend(103, 2, '211046ZW999999', days_ago=1)  # 条形码不存在
+
+    def tearDown(self):
+        self.conn.close()
+
+    def lend(self, lid, rid, barcode, days_ago, returned=False):
+        lend_time = self.now - timedelta(days=days_ago)
+        self.conn.execute('INSERT INTO LendHist VALUES (?, ?, ?, ?, ?, ?, ?)', (
+            lid, rid, barcode, lend_time, lend_time + timedelta(days=7),
+            int(returned), self.now if returned else None))
+
+    def test_initial_sync(self):
+        report = sync_library(self.source)
+        self.assertEqual(Reader.objects.count(), 2)
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertDictEqual(
+            dict(LendRecord.objects.values_list('id', 'book_id')),
+            {100: 10, 101: 11, 103: None})
+        self.assertFalse(Book.objects.get(id=11).returned)
+        self.assertEqual(report.stages['records'].read, 4)
+        self.assertEqual(report.stages['records'].written, 3)
+        self.assertIn('barcodes', str(report))
+
+    def test_incremental_sync(self):
+        sync_library(self.source)
+        self.conn.execute("UPDATE Readers SET IDCardNo = '2100010000' WHERE ID = 2")
+        self.conn.execute('INSERT INTO Readers VALUES (3, NULL)')
+        self.conn.execute(
+            "INSERT INTO CircMarc VALUES (12, '概率论', '何书元', '北京大学出版社', 'MATH-3')")
+        self.conn.execute('UPDATE LendHist SET IsReturn = 1, ReturnTime = ? WHERE ID = 100',
+                          (self.now,))
+        self.lend(104, 3, '211046ZW005377', days_ago=0)
+
+        report = sync_library(self.source)
+        stages = report.stages
+        self.assertEqual(stages['readers'].written, 2)
+        self.assertEqual(stages['books'].read, 1)
+        # 只读取水位线之后的借阅记录
+        self.assertEqual(stages['records'].read, 1)
+        self.assertEqual(stages['returns'].written, 1)
+        self.assertEqual(Reader.objects.get(id=2).student_id, '2100010000')
+        self.assertEqual(LendRecord.objects.get(id=104).book_id_id, 10)
+        record = LendRecord.objects.get(id=100)
+        self.assertTrue(record.returned)
+        self.assertEqual(record.return_time, self.now)
+
+        report = sync_library(self.source)
+        self.assertNotIn('barcodes', report.stages)
+        self.assertEqual(report.stages['readers'].written, 0)